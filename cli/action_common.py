@@ -144,18 +144,14 @@ class atest_create_or_delete(topic_common.atest):
     self.msg_done:       'Deleted'       The printable version of the action.
     """
     def execute(self):
-        handled = []
-
         # Create or Delete the <topic> altogether
         op = '%s_%s' % (self.op_action, self.topic)
+        calls = []
         for item in self.get_items():
-            try:
-                self.data[self.data_item_key] = item
-                new_id = self.execute_rpc(op, item=item, **self.data)
-                handled.append(item)
-            except topic_common.CliError:
-                pass
-        return handled
+            data = self.data.copy()
+            data[self.data_item_key] = item
+            calls.append((item, data))
+        return self.execute_rpcs(op, calls)
 
 
     def output(self, results):
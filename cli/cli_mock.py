@@ -28,11 +28,24 @@ class ExitException(Exception):
     pass
 
 
+def _run_batch_serially(comm, op, calls, transaction=False):
+    """Runs the calls of a batch through the mocked run(), in order, so
+    that tests expect each call of a batch as a separate RPC."""
+    results = []
+    for data in calls:
+        try:
+            results.append(comm.run(op, **data))
+        except proxy.JSONRPCException, err:
+            results.append(err)
+    return results
+
+
 class cli_unittest(unittest.TestCase):
     def setUp(self):
         super(cli_unittest, self).setUp()
         self.god = mock.mock_god(debug=CLI_UT_DEBUG, ut=self)
         self.god.stub_class_method(rpc.afe_comm, 'run')
+        self.god.stub_with(rpc.afe_comm, 'run_batch', _run_batch_serially)
         self.god.stub_function(sys, 'exit')
 
         def stub_authorization_headers(*args, **kwargs):
@@ -344,19 +344,13 @@ class host_mod(host):
 
 
     def execute(self):
-        successes = []
+        calls = []
         for host in self.hosts:
-            try:
-                res = self.execute_rpc('modify_host', item=host,
-                                       id=host, **self.data)
-                # TODO: Make the AFE return True or False,
-                # especially for lock
-                successes.append(host)
-            except topic_common.CliError, full_error:
-                # Already logged by execute_rpc()
-                pass
-
-        return successes
+            data = self.data.copy()
+            data['id'] = host
+            calls.append((host, data))
+        # TODO: Make the AFE return True or False, especially for lock
+        return self.execute_rpcs('modify_host', calls)
 
 
     def output(self, hosts):
@@ -425,19 +419,17 @@ class host_create(host):
         return (options, leftover)
 
 
-    def _execute_add_one_host(self, host):
-        # Always add the hosts as locked to avoid the host
-        # being picked up by the scheduler before it's ACL'ed
-        self.data['locked'] = True
-        self.execute_rpc('add_host', hostname=host,
-                         status="Ready", **self.data)
-
-        # Now add the platform label
-        labels = self.labels[:]
-        if self.platform:
-            labels.append(self.platform)
-        if len (labels):
-            self.execute_rpc('host_add_labels', id=host, labels=labels)
+    def _execute_add_hosts(self, hosts):
+        # add_hosts keeps the hosts locked until they're ACL'ed, so that
+        # the scheduler doesn't pick them up before
+        data = self.data.copy()
+        data['locked'] = self.locked
+        try:
+            self.execute_rpc('add_hosts', hostnames=hosts, labels=self.labels,
+                             acls=self.acls, platform=self.platform, **data)
+        except topic_common.CliError:
+            return []
+        return hosts
 
 
     def execute(self):
@@ -458,28 +450,11 @@ class host_create(host):
                                         'add_acl_group',
                                         self.acls)
 
-        success = self.site_create_hosts_hook()
-
-        if len(success):
-            for acl in self.acls:
-                self.execute_rpc('acl_group_add_hosts', id=acl, hosts=success)
-
-            if not self.locked:
-                for host in success:
-                    self.execute_rpc('modify_host', id=host, locked=False)
-        return success
+        return self.site_create_hosts_hook()
 
 
     def site_create_hosts_hook(self):
-        success = []
-        for host in self.hosts:
-            try:
-                self._execute_add_one_host(host)
-                success.append(host)
-            except topic_common.CliError:
-                pass
-
-        return success
+        return self._execute_add_hosts(self.hosts)
 
 
     def output(self, hosts):
@@ -1299,23 +1299,12 @@ class host_create_unittest(cli_mock.cli_unittest):
                             True, []),
                            ('add_acl_group', {'name': 'acl0'},
                             True, 5),
-                           ('add_host', {'hostname': 'host1',
-                                         'status': 'Ready',
-                                         'locked': True},
-                            True, 42),
-                           ('host_add_labels', {'id': 'host1',
-                                                'labels': ['label0']},
-                            True, None),
-                           ('add_host', {'hostname': 'host0',
-                                         'status': 'Ready',
-                                         'locked': True},
-                            True, 42),
-                           ('host_add_labels', {'id': 'host0',
-                                                'labels': ['label0']},
-                            True, None),
-                           ('acl_group_add_hosts',
-                            {'id': 'acl0', 'hosts': ['host1', 'host0']},
-                            True, None)],
+                           ('add_hosts', {'hostnames': ['host1', 'host0'],
+                                          'labels': ['label0'],
+                                          'acls': ['acl0'],
+                                          'platform': None,
+                                          'locked': True},
+                            True, [42, 43])],
                      out_words_ok=['host0', 'host1'])
 
 
@@ -1334,27 +1323,12 @@ class host_create_unittest(cli_mock.cli_unittest):
                             True, []),
                            ('add_acl_group', {'name': 'acl0'},
                             True, 5),
-                           ('add_host', {'hostname': 'host1',
-                                         'status': 'Ready',
-                                         'locked': True},
-                            True, 42),
-                           ('host_add_labels', {'id': 'host1',
-                                                'labels': ['label0']},
-                            True, None),
-                           ('add_host', {'hostname': 'host0',
-                                         'status': 'Ready',
-                                         'locked': True},
-                            True, 42),
-                           ('host_add_labels', {'id': 'host0',
-                                                'labels': ['label0']},
-                            True, None),
-                           ('acl_group_add_hosts',
-                            {'id': 'acl0', 'hosts': ['host1', 'host0']},
-                            True, None),
-                           ('modify_host', {'id': 'host1', 'locked': False},
-                            True, None),
-                           ('modify_host', {'id': 'host0', 'locked': False},
-                            True, None)],
+                           ('add_hosts', {'hostnames': ['host1', 'host0'],
+                                          'labels': ['label0'],
+                                          'acls': ['acl0'],
+                                          'platform': None,
+                                          'locked': False},
+                            True, [42, 43])],
                      out_words_ok=['host0', 'host1'])
 
 
@@ -1388,29 +1362,13 @@ class host_create_unittest(cli_mock.cli_unittest):
                             True, []),
                            ('add_acl_group', {'name': 'acl0'},
                             True, 5),
-                           ('add_host', {'hostname': 'host1',
-                                         'status': 'Ready',
-                                         'locked': True},
-                            True, 42),
-                           ('host_add_labels', {'id': 'host1',
-                                                'labels': ['label0', 'label,1',
-                                                           'label,2']},
-                            True, None),
-                           ('add_host', {'hostname': 'host0',
-                                         'status': 'Ready',
-                                         'locked': True},
-                            True, 42),
-                           ('host_add_labels', {'id': 'host0',
-                                                'labels': ['label0', 'label,1',
-                                                           'label,2']},
-                            True, None),
-                           ('acl_group_add_hosts',
-                            {'id': 'acl0', 'hosts': ['host1', 'host0']},
-                            True, None),
-                           ('modify_host', {'id': 'host1', 'locked': False},
-                            True, None),
-                           ('modify_host', {'id': 'host0', 'locked': False},
-                            True, None)],
+                           ('add_hosts', {'hostnames': ['host1', 'host0'],
+                                          'labels': ['label0', 'label,1',
+                                                     'label,2'],
+                                          'acls': ['acl0'],
+                                          'platform': None,
+                                          'locked': False},
+                            True, [42, 43])],
                      out_words_ok=['host0', 'host1'])
 
 
@@ -47,10 +47,10 @@ class rpc_comm(object):
     def _connect(self, rpc_path):
         # This does not fail even if the address is wrong.
         # We need to wait for an actual RPC to fail
-        headers = rpc_client_lib.authorization_headers(self.username,
-                                                       self.web_server)
-        rpc_server = self.web_server + rpc_path
-        return rpc_client_lib.get_proxy(rpc_server, headers=headers)
+        self.headers = rpc_client_lib.authorization_headers(self.username,
+                                                            self.web_server)
+        self.rpc_server = self.web_server + rpc_path
+        return rpc_client_lib.get_proxy(self.rpc_server, headers=self.headers)
 
 
     def run(self, op, *args, **data):
@@ -63,6 +63,27 @@ class rpc_comm(object):
         return result
 
 
+    def run_batch(self, op, calls, transaction=False):
+        """
+        Runs op once for each dictionary of arguments in calls, in a single
+        request.
+
+        @returns a list with the result of each call, holding a
+                proxy.JSONRPCException for the calls that failed.
+        """
+        if 'AUTOTEST_CLI_DEBUG' in os.environ:
+            print self.web_server, op, calls
+        batch = rpc_client_lib.get_batch_proxy(self.rpc_server,
+                                               headers=self.headers,
+                                               transaction=transaction)
+        for data in calls:
+            batch.add_call(op, **data)
+        results = batch.execute()
+        if 'AUTOTEST_CLI_DEBUG' in os.environ:
+            print 'results:', results
+        return results
+
+
 class afe_comm(rpc_comm):
     """Handles the AFE setup and communication through RPC"""
     def __init__(self, web_server=None, rpc_path=AFE_RPC_PATH, username=None):
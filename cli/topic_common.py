@@ -46,8 +46,9 @@ High Level Algorithm:
 
 3. Execution
    This execute() method is specific to the child and should use the
-   self.execute_rpc() to send commands to the Autotest Front-End.  It
-   should return results.
+   self.execute_rpc() to send commands to the Autotest Front-End, or
+   self.execute_rpcs() to send the same command for many items in one
+   request.  It should return results.
 
 4. Output
    The child output() method is called with the execute() resutls as a
@@ -470,10 +471,47 @@ class atest(object):
 
 
     def execute_rpc(self, op, item='', **data):
+        return self._run_rpc(op, item, data, self.afe.run, op, **data)
+
+
+    def execute_rpcs(self, op, calls):
+        """Runs op for many items in one request.
+
+        calls is a list of (item, data) tuples, op is called with the
+        keyword arguments in data once for each item.  Failures are
+        reported like execute_rpc() reports them, and with
+        --kill-on-failure none of the calls take effect if one fails.
+
+        Returns the items whose call succeeded."""
+        if not calls:
+            return []
+        all_data = [data for item, data in calls]
+        try:
+            results = self._run_rpc(op, '', all_data, self.afe.run_batch, op,
+                                    all_data, transaction=self.kill_on_failure)
+        except CliError:
+            return []
+
+        succeeded, failed, aborted = [], [], []
+        for (item, data), result in zip(calls, results):
+            if not isinstance(result, proxy.JSONRPCException):
+                succeeded.append(item)
+            elif str(result).startswith('BatchAborted:'):
+                aborted.append((item, result))
+            else:
+                failed.append((item, result))
+        # report the failed call before the ones aborted because of it
+        for item, error in failed + aborted:
+            self.failure(error, item=item,
+                         what_failed='Operation %s failed' % op)
+        return succeeded
+
+
+    def _run_rpc(self, op, item, data, function, *args, **dargs):
         retry = 2
         while retry:
             try:
-                return self.afe.run(op, **data)
+                return function(*args, **dargs)
             except urllib2.URLError, err:
                 if hasattr(err, 'reason'):
                     if 'timed out' not in err.reason:
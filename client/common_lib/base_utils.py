@@ -611,6 +611,69 @@ class FileFieldMonitor(object):
         return (self.value, self.test_time, self.log, self.time_step)
 
 
+class LruCache(object):
+    """
+    A mapping of at most max_size entries, which drops the least recently
+    used entry to make room for a new one.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        # maps key to its [previous, next, key, value] node in a circular
+        # list running from the least to the most recently used entry
+        self._nodes = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+    def _unlink(self, node):
+        previous_node, next_node = node[0], node[1]
+        previous_node[1] = next_node
+        next_node[0] = previous_node
+
+
+    def _append(self, node):
+        last = self._root[0]
+        node[0], node[1] = last, self._root
+        last[1] = node
+        self._root[0] = node
+
+
+    def get(self, key, default=None):
+        node = self._nodes.get(key)
+        if node is None:
+            return default
+        self._unlink(node)
+        self._append(node)
+        return node[3]
+
+
+    def set(self, key, value):
+        node = self._nodes.get(key)
+        if node is not None:
+            node[3] = value
+            self._unlink(node)
+            self._append(node)
+            return
+        if self.max_size <= 0:
+            return
+        if len(self._nodes) >= self.max_size:
+            oldest = self._root[1]
+            self._unlink(oldest)
+            del self._nodes[oldest[2]]
+        node = [None, None, key, value]
+        self._append(node)
+        self._nodes[key] = node
+
+
+    def clear(self):
+        self._nodes.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+
 def is_url(path):
     """Return true if path looks like a URL"""
     # for now, just handle http and ftp
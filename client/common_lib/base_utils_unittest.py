@@ -331,6 +331,41 @@ class test_write_keyval(unittest.TestCase):
         self.assertEquals(result, "a-b=value\n")
 
 
+class test_lru_cache(unittest.TestCase):
+    def test_least_recently_used_dropped(self):
+        cache = base_utils.LruCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEquals(1, cache.get('a'))
+        cache.set('c', 3)
+        self.assertEquals(2, len(cache))
+        self.assertEquals(None, cache.get('b'))
+        self.assertEquals(1, cache.get('a'))
+        self.assertEquals(3, cache.get('c'))
+
+
+    def test_set_existing_key(self):
+        cache = base_utils.LruCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 3)
+        cache.set('c', 4)
+        self.assertEquals(3, cache.get('a'))
+        self.assertEquals('missing', cache.get('b', 'missing'))
+
+
+    def test_clear_and_zero_size(self):
+        cache = base_utils.LruCache(2)
+        cache.set('a', 1)
+        cache.clear()
+        self.assertEquals(0, len(cache))
+        cache.set('b', 2)
+        self.assertEquals(2, cache.get('b'))
+        cache = base_utils.LruCache(0)
+        cache.set('a', 1)
+        self.assertEquals(0, len(cache))
+
+
 class test_is_url(unittest.TestCase):
     def test_accepts_http(self):
         self.assertTrue(base_utils.is_url("http://example.com"))
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+"""
+Benchmark for create_job latency against the number of hosts a job runs on.
+
+Fills an in-memory sqlite database with hosts and labels, then times
+create_job on growing numbers of hosts, and on as many metahosts.
+"""
+
+import optparse, time
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from autotest_lib.frontend.afe import models, rpc_interface
+
+
+def _create_job(**host_args):
+    start_time = time.time()
+    rpc_interface.create_job('job', 'Medium', 'control file', 'Server',
+                             keyvals={'key': 'value'}, **host_args)
+    return time.time() - start_time
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-H', '--hosts', type='string', default='100,1000,5000',
+                      help='comma separated numbers of hosts per job')
+    parser.add_option('-l', '--labels', type='int', default=10,
+                      help='number of labels to use as metahosts')
+    options, args = parser.parse_args()
+    host_counts = [int(count) for count in options.hosts.split(',')]
+
+    setup_test_environment.set_up()
+    models.User.current_user()
+    labels = ['label%d' % index for index in xrange(options.labels)]
+    for label in labels:
+        rpc_interface.add_label(label)
+    hostnames = ['host%d' % index for index in xrange(max(host_counts))]
+    rpc_interface.add_hosts(hostnames)
+
+    for count in host_counts:
+        hosts_duration = _create_job(hosts=hostnames[:count])
+        meta_hosts = [labels[index % len(labels)] for index in xrange(count)]
+        meta_hosts_duration = _create_job(meta_hosts=meta_hosts)
+        print '%6d hosts: %.3fs, %6d metahosts: %.3fs' % (
+                count, hosts_duration, count, meta_hosts_duration)
+
+
+if __name__ == '__main__':
+    main()
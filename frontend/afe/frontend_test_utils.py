@@ -5,6 +5,7 @@ except ImportError:
     import common
 from autotest_lib.frontend import setup_test_environment
 from autotest_lib.frontend import thread_local
+from django.db import connection
 from autotest_lib.frontend.afe import models, model_attributes
 from autotest_lib.client.common_lib import global_config
 from autotest_lib.client.common_lib.test_utils import mock
@@ -84,6 +85,30 @@ class FrontendTestMixin(object):
         self.god.unstub_all()
 
 
+    def _assert_num_queries(self, expected_num_queries, function, *args,
+                            **dargs):
+        """
+        Call function with the given arguments, and check that it makes
+        expected_num_queries database queries, so that tests catch RPCs that
+        start making a query per object.
+
+        @returns function's return value.
+        """
+        old_use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        first_query = len(connection.queries)
+        try:
+            result = function(*args, **dargs)
+        finally:
+            connection.use_debug_cursor = old_use_debug_cursor
+        queries = [query['sql'] for query in connection.queries[first_query:]]
+        self.assertEquals(len(queries), expected_num_queries,
+                          'Expected %d queries, got %d:\n%s'
+                          % (expected_num_queries, len(queries),
+                             '\n'.join(queries)))
+        return result
+
+
     def _create_job(self, hosts=[], metahosts=[], priority=0, active=False,
                     synchronous=False, atomic_group=None, hostless=False,
                     drone_set=None, control_file='control',
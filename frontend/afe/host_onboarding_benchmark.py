@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+"""
+Benchmark for adding many hosts through the AFE RPC interface.
+
+Adds a number of hosts to an in-memory sqlite database with a platform,
+labels and an ACL group, once the way atest used to (add_host,
+host_add_labels and modify_host per host, then acl_group_add_hosts) and once
+with a single add_hosts call.
+"""
+
+import optparse, time
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from autotest_lib.frontend.afe import models, rpc_interface
+
+
+def _add_hosts_one_by_one(hostnames, labels, acl, platform):
+    for hostname in hostnames:
+        rpc_interface.add_host(hostname, locked=True)
+        rpc_interface.host_add_labels(hostname, labels + [platform])
+    rpc_interface.acl_group_add_hosts(acl, hostnames)
+    for hostname in hostnames:
+        rpc_interface.modify_host(hostname, locked=False)
+
+
+def _add_hosts_in_bulk(hostnames, labels, acl, platform):
+    rpc_interface.add_hosts(hostnames, labels=labels, acls=[acl],
+                            platform=platform)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-H', '--hosts', type='int', default=10000,
+                      help='number of hosts to add per mode')
+    parser.add_option('-l', '--labels', type='int', default=5,
+                      help='number of labels given to each host')
+    options, args = parser.parse_args()
+
+    setup_test_environment.set_up()
+    models.User.current_user()
+    labels = ['label%d' % index for index in xrange(options.labels)]
+    for label in labels:
+        rpc_interface.add_label(label)
+    rpc_interface.add_label('platform', platform=True)
+    rpc_interface.add_acl_group('acl')
+
+    for name, add_hosts in (('one by one', _add_hosts_one_by_one),
+                            ('bulk', _add_hosts_in_bulk)):
+        hostnames = ['%s-host%d' % (add_hosts.func_name, index)
+                     for index in xrange(options.hosts)]
+        start_time = time.time()
+        add_hosts(hostnames, labels, 'acl', 'platform')
+        print '%-10s %d hosts: %.3fs' % (name, options.hosts,
+                                         time.time() - start_time)
+
+
+if __name__ == '__main__':
+    main()
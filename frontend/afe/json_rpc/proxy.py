@@ -19,11 +19,119 @@
   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import urllib2
+import httplib, socket, StringIO, threading, urllib, urllib2, urlparse
 
 class JSONRPCException(Exception):
     pass
 
+
+class _UrllibTransport(object):
+    """Posts each request over a new connection, through any HTTP proxy."""
+    def __init__(self, url):
+        self._url = url
+
+
+    def post(self, data, headers):
+        request = urllib2.Request(self._url, data=data, headers=headers)
+        return urllib2.urlopen(request).read()
+
+
+class _KeepAliveTransport(object):
+    """
+    Posts requests over one HTTP/1.1 connection, kept open between requests.
+    Errors are raised as urllib2.urlopen() raises them.
+    """
+    def __init__(self, url):
+        self._url = url
+        scheme, self._host, self._path, query, fragment = urlparse.urlsplit(
+                url)
+        if query:
+            self._path += '?' + query
+        if scheme == 'https':
+            self._connection_class = httplib.HTTPSConnection
+        else:
+            self._connection_class = httplib.HTTPConnection
+        self._connection = None
+        self._connection_used = False
+
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+    def _post_once(self, data, headers):
+        if self._connection is None:
+            self._connection = self._connection_class(self._host)
+            self._connection_used = False
+        all_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        all_headers.update(headers)
+        self._connection.request('POST', self._path, data, all_headers)
+        response = self._connection.getresponse()
+        body = response.read()
+        self._connection_used = True
+        if response.will_close:
+            self._close()
+        if not 200 <= response.status < 300:
+            raise urllib2.HTTPError(self._url, response.status,
+                                    response.reason, response.msg,
+                                    StringIO.StringIO(body))
+        return body
+
+
+    def post(self, data, headers):
+        try:
+            try:
+                return self._post_once(data, headers)
+            except (httplib.BadStatusLine, socket.error):
+                if not self._connection_used:
+                    raise
+                # the server closed the connection while it was idle
+                self._close()
+                return self._post_once(data, headers)
+        except (httplib.HTTPException, socket.error), e:
+            self._close()
+            raise urllib2.URLError(e)
+
+
+# transports are kept per thread, since connections can't be shared
+_transports = threading.local()
+
+
+def _get_transport(url):
+    transports = getattr(_transports, 'by_url', None)
+    if transports is None:
+        transports = _transports.by_url = {}
+    if url not in transports:
+        scheme, host = urlparse.urlsplit(url)[:2]
+        if (scheme in urllib.getproxies() and
+                not urllib.proxy_bypass(host.split(':')[0])):
+            transports[url] = _UrllibTransport(url)
+        else:
+            transports[url] = _KeepAliveTransport(url)
+    return transports[url]
+
+
+def _decode_response(respdata):
+    # pull in simplejson imports lazily so that the library isn't required
+    # unless you actually need to do encoding and decoding
+    from simplejson import decoder
+    try:
+        return decoder.JSONDecoder().decode(respdata)
+    except ValueError:
+        raise JSONRPCException('Error decoding JSON reponse:\n' + respdata)
+
+
+def _get_error(resp):
+    if resp['error'] is None:
+        return None
+    error_message = (resp['error']['name'] + ': ' +
+                     resp['error']['message'] + '\n' +
+                     resp['error']['traceback'])
+    return JSONRPCException(error_message)
+
+
 class ServiceProxy(object):
     def __init__(self, serviceURL, serviceName=None, headers=None):
         self.__serviceURL = serviceURL
@@ -36,24 +144,76 @@ class ServiceProxy(object):
         return ServiceProxy(self.__serviceURL, name, self.__headers)
 
     def __call__(self, *args, **kwargs):
-        # pull in simplejson imports lazily so that the library isn't required
-        # unless you actually need to do encoding and decoding
-        from simplejson import decoder, encoder
+        from simplejson import encoder
 
         postdata = encoder.JSONEncoder().encode({"method": self.__serviceName,
                                                 'params': args + (kwargs,),
                                                 'id':'jsonrpc'})
-        request = urllib2.Request(self.__serviceURL, data=postdata,
-                                  headers=self.__headers)
-        respdata = urllib2.urlopen(request).read()
-        try:
-            resp = decoder.JSONDecoder().decode(respdata)
-        except ValueError:
-            raise JSONRPCException('Error decoding JSON reponse:\n' + respdata)
-        if resp['error'] is not None:
-            error_message = (resp['error']['name'] + ': ' +
-                             resp['error']['message'] + '\n' +
-                             resp['error']['traceback'])
-            raise JSONRPCException(error_message)
+        respdata = _get_transport(self.__serviceURL).post(postdata,
+                                                          self.__headers)
+        resp = _decode_response(respdata)
+        error = _get_error(resp)
+        if error is not None:
+            raise error
         else:
             return resp['result']
+
+
+class BatchProxy(object):
+    """
+    Sends RPC calls to the server together in one batch request:
+
+        batch = BatchProxy(url, headers=headers)
+        batch.add_call('add_host', hostname='host1')
+        batch.add_call('host_add_labels', id='host1', labels=['label1'])
+        results = batch.execute()
+
+    With transaction=True the server runs the calls in one database
+    transaction, so either all of them or none of them take effect.
+    """
+    def __init__(self, serviceURL, headers=None, transaction=False):
+        self.__serviceURL = serviceURL
+        self.__headers = dict(headers or {})
+        if transaction:
+            self.__headers['X-RPC-Transaction'] = '1'
+        self.__calls = []
+
+
+    def __len__(self):
+        return len(self.__calls)
+
+
+    def add_call(self, method, *args, **kwargs):
+        self.__calls.append({'method': method, 'params': args + (kwargs,),
+                             'id': len(self.__calls)})
+
+
+    def execute(self):
+        """
+        Sends the calls added since the last execute().
+
+        @returns a list with the result of each call, in the order they were
+                added, holding a JSONRPCException for the calls that failed.
+        """
+        from simplejson import encoder
+
+        calls, self.__calls = self.__calls, []
+        if not calls:
+            return []
+        postdata = encoder.JSONEncoder().encode(calls)
+        respdata = _get_transport(self.__serviceURL).post(postdata,
+                                                          self.__headers)
+        responses = _decode_response(respdata)
+        if isinstance(responses, dict):
+            # the whole batch was rejected
+            raise _get_error(responses) or JSONRPCException(
+                    'Unexpected response to batch request:\n' + respdata)
+
+        results = [None] * len(calls)
+        for resp in responses:
+            error = _get_error(resp)
+            if error is not None:
+                results[resp['id']] = error
+            else:
+                results[resp['id']] = resp['result']
+        return results
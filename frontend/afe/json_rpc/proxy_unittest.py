@@ -0,0 +1,136 @@
+#!/usr/bin/python
+
+import httplib, unittest, urllib2
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+import proxy, serviceHandler
+
+
+class FakeResponse(object):
+    def __init__(self, body, status=200, will_close=False):
+        self.body = body
+        self.status = status
+        self.reason = 'reason'
+        self.msg = {}
+        self.will_close = will_close
+
+
+    def read(self):
+        return self.body
+
+
+class FakeConnection(object):
+    """Answers requests with the queued responses, and fails once they're
+    used up as a connection the server closed would."""
+    instances = []
+
+    def __init__(self, host):
+        self.host = host
+        self.requests = []
+        self.responses = list(FakeConnection.responses)
+        self.closed = False
+        FakeConnection.instances.append(self)
+
+
+    def request(self, method, path, data, headers):
+        self.requests.append((method, path, data, headers))
+
+
+    def getresponse(self):
+        if not self.responses:
+            raise httplib.BadStatusLine('')
+        return self.responses.pop(0)
+
+
+    def close(self):
+        self.closed = True
+
+
+class RpcMethodHolder(object):
+    @staticmethod
+    def add(x, y, keyword_args):
+        return x + y
+
+
+class KeepAliveTransportTest(unittest.TestCase):
+    def setUp(self):
+        FakeConnection.instances = []
+        FakeConnection.responses = [FakeResponse('1'), FakeResponse('2')]
+        self.transport = proxy._KeepAliveTransport(
+                'http://autotest/afe/server/rpc/')
+        self.transport._connection_class = FakeConnection
+
+
+    def test_connection_reused(self):
+        self.assertEquals('1', self.transport.post('a', {'X': 'y'}))
+        self.assertEquals('2', self.transport.post('b', {}))
+        self.assertEquals(1, len(FakeConnection.instances))
+        connection = FakeConnection.instances[0]
+        self.assertEquals('autotest', connection.host)
+        self.assertEquals(['a', 'b'], [request[2]
+                                       for request in connection.requests])
+        self.assertEquals('/afe/server/rpc/', connection.requests[0][1])
+        self.assertEquals('y', connection.requests[0][3]['X'])
+
+
+    def test_reconnect_when_server_closed_connection(self):
+        FakeConnection.responses = [FakeResponse('1')]
+        self.transport.post('a', {})
+        self.assertEquals('1', self.transport.post('b', {}))
+        self.assertEquals(2, len(FakeConnection.instances))
+        self.assert_(FakeConnection.instances[0].closed)
+
+
+    def test_errors_raised_as_urllib2_does(self):
+        FakeConnection.responses = [FakeResponse('', status=500)]
+        self.assertRaises(urllib2.HTTPError, self.transport.post, 'a', {})
+        FakeConnection.responses = []
+        self.assertRaises(urllib2.URLError, self.transport.post, 'a', {})
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.handler = serviceHandler.ServiceHandler(RpcMethodHolder())
+        self.requests = []
+
+
+    def post(self, data, headers):
+        self.requests.append((data, headers))
+        return self.handler.handleRequest(data)
+
+
+class BatchProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.orig_get_transport = proxy._get_transport
+        proxy._get_transport = lambda url: self.transport
+
+
+    def tearDown(self):
+        proxy._get_transport = self.orig_get_transport
+
+
+    def test_execute(self):
+        batch = proxy.BatchProxy('http://autotest/afe/server/rpc/',
+                                 headers={'AUTHORIZATION': 'me'},
+                                 transaction=True)
+        batch.add_call('add', 1, 2)
+        batch.add_call('subtract', 1, 2)
+        batch.add_call('add', 3, 4)
+        self.assertEquals(3, len(batch))
+        results = batch.execute()
+
+        self.assertEquals(1, len(self.transport.requests))
+        self.assertEquals({'AUTHORIZATION': 'me', 'X-RPC-Transaction': '1'},
+                          self.transport.requests[0][1])
+        self.assertEquals(3, results[0])
+        self.assert_(isinstance(results[1], proxy.JSONRPCException))
+        self.assertEquals(7, results[2])
+        self.assertEquals(0, len(batch))
+        self.assertEquals([], batch.execute())
+
+
+if __name__ == '__main__':
+    unittest.main()
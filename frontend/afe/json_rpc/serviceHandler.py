@@ -65,6 +65,9 @@ class BadServiceRequest(ServiceException):
 class ServiceMethodNotFound(ServiceException):
     pass
 
+class BatchAborted(ServiceException):
+    pass
+
 
 class ServiceHandler(object):
 
@@ -101,6 +104,35 @@ class ServiceHandler(object):
         return results
 
 
+    def dispatchBatch(self, requests, stop_on_error=False):
+        """
+        Invoke the json RPC calls of a decoded batch request, in order.
+        @param requests: a list of decoded json requests
+        @param stop_on_error: if True, the calls after the first one that fails
+                are not invoked, and fail with BatchAborted
+        @returns a list of dictionaries like dispatchRequest() returns, in the
+                order of the requests
+        """
+        if not requests:
+            raise BadServiceRequest(requests)
+
+        all_results = []
+        failed_request_id = None
+        for request in requests:
+            if failed_request_id is None:
+                results = self.dispatchRequest(request)
+                if stop_on_error and results['err'] is not None:
+                    failed_request_id = results['id']
+            else:
+                results = self.blank_result_dict()
+                results['id'] = self._getRequestId(request)
+                results['err'] = BatchAborted(
+                        'Not run, call %s failed' % failed_request_id)
+                results['err_traceback'] = ''
+            all_results.append(results)
+        return all_results
+
+
     def _getRequestId(self, request):
         try:
             return request['id']
@@ -110,6 +142,8 @@ class ServiceHandler(object):
 
     def handleRequest(self, jsonRequest):
         request = self.translateRequest(jsonRequest)
+        if isinstance(request, list):
+            return self.translateBatchResult(self.dispatchBatch(request))
         results = self.dispatchRequest(request)
         return self.translateResult(results)
 
@@ -162,3 +196,14 @@ class ServiceHandler(object):
                                         "error":err})
 
         return data
+
+
+    @classmethod
+    def translateBatchResult(cls, result_dicts):
+        """
+        @param result_dicts: a list of dictionaries like translateResult()
+                takes, as dispatchBatch() returns.
+        @returns translated json result, a list of the calls' results
+        """
+        return '[%s]' % ', '.join([cls.translateResult(result_dict)
+                                   for result_dict in result_dicts])
@@ -47,6 +47,12 @@ json_request3 = """
 }
 """
 
+json_batch_request = """
+[{"method": "service_1", "params": [7, 9], "id": 0},
+ {"method": "service_3", "params": [], "id": 1},
+ {"method": "service_2", "params": ["/path/to/package.rpm"], "id": 2}]
+"""
+
 
 class TestServiceHandler(unittest.TestCase):
     def setUp(self):
@@ -70,5 +76,32 @@ class TestServiceHandler(unittest.TestCase):
         self.assertNotEquals(response_obj['error'], 'None')
 
 
+
+    def test_handleBatchRequest(self):
+        response = self.serviceHandler.handleRequest(json_batch_request)
+        results = serviceHandler.json_decoder.decode(response)
+        self.assertEquals([0, 1, 2], [result['id'] for result in results])
+        self.assertEquals([16, None, 'package.rpm'],
+                          [result['result'] for result in results])
+        self.assertEquals('ServiceMethodNotFound', results[1]['error']['name'])
+
+
+    def test_dispatchBatch_stop_on_error(self):
+        requests = serviceHandler.ServiceHandler.translateRequest(
+                json_batch_request)
+        results = self.serviceHandler.dispatchBatch(requests,
+                                                    stop_on_error=True)
+        self.assertEquals(16, results[0]['result'])
+        self.assert_(isinstance(results[1]['err'],
+                                serviceHandler.ServiceMethodNotFound))
+        self.assert_(isinstance(results[2]['err'],
+                                serviceHandler.BatchAborted))
+
+
+    def test_empty_batch(self):
+        self.assertRaises(serviceHandler.BadServiceRequest,
+                          self.serviceHandler.handleRequest, '[]')
+
+
 if __name__ == "__main__":
     unittest.main()
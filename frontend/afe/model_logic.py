@@ -4,7 +4,7 @@ Extensions to Django's model logic.
 
 import re
 import django.core.exceptions
-from django.db import models as dbmodels, backend, connection
+from django.db import models as dbmodels, backend, connection, transaction
 from django.db.models.sql import query
 import django.db.models.sql.where
 from django.utils import datastructures
@@ -33,6 +33,77 @@ def _quote_name(name):
     return connection.ops.quote_name(name)
 
 
+# keeps multi-row statements under the parameter limit of older SQLite
+# versions
+_MAX_PARAMETERS_PER_STATEMENT = 900
+
+
+def insert_many(table, columns, rows):
+    """\
+    Insert rows (sequences of values for columns) into table with multi-row
+    INSERT statements, rather than a statement per row.
+    """
+    if not rows:
+        return
+    rows_per_statement = max(1, _MAX_PARAMETERS_PER_STATEMENT / len(columns))
+    row_sql = '(%s)' % ', '.join(['%s'] * len(columns))
+    column_sql = ', '.join([_quote_name(column) for column in columns])
+    cursor = connection.cursor()
+    for start in xrange(0, len(rows), rows_per_statement):
+        chunk = rows[start:start + rows_per_statement]
+        parameters = []
+        for row in chunk:
+            parameters.extend(row)
+        cursor.execute('INSERT INTO %s (%s) VALUES %s'
+                       % (_quote_name(table), column_sql,
+                          ', '.join([row_sql] * len(chunk))),
+                       parameters)
+    transaction.commit_unless_managed()
+
+
+def insert_objects(model, objects):
+    """\
+    Insert unsaved instances of model with insert_many().  Unlike save(),
+    this doesn't set the IDs of the objects.
+    """
+    fields = [field for field in model._meta.local_fields
+              if not isinstance(field, dbmodels.AutoField)]
+    rows = [[field.get_db_prep_save(field.pre_save(model_object, True),
+                                    connection=connection)
+             for field in fields]
+            for model_object in objects]
+    insert_many(model._meta.db_table, [field.column for field in fields],
+                rows)
+
+
+def in_transaction(function):
+    """\
+    Decorator to run function in a database transaction, committed if it
+    returns and rolled back if it raises.  If the caller already manages a
+    transaction (as transactional RPC batches do), function's changes are
+    left to it.
+    """
+    def wrapper(*args, **kwargs):
+        if transaction.is_managed():
+            return function(*args, **kwargs)
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            try:
+                result = function(*args, **kwargs)
+                transaction.commit()
+                return result
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            transaction.leave_transaction_management()
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
 def _wrap_generator_with_readonly(generator):
     """
     We have to wrap generators specially.  Assume it performs
@@ -488,6 +559,72 @@ class ExtendedManager(dbmodels.Manager):
             yield base_objects_by_id[base_id], related_objects_by_id[related_id]
 
 
+    def _get_pivot_table(self, related_model):
+        """
+        @returns a tuple (pivot table, field referencing self.model, field
+        referencing related_model) for the many-to-many relationship between
+        this model and related_model.
+        """
+        relationship_type, field = self.determine_relationship(related_model)
+        if relationship_type == self.M2M_ON_RELATED_MODEL:
+            return (field.m2m_db_table(), field.m2m_reverse_name(),
+                    field.m2m_column_name())
+        elif relationship_type == self.M2M_ON_THIS_MODEL:
+            return (field.m2m_db_table(), field.m2m_column_name(),
+                    field.m2m_reverse_name())
+        raise ValueError('%s has no many-to-many relation to %s' %
+                         (related_model, self.model))
+
+
+    def _get_pivot_where(self, pivot_from_field, base_ids, pivot_to_field,
+                         related_ids):
+        return '%s IN (%s) AND %s IN (%s)' % (
+                pivot_from_field, ','.join(str(id_) for id_ in base_ids),
+                pivot_to_field, ','.join(str(id_) for id_ in related_ids))
+
+
+    def add_relationships_bulk(self, base_ids, related_model, related_ids):
+        """
+        Relate each object of this model with an ID in base_ids to each
+        related_model object with an ID in related_ids, with multi-row
+        INSERTs into the pivot table instead of a query per relationship.
+        Existing relationships are left alone.
+        """
+        if not base_ids or not related_ids:
+            return
+        pivot_table, pivot_from_field, pivot_to_field = (
+                self._get_pivot_table(related_model))
+        cursor = connection.cursor()
+        cursor.execute('SELECT %s, %s FROM %s WHERE %s' % (
+                pivot_from_field, pivot_to_field, pivot_table,
+                self._get_pivot_where(pivot_from_field, base_ids,
+                                      pivot_to_field, related_ids)))
+        existing_pairs = set(cursor.fetchall())
+        new_pairs = [(base_id, related_id)
+                     for base_id in base_ids for related_id in related_ids
+                     if (base_id, related_id) not in existing_pairs]
+        insert_many(pivot_table, (pivot_from_field, pivot_to_field),
+                    new_pairs)
+
+
+    def remove_relationships_bulk(self, base_ids, related_model, related_ids):
+        """
+        Remove the relationships between the objects of this model with an ID
+        in base_ids and the related_model objects with an ID in related_ids,
+        in one statement.
+        """
+        if not base_ids or not related_ids:
+            return
+        pivot_table, pivot_from_field, pivot_to_field = (
+                self._get_pivot_table(related_model))
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM %s WHERE %s' % (
+                pivot_table,
+                self._get_pivot_where(pivot_from_field, base_ids,
+                                      pivot_to_field, related_ids)))
+        transaction.commit_unless_managed()
+
+
     def populate_relationships(self, base_objects, related_model,
                                related_list_name):
         """
@@ -516,6 +653,33 @@ class ExtendedManager(dbmodels.Manager):
             getattr(base_object, related_list_name).append(related_object)
 
 
+    def populate_foreign_keys(self, base_objects, field_names):
+        """
+        For each instance of this model in base_objects, fetch the objects
+        its foreign key fields named field_names refer to, with a query per
+        field rather than a query per instance and field.  Unlike
+        select_related(), this doesn't add joins to the query for
+        base_objects, which could make columns in extra WHERE clauses
+        ambiguous.
+        @param base_objects - list of instances of this model
+        @param field_names - names of foreign key fields of this model
+        """
+        for field_name in field_names:
+            field = self.model._meta.get_field(field_name)
+            cache_name = field.get_cache_name()
+            related_ids = set(getattr(base_object, field.attname)
+                              for base_object in base_objects
+                              if not hasattr(base_object, cache_name))
+            related_ids.discard(None)
+            related_objects_by_id = field.rel.to.objects.in_bulk(
+                    list(related_ids))
+            for base_object in base_objects:
+                related_id = getattr(base_object, field.attname)
+                if related_id in related_objects_by_id:
+                    setattr(base_object, cache_name,
+                            related_objects_by_id[related_id])
+
+
 class ModelWithInvalidQuerySet(dbmodels.query.QuerySet):
     """
     QuerySet that handles delete() properly for models with an "invalid" bit
@@ -623,7 +787,8 @@ class ModelExtensions(object):
 
 
     @classmethod
-    def convert_human_readable_values(cls, data, to_human_readable=False):
+    def convert_human_readable_values(cls, data, to_human_readable=False,
+                                      related_objects=None):
         """\
         Performs conversions on user-supplied field data, to make it
         easier for users to pass human-readable data.
@@ -640,8 +805,13 @@ class ModelExtensions(object):
         If to_human_readable=True, perform the inverse - i.e. convert
         numeric values to human readable values.
 
+        related_objects optionally maps foreign key field names to the
+        objects they refer to, which are then used instead of smart_get.
+
         This method modifies data in-place.
         """
+        if related_objects is None:
+            related_objects = {}
         field_dict = cls.get_field_dict()
         for field_name in data:
             if field_name not in field_dict or data[field_name] is None:
@@ -660,8 +830,10 @@ class ModelExtensions(object):
                         break
             # convert foreign key values
             elif field_obj.rel:
-                dest_obj = field_obj.rel.to.smart_get(data[field_name],
-                                                      valid_only=False)
+                dest_obj = related_objects.get(field_name)
+                if dest_obj is None:
+                    dest_obj = field_obj.rel.to.smart_get(data[field_name],
+                                                          valid_only=False)
                 if to_human_readable:
                     if dest_obj.name_field is not None:
                         data[field_name] = getattr(dest_obj,
@@ -895,17 +1067,19 @@ class ModelExtensions(object):
 
 
     @classmethod
-    def clean_object_dicts(cls, field_dicts):
+    def clean_object_dicts(cls, field_dicts, related_objects=None):
         """\
         Take a list of dicts corresponding to object (as returned by
         query.values()) and clean the data to be more suitable for
-        returning to the user.
+        returning to the user.  See convert_human_readable_values() for
+        related_objects.
         """
         for field_dict in field_dicts:
             cls.clean_foreign_keys(field_dict)
             cls._convert_booleans(field_dict)
             cls.convert_human_readable_values(field_dict,
-                                              to_human_readable=True)
+                                              to_human_readable=True,
+                                              related_objects=related_objects)
 
 
     @classmethod
@@ -940,11 +1114,42 @@ class ModelExtensions(object):
                                                       type(id_or_name)))
 
 
+    # how many values smart_get_bulk() looks up per query
+    _SMART_GET_CHUNK_SIZE = 500
+
     @classmethod
     def smart_get_bulk(cls, id_or_name_list):
+        """\
+        Like smart_get() for each item of id_or_name_list, but looks up the
+        objects a chunk at a time.
+        """
+        manager = cls.get_valid_manager()
+        ids = [id_or_name for id_or_name in id_or_name_list
+               if isinstance(id_or_name, (int, long))]
+        names = [id_or_name for id_or_name in id_or_name_list
+                 if isinstance(id_or_name, basestring)]
+        objects_by_id_or_name = {}
+        for start in xrange(0, len(ids), cls._SMART_GET_CHUNK_SIZE):
+            chunk = ids[start:start + cls._SMART_GET_CHUNK_SIZE]
+            for model_object in manager.filter(pk__in=chunk):
+                objects_by_id_or_name[model_object.id] = model_object
+        if cls.name_field:
+            for start in xrange(0, len(names), cls._SMART_GET_CHUNK_SIZE):
+                chunk = names[start:start + cls._SMART_GET_CHUNK_SIZE]
+                filter_data = {cls.name_field + '__in': chunk}
+                for model_object in manager.filter(**filter_data):
+                    name = getattr(model_object, cls.name_field)
+                    objects_by_id_or_name[name] = model_object
+
         invalid_inputs = []
         result_objects = []
         for id_or_name in id_or_name_list:
+            if id_or_name in objects_by_id_or_name:
+                result_objects.append(objects_by_id_or_name[id_or_name])
+                continue
+            # the database may match names smart_get() would find (e.g.
+            # case-insensitively) that aren't keys above, and smart_get()
+            # raises ValueError for invalid inputs
             try:
                 result_objects.append(cls.smart_get(id_or_name))
             except cls.DoesNotExist:
@@ -962,12 +1167,23 @@ class ModelExtensions(object):
         extra_fields: list of extra attribute names to include, in addition to
         the fields defined on this object.
         """
-        fields = self.get_field_dict().keys()
+        field_dict = self.get_field_dict()
+        fields = field_dict.keys()
         if extra_fields:
             fields += extra_fields
-        object_dict = dict((field_name, getattr(self, field_name))
-                           for field_name in fields)
-        self.clean_object_dicts([object_dict])
+        object_dict = {}
+        # related objects fetched already, e.g. by select_related()
+        related_objects = {}
+        for field_name in fields:
+            field = field_dict.get(field_name)
+            if field is not None and field.rel:
+                # use the ID, rather than fetching the related object
+                related_object = getattr(self, field.get_cache_name(), None)
+                if related_object is not None:
+                    related_objects[field_name] = related_object
+                field_name = field.attname
+            object_dict[field_name] = getattr(self, field_name)
+        self.clean_object_dicts([object_dict], related_objects)
         self._postprocess_object_dict(object_dict)
         return object_dict
 
@@ -106,10 +106,7 @@ class Label(model_logic.ModelWithInvalid, dbmodels.Model):
 
     def enqueue_job(self, job, atomic_group=None, is_template=False):
         """Enqueue a job on any host of this label."""
-        queue_entry = HostQueueEntry.create(meta_host=self, job=job,
-                                            is_template=is_template,
-                                            atomic_group=atomic_group)
-        queue_entry.save()
+        job.queue([self], atomic_group=atomic_group, is_template=is_template)
 
 
     class Meta:
@@ -284,8 +281,10 @@ class User(dbmodels.Model, model_logic.ModelExtensions):
         user = thread_local.get_user()
         if user is None:
             user, _ = cls.objects.get_or_create(login=cls.AUTOTEST_SYSTEM)
-            user.access_level = cls.ACCESS_ROOT
-            user.save()
+            # saving bumps the static data generation, so only save if needed
+            if user.access_level != cls.ACCESS_ROOT:
+                user.access_level = cls.ACCESS_ROOT
+                user.save()
         return user
 
 
@@ -368,6 +367,99 @@ class Host(model_logic.ModelWithInvalid, dbmodels.Model,
         return host
 
 
+    @classmethod
+    def _get_ids_by_hostname(cls, query, hostnames):
+        """
+        @returns a dictionary mapping each of hostnames to the ID of the host
+        in query with that name.  Names are also matched case-insensitively,
+        as MySQL compares them.
+        """
+        ids_by_hostname = {}
+        for start in xrange(0, len(hostnames), cls._SMART_GET_CHUNK_SIZE):
+            chunk = hostnames[start:start + cls._SMART_GET_CHUNK_SIZE]
+            for id, hostname in query.filter(
+                    hostname__in=chunk).values_list('id', 'hostname'):
+                ids_by_hostname[hostname] = id
+                ids_by_hostname.setdefault(hostname.lower(), id)
+
+        matched_ids = {}
+        for hostname in hostnames:
+            id = ids_by_hostname.get(hostname,
+                                     ids_by_hostname.get(hostname.lower()))
+            if id is not None:
+                matched_ids[hostname] = id
+        return matched_ids
+
+
+    @classmethod
+    def add_objects_bulk(cls, hostnames, data):
+        """\
+        Add hosts named hostnames, all with the field values in data.  The
+        values are validated once and the hosts are inserted with multi-row
+        INSERTs.  Deleted hosts are brought back as add_object() does.  The
+        hosts aren't added to any ACL group.
+
+        @returns the IDs of the hosts, in the order of hostnames.
+        """
+        hostnames = [hostname.strip() for hostname in hostnames]
+        # a host with the values all the hosts share, validated only once
+        data = cls.prepare_data_args(data, {'hostname': 'prototype'})
+        prototype = cls(**cls.provide_default_values(data))
+        errors = prototype._validate()
+        seen, duplicates = set(), set()
+        for hostname in hostnames:
+            if hostname in seen:
+                duplicates.add(hostname)
+            seen.add(hostname)
+        if '' in hostnames:
+            errors['hostname'] = 'This field is required.'
+        elif duplicates:
+            errors['hostname'] = ('Hostnames given more than once: %s'
+                                  % ', '.join(sorted(duplicates)))
+        else:
+            existing = cls._get_ids_by_hostname(cls.valid_objects, hostnames)
+            if existing:
+                errors['hostname'] = ('This value must be unique (%s)'
+                                      % ', '.join(sorted(existing)))
+        if errors:
+            raise model_logic.ValidationError(errors)
+
+        if prototype.locked:
+            prototype.locked_by = User.current_user()
+            prototype.lock_time = datetime.now()
+            prototype.dirty = True
+
+        deleted = cls._get_ids_by_hostname(cls.objects.filter(invalid=True),
+                                           hostnames)
+        if deleted:
+            # as in resurrect_object(), keep the status of deleted hosts
+            cls.objects.filter(id__in=deleted.values()).update(
+                    invalid=False, locked=prototype.locked,
+                    protection=prototype.protection,
+                    locked_by=prototype.locked_by,
+                    lock_time=prototype.lock_time, dirty=prototype.dirty,
+                    synch_id=prototype.synch_id)
+
+        fields = [field for field in cls._meta.local_fields
+                  if not isinstance(field, dbmodels.AutoField)]
+        values = [field.get_db_prep_save(getattr(prototype, field.attname),
+                                         connection=connection)
+                  for field in fields]
+        hostname_index = [field.name for field in fields].index('hostname')
+        rows = []
+        for hostname in hostnames:
+            if hostname in deleted:
+                continue
+            row = list(values)
+            row[hostname_index] = hostname
+            rows.append(row)
+        model_logic.insert_many(cls._meta.db_table,
+                                [field.column for field in fields], rows)
+
+        ids_by_hostname = cls._get_ids_by_hostname(cls.objects, hostnames)
+        return [ids_by_hostname[hostname] for hostname in hostnames]
+
+
     def resurrect_object(self, old_object):
         super(Host, self).resurrect_object(old_object)
         # invalid hosts can be in use by the scheduler (as one-time hosts), so
@@ -416,17 +508,25 @@ class Host(model_logic.ModelWithInvalid, dbmodels.Model,
 
     def enqueue_job(self, job, atomic_group=None, is_template=False):
         """Enqueue a job on this host."""
-        queue_entry = HostQueueEntry.create(host=self, job=job,
-                                            is_template=is_template,
-                                            atomic_group=atomic_group)
-        # allow recovery of dead hosts from the frontend
-        if not self.active_queue_entry() and self.is_dead():
-            self.status = Host.Status.READY
-            self.save()
-        queue_entry.save()
+        job.queue([self], atomic_group=atomic_group, is_template=is_template)
 
-        block = IneligibleHostQueue(job=job, host=self)
-        block.save()
+
+    @classmethod
+    def recover_dead_hosts(cls, hosts):
+        """\
+        Make the dead hosts among hosts that aren't running anything Ready
+        again, to allow recovery of dead hosts from the frontend.
+        """
+        dead_hosts = [host for host in hosts if host.is_dead()]
+        if not dead_hosts:
+            return
+        busy_host_ids = set(HostQueueEntry.objects.filter(
+                host__in=dead_hosts, active=True).values_list('host',
+                                                              flat=True))
+        for host in dead_hosts:
+            if host.id not in busy_host_ids:
+                host.status = Host.Status.READY
+                host.save()
 
 
     def platform(self):
@@ -679,17 +779,19 @@ class AclGroup(dbmodels.Model, model_logic.ModelExtensions):
         # doesn't work in general (on all foreign key relationships).  I'll
         # replace it with a better technique when the need arises.
         orphaned_hosts = Host.valid_objects.filter(aclgroup__id__isnull=True)
-        everyone.hosts.add(*orphaned_hosts.distinct())
+        AclGroup.objects.add_relationships_bulk(
+                [everyone.id], Host,
+                list(orphaned_hosts.distinct().values_list('id', flat=True)))
 
         # find hosts in both Everyone and another ACL group, and remove them
         # from Everyone
-        hosts_in_everyone = Host.valid_objects.filter(aclgroup__name='Everyone')
-        acled_hosts = set()
-        for host in hosts_in_everyone:
-            # Has an ACL group other than Everyone
-            if host.aclgroup_set.count() > 1:
-                acled_hosts.add(host)
-        everyone.hosts.remove(*acled_hosts)
+        memberships = AclGroup.hosts.through.objects
+        hosts_in_everyone = set(memberships.filter(
+                aclgroup=everyone).values_list('host', flat=True))
+        acled_hosts = set(memberships.exclude(
+                aclgroup=everyone).values_list('host', flat=True))
+        AclGroup.objects.remove_relationships_bulk(
+                [everyone.id], Host, list(hosts_in_everyone & acled_hosts))
 
 
     def delete(self):
@@ -1028,8 +1130,10 @@ class Job(dbmodels.Model, model_logic.ModelExtensions):
         job.dependency_labels = options['dependencies']
 
         if options.get('keyvals'):
-            for key, value in options['keyvals'].iteritems():
-                JobKeyval.objects.create(job=job, key=key, value=value)
+            model_logic.insert_objects(
+                    JobKeyval, [JobKeyval(job=job, key=key, value=value)
+                                for key, value
+                                in options['keyvals'].iteritems()])
 
         return job
 
@@ -1041,7 +1145,11 @@ class Job(dbmodels.Model, model_logic.ModelExtensions):
 
 
     def queue(self, hosts, atomic_group=None, is_template=False):
-        """Enqueue a job on the given hosts."""
+        """\
+        Enqueue a job on the given hosts and metahosts (Host and Label
+        objects).  The queue entries and the IneligibleHostQueue entries
+        blocking the hosts are inserted with multi-row INSERTs.
+        """
         if not hosts:
             if atomic_group:
                 # No hosts or labels are required to queue an atomic group
@@ -1053,9 +1161,24 @@ class Job(dbmodels.Model, model_logic.ModelExtensions):
                 entry.save()
             return
 
+        queue_entries = []
+        blocked_hosts = []
         for host in hosts:
-            host.enqueue_job(self, atomic_group=atomic_group,
-                             is_template=is_template)
+            if isinstance(host, Label):
+                queue_entries.append(HostQueueEntry.create(
+                        job=self, meta_host=host, atomic_group=atomic_group,
+                        is_template=is_template))
+            else:
+                queue_entries.append(HostQueueEntry.create(
+                        job=self, host=host, atomic_group=atomic_group,
+                        is_template=is_template))
+                blocked_hosts.append(host)
+
+        Host.recover_dead_hosts(blocked_hosts)
+        model_logic.insert_objects(HostQueueEntry, queue_entries)
+        model_logic.insert_objects(
+                IneligibleHostQueue, [IneligibleHostQueue(job=self, host=host)
+                                      for host in blocked_hosts])
 
 
     def create_recurring_job(self, start_date, loop_period, loop_count, owner):
@@ -1154,8 +1277,10 @@ class HostQueueEntry(dbmodels.Model, model_logic.ModelExtensions):
         else:
             status = cls.Status.QUEUED
 
-        return cls(job=job, host=host, meta_host=meta_host,
-                   atomic_group=atomic_group, status=status)
+        queue_entry = cls(job=job, host=host, meta_host=meta_host,
+                          atomic_group=atomic_group, status=status)
+        queue_entry._set_active_and_complete()
+        return queue_entry
 
 
     def save(self, *args, **kwargs):
@@ -1403,3 +1528,41 @@ class SpecialTask(dbmodels.Model, model_logic.ModelExtensions):
             result += u' (active)'
 
         return result
+
+
+class StaticDataGeneration(dbmodels.Model):
+    """
+    A counter bumped whenever an object get_static_data() returns is saved or
+    deleted, so that cached static data can tell it is out of date.
+    """
+    generation = dbmodels.IntegerField(default=0)
+
+    @classmethod
+    def get_current(cls):
+        generations = list(cls.objects.values_list('generation', flat=True))
+        if not generations:
+            return 0
+        return generations[0]
+
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.update(generation=dbmodels.F('generation') + 1):
+            cls.objects.create(generation=1)
+
+
+    class Meta:
+        db_table = 'afe_static_data_generation'
+
+
+def _bump_static_data_generation(sender, **kwargs):
+    StaticDataGeneration.bump()
+
+
+# these signals fire in every process changing the models through Django,
+# e.g. utils/test_importer.py, and the counter is shared through the database
+for _model in (User, Label, AtomicGroup, Test, Profiler, DroneSet):
+    dbmodels.signals.post_save.connect(_bump_static_data_generation,
+                                       sender=_model)
+    dbmodels.signals.post_delete.connect(_bump_static_data_generation,
+                                         sender=_model)
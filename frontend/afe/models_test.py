@@ -306,5 +306,33 @@ class JobTest(unittest.TestCase, frontend_test_utils.FrontendTestMixin):
                           control_file=object(), parameterized_job=None)
 
 
+    def test_queue(self):
+        dead_host, busy_host = self.hosts[1], self.hosts[2]
+        busy_job = self._create_job(hosts=[busy_host.id], active=True)
+        for host in (dead_host, busy_host):
+            host.status = models.Host.Status.REPAIR_FAILED
+            host.save()
+
+        job = self._create_job()
+        job.queue([self.hosts[0], self.labels[0], dead_host, busy_host])
+        entries = job.hostqueueentry_set.order_by('id')
+        self.assertEquals([(entry.host_id, entry.meta_host_id)
+                           for entry in entries],
+                          [(self.hosts[0].id, None), (None, self.labels[0].id),
+                           (dead_host.id, None), (busy_host.id, None)])
+        for entry in entries:
+            self.assertEquals((entry.status, entry.active, entry.complete),
+                              (models.HostQueueEntry.Status.QUEUED, False,
+                               False))
+        self.assertEquals(
+                sorted(models.IneligibleHostQueue.objects.filter(
+                        job=job).values_list('host', flat=True)),
+                [self.hosts[0].id, dead_host.id, busy_host.id])
+        self.assertEquals(models.Host.objects.get(id=dead_host.id).status,
+                          models.Host.Status.READY)
+        self.assertEquals(models.Host.objects.get(id=busy_host.id).status,
+                          models.Host.Status.REPAIR_FAILED)
+
+
 if __name__ == '__main__':
     unittest.main()
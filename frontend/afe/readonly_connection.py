@@ -38,9 +38,14 @@ class ReadOnlyConnection(object):
     def _open_connection(self):
         if self._connection is not None:
             return
+        self._connection = self._open_new_connection()
+
+
+    def _open_new_connection(self):
         self._save_django_state()
-        self._connection = self._get_readonly_connection()
+        connection = self._get_readonly_connection()
         self._restore_django_state()
+        return connection
 
 
     def _save_django_state(self):
@@ -90,6 +95,18 @@ class ReadOnlyConnection(object):
         return self._connection.cursor()
 
 
+    def server_side_cursor(self):
+        """
+        Returns a server-side cursor on a new connection of its own, which is
+        closed along with the cursor.  Unlike the shared connection, it stays
+        open after the request finishes, so the cursor can be read while the
+        response is streamed.
+        """
+        db_connection = self._open_new_connection()
+        cursor = _server_side_cursor(db_connection, db_connection.cursor)
+        return _ConnectionOwningCursor(cursor, db_connection)
+
+
     def close(self):
         if self._connection is not None:
             assert django_db.connection.connection != self._connection
@@ -121,10 +138,55 @@ class DummyReadOnlyConnection(object):
         return django_db.connection.cursor()
 
 
+    def server_side_cursor(self):
+        # the global connection is only closed at the end of requests, and
+        # this class is only used outside of the web server
+        cursor = self.cursor() # ensures the connection is alive
+        return _server_side_cursor(django_db.connection.connection,
+                                   lambda: cursor)
+
+
     def close(self):
         pass
 
 
+class _ConnectionOwningCursor(object):
+    """
+    A cursor which closes its connection when it is closed.
+    """
+    def __init__(self, cursor, db_connection):
+        self._cursor = cursor
+        self._db_connection = db_connection
+
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+    def close(self):
+        try:
+            self._cursor.close()
+        finally:
+            self._db_connection.close()
+
+
+def _server_side_cursor(db_connection, get_cursor):
+    """
+    Returns a cursor on the given DB-API connection that leaves the rows of a
+    result on the server until they are fetched, so that reading a large
+    result in chunks keeps memory use flat.  No other query may run on the
+    connection until the result is read.  Falls back to get_cursor() for
+    drivers other than MySQLdb.
+    """
+    try:
+        from MySQLdb import connections, cursors
+    except ImportError:
+        return get_cursor()
+    if isinstance(db_connection, connections.Connection):
+        return db_connection.cursor(cursors.SSCursor)
+    return get_cursor()
+
+
 # convenience
 def connection():
     return ReadOnlyConnection.get_connection()
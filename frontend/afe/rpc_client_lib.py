@@ -19,6 +19,11 @@ def get_proxy(*args, **kwargs):
     return proxy.ServiceProxy(*args, **kwargs)
 
 
+def get_batch_proxy(*args, **kwargs):
+    """Use this to make many AFE or TKO RPC calls in one request."""
+    return proxy.BatchProxy(*args, **kwargs)
+
+
 def _base_authorization_headers(username, server):
     """
     Don't call this directly, call authorization_headers().
@@ -6,9 +6,11 @@ defined in rpc_interface.py.
 __author__ = 'showard@google.com (Steve Howard)'
 
 import traceback, pydoc, re, urllib, logging, logging.handlers, inspect
+import django.http
+from django.db import transaction
 from autotest_lib.frontend.afe.json_rpc import serviceHandler
 from autotest_lib.frontend.afe import models, rpc_utils
-from autotest_lib.client.common_lib import global_config
+from autotest_lib.client.common_lib import global_config, utils
 from autotest_lib.frontend.afe import rpcserver_logging
 
 LOGGING_REGEXPS = [r'.*add_.*',
@@ -19,6 +21,14 @@ LOGGING_REGEXPS = [r'.*add_.*',
 FULL_REGEXP = '(' + '|'.join(LOGGING_REGEXPS) + ')'
 COMPILED_REGEXP = re.compile(FULL_REGEXP)
 
+# clients set the X-RPC-Transaction header of a batch request to run all of
+# its calls in one database transaction
+TRANSACTION_HEADER = 'HTTP_X_RPC_TRANSACTION'
+
+# responses to these RPCs carry an ETag, so that clients can revalidate them
+# with If-None-Match and get a 304 Not Modified if they haven't changed
+ETAG_METHODS = set(['get_static_data'])
+
 
 def should_log_message(name):
     return COMPILED_REGEXP.match(name)
@@ -66,6 +76,44 @@ class RpcHandler(object):
         return self._dispatcher.dispatchRequest(decoded_request)
 
 
+    def dispatch_batch(self, decoded_requests, in_transaction=False):
+        """
+        Runs the calls of a batch request.  In a transaction, the calls after
+        the first one that fails are not run, and if any call fails the
+        changes of all of them are rolled back, and the calls that succeeded
+        fail with BatchAborted.
+        """
+        if not in_transaction:
+            return self._dispatcher.dispatchBatch(decoded_requests)
+
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            try:
+                decoded_results = self._dispatcher.dispatchBatch(
+                        decoded_requests, stop_on_error=True)
+                failed_ids = [decoded_result['id']
+                              for decoded_result in decoded_results
+                              if decoded_result['err'] is not None]
+                if not failed_ids:
+                    transaction.commit()
+                    return decoded_results
+
+                transaction.rollback()
+                for decoded_result in decoded_results:
+                    if decoded_result['err'] is None:
+                        decoded_result['result'] = None
+                        decoded_result['err'] = serviceHandler.BatchAborted(
+                                'Rolled back, call %s failed' % failed_ids[0])
+                        decoded_result['err_traceback'] = ''
+                return decoded_results
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            transaction.leave_transaction_management()
+
+
     def log_request(self, user, decoded_request, decoded_result,
                     log_all=False):
         if log_all or should_log_message(decoded_request['method']):
@@ -82,17 +130,47 @@ class RpcHandler(object):
         return self._dispatcher.translateResult(results)
 
 
+    def encode_batch_result(self, results):
+        return self._dispatcher.translateBatchResult(results)
+
+
     def handle_rpc_request(self, request):
         user = models.User.current_user()
         json_request = self.raw_request_data(request)
         decoded_request = self.decode_request(json_request)
-        decoded_result = self.dispatch_request(decoded_request)
-        result = self.encode_result(decoded_result)
+        if isinstance(decoded_request, list):
+            decoded_requests = decoded_request
+            in_transaction = bool(request.META.get(TRANSACTION_HEADER))
+            decoded_results = self.dispatch_batch(decoded_requests,
+                                                  in_transaction)
+            result = self.encode_batch_result(decoded_results)
+        else:
+            decoded_requests = [decoded_request]
+            decoded_results = [self.dispatch_request(decoded_request)]
+            result = self.encode_result(decoded_results[0])
         if rpcserver_logging.LOGGING_ENABLED:
-            self.log_request(user, decoded_request, decoded_result)
+            for decoded_request, decoded_result in zip(decoded_requests,
+                                                       decoded_results):
+                self.log_request(user, decoded_request, decoded_result)
+
+        if (len(decoded_requests) == 1 and decoded_results[0]['err'] is None
+            and decoded_requests[0]['method'] in ETAG_METHODS):
+            return self._make_etag_response(request, result)
         return rpc_utils.raw_http_response(result)
 
 
+    def _make_etag_response(self, request, result):
+        etag = '"%s"' % utils.hash('sha1', result).hexdigest()
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = django.http.HttpResponseNotModified()
+        else:
+            response = rpc_utils.raw_http_response(result)
+        response['ETag'] = etag
+        # the response depends on the user, and must be revalidated each time
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
     def handle_jsonp_rpc_request(self, request):
         request_data = request.GET['request']
         callback_name = request.GET['callback']
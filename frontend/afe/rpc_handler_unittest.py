@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+import unittest
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend.afe import frontend_test_utils
+from autotest_lib.frontend.afe import models, rpc_handler, rpc_interface
+from autotest_lib.frontend.afe.json_rpc import serviceHandler
+
+
+class FakeRequest(object):
+    method = 'POST'
+
+    def __init__(self, raw_post_data, META={}):
+        self.raw_post_data = raw_post_data
+        self.META = META
+
+
+class RpcHandlerTest(unittest.TestCase,
+                     frontend_test_utils.FrontendTestMixin):
+    def setUp(self):
+        self._frontend_common_setup()
+        self.handler = rpc_handler.RpcHandler((rpc_interface,))
+
+
+    def tearDown(self):
+        self._frontend_common_teardown()
+
+
+    def _batch_add_labels(self, names, META={}):
+        calls = [{'method': 'add_label', 'params': [{'name': name}],
+                  'id': index}
+                 for index, name in enumerate(names)]
+        response = self.handler.handle_rpc_request(
+                FakeRequest(serviceHandler.json_encoder.encode(calls), META))
+        return serviceHandler.json_decoder.decode(response.content)
+
+
+    def _label_exists(self, name):
+        return models.Label.objects.filter(name=name).count() > 0
+
+
+    def test_batch(self):
+        results = self._batch_add_labels(['new1', 'label1', 'new2'])
+        self.assertEquals([None, 'ValidationError', None],
+                          [result['error'] and result['error']['name']
+                           for result in results])
+        self.assert_(self._label_exists('new1'))
+        self.assert_(self._label_exists('new2'))
+
+
+    def test_batch_in_transaction(self):
+        results = self._batch_add_labels(
+                ['new1', 'label1', 'new2'],
+                {rpc_handler.TRANSACTION_HEADER: '1'})
+        self.assertEquals(['BatchAborted', 'ValidationError', 'BatchAborted'],
+                          [result['error']['name'] for result in results])
+        self.assertFalse(self._label_exists('new1'))
+        self.assertFalse(self._label_exists('new2'))
+
+        results = self._batch_add_labels(
+                ['new1', 'new2'], {rpc_handler.TRANSACTION_HEADER: '1'})
+        self.assertEquals([None, None],
+                          [result['error'] for result in results])
+        self.assert_(self._label_exists('new2'))
+
+
+    def _get_static_data(self, META={}):
+        call = {'method': 'get_static_data', 'params': [{}], 'id': 0}
+        return self.handler.handle_rpc_request(
+                FakeRequest(serviceHandler.json_encoder.encode(call), META))
+
+
+    def test_static_data_etag(self):
+        response = self._get_static_data()
+        self.assertEquals(200, response.status_code)
+        etag = response['ETag']
+
+        response = self._get_static_data({'HTTP_IF_NONE_MATCH': etag})
+        self.assertEquals(304, response.status_code)
+        self.assertEquals('', response.content)
+
+        models.Label.objects.create(name='newlabel')
+        response = self._get_static_data({'HTTP_IF_NONE_MATCH': etag})
+        self.assertEquals(200, response.status_code)
+        self.assertNotEquals(etag, response['ETag'])
+
+
+if __name__ == '__main__':
+    unittest.main()
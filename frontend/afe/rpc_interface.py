@@ -36,6 +36,7 @@ except ImportError:
     import common
 from autotest_lib.frontend.afe import models, model_logic, model_attributes
 from autotest_lib.frontend.afe import control_file, rpc_utils
+from autotest_lib.frontend.afe import static_data_cache
 from autotest_lib.client.common_lib import global_config
 
 
@@ -56,16 +57,11 @@ def delete_label(id):
 
 
 def label_add_hosts(id, hosts):
-    host_objs = models.Host.smart_get_bulk(hosts)
-    label = models.Label.smart_get(id)
-    if label.platform:
-        models.Host.check_no_platform(host_objs)
-    label.host_set.add(*host_objs)
+    hosts_add_labels(hosts, [id])
 
 
 def label_remove_hosts(id, hosts):
-    host_objs = models.Host.smart_get_bulk(hosts)
-    models.Label.smart_get(id).host_set.remove(*host_objs)
+    hosts_remove_labels(hosts, [id])
 
 
 def get_labels(**filter_data):
@@ -115,6 +111,59 @@ def add_host(hostname, status=None, locked=None, protection=None):
                                   locked=locked, protection=protection).id
 
 
+def _check_one_platform(labels):
+    platforms = [label.name for label in labels if label.platform]
+    if len(platforms) > 1:
+        raise model_logic.ValidationError(
+            {'labels': 'Adding more than one platform label: %s' %
+                       ', '.join(platforms)})
+    return platforms
+
+
+@model_logic.in_transaction
+def add_hosts(hostnames, labels=(), acls=(), platform=None, locked=False,
+              protection=None, status=None):
+    """\
+    Add many hosts at once, like add_host(), host_add_labels() and
+    acl_group_add_hosts() for each host, but validating everything once and
+    writing with multi-row INSERTs.  Everything is written in one
+    transaction, so nothing is added if any step fails.
+
+    The hosts stay locked until they're in their ACL groups, so that the
+    scheduler can't use them before.
+
+    @param labels: labels to add to every host.
+    @param acls: ACL groups to add every host to.  Hosts are added to
+            Everyone if this is empty.
+    @param platform: the platform label of every host.
+    @returns the IDs of the hosts, in the order of hostnames.
+    """
+    label_objs = models.Label.smart_get_bulk(labels)
+    if platform is not None:
+        platform_obj = models.Label.smart_get(platform)
+        if not platform_obj.platform:
+            raise model_logic.ValidationError(
+                {'platform': '%s is not a platform label' % platform_obj.name})
+        label_objs.append(platform_obj)
+    _check_one_platform(label_objs)
+    acl_objs = models.AclGroup.smart_get_bulk(acls)
+    for acl in acl_objs:
+        acl.check_for_acl_violation_acl_group()
+
+    host_ids = models.Host.add_objects_bulk(
+            hostnames, dict(locked=True, protection=protection, status=status))
+    models.Host.objects.add_relationships_bulk(
+            host_ids, models.Label, [label.id for label in label_objs])
+    if not acl_objs:
+        acl_objs = [models.AclGroup.objects.get(name='Everyone')]
+    models.AclGroup.objects.add_relationships_bulk(
+            [acl.id for acl in acl_objs], models.Host, host_ids)
+    if not locked:
+        models.Host.objects.filter(id__in=host_ids).update(
+                locked=False, locked_by=None, lock_time=None)
+    return host_ids
+
+
 def modify_host(id, **data):
     rpc_utils.check_modify_host(data)
     host = models.Host.smart_get(id)
@@ -134,22 +183,34 @@ def modify_hosts(host_filter_data, update_data):
 
 
 def host_add_labels(id, labels):
-    labels = models.Label.smart_get_bulk(labels)
-    host = models.Host.smart_get(id)
-
-    platforms = [label.name for label in labels if label.platform]
-    if len(platforms) > 1:
-        raise model_logic.ValidationError(
-            {'labels': 'Adding more than one platform label: %s' %
-                       ', '.join(platforms)})
-    if len(platforms) == 1:
-        models.Host.check_no_platform([host])
-    host.labels.add(*labels)
+    hosts_add_labels([id], labels)
 
 
 def host_remove_labels(id, labels):
+    hosts_remove_labels([id], labels)
+
+
+def hosts_add_labels(hosts, labels):
+    """\
+    Add each of labels to each of hosts, validating once and writing with
+    multi-row INSERTs.
+    """
     labels = models.Label.smart_get_bulk(labels)
-    models.Host.smart_get(id).labels.remove(*labels)
+    host_objs = models.Host.smart_get_bulk(hosts)
+    if _check_one_platform(labels):
+        models.Host.check_no_platform(host_objs)
+    models.Host.objects.add_relationships_bulk(
+            [host.id for host in host_objs], models.Label,
+            [label.id for label in labels])
+
+
+def hosts_remove_labels(hosts, labels):
+    """Remove each of labels from each of hosts, in one statement."""
+    labels = models.Label.smart_get_bulk(labels)
+    host_objs = models.Host.smart_get_bulk(hosts)
+    models.Host.objects.remove_relationships_bulk(
+            [host.id for host in host_objs], models.Label,
+            [label.id for label in labels])
 
 
 def set_host_attribute(attribute, value, **host_filter_data):
@@ -186,6 +247,7 @@ def get_hosts(multiple_labels=(), exclude_only_if_needed_labels=False,
                                      exclude_atomic_group_hosts,
                                      valid_only, filter_data)
     hosts = list(hosts)
+    models.Host.objects.populate_foreign_keys(hosts, ('locked_by',))
     models.Host.objects.populate_relationships(hosts, models.Label,
                                                'label_list')
     models.Host.objects.populate_relationships(hosts, models.AclGroup,
@@ -318,19 +380,39 @@ def acl_group_remove_users(id, users):
 
 
 def acl_group_add_hosts(id, hosts):
-    group = models.AclGroup.smart_get(id)
-    group.check_for_acl_violation_acl_group()
-    hosts = models.Host.smart_get_bulk(hosts)
-    group.hosts.add(*hosts)
-    group.on_host_membership_change()
+    acl_groups_add_hosts([id], hosts)
 
 
 def acl_group_remove_hosts(id, hosts):
-    group = models.AclGroup.smart_get(id)
-    group.check_for_acl_violation_acl_group()
+    acl_groups_remove_hosts([id], hosts)
+
+
+def _get_acl_groups_for_update(acl_groups):
+    groups = models.AclGroup.smart_get_bulk(acl_groups)
+    for group in groups:
+        group.check_for_acl_violation_acl_group()
+    return [group.id for group in groups]
+
+
+def acl_groups_add_hosts(acl_groups, hosts):
+    """\
+    Add each of hosts to each of acl_groups, validating once and writing
+    with multi-row INSERTs.
+    """
+    group_ids = _get_acl_groups_for_update(acl_groups)
     hosts = models.Host.smart_get_bulk(hosts)
-    group.hosts.remove(*hosts)
-    group.on_host_membership_change()
+    models.AclGroup.objects.add_relationships_bulk(
+            group_ids, models.Host, [host.id for host in hosts])
+    models.AclGroup.on_host_membership_change()
+
+
+def acl_groups_remove_hosts(acl_groups, hosts):
+    """Remove each of hosts from each of acl_groups, in one statement."""
+    group_ids = _get_acl_groups_for_update(acl_groups)
+    hosts = models.Host.smart_get_bulk(hosts)
+    models.AclGroup.objects.remove_relationships_bulk(
+            group_ids, models.Host, [host.id for host in hosts])
+    models.AclGroup.on_host_membership_change()
 
 
 def delete_acl_group(id):
@@ -573,6 +655,8 @@ def get_jobs(not_yet_run=False, running=False, finished=False, **filter_data):
                                                             finished)
     job_dicts = []
     jobs = list(models.Job.query_objects(filter_data))
+    models.Job.objects.populate_foreign_keys(
+            jobs, ('drone_set', 'parameterized_job'))
     models.Job.objects.populate_relationships(jobs, models.Label,
                                               'dependencies')
     models.Job.objects.populate_relationships(jobs, models.JobKeyval, 'keyvals')
@@ -621,9 +705,13 @@ def get_info_for_clone(id, preserve_metahosts, queue_entry_filter_data=None):
                                       queue_entry_filter_data)
 
     host_dicts = []
+    if job_info['hosts']:
+        host_dicts_by_id = dict(
+                (host_dict['id'], host_dict) for host_dict in get_hosts(
+                        id__in=[host.id for host in job_info['hosts']]))
     for host in job_info['hosts']:
-        host_dict = get_hosts(id=host.id)[0]
-        other_labels = host_dict['labels']
+        host_dict = dict(host_dicts_by_id[host.id])
+        other_labels = host_dict['labels'] = list(host_dict['labels'])
         if host_dict['platform']:
             other_labels.remove(host_dict['platform'])
         host_dict['other_labels'] = ', '.join(other_labels)
@@ -793,25 +881,18 @@ def get_static_data():
     motd: Server's message of the day.
     status_dictionary: A mapping from one word job status names to a more
             informative description.
+
+    The users, labels, atomic groups, tests, profilers and drone sets are
+    cached until one of them changes.
     """
 
     job_fields = models.Job.get_field_dict()
-    default_drone_set_name = models.DroneSet.default_drone_set_name()
-    drone_sets = ([default_drone_set_name] +
-                  sorted(drone_set.name for drone_set in
-                         models.DroneSet.objects.exclude(
-                                 name=default_drone_set_name)))
 
-    result = {}
+    result = static_data_cache.get(_get_static_database_data).copy()
     result['priorities'] = models.Job.Priority.choices()
     default_priority = job_fields['priority'].default
     default_string = models.Job.Priority.get_string(default_priority)
     result['default_priority'] = default_string
-    result['users'] = get_users(sort_by=['login'])
-    result['labels'] = get_labels(sort_by=['-platform', 'name'])
-    result['atomic_groups'] = get_atomic_groups(sort_by=['name'])
-    result['tests'] = get_tests(sort_by=['name'])
-    result['profilers'] = get_profilers(sort_by=['name'])
     result['current_user'] = rpc_utils.prepare_for_serialization(
         models.User.current_user().get_object_dict())
     result['host_statuses'] = sorted(models.Host.Status.names)
@@ -824,7 +905,6 @@ def get_static_data():
     result['reboot_after_options'] = model_attributes.RebootAfter.names
     result['motd'] = rpc_utils.get_motd()
     result['drone_sets_enabled'] = models.DroneSet.drone_sets_enabled()
-    result['drone_sets'] = drone_sets
     result['parameterized_jobs'] = models.Job.parameterized_jobs_enabled()
 
     result['status_dictionary'] = {"Aborted": "Aborted",
@@ -844,5 +924,25 @@ def get_static_data():
     return result
 
 
+def _get_static_database_data():
+    """
+    The part of get_static_data() read from the database, which is cached.
+    """
+    default_drone_set_name = models.DroneSet.default_drone_set_name()
+    drone_sets = ([default_drone_set_name] +
+                  sorted(drone_set.name for drone_set in
+                         models.DroneSet.objects.exclude(
+                                 name=default_drone_set_name)))
+
+    result = {}
+    result['users'] = get_users(sort_by=['login'])
+    result['labels'] = get_labels(sort_by=['-platform', 'name'])
+    result['atomic_groups'] = get_atomic_groups(sort_by=['name'])
+    result['tests'] = get_tests(sort_by=['name'])
+    result['profilers'] = get_profilers(sort_by=['name'])
+    result['drone_sets'] = drone_sets
+    return result
+
+
 def get_server_time():
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
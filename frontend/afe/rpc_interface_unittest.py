@@ -103,6 +103,88 @@ class RpcInterfaceTest(unittest.TestCase,
         self._check_hostnames(hosts, ['host2'])
 
 
+    def test_add_hosts(self):
+        self.hosts[0].delete()
+        ids = rpc_interface.add_hosts(
+                ['newhost1', 'host1', 'newhost2'], labels=['label1'],
+                acls=['my_acl'], platform='myplatform', locked=False)
+        self.assertEquals(self.hosts[0].id, ids[1])
+
+        hosts = rpc_interface.get_hosts(id__in=ids)
+        self._check_hostnames(hosts, ['newhost1', 'host1', 'newhost2'])
+        for host in hosts:
+            self.assertEquals(sorted(host['labels']), ['label1', 'myplatform'])
+            self.assertEquals(host['acls'], ['my_acl'])
+            self.assertFalse(host['locked'])
+            self.assertEquals(host['locked_by'], None)
+            self.assertEquals(host['status'], 'Ready')
+
+
+    def test_add_hosts_locked_in_everyone(self):
+        ids = rpc_interface.add_hosts(['newhost1', 'newhost2'], locked=True)
+        hosts = rpc_interface.get_hosts(id__in=ids)
+        self.assertEquals([host['acls'] for host in hosts],
+                          [['Everyone'], ['Everyone']])
+        self.assertEquals([host['locked_by'] for host in hosts],
+                          ['autotest_system', 'autotest_system'])
+
+
+    def test_add_hosts_validation(self):
+        self.assertRaises(model_logic.ValidationError, rpc_interface.add_hosts,
+                          ['newhost1', 'host1'])
+        self.assertRaises(model_logic.ValidationError, rpc_interface.add_hosts,
+                          ['newhost1', 'newhost1'])
+        self.assertRaises(model_logic.ValidationError, rpc_interface.add_hosts,
+                          ['newhost1'], platform='label1')
+        self.assertRaises(models.Label.DoesNotExist, rpc_interface.add_hosts,
+                          ['newhost1'], labels=['nolabel'])
+        self.assertEquals(0, rpc_interface.get_num_hosts(hostname='newhost1'))
+
+
+    def test_add_hosts_rolled_back_on_failure(self):
+        self.hosts[0].delete()
+        self.god.stub_function(models.AclGroup.objects,
+                               'add_relationships_bulk')
+        models.AclGroup.objects.add_relationships_bulk.expect_any_call(
+                ).and_raises(model_logic.ValidationError({'acls': 'failed'}))
+        self.assertRaises(model_logic.ValidationError, rpc_interface.add_hosts,
+                          ['newhost1', 'host1'], labels=['label1'])
+        self.assertEquals(0, rpc_interface.get_num_hosts(hostname='newhost1'))
+        host1 = models.Host.objects.get(id=self.hosts[0].id)
+        self.assert_(host1.invalid)
+        self.assertEquals([], list(host1.labels.all()))
+
+
+    def test_hosts_add_remove_labels(self):
+        rpc_interface.hosts_add_labels(['host1', 'host2', 'host3'],
+                                       ['label1', 'label2'])
+        for host in rpc_interface.get_hosts(hostname__in=['host1', 'host2',
+                                                          'host3']):
+            self.assertEquals(sorted(host['labels']),
+                              ['label1', 'label2', 'myplatform'])
+        self.assertRaises(model_logic.ValidationError,
+                          rpc_interface.hosts_add_labels, ['host1'],
+                          ['myplatform'])
+
+        rpc_interface.hosts_remove_labels(['host1', 'host2'], ['label1'])
+        self.assertEquals(['label2', 'myplatform'], sorted(
+                rpc_interface.get_hosts(hostname='host1')[0]['labels']))
+        self.assertEquals(['label1', 'label2', 'myplatform'], sorted(
+                rpc_interface.get_hosts(hostname='host3')[0]['labels']))
+
+
+    def test_acl_groups_add_remove_hosts(self):
+        rpc_interface.add_acl_group('acl2')
+        rpc_interface.acl_groups_remove_hosts(['my_acl'], ['host1', 'host2'])
+        hosts = rpc_interface.get_hosts(hostname__in=['host1', 'host2'])
+        self.assertEquals([host['acls'] for host in hosts],
+                          [['Everyone'], ['Everyone']])
+
+        rpc_interface.acl_groups_add_hosts(['my_acl', 'acl2'], ['host1'])
+        host = rpc_interface.get_hosts(hostname='host1')[0]
+        self.assertEquals(sorted(host['acls']), ['acl2', 'my_acl'])
+
+
     def test_job_keyvals(self):
         keyval_dict = {'mykey': 'myvalue'}
         job_id = rpc_interface.create_job(name='test', priority='Medium',
@@ -124,6 +206,13 @@ class RpcInterfaceTest(unittest.TestCase,
         entries[2].aborted = True
         entries[2].save()
 
+        self._create_job(hosts=[1], drone_set=models.DroneSet.objects.create(
+                name='drones'))
+
+        # a query each for the jobs, drone sets, dependencies, keyvals and
+        # status counts
+        self.assertEquals(len(self._assert_num_queries(
+                5, rpc_interface.get_jobs_summary)), 2)
         job_summaries = rpc_interface.get_jobs_summary(id=job.id)
         self.assertEquals(len(job_summaries), 1)
         summary = job_summaries[0]
@@ -190,6 +279,24 @@ class RpcInterfaceTest(unittest.TestCase,
                           hosts=[1, 1])
 
 
+    def test_create_job_rolled_back_on_failure(self):
+        self.god.stub_function(models.Job, 'queue')
+        models.Job.queue.expect_any_call().and_raises(
+                model_logic.ValidationError({'hosts': 'failed'}))
+        self.assertRaises(model_logic.ValidationError, self._create_job_helper,
+                          hosts=['host1'], keyvals={'key': 'value'})
+        self.assertEquals(models.Job.objects.count(), 0)
+        self.assertEquals(models.JobKeyval.objects.count(), 0)
+
+
+    def test_create_job_keyvals(self):
+        job_id = self._create_job_helper(hosts=['host1', 'host2'],
+                                         keyvals={'a': '1', 'b': '2'})
+        job = models.Job.objects.get(id=job_id)
+        self.assertEquals(job.keyval_dict(), {'a': '1', 'b': '2'})
+        self.assertEquals(job.hostqueueentry_set.count(), 2)
+
+
     def test_create_hostless_job(self):
         job_id = self._create_job_helper(hostless=True)
         job = models.Job.objects.get(pk=job_id)
@@ -200,6 +307,42 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(queue_entries[0].atomic_group, None)
 
 
+    def test_get_info_for_clone(self):
+        self.hosts[0].locked = True
+        self.hosts[0].save()
+        one_time_host = models.Host.create_one_time_host('onetime')
+        job = self._create_job(hosts=[host.id for host in self.hosts],
+                               metahosts=[self.labels[0].id])
+        job.hostqueueentry_set.create(host=one_time_host)
+
+        # the number of queries doesn't depend on the number of hosts
+        info = self._assert_num_queries(
+                14, rpc_interface.get_info_for_clone, job.id, False)
+        self._check_hostnames(info['hosts'],
+                              [host.hostname for host in self.hosts]
+                              + ['onetime'])
+        host1_info = info['hosts'][0]
+        self.assertEquals(host1_info['platform'], 'myplatform')
+        self.assertEquals(host1_info['labels'], ['label1'])
+        self.assertEquals(host1_info['other_labels'], 'label1')
+        self.assertEquals(info['meta_host_counts'], {'label1': 1})
+
+
+    def test_get_host_queue_entries(self):
+        self.hosts[0].locked = True
+        self.hosts[0].save()
+        self._create_job(hosts=[host.id for host in self.hosts],
+                         metahosts=[self.labels[0].id])
+        entries = self._assert_num_queries(
+                5, rpc_interface.get_host_queue_entries)
+        self.assertEquals(len(entries), len(self.hosts) + 1)
+        self.assertEquals(entries[0]['host']['hostname'], 'host1')
+        self.assertEquals(entries[0]['host']['locked_by'], 'autotest_system')
+        self.assertEquals(entries[0]['job']['name'], 'test')
+        self.assertEquals(entries[-1]['host'], None)
+        self.assertEquals(entries[-1]['meta_host'], 'label1')
+
+
     def _setup_special_tasks(self):
         host = self.hosts[0]
 
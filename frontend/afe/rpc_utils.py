@@ -27,15 +27,25 @@ def prepare_rows_as_nested_dicts(query, nested_dict_column_names):
     Prepare a Django query to be returned via RPC as a sequence of nested
     dictionaries.
 
-    @param query - A Django model query object with a select_related() method.
+    @param query - A Django model query object.
     @param nested_dict_column_names - A list of column/attribute names for the
             rows returned by query to expand into nested dictionaries using
             their get_object_dict() method when not None.
 
     @returns An list suitable to returned in an RPC.
     """
+    # fetch the objects of all the foreign keys, and those of the nested
+    # objects, with a query per field rather than queries per row
+    rows = list(query)
+    _populate_all_foreign_keys(query.model, rows)
+    for column in nested_dict_column_names:
+        field = query.model._meta.get_field(column)
+        nested_objects = [getattr(row, column) for row in rows
+                          if getattr(row, field.attname) is not None]
+        _populate_all_foreign_keys(field.rel.to, nested_objects)
+
     all_dicts = []
-    for row in query.select_related():
+    for row in rows:
         row_dict = row.get_object_dict()
         for column in nested_dict_column_names:
             if row_dict[column] is not None:
@@ -44,6 +54,11 @@ def prepare_rows_as_nested_dicts(query, nested_dict_column_names):
     return prepare_for_serialization(all_dicts)
 
 
+def _populate_all_foreign_keys(model, model_objects):
+    foreign_keys = [field.name for field in model._meta.fields if field.rel]
+    model.objects.populate_foreign_keys(model_objects, foreign_keys)
+
+
 def _prepare_data(data):
     """
     Recursively process data structures, performing necessary type
@@ -403,6 +418,9 @@ def get_job_info(job, preserve_metahosts=False, queue_entry_filter_data=None):
     if queue_entry_filter_data:
         queue_entries = models.HostQueueEntry.query_objects(
             queue_entry_filter_data, initial_query=queue_entries)
+    queue_entries = list(queue_entries)
+    models.HostQueueEntry.objects.populate_foreign_keys(
+            queue_entries, ('host', 'meta_host', 'atomic_group'))
 
     for queue_entry in queue_entries:
         if (queue_entry.host and (preserve_metahosts or
@@ -454,6 +472,7 @@ def check_for_duplicate_hosts(host_objects):
                  % ', '.join(duplicate_hostnames)})
 
 
+@model_logic.in_transaction
 def create_new_job(owner, options, host_objects, metahost_objects,
                    atomic_group=None):
     labels_by_name = dict((label.name, label)
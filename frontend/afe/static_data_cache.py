@@ -0,0 +1,47 @@
+"""
+Caches the part of get_static_data() read from the database -- the users,
+labels, atomic groups, tests, profilers and drone sets -- which every AFE page
+load asks for.
+
+The data is cached per process, already prepared for serialization, and
+dropped whenever the afe_static_data_generation counter (see
+models.StaticDataGeneration) changes.  Saving or deleting any of those objects
+bumps the counter.
+"""
+
+from autotest_lib.frontend.afe import models
+
+
+class StaticDataCache(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # (generation, data), replaced as a whole so that concurrent requests
+        # never see data with the wrong generation
+        self._entry = (None, None)
+
+
+    def get(self, compute_data):
+        """
+        Returns the cached data, or the data compute_data() returns if the
+        cached data is out of date.  Callers share the data, so must not
+        modify it.
+        """
+        # read the generation first, so that data computed while the objects
+        # change is stored under the older generation
+        generation = models.StaticDataGeneration.get_current()
+        cached_generation, data = self._entry
+        if data is not None and cached_generation == generation:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = compute_data()
+        self._entry = (generation, data)
+        return data
+
+
+_cache = StaticDataCache()
+
+
+def get(compute_data):
+    return _cache.get(compute_data)
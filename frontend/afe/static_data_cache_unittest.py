@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+import unittest
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend.afe import frontend_test_utils
+from autotest_lib.frontend.afe import models, rpc_interface, static_data_cache
+
+
+class StaticDataCacheTest(unittest.TestCase,
+                          frontend_test_utils.FrontendTestMixin):
+    def setUp(self):
+        self._frontend_common_setup()
+        self.god.stub_with(static_data_cache, '_cache',
+                           static_data_cache.StaticDataCache())
+
+
+    def tearDown(self):
+        self._frontend_common_teardown()
+
+
+    def _get_label_names(self):
+        return [label['name']
+                for label in rpc_interface.get_static_data()['labels']]
+
+
+    def test_cached_until_changed(self):
+        names = self._get_label_names()
+        self.assertEquals(names, self._get_label_names())
+        self.assertEquals(1, static_data_cache._cache.hits)
+
+        models.Label.objects.create(name='newlabel')
+        self.assert_('newlabel' in self._get_label_names())
+        self.assertEquals(2, static_data_cache._cache.misses)
+
+
+    def test_deletion_invalidates(self):
+        self.assert_('label1' in self._get_label_names())
+        models.Label.smart_get('label1').delete()
+        self.assert_('label1' not in self._get_label_names())
+
+        test = models.Test.objects.create(name='mytest', test_type=1,
+                                          path='mytest/control')
+        tests = rpc_interface.get_static_data()['tests']
+        self.assertEquals(['mytest'], [test_dict['name']
+                                       for test_dict in tests])
+        test.delete()
+        self.assertEquals([], rpc_interface.get_static_data()['tests'])
+
+
+    def test_cached_call_queries(self):
+        rpc_interface.get_static_data()
+        # one for the generation and one for the current user
+        self._assert_num_queries(2, rpc_interface.get_static_data)
+
+
+    def test_current_user_not_cached(self):
+        static_data = rpc_interface.get_static_data()
+        self.assertEquals('autotest_system',
+                          static_data['current_user']['login'])
+        self.assertFalse('current_user' in static_data_cache._cache.get(
+                lambda: None))
+
+
+if __name__ == '__main__':
+    unittest.main()
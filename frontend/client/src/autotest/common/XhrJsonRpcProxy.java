@@ -6,11 +6,16 @@ import com.google.gwt.http.client.RequestBuilder;
 import com.google.gwt.http.client.RequestCallback;
 import com.google.gwt.http.client.RequestException;
 import com.google.gwt.http.client.Response;
+import com.google.gwt.http.client.URL;
 import com.google.gwt.json.client.JSONException;
 import com.google.gwt.json.client.JSONObject;
 import com.google.gwt.json.client.JSONParser;
 import com.google.gwt.json.client.JSONValue;
 
+import java.util.Arrays;
+import java.util.HashSet;
+import java.util.Set;
+
 
 /**
  * JsonRpcProxy that uses XmlHttpRequests to make requests to the server.  This is the standard 
@@ -18,16 +23,30 @@ import com.google.gwt.json.client.JSONValue;
  * two simultaneous outstanding requests.
  */
 class XhrJsonRpcProxy extends JsonRpcProxy {
+    // methods called with GET requests, whose responses the server gives an ETag, so that the
+    // browser can cache them and revalidate them with If-None-Match
+    private static final Set<String> GET_METHODS =
+        new HashSet<String>(Arrays.asList("get_static_data"));
+
     protected RequestBuilder requestBuilder;
+    private String url;
     
     public XhrJsonRpcProxy(String url) {
+        this.url = url;
         requestBuilder = new RequestBuilder(RequestBuilder.POST, url);
     }
 
     @Override
     protected void sendRequest(JSONObject request, final JsonRpcCallback callback) {
+        String method = request.get("method").isString().stringValue();
         try {
-          requestBuilder.sendRequest(request.toString(), new RpcHandler(callback));
+            if (GET_METHODS.contains(method)) {
+                RequestBuilder getRequestBuilder =
+                    new RequestBuilder(RequestBuilder.GET, url + "?" + URL.encode(request.toString()));
+                getRequestBuilder.sendRequest(null, new RpcHandler(callback));
+            } else {
+                requestBuilder.sendRequest(request.toString(), new RpcHandler(callback));
+            }
         }
         catch (RequestException e) {
             notify.showError("Unable to connect to server");
@@ -0,0 +1,83 @@
+# afe_scheduler_changes is a change log read by the scheduler to keep its
+# in-memory host eligibility index up to date (see
+# scheduler/eligibility_index.py).  It is filled in by triggers; the scheduler
+# deletes rows once it has processed them.
+#
+# Creating triggers may require the SUPER privilege when binary logging is
+# enabled (see log_bin_trust_function_creators).
+
+CREATE_TABLE_SQL = """
+CREATE TABLE afe_scheduler_changes (
+    id integer NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    change_type varchar(32) NOT NULL,
+    object_id integer NOT NULL
+) ENGINE=InnoDB
+"""
+
+# (table, event, trigger body)
+_TRIGGERS = (
+    ('afe_hosts', 'INSERT', "CALL_LOG('host', NEW.id)"),
+    ('afe_hosts', 'UPDATE', "CALL_LOG('host', NEW.id)"),
+    ('afe_hosts', 'DELETE', "CALL_LOG('host', OLD.id)"),
+    ('afe_host_queue_entries', 'INSERT', """
+        CALL_LOG('queue_entry', NEW.id);
+        IF NEW.host_id IS NOT NULL THEN
+            CALL_LOG('host', NEW.host_id);
+        END IF"""),
+    ('afe_host_queue_entries', 'UPDATE', """
+        CALL_LOG('queue_entry', NEW.id);
+        IF NEW.active <> OLD.active OR NOT (NEW.host_id <=> OLD.host_id) THEN
+            IF NEW.host_id IS NOT NULL THEN
+                CALL_LOG('host', NEW.host_id);
+            END IF;
+            IF OLD.host_id IS NOT NULL THEN
+                CALL_LOG('host', OLD.host_id);
+            END IF;
+        END IF"""),
+    ('afe_host_queue_entries', 'DELETE', """
+        CALL_LOG('queue_entry', OLD.id);
+        IF OLD.host_id IS NOT NULL THEN
+            CALL_LOG('host', OLD.host_id);
+        END IF"""),
+    ('afe_hosts_labels', 'INSERT', "CALL_LOG('host_labels', NEW.host_id)"),
+    ('afe_hosts_labels', 'DELETE', "CALL_LOG('host_labels', OLD.host_id)"),
+    ('afe_acl_groups_hosts', 'INSERT', "CALL_LOG('host_acls', NEW.host_id)"),
+    ('afe_acl_groups_hosts', 'DELETE', "CALL_LOG('host_acls', OLD.host_id)"),
+    ('afe_acl_groups_users', 'INSERT', "CALL_LOG('user_acls', NEW.user_id)"),
+    ('afe_acl_groups_users', 'DELETE', "CALL_LOG('user_acls', OLD.user_id)"),
+    ('afe_labels', 'INSERT', "CALL_LOG('label', NEW.id)"),
+    ('afe_labels', 'UPDATE', "CALL_LOG('label', NEW.id)"),
+    ('afe_labels', 'DELETE', "CALL_LOG('label', OLD.id)"),
+    ('afe_jobs', 'UPDATE', "CALL_LOG('job', NEW.id)"),
+    ('afe_jobs_dependency_labels', 'INSERT', "CALL_LOG('job', NEW.job_id)"),
+    ('afe_jobs_dependency_labels', 'DELETE', "CALL_LOG('job', OLD.job_id)"),
+    ('afe_ineligible_host_queues', 'INSERT', "CALL_LOG('job', NEW.job_id)"),
+    ('afe_ineligible_host_queues', 'DELETE', "CALL_LOG('job', OLD.job_id)"),
+)
+
+_LOG_RE_SOURCE = r"CALL_LOG\('(\w+)', ([\w.]+)\)"
+_LOG_REPLACEMENT = (r"INSERT INTO afe_scheduler_changes "
+                    r"(change_type, object_id) VALUES ('\1', \2)")
+
+
+def _trigger_name(table, event):
+    return '%s_%s_change_log' % (table, event.lower())
+
+
+def migrate_up(manager):
+    import re
+    manager.execute(CREATE_TABLE_SQL)
+    for table, event, body in _TRIGGERS:
+        body = re.sub(_LOG_RE_SOURCE, _LOG_REPLACEMENT, body.strip())
+        # each trigger is a single statement, so it must not go through
+        # execute_script(), which splits on semicolons
+        manager.execute('CREATE TRIGGER %s AFTER %s ON %s FOR EACH ROW '
+                        'BEGIN %s; END' % (_trigger_name(table, event), event,
+                                           table, body))
+
+
+def migrate_down(manager):
+    for table, event, body in _TRIGGERS:
+        manager.execute('DROP TRIGGER IF EXISTS %s'
+                        % _trigger_name(table, event))
+    manager.execute('DROP TABLE IF EXISTS afe_scheduler_changes')
@@ -0,0 +1,51 @@
+# tko_test_rollup holds test counts per job, test name, kernel and status,
+# with the job, machine and kernel columns of tko_test_view_2 copied in, so
+# that spreadsheet and status count queries need neither the view's joins nor
+# a row per test.  The parser rebuilds a job's rows whenever it writes the job
+# (see tko/db.py); this fills it in for the tests already in the database.
+UP_SQL = """
+CREATE TABLE tko_test_rollup (
+  id int(10) unsigned NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  job_idx int(10) unsigned NOT NULL,
+  machine_idx int(10) unsigned NOT NULL,
+  kernel_idx int(10) unsigned NOT NULL,
+  status_idx int(10) unsigned NOT NULL,
+  test_name varchar(300) default NULL,
+  job_tag varchar(100) default NULL,
+  job_name varchar(100) default NULL,
+  job_owner varchar(80) default NULL,
+  hostname varchar(700) default NULL,
+  platform varchar(80) default NULL,
+  kernel varchar(100) default NULL,
+  status varchar(10) default NULL,
+  test_count int(10) unsigned NOT NULL,
+  max_test_idx int(10) unsigned NOT NULL,
+  KEY job_idx (job_idx),
+  KEY machine_idx (machine_idx),
+  KEY test_name (test_name),
+  KEY job_tag (job_tag),
+  KEY hostname (hostname(255)),
+  KEY kernel (kernel)
+) ENGINE=InnoDB;
+
+INSERT INTO tko_test_rollup (job_idx, machine_idx, kernel_idx, status_idx,
+                             test_name, job_tag, job_name, job_owner,
+                             hostname, platform, kernel, status, test_count,
+                             max_test_idx)
+SELECT tko_tests.job_idx, tko_jobs.machine_idx, tko_tests.kernel_idx,
+       tko_tests.status, tko_tests.test, tko_jobs.tag, tko_jobs.label,
+       tko_jobs.username, tko_machines.hostname, tko_machines.machine_group,
+       tko_kernels.printable, tko_status.word, COUNT(1),
+       MAX(tko_tests.test_idx)
+FROM tko_tests
+INNER JOIN tko_jobs ON tko_jobs.job_idx = tko_tests.job_idx
+INNER JOIN tko_machines ON tko_machines.machine_idx = tko_jobs.machine_idx
+INNER JOIN tko_kernels ON tko_kernels.kernel_idx = tko_tests.kernel_idx
+INNER JOIN tko_status ON tko_status.status_idx = tko_tests.status
+GROUP BY tko_tests.job_idx, tko_tests.test, tko_tests.kernel_idx,
+         tko_tests.status;
+"""
+
+DOWN_SQL = """
+DROP TABLE IF EXISTS tko_test_rollup;
+"""
@@ -0,0 +1,15 @@
+# tko_generation holds a single counter, bumped by the parser and the TKO RPCs
+# whenever they change test results, which tells the TKO RPC result cache
+# (see frontend/tko/query_cache.py) when its results are out of date.
+UP_SQL = """
+CREATE TABLE tko_generation (
+  id int(10) unsigned NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  generation int(10) unsigned NOT NULL default 0
+) ENGINE=InnoDB;
+
+INSERT INTO tko_generation (generation) VALUES (0);
+"""
+
+DOWN_SQL = """
+DROP TABLE IF EXISTS tko_generation;
+"""
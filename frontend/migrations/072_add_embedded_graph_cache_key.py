@@ -0,0 +1,12 @@
+# cache_key names the image in the on-disk graph cache (see
+# frontend/tko/graph_cache.py) that was last rendered for an embedded graph.
+# Graphs rendered before this migration keep being served from cached_png
+# until they are rendered again.
+UP_SQL = """
+ALTER TABLE tko_embedded_graphing_queries
+ADD COLUMN cache_key varchar(40) default NULL;
+"""
+
+DOWN_SQL = """
+ALTER TABLE tko_embedded_graphing_queries DROP COLUMN cache_key;
+"""
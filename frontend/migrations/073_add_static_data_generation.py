@@ -0,0 +1,16 @@
+# afe_static_data_generation holds a single counter, bumped whenever a user,
+# label, atomic group, test, profiler or drone set is saved or deleted, which
+# tells the get_static_data() cache (see frontend/afe/static_data_cache.py)
+# when its data is out of date.
+UP_SQL = """
+CREATE TABLE afe_static_data_generation (
+  id int(10) unsigned NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  generation int(10) unsigned NOT NULL default 0
+) ENGINE=InnoDB;
+
+INSERT INTO afe_static_data_generation (generation) VALUES (0);
+"""
+
+DOWN_SQL = """
+DROP TABLE IF EXISTS afe_static_data_generation;
+"""
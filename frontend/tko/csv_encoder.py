@@ -1,4 +1,4 @@
-import csv
+import csv, itertools, StringIO
 import django.http
 try:
     import autotest.common as common
@@ -6,7 +6,44 @@ except ImportError:
     import common
 from autotest_lib.frontend.afe import rpc_utils
 
+class _CsvIterator(object):
+    """
+    Iterates over the CSV text for rows, chunk_size rows at a time.  close(),
+    which Django calls once the response is sent, closes rows_source, the
+    iterator the rows are read from, if it can be closed.
+    """
+    def __init__(self, rows, chunk_size, rows_source=None):
+        self._rows = iter(rows)
+        self._chunk_size = chunk_size
+        self._rows_source = rows_source
+        self._buffer = StringIO.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+
+    def __iter__(self):
+        return self
+
+
+    def next(self):
+        for row in itertools.islice(self._rows, self._chunk_size):
+            self._writer.writerow(row)
+        text = self._buffer.getvalue()
+        if not text:
+            raise StopIteration
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+
+    def close(self):
+        if hasattr(self._rows_source, 'close'):
+            self._rows_source.close()
+
+
 class CsvEncoder(object):
+    # rows written to the response at a time
+    _CHUNK_SIZE = 1000
+
     def __init__(self, request, response):
         self._request = request
         self._response = response
@@ -17,12 +54,20 @@ class CsvEncoder(object):
         self._output_rows.append(row)
 
 
-    def _build_response(self):
-        response = django.http.HttpResponse(mimetype='text/csv')
+    def _build_response(self, rows=None, rows_source=None):
+        """
+        Returns a response with the CSV for rows, or for the appended output
+        rows if rows is None.  rows may be an iterator, in which case the
+        response is streamed as rows are read from it, and rows_source, the
+        iterator rows come from, is closed once the response is sent.
+        """
+        if rows is None:
+            rows = self._output_rows
+        response = django.http.HttpResponse(
+                _CsvIterator(rows, self._CHUNK_SIZE, rows_source),
+                mimetype='text/csv')
         response['Content-Disposition'] = (
             'attachment; filename=tko_query.csv')
-        writer = csv.writer(response)
-        writer.writerows(self._output_rows)
         return response
 
 
@@ -102,12 +147,20 @@ class TableCsvEncoder(CsvEncoder):
         return [row_object.get(field) for field, name in self._column_specs]
 
 
-    def _encode_table(self, row_objects):
-        self._append_output_row([column_spec[1] # header row
-                                 for column_spec in self._column_specs])
+    def _iterate_table_rows(self, row_objects):
+        yield [column_spec[1] # header row
+               for column_spec in self._column_specs]
         for row_object in row_objects:
-            self._append_output_row(self._format_row(row_object))
-        return self._build_response()
+            yield self._format_row(row_object)
+
+
+    def _encode_table(self, row_objects):
+        """
+        row_objects may be an iterator, to stream a table too big to hold in
+        memory.
+        """
+        return self._build_response(self._iterate_table_rows(row_objects),
+                                    rows_source=row_objects)
 
 
     def encode(self):
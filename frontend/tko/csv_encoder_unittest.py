@@ -59,6 +59,24 @@ class CsvEncodingTest(unittest.TestCase):
                                       'baz,asdf')
 
 
+    def test_table_encoder_streams_rows(self):
+        request = self._make_request('get_test_views', [['col1', 'Column 1']])
+        rows_read = []
+        def iterate_rows():
+            for i in xrange(5):
+                rows_read.append(i)
+                yield {'col1': i}
+
+        encoder = csv_encoder.encoder(request, iterate_rows())
+        encoder._CHUNK_SIZE = 2
+        response = encoder.encode()
+        self.assertEquals([], rows_read)
+        chunks = list(response)
+        self.assertEquals(['Column 1\r\n0\r\n', '1\r\n2\r\n', '3\r\n4\r\n'],
+                          chunks)
+        self.assertEquals(range(5), rows_read)
+
+
     def test_grouped_table_encoder(self):
         request = self._make_request('get_group_counts',
                                      [['col1', 'Column 1'],
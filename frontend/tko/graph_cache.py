@@ -0,0 +1,102 @@
+"""
+On-disk cache of rendered embedded graph images.
+
+Images are stored under a key computed from the graph's type and query
+parameters and the tko_generation counter (see models.Generation), so a graph
+is only rendered again once test results change, and embeddings of the same
+graph share one image.
+"""
+
+import errno, os, tempfile, time
+from autotest_lib.client.common_lib import global_config, utils
+from autotest_lib.frontend.tko import query_cache
+
+
+def get_cache_key(graph_type, params, generation):
+    """
+    @param graph_type: the EmbeddedGraphingQuery graph_type.
+    @param params: the unpickled EmbeddedGraphingQuery params.
+    @param generation: the data version the image is rendered from.
+    """
+    canonical_params = query_cache.canonicalize(params)
+    return utils.hash('sha1', '%s\n%r\n%d' % (graph_type, canonical_params,
+                                              generation)).hexdigest()
+
+
+class GraphCache(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.png')
+
+
+    def contains(self, key):
+        return os.path.exists(self._get_path(key))
+
+
+    def read(self, key):
+        """
+        Returns the image stored under key, or None.
+        """
+        try:
+            image_file = open(self._get_path(key), 'rb')
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            return image_file.read()
+        finally:
+            image_file.close()
+
+
+    def write(self, key, image):
+        """
+        Stores image under key.  Readers never see a partly written image.
+        """
+        path = self._get_path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                # another process may have created it
+                if e.errno != errno.EEXIST:
+                    raise
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            os.write(fd, image)
+        finally:
+            os.close(fd)
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, path)
+
+
+    def prune(self, keys_in_use, min_age_seconds):
+        """
+        Removes the images not in keys_in_use that were stored more than
+        min_age_seconds ago, and returns how many were removed.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        oldest_kept = time.time() - min_age_seconds
+        num_removed = 0
+        for subdirectory in os.listdir(self.directory):
+            subdirectory = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(subdirectory):
+                continue
+            for name in os.listdir(subdirectory):
+                key = name.split('.')[0]
+                path = os.path.join(subdirectory, name)
+                if key in keys_in_use or os.path.getmtime(path) > oldest_kept:
+                    continue
+                os.remove(path)
+                num_removed += 1
+        return num_removed
+
+
+cache = GraphCache(global_config.global_config.get_config_value(
+        'AUTOTEST_WEB', 'graph_cache_dir',
+        default=os.path.join(tempfile.gettempdir(), 'autotest_graph_cache')))
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""
+Renders the images of embedded TKO graphs in the background whenever test
+results change, so that requests for them are served from the graph cache
+instead of waiting for matplotlib.
+
+Run it alongside the web frontend:
+
+./graph_renderer.py --interval 60
+"""
+
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+import logging, optparse, sys, time
+from autotest_lib.frontend import setup_django_environment
+import django.db
+from autotest_lib.frontend.tko import graphing_utils
+from autotest_lib.client.common_lib import logging_config, logging_manager
+
+
+class GraphRendererLoggingConfig(logging_config.LoggingConfig):
+    def configure_logging(self, results_dir=None, verbose=False):
+        super(GraphRendererLoggingConfig, self).configure_logging(
+                use_console=True, verbose=verbose)
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('-i', '--interval', dest='interval', type='int',
+                      default=60,
+                      help='Seconds between checks for changed test results')
+    parser.add_option('-o', '--once', dest='once', action='store_true',
+                      default=False,
+                      help='Render the out of date graphs once and exit')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true',
+                      default=False, help='Run in verbose mode')
+    options, args = parser.parse_args(argv[1:])
+    if args:
+        parser.error('Unexpected arguments: %s' % ' '.join(args))
+
+    logging_manager.configure_logging(GraphRendererLoggingConfig(),
+                                      verbose=options.verbose)
+
+    while True:
+        num_rendered = graphing_utils.refresh_embedded_plots()
+        if num_rendered:
+            logging.info('Rendered %d embedded graphs', num_rendered)
+        if options.once:
+            return 0
+        # start the next pass in a new transaction, so it sees the results
+        # written since this one
+        django.db.connection.close()
+        time.sleep(options.interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,5 +1,5 @@
 import base64, os, tempfile, operator, pickle, datetime, django.db
-import os.path, getpass
+import os.path, getpass, logging
 from math import sqrt
 
 # When you import matplotlib, it tries to write some temp files for better
@@ -24,7 +24,7 @@ from autotest_lib.frontend.afe import readonly_connection
 from autotest_lib.frontend.afe.model_logic import ValidationError
 from simplejson import encoder
 from autotest_lib.client.common_lib import global_config
-from autotest_lib.frontend.tko import models, tko_rpc_utils
+from autotest_lib.frontend.tko import graph_cache, models, tko_rpc_utils
 
 _FIGURE_DPI = 100
 _FIGURE_WIDTH_IN = 10
@@ -812,43 +812,126 @@ def create_embedded_plot(model, update_time):
 _cache_timeout = global_config.global_config.get_config_value(
     'AUTOTEST_WEB', 'graph_cache_creation_timeout_minutes')
 
+# how long images no embedded graph uses are kept in the graph cache, so that
+# requests which looked up an image just before it was replaced can still
+# read it
+_UNUSED_IMAGE_MAX_AGE_SECONDS = 60 * 60
+
+
+def _get_cache_key(model, generation):
+    return graph_cache.get_cache_key(model.graph_type,
+                                     pickle.loads(model.params), generation)
+
+
+def render_to_cache(model, generation, now):
+    """\
+    Make sure the graph cache holds the PNG image of an EmbeddedGraphingQuery
+    at the given data generation, rendering it only if no graph with the same
+    type and parameters has been rendered at that generation, and point the
+    model at it.  The caller saves the model.
+
+    Returns the PNG image.
+    """
+    key = _get_cache_key(model, generation)
+    image = graph_cache.cache.read(key)
+    if image is None:
+        image = create_embedded_plot(model, now.ctime())
+        graph_cache.cache.write(key, image)
+    model.cache_key = key
+    model.last_updated = now
+    model.refresh_time = None
+    return image
+
+
+def _save_cache_key(model):
+    # an UPDATE rather than model.save(), which would write cached_png back
+    models.EmbeddedGraphingQuery.objects.filter(id=model.id).update(
+            cache_key=model.cache_key, last_updated=model.last_updated,
+            refresh_time=model.refresh_time)
+
+
+def _read_last_plot(model):
+    if model.cache_key:
+        image = graph_cache.cache.read(model.cache_key)
+        if image is not None:
+            return image
+    return model.cached_png or None
+
+
+def _claim_refresh(id):
+    cursor = django.db.connection.cursor()
+
+    # We want this query to update the refresh_time only once, even if
+    # multiple threads are running it at the same time. That is, only the
+    # first thread will win the race, and it will be the one to update the
+    # cached image; all other threads will show that they updated 0 rows
+    query = """
+        UPDATE tko_embedded_graphing_queries
+        SET refresh_time = NOW()
+        WHERE id = %s AND (
+            refresh_time IS NULL OR
+            refresh_time + INTERVAL %s MINUTE < NOW()
+        )
+    """
+    cursor.execute(query, (id, _cache_timeout))
+    return bool(cursor.rowcount)
+
 
 def handle_plot_request(id, max_age):
     """\
     Given the embedding id of a graph, generate a PNG of the embedded graph
     associated with that id.
 
+    Images are normally rendered ahead of time by refresh_embedded_plots()
+    (see graph_renderer.py), and an out of date image is served while a new
+    one is rendered.  The image is only rendered here if there is none yet,
+    or if the last one is older than max_age.
+
     id: id of the embedded graph
     max_age: maximum age, in minutes, that a cached version should be held
     """
     model = models.EmbeddedGraphingQuery.objects.get(id=id)
+    generation = models.Generation.get_current()
 
-    # Check if the cached image needs to be updated
+    image = graph_cache.cache.read(_get_cache_key(model, generation))
+    if image is not None:
+        return image
+
+    image = _read_last_plot(model)
     now = datetime.datetime.now()
     update_time = model.last_updated + datetime.timedelta(minutes=int(max_age))
-    if now > update_time:
-        cursor = django.db.connection.cursor()
-
-        # We want this query to update the refresh_time only once, even if
-        # multiple threads are running it at the same time. That is, only the
-        # first thread will win the race, and it will be the one to update the
-        # cached image; all other threads will show that they updated 0 rows
-        query = """
-            UPDATE embedded_graphing_queries
-            SET refresh_time = NOW()
-            WHERE id = %s AND (
-                refresh_time IS NULL OR
-                refresh_time + INTERVAL %s MINUTE < NOW()
-            )
-        """
-        cursor.execute(query, (id, _cache_timeout))
+    if image is None or (now > update_time and _claim_refresh(id)):
+        image = render_to_cache(model, generation, now)
+        _save_cache_key(model)
+    return image
 
-        # Only refresh the cached image if we were successful in updating the
-        # refresh time
-        if cursor.rowcount:
-            model.cached_png = create_embedded_plot(model, now.ctime())
-            model.last_updated = now
-            model.refresh_time = None
-            model.save()
 
-    return model.cached_png
+def refresh_embedded_plots():
+    """\
+    Render the images of all embedded graphs whose data has changed since
+    they were last rendered, so that requests for them don't have to, and
+    remove the images no graph uses any more.
+
+    Returns the number of images rendered.
+    """
+    generation = models.Generation.get_current()
+    now = datetime.datetime.now()
+    keys_in_use = set()
+    num_rendered = 0
+    for model in models.EmbeddedGraphingQuery.objects.defer('cached_png'):
+        try:
+            key = _get_cache_key(model, generation)
+            keys_in_use.add(key)
+            if model.cache_key == key and graph_cache.cache.contains(key):
+                continue
+            if not graph_cache.cache.contains(key):
+                num_rendered += 1
+            render_to_cache(model, generation, now)
+            _save_cache_key(model)
+        except Exception:
+            logging.exception('Failed to render embedded graph %s', model.id)
+            # keep serving the last image
+            keys_in_use.add(model.cache_key)
+
+    graph_cache.cache.prune(keys_in_use, _UNUSED_IMAGE_MAX_AGE_SECONDS)
+    return num_rendered
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+import os, shutil, tempfile, time, unittest
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from autotest_lib.client.common_lib.test_utils import mock
+from autotest_lib.frontend.tko import graph_cache, graphing_utils, models
+from autotest_lib.frontend.tko import rpc_interface
+
+
+_PARAMS = {'queries': {'__main__': 'SELECT 1'}, 'plot': 'Line',
+           'invert': []}
+
+
+class EmbeddedGraphCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.god = mock.mock_god()
+        setup_test_environment.set_up()
+        self.cache_dir = tempfile.mkdtemp()
+        self.god.stub_with(graph_cache, 'cache',
+                           graph_cache.GraphCache(self.cache_dir))
+        self.images = []
+        self.god.stub_with(graphing_utils, 'create_embedded_plot',
+                           self._create_embedded_plot)
+
+
+    def tearDown(self):
+        self.god.unstub_all()
+        setup_test_environment.tear_down()
+        shutil.rmtree(self.cache_dir)
+
+
+    def _create_embedded_plot(self, model, update_time):
+        image = 'png%d' % len(self.images)
+        self.images.append(image)
+        return image
+
+
+    def _embed(self, url_token, params=_PARAMS):
+        return rpc_interface.get_embedding_id(url_token, 'metrics', params)
+
+
+    def test_identical_graphs_rendered_once(self):
+        first_id = self._embed('token1')
+        second_id = self._embed('token2', dict(_PARAMS))
+        self.assertEquals(['png0'], self.images)
+        self.assertEquals('png0',
+                          graphing_utils.handle_plot_request(second_id, 60))
+
+        self._embed('token3', dict(_PARAMS, plot='Bar'))
+        self.assertEquals(['png0', 'png1'], self.images)
+
+
+    def test_requests_served_while_out_of_date(self):
+        first_id = self._embed('token1')
+        second_id = self._embed('token2', dict(_PARAMS))
+        models.Generation.bump()
+        self.assertEquals('png0',
+                          graphing_utils.handle_plot_request(first_id, 60))
+        self.assertEquals(['png0'], self.images)
+
+        self.assertEquals(1, graphing_utils.refresh_embedded_plots())
+        self.assertEquals(0, graphing_utils.refresh_embedded_plots())
+        for id in (first_id, second_id):
+            self.assertEquals('png1',
+                              graphing_utils.handle_plot_request(id, 60))
+        self.assertEquals(['png0', 'png1'], self.images)
+
+
+    def test_request_renders_missing_image(self):
+        id = self._embed('token1')
+        shutil.rmtree(self.cache_dir)
+        self.assertEquals('png1', graphing_utils.handle_plot_request(id, 60))
+        self.assertEquals('png1', graphing_utils.handle_plot_request(id, 60))
+
+
+    def test_unused_images_pruned(self):
+        self._embed('token1')
+        old_key = models.EmbeddedGraphingQuery.objects.get().cache_key
+        old_path = graph_cache.cache._get_path(old_key)
+        last_week = time.time() - 7 * 24 * 60 * 60
+        os.utime(old_path, (last_week, last_week))
+
+        models.Generation.bump()
+        graphing_utils.refresh_embedded_plots()
+        self.assertFalse(graph_cache.cache.contains(old_key))
+        new_key = models.EmbeddedGraphingQuery.objects.get().cache_key
+        self.assertEquals('png1', graph_cache.cache.read(new_key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,51 @@
 from django.db import models as dbmodels, connection
+from django.db.models.sql.datastructures import EmptyResultSet
 from django.utils import datastructures
 from autotest_lib.frontend.afe import model_logic, readonly_connection
 
 _quote_name = connection.ops.quote_name
 
+class _CursorDictIterator(object):
+    def __init__(self, cursor, field_names, chunk_size, prepare_dict=None):
+        self._cursor = cursor
+        self._field_names = field_names
+        self._chunk_size = chunk_size
+        self._prepare_dict = prepare_dict
+        self._rows = iter(())
+
+
+    def __iter__(self):
+        return self
+
+
+    def _next_row(self):
+        while True:
+            try:
+                return self._rows.next()
+            except StopIteration:
+                pass
+            if self._cursor is None:
+                raise StopIteration
+            rows = self._cursor.fetchmany(self._chunk_size)
+            if not rows:
+                self.close()
+                raise StopIteration
+            self._rows = iter(rows)
+
+
+    def next(self):
+        row_dict = dict(zip(self._field_names, self._next_row()))
+        if self._prepare_dict:
+            row_dict = self._prepare_dict(row_dict)
+        return row_dict
+
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+
 class TempManager(model_logic.ExtendedManager):
     _GROUP_COUNT_NAME = 'group_count'
 
@@ -64,6 +106,29 @@ class TempManager(model_logic.ExtendedManager):
         return row_dicts
 
 
+    def iterate_dicts(self, query, chunk_size=1000, prepare_dict=None):
+        """
+        Runs the given query on a server-side cursor and returns an iterator
+        over a dict for each row, mapping column names to values, which reads
+        chunk_size rows at a time.  Each dict is passed through prepare_dict,
+        if given.  The cursor is closed once every row is read, or when the
+        iterator's close() is called.
+        """
+        try:
+            sql, params = query.query.get_compiler(using=query.db).as_sql()
+        except EmptyResultSet:
+            return iter(())
+        cursor = readonly_connection.connection().server_side_cursor()
+        try:
+            cursor.execute(sql, params)
+            field_names = self._get_column_names(cursor)
+        except:
+            cursor.close()
+            raise
+        return _CursorDictIterator(cursor, field_names, chunk_size,
+                                   prepare_dict)
+
+
     def get_count_sql(self, query):
         """
         Get the SQL to properly select a per-group count of unique matches for
@@ -105,6 +170,31 @@ class TempManager(model_logic.ExtendedManager):
         return self._cursor_rowcount(cursor)
 
 
+class Generation(dbmodels.Model):
+    """
+    A counter bumped by everything that changes test results, including the
+    parser, so that cached query results can tell they are out of date.
+    """
+    generation = dbmodels.IntegerField(default=0)
+
+    @classmethod
+    def get_current(cls):
+        generations = list(cls.objects.values_list('generation', flat=True))
+        if not generations:
+            return 0
+        return generations[0]
+
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.update(generation=dbmodels.F('generation') + 1):
+            cls.objects.create(generation=1)
+
+
+    class Meta:
+        db_table = 'tko_generation'
+
+
 class Machine(dbmodels.Model):
     machine_idx = dbmodels.AutoField(primary_key=True)
     hostname = dbmodels.CharField(unique=True, max_length=255)
@@ -277,8 +367,12 @@ class EmbeddedGraphingQuery(dbmodels.Model, model_logic.ModelExtensions):
     # image, or NULL if no one is updating the image. This is used so that only
     # one thread is updating the cached image at a time (see
     # graphing_utils.handle_plot_request)
-    refresh_time = dbmodels.DateTimeField(editable=False)
+    refresh_time = dbmodels.DateTimeField(null=True, editable=False)
     cached_png = dbmodels.TextField(editable=False)
+    # cache_key names the last image rendered for this graph in the on-disk
+    # graph cache (see graph_cache.py), or is NULL for graphs rendered before
+    # the cache existed, whose image is in cached_png
+    cache_key = dbmodels.CharField(max_length=40, null=True, editable=False)
 
     class Meta:
         db_table = 'tko_embedded_graphing_queries'
@@ -695,3 +789,59 @@ class TestView(dbmodels.Model, model_logic.ModelExtensions):
 
     class Meta:
         db_table = 'tko_test_view_2'
+
+
+class TestRollupManager(TempManager):
+    def get_count_sql(self, query):
+        # each row stands for test_count tests.  CAST keeps the sum an
+        # integer rather than a decimal in MySQL.
+        return (self._GROUP_COUNT_NAME,
+                'CAST(SUM(%s) AS UNSIGNED)'
+                % self.get_key_on_this_table('test_count'))
+
+
+class TestRollup(dbmodels.Model, model_logic.ModelExtensions):
+    """
+    Test counts per job, test name, kernel and status, with the TestView
+    columns that depend on only those.  Rebuilt for a job by the parser
+    whenever it writes the job, and used to answer grouped TestView queries
+    that need no other columns.
+    """
+    group_fields = [
+            'test_name',
+            'status',
+            'kernel',
+            'hostname',
+            'job_tag',
+            'job_name',
+            'platform',
+            'job_owner',
+    ]
+
+    job_idx = dbmodels.IntegerField('job index')
+    machine_idx = dbmodels.IntegerField('host index')
+    kernel_idx = dbmodels.IntegerField('kernel index')
+    status_idx = dbmodels.IntegerField('status index')
+    test_name = dbmodels.CharField(blank=True, max_length=300)
+    job_tag = dbmodels.CharField(blank=True, max_length=100)
+    job_name = dbmodels.CharField(blank=True, max_length=100)
+    job_owner = dbmodels.CharField('owner', blank=True, max_length=80)
+    hostname = dbmodels.CharField(blank=True, max_length=700)
+    platform = dbmodels.CharField(blank=True, max_length=80)
+    kernel = dbmodels.CharField(blank=True, max_length=100)
+    status = dbmodels.CharField(blank=True, max_length=10)
+    test_count = dbmodels.IntegerField()
+    max_test_idx = dbmodels.IntegerField()
+
+    objects = TestRollupManager()
+
+    def save(self):
+        raise NotImplementedError('TestRollup is read-only')
+
+
+    def delete(self):
+        raise NotImplementedError('TestRollup is read-only')
+
+
+    class Meta:
+        db_table = 'tko_test_rollup'
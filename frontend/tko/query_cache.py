@@ -0,0 +1,131 @@
+"""
+Caches the results of the read-only TKO RPCs that dashboards and the TKO
+client repeat with the same arguments.
+
+Results are cached per process, keyed on the RPC name and its arguments, and
+dropped whenever the tko_generation counter (see models.Generation) changes.
+The least recently used result is evicted once the cache is full.
+"""
+
+import copy
+from autotest_lib.client.common_lib import global_config, utils
+from autotest_lib.frontend.afe import rpcserver_logging
+from autotest_lib.frontend.tko import models
+
+
+_NOT_CACHED = object()
+
+
+class QueryCache(object):
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._generation = None
+        self._results = utils.LruCache(max_size)
+
+
+    def __len__(self):
+        return len(self._results)
+
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            self._results.clear()
+            self._generation = generation
+
+
+    def get(self, key, generation):
+        """
+        Returns the result stored for key at the given generation, or
+        _NOT_CACHED.
+        """
+        self._check_generation(generation)
+        result = self._results.get(key, _NOT_CACHED)
+        if result is _NOT_CACHED:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+
+    def set(self, key, generation, result):
+        self._check_generation(generation)
+        self._results.set(key, result)
+
+
+    def get_hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return 100.0 * self.hits / lookups
+
+
+_cache = QueryCache(global_config.global_config.get_config_value(
+        'AUTOTEST_WEB', 'tko_query_cache_size', type=int, default=100))
+
+
+def canonicalize(value):
+    """
+    Turns RPC arguments into an equivalent hashable value, so that equal
+    filter_data gives equal keys whatever the order of its items.
+    """
+    if isinstance(value, dict):
+        items = [(key, canonicalize(item)) for key, item in value.iteritems()]
+        items.sort()
+        return ('dict', tuple(items))
+    if isinstance(value, (list, tuple)):
+        return tuple(canonicalize(item) for item in value)
+    hash(value) # raises TypeError for anything else we can't key on
+    return value
+
+
+def _log_lookup(name, hit):
+    if not rpcserver_logging.LOGGING_ENABLED:
+        return
+    if hit:
+        outcome = 'hit'
+    else:
+        outcome = 'miss'
+    rpcserver_logging.rpc_logger.info(
+            '%s: query cache %s (%d hits, %d misses, %.1f%% hit rate, '
+            '%d entries)' % (name, outcome, _cache.hits, _cache.misses,
+                             _cache.get_hit_rate(), len(_cache)))
+
+
+def cached(function):
+    """
+    Decorator for RPCs whose result depends only on their arguments and the
+    test results in the database.
+    """
+    def cached_function(*args, **kwargs):
+        if _cache.max_size <= 0:
+            return function(*args, **kwargs)
+        try:
+            key = (function.func_name, canonicalize(args),
+                   canonicalize(kwargs))
+        except TypeError:
+            return function(*args, **kwargs)
+
+        # read the generation first, so that results computed while the
+        # parser writes are stored under the older generation
+        generation = models.Generation.get_current()
+        result = _cache.get(key, generation)
+        _log_lookup(function.func_name, result is not _NOT_CACHED)
+        if result is _NOT_CACHED:
+            result = function(*args, **kwargs)
+            _cache.set(key, generation, result)
+        # callers such as the CSV encoders may modify what they get
+        return copy.deepcopy(result)
+
+    cached_function.func_name = function.func_name
+    cached_function.__doc__ = function.__doc__
+    return cached_function
+
+
+def invalidate():
+    """
+    Marks the cached results of all processes out of date, for RPCs that
+    change test results.
+    """
+    models.Generation.bump()
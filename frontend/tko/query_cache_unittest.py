@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+import unittest
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from autotest_lib.client.common_lib.test_utils import mock
+from autotest_lib.frontend.tko import models, query_cache, rpc_interface
+from autotest_lib.frontend.tko import rpc_interface_unittest
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = query_cache.QueryCache(2)
+
+
+    def test_least_recently_used_dropped(self):
+        self.cache.set('a', 0, 1)
+        self.cache.set('b', 0, 2)
+        self.assertEquals(1, self.cache.get('a', 0))
+        self.cache.set('c', 0, 3)
+        self.assertEquals(2, len(self.cache))
+        self.assertEquals(query_cache._NOT_CACHED, self.cache.get('b', 0))
+        self.assertEquals(3, self.cache.get('c', 0))
+        self.assertEquals((2, 1), (self.cache.hits, self.cache.misses))
+
+
+    def test_new_generation_drops_results(self):
+        self.cache.set('a', 0, 1)
+        self.assertEquals(query_cache._NOT_CACHED, self.cache.get('a', 1))
+        self.assertEquals(0, len(self.cache))
+
+
+    def test_canonicalize(self):
+        self.assertEquals(
+                query_cache.canonicalize({'a': [1, 2], 'b': {'c': 'd'}}),
+                query_cache.canonicalize({'b': {'c': 'd'}, 'a': (1, 2)}))
+        self.assertNotEquals(query_cache.canonicalize({'a': [1, 2]}),
+                             query_cache.canonicalize({'a': [2, 1]}))
+
+
+class CachedRpcTest(unittest.TestCase, rpc_interface_unittest.TkoTestMixin):
+    def setUp(self):
+        self.god = mock.mock_god()
+        setup_test_environment.set_up()
+        self._patch_sqlite_stuff()
+        rpc_interface_unittest.setup_test_view()
+        self._create_initial_data()
+        self.god.stub_with(query_cache, '_cache', query_cache.QueryCache(10))
+
+
+    def tearDown(self):
+        setup_test_environment.tear_down()
+        self.god.unstub_all()
+
+
+    def _count_views(self, **filter_data):
+        return rpc_interface.get_num_test_views(**filter_data)
+
+
+    def test_results_cached_until_generation_bumped(self):
+        self.assertEquals(2, self._count_views(job_name='myjob1'))
+        models.Test.objects.create(job=self.first_test.job, test='mytest3',
+                                   kernel=self.first_test.kernel,
+                                   status=self.first_test.status,
+                                   machine=self.first_test.machine)
+        self.assertEquals(2, self._count_views(job_name='myjob1'))
+        self.assertEquals(1, query_cache._cache.hits)
+
+        models.Generation.bump()
+        self.assertEquals(3, self._count_views(job_name='myjob1'))
+        self.assertEquals(1, query_cache._cache.hits)
+
+
+    def test_changing_rpcs_invalidate(self):
+        tests = rpc_interface.get_test_views(test_label_fields=['testlabel1'])
+        label_id = models.TestLabel.objects.get(name='testlabel1').id
+        rpc_interface.test_label_remove_tests(label_id, test_name='mytest1')
+        self.assertNotEquals(
+                tests,
+                rpc_interface.get_test_views(test_label_fields=['testlabel1']))
+        self.assertEquals(0, query_cache._cache.hits)
+
+
+    def test_callers_get_copies(self):
+        counts = rpc_interface.get_group_counts(['job_name'])
+        counts['groups'].pop()
+        self.assertEquals(
+                2, len(rpc_interface.get_group_counts(['job_name'])['groups']))
+        self.assertEquals(1, query_cache._cache.hits)
+
+
+if __name__ == '__main__':
+    unittest.main()
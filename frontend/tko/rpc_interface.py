@@ -3,19 +3,22 @@ from django.db import models as dbmodels
 from autotest_lib.frontend.afe import rpc_utils, model_logic
 from autotest_lib.frontend.afe import models as afe_models, readonly_connection
 from autotest_lib.frontend.tko import models, tko_rpc_utils, graphing_utils
-from autotest_lib.frontend.tko import preconfigs
+from autotest_lib.frontend.tko import preconfigs, query_cache
 
 # table/spreadsheet view support
 
+@query_cache.cached
 def get_test_views(**filter_data):
     return rpc_utils.prepare_for_serialization(
         models.TestView.list_objects(filter_data))
 
 
+@query_cache.cached
 def get_num_test_views(**filter_data):
     return models.TestView.query_count(filter_data)
 
 
+@query_cache.cached
 def get_group_counts(group_by, header_groups=None, fixed_headers=None,
                      extra_select_fields=None, **filter_data):
     """
@@ -40,16 +43,34 @@ def get_group_counts(group_by, header_groups=None, fixed_headers=None,
       total count in the group, plus keys for each of the extra_select_fields.
       The keys for the extra_select_fields are determined by the "AS" alias of
       the field.
+
+    Queries that only use the TestRollup fields are answered from it.
     """
-    query = models.TestView.objects.get_query_set_with_joins(filter_data)
-    # don't apply presentation yet, since we have extra selects to apply
-    query = models.TestView.query_objects(filter_data, initial_query=query,
-                                          apply_presentation=False)
-    count_alias, count_sql = models.TestView.objects.get_count_sql(query)
+    query = None
+    if (not extra_select_fields or
+            extra_select_fields == tko_rpc_utils.STATUS_FIELDS):
+        query = tko_rpc_utils.get_rollup_query(filter_data, group_by,
+                                               header_groups or [],
+                                               fixed_headers or {})
+    if query is not None:
+        model = models.TestRollup
+        if extra_select_fields:
+            extra_select_fields = tko_rpc_utils.ROLLUP_STATUS_FIELDS
+        # the spreadsheet opens the test of single test groups by test_idx
+        query = query.extra(select={
+                'test_idx': 'MAX(%s)' % models.TestRollup.objects.
+                        get_key_on_this_table('max_test_idx')})
+    else:
+        model = models.TestView
+        query = models.TestView.objects.get_query_set_with_joins(filter_data)
+        # don't apply presentation yet, since we have extra selects to apply
+        query = models.TestView.query_objects(filter_data, initial_query=query,
+                                              apply_presentation=False)
+    count_alias, count_sql = model.objects.get_count_sql(query)
     query = query.extra(select={count_alias: count_sql})
     if extra_select_fields:
         query = query.extra(select=extra_select_fields)
-    query = models.TestView.apply_presentation(query, filter_data)
+    query = model.apply_presentation(query, filter_data)
 
     group_processor = tko_rpc_utils.GroupDataProcessor(query, group_by,
                                                        header_groups or [],
@@ -58,10 +79,15 @@ def get_group_counts(group_by, header_groups=None, fixed_headers=None,
     return rpc_utils.prepare_for_serialization(group_processor.get_info_dict())
 
 
+@query_cache.cached
 def get_num_groups(group_by, **filter_data):
     """
     Gets the count of unique groups with the given grouping fields.
     """
+    query = tko_rpc_utils.get_rollup_query(filter_data, group_by)
+    if query is not None:
+        query = models.TestRollup.apply_presentation(query, filter_data)
+        return models.TestRollup.objects.get_num_groups(query, group_by)
     query = models.TestView.objects.get_query_set_with_joins(filter_data)
     query = models.TestView.query_objects(filter_data, initial_query=query)
     return models.TestView.objects.get_num_groups(query, group_by)
@@ -80,6 +106,7 @@ def get_status_counts(group_by, header_groups=[], fixed_headers={},
                             **filter_data)
 
 
+@query_cache.cached
 def get_latest_tests(group_by, header_groups=[], fixed_headers={},
                      extra_info=[], **filter_data):
     """
@@ -92,16 +119,23 @@ def get_latest_tests(group_by, header_groups=[], fixed_headers={},
                       field of the return dictionary.
     """
     # find latest test per group
-    initial_query = models.TestView.objects.get_query_set_with_joins(
-            filter_data)
-    query = models.TestView.query_objects(filter_data,
-                                          initial_query=initial_query,
-                                          apply_presentation=False)
+    query = tko_rpc_utils.get_rollup_query(filter_data, group_by,
+                                           header_groups, fixed_headers)
+    if query is not None:
+        model, test_idx_field = models.TestRollup, 'max_test_idx'
+        initial_query = models.TestView.objects.all()
+    else:
+        model, test_idx_field = models.TestView, 'test_idx'
+        initial_query = models.TestView.objects.get_query_set_with_joins(
+                filter_data)
+        query = models.TestView.query_objects(filter_data,
+                                              initial_query=initial_query,
+                                              apply_presentation=False)
     query = query.exclude(status__in=tko_rpc_utils._INVALID_STATUSES)
     query = query.extra(
             select={'latest_test_idx' : 'MAX(%s)' %
-                    models.TestView.objects.get_key_on_this_table('test_idx')})
-    query = models.TestView.apply_presentation(query, filter_data)
+                    model.objects.get_key_on_this_table(test_idx_field)})
+    query = model.apply_presentation(query, filter_data)
 
     group_processor = tko_rpc_utils.GroupDataProcessor(query, group_by,
                                                        header_groups,
@@ -177,6 +211,7 @@ def _job_keyvals_to_dict(keyvals):
     return dict((keyval.key, keyval.value) for keyval in keyvals)
 
 
+@query_cache.cached
 def get_detailed_test_views(**filter_data):
     test_views = models.TestView.list_objects(filter_data)
 
@@ -270,8 +305,8 @@ def get_embedding_id(url_token, graph_type, params):
                                              graph_type=graph_type,
                                              params=params_str,
                                              last_updated=now)
-        model.cached_png = graphing_utils.create_embedded_plot(model,
-                                                               now.ctime())
+        graphing_utils.render_to_cache(model, models.Generation.get_current(),
+                                       now)
         model.save()
 
     return model.id
@@ -290,10 +325,12 @@ def add_test_label(name, description=None):
 
 def modify_test_label(label_id, **data):
     models.TestLabel.smart_get(label_id).update_object(data)
+    query_cache.invalidate()
 
 
 def delete_test_label(label_id):
     models.TestLabel.smart_get(label_id).delete()
+    query_cache.invalidate()
 
 
 def get_test_labels(**filter_data):
@@ -310,6 +347,7 @@ def get_test_labels_for_tests(**test_filter_data):
 def test_label_add_tests(label_id, **test_filter_data):
     test_ids = models.TestView.objects.query_test_ids(test_filter_data)
     models.TestLabel.smart_get(label_id).tests.add(*test_ids)
+    query_cache.invalidate()
 
 
 def test_label_remove_tests(label_id, **test_filter_data):
@@ -324,6 +362,7 @@ def test_label_remove_tests(label_id, **test_filter_data):
     test_ids = models.TestView.objects.query_test_ids(test_filter_data)
 
     label.tests.remove(*test_ids)
+    query_cache.invalidate()
 
 
 # user-created test attributes
@@ -341,6 +380,7 @@ def set_test_attribute(attribute, value, **test_filter_data):
 
     for test in tests.itervalues():
         test.set_or_delete_attribute(attribute, value)
+    query_cache.invalidate()
 
 
 # saved queries
@@ -8,8 +8,13 @@ except ImportError:
 from autotest_lib.frontend import setup_django_environment
 from autotest_lib.frontend import setup_test_environment
 from autotest_lib.client.common_lib.test_utils import mock
+from django.core import signals
 from django.db import connection
-from autotest_lib.frontend.tko import models, rpc_interface
+from autotest_lib.frontend.afe import readonly_connection
+from autotest_lib.frontend.afe.json_rpc import serviceHandler
+from autotest_lib.frontend.tko import models, rpc_interface, tko_rpc_utils
+from autotest_lib.frontend.tko import query_cache, views
+from autotest_lib.tko import db as tko_db
 
 # this will need to be updated when the view changes for the test to be
 # consistent with reality
@@ -90,6 +95,45 @@ def fix_iteration_tables():
     cursor.execute(_CREATE_ITERATION_RESULTS)
 
 
+class FakeRequest(object):
+    method = 'POST'
+
+    def __init__(self, raw_post_data):
+        self.raw_post_data = raw_post_data
+
+
+class ClosableConnection(object):
+    """
+    Wraps the Django connection to fail on use after close(), like MySQL
+    connections do.  Django ignores close() on in-memory sqlite databases.
+    """
+    def __init__(self):
+        self.closed = False
+
+
+    def cursor(self):
+        return ClosableCursor(self, connection.cursor())
+
+
+    def close(self):
+        self.closed = True
+
+
+class ClosableCursor(object):
+    def __init__(self, db_connection, cursor):
+        self._db_connection = db_connection
+        self._cursor = cursor
+
+
+    def __getattr__(self, name):
+        assert not self._db_connection.closed, 'connection closed'
+        return getattr(self._cursor, name)
+
+
+    def close(self):
+        pass
+
+
 class TkoTestMixin(object):
     def _patch_sqlite_stuff(self):
         self.god.stub_with(models.TempManager, '_get_column_names',
@@ -207,6 +251,18 @@ class TkoTestMixin(object):
         label1.tests.add(job1_test1)
         label2.tests.add(job1_test1)
 
+        self._refresh_test_rollup()
+
+
+    def _refresh_test_rollup(self):
+        """
+        Rebuild tko_test_rollup as the parser does after writing a job.
+        """
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM tko_test_rollup')
+        for job in models.Job.objects.all():
+            cursor.execute(tko_db._TEST_ROLLUP_SQL, [job.job_idx])
+
 
     def _add_iteration_keyval(self, table, test, iteration, attribute, value):
         cursor = connection.cursor()
@@ -220,6 +276,8 @@ class RpcInterfaceTest(unittest.TestCase, TkoTestMixin):
 
         setup_test_environment.set_up()
         self._patch_sqlite_stuff()
+        # query_cache_unittest covers caching
+        self.god.stub_with(query_cache, '_cache', query_cache.QueryCache(0))
         setup_test_view()
         self._create_initial_data()
 
@@ -239,6 +297,40 @@ class RpcInterfaceTest(unittest.TestCase, TkoTestMixin):
         self.assertEquals(test['kernel'], 'mykernel1')
 
 
+    def test_iterate_test_views(self):
+        filter_data = {'test_attribute_fields': ['myattr'],
+                       'sort_by': ['-test_idx']}
+        tests = list(tko_rpc_utils.iterate_test_views(dict(filter_data),
+                                                      chunk_size=2))
+        self.assertEquals(rpc_interface.get_test_views(**filter_data), tests)
+        self.assertEquals(['kernbench', 'mytest2', 'mytest1'],
+                          [test['test_name'] for test in tests])
+        self.assertEquals([], list(tko_rpc_utils.iterate_test_views(
+                {'test_idx__in': []})))
+
+
+    def test_streamed_csv_read_after_request_finished(self):
+        read_only = readonly_connection.ReadOnlyConnection()
+        connections = []
+        def open_connection():
+            connections.append(ClosableConnection())
+            return connections[-1]
+        self.god.stub_with(read_only, '_get_readonly_connection',
+                           open_connection)
+        self.god.stub_with(readonly_connection.ReadOnlyConnection,
+                           '_the_instance', read_only)
+
+        request = {'method': 'get_test_views', 'params': [{}],
+                   'columns': [['test_name', 'Test']], 'id': 0}
+        response = views.handle_csv(
+                FakeRequest(serviceHandler.json_encoder.encode(request)))
+        # Django finishes the request before sending a streamed response
+        signals.request_finished.send(sender=None)
+        self.assertEquals('Test\r\nmytest1\r\nmytest2\r\nkernbench\r\n',
+                          response.content)
+        self.assert_(connections[0].closed)
+
+
     def test_get_detailed_test_views(self):
         test = rpc_interface.get_detailed_test_views()[0]
 
@@ -382,6 +474,87 @@ class RpcInterfaceTest(unittest.TestCase, TkoTestMixin):
         self.assertEquals(group2['extra_info'], ['2-myjobtag2'])
 
 
+    # the group dicts also hold the other columns of some row in the group,
+    # which only identify the test for single test groups
+    _GROUP_KEYS = ('id', 'header_indices', 'group_count', 'pass_count',
+                   'complete_count', 'incomplete_count', 'test_idx',
+                   'extra_info')
+
+    def _strip_groups(self, info):
+        for i, group in enumerate(info['groups']):
+            if group['group_count'] > 1:
+                del group['test_idx']
+            info['groups'][i] = dict((key, group[key])
+                                     for key in self._GROUP_KEYS
+                                     if key in group)
+        return info
+
+
+    def _check_rollup_matches_test_view(self, function, *args, **kwargs):
+        self.god.stub_with(models.TestRollup.objects, 'execute_group_query',
+                           self._fail_rollup_query)
+        self.god.stub_with(tko_rpc_utils, '_use_test_rollup', False)
+        expected = self._strip_groups(function(*args, **kwargs))
+        self.god.unstub(models.TestRollup.objects, 'execute_group_query')
+        self.god.unstub(tko_rpc_utils, '_use_test_rollup')
+
+        self.god.stub_with(models.TestView.objects, 'execute_group_query',
+                           self._fail_test_view_query)
+        self.assertEquals(expected,
+                          self._strip_groups(function(*args, **kwargs)))
+        self.god.unstub(models.TestView.objects, 'execute_group_query')
+        return expected
+
+
+    def _fail_rollup_query(self, query, group_by):
+        self.fail('TestRollup queried')
+
+
+    def _fail_test_view_query(self, query, group_by):
+        self.fail('TestView queried')
+
+
+    def test_rollup_answers_status_counts(self):
+        models.Test.objects.create(job=self.first_test.job, test='mytest1',
+                                   kernel=self.first_test.kernel,
+                                   status=self.first_test.status,
+                                   machine=self.first_test.machine)
+        self._refresh_test_rollup()
+
+        counts = self._check_rollup_matches_test_view(
+                rpc_interface.get_status_counts,
+                ['test_name', 'hostname'], header_groups=[['test_name'],
+                                                          ['hostname']],
+                extra_where='status = "GOOD" or test_name LIKE "%bench"')
+        self.assertEquals([1, 2], [group['pass_count']
+                                   for group in counts['groups']])
+        self._check_rollup_matches_test_view(
+                rpc_interface.get_group_counts, ['job_name', 'kernel'],
+                job_tag__startswith='1-', sort_by=['-group_count'])
+        self._check_rollup_matches_test_view(
+                rpc_interface.get_latest_tests, ['test_name'],
+                extra_info=['job_tag', 'reason'])
+        self.assertEquals(rpc_interface.get_num_groups(['test_name']), 3)
+
+
+    def test_test_view_answers_other_queries(self):
+        self.god.stub_with(models.TestRollup.objects, 'execute_group_query',
+                           self._fail_rollup_query)
+        self.god.stub_with(models.TestRollup.objects, 'get_num_groups',
+                           self._fail_rollup_query)
+        rpc_interface.get_status_counts(['DATE(test_finished_time)'])
+        rpc_interface.get_status_counts(['test_name'], reason='')
+        rpc_interface.get_status_counts(['test_name'],
+                                        extra_where='reason = "x"')
+        rpc_interface.get_status_counts(['test_name'],
+                                        include_labels=['testlabel1'])
+        rpc_interface.get_group_counts(['test_name'],
+                                       extra_select_fields={'extra': 'subdir'})
+        rpc_interface.get_latest_tests(['test_name'],
+                                       test_label_fields=['testlabel1'])
+        rpc_interface.get_num_groups(['subdir'])
+
+
     def test_get_job_ids(self):
         self.assertEquals([1,2], rpc_interface.get_job_ids())
         self.assertEquals([1], rpc_interface.get_job_ids(test_name='mytest2'))
@@ -1,5 +1,6 @@
+import itertools, re
 from autotest_lib.frontend.afe import rpc_utils
-from autotest_lib.client.common_lib import kernel_versions
+from autotest_lib.client.common_lib import global_config, kernel_versions
 from autotest_lib.frontend.tko import models
 
 class TooManyRowsError(Exception):
@@ -59,6 +60,36 @@ STATUS_FIELDS = {_PASS_COUNT_NAME : _PASS_COUNT_SQL,
                  _INCOMPLETE_COUNT_NAME : _INCOMPLETE_COUNT_SQL}
 _INVALID_STATUSES = ('TEST_NA', 'NOSTATUS')
 
+# the same counts over TestRollup, where each row stands for test_count tests
+ROLLUP_STATUS_FIELDS = {
+        _PASS_COUNT_NAME :
+                'CAST(SUM(IF(status="GOOD", test_count, 0)) AS UNSIGNED)',
+        _COMPLETE_COUNT_NAME :
+                'CAST(SUM(IF(status NOT IN ("TEST_NA", "RUNNING", '
+                '"NOSTATUS"), test_count, 0)) AS UNSIGNED)',
+        _INCOMPLETE_COUNT_NAME :
+                'CAST(SUM(IF(status="RUNNING", test_count, 0)) AS UNSIGNED)'}
+
+_use_test_rollup = global_config.global_config.get_config_value(
+        'AUTOTEST_WEB', 'tko_use_test_rollup', type=bool, default=True)
+
+# filter_data keys that make a query need more than TestRollup has
+_ROLLUP_JOIN_PARAMS = ('test_attribute_fields', 'test_label_fields',
+                       'machine_label_fields', 'iteration_result_fields',
+                       'job_keyval_fields', 'iteration_attribute_fields',
+                       'include_labels', 'exclude_labels',
+                       'include_attributes_where', 'exclude_attributes_where',
+                       'extra_args')
+_ROLLUP_COLUMNS = frozenset(models.TestRollup.group_fields +
+                            ['job_idx', 'machine_idx', 'kernel_idx',
+                             'status_idx'])
+# words allowed in an extra_where answered from TestRollup besides its columns
+_SQL_WORDS = frozenset(['and', 'or', 'not', 'in', 'is', 'null', 'like',
+                        'regexp', 'rlike', 'between', 'escape', 'binary',
+                        'true', 'false', 'lower', 'upper'])
+_SQL_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"|' r"'(?:[^'\\]|\\.)*'")
+_SQL_NAME_RE = re.compile(r'\b[a-z_][\w.]*', re.IGNORECASE)
+
 
 def add_status_counts(group_dict, status):
     pass_count = complete_count = incomplete_count = 0
@@ -74,6 +105,71 @@ def add_status_counts(group_dict, status):
     group_dict[models.TestView.objects._GROUP_COUNT_NAME] = 1
 
 
+def _uses_only_rollup_columns(sql):
+    sql = _SQL_STRING_RE.sub('', sql)
+    for name in _SQL_NAME_RE.findall(sql):
+        name = name.lower()
+        if name not in _ROLLUP_COLUMNS and name not in _SQL_WORDS:
+            return False
+    return True
+
+
+def get_rollup_query(filter_data, group_by, header_groups=(),
+                     fixed_headers={}):
+    """
+    Returns a TestRollup query for the tests matching filter_data, for
+    grouping by the given fields, or None if TestRollup can't answer the
+    query and TestView must be used instead.  Sorting and paging are not
+    applied.
+    """
+    if not _use_test_rollup:
+        return None
+    fields = itertools.chain(group_by, itertools.chain(*header_groups),
+                             fixed_headers)
+    if not _ROLLUP_COLUMNS.issuperset(fields):
+        return None
+
+    for key, value in filter_data.iteritems():
+        if key in _ROLLUP_JOIN_PARAMS:
+            if value:
+                return None
+        elif key not in models.TestRollup._SPECIAL_FILTER_KEYS:
+            if key.split('__')[0] not in _ROLLUP_COLUMNS:
+                return None
+
+    extra_where = filter_data.get('extra_where')
+    if extra_where and not _uses_only_rollup_columns(extra_where):
+        return None
+
+    sort_fields = _ROLLUP_COLUMNS.union(STATUS_FIELDS,
+                                        [models.TempManager._GROUP_COUNT_NAME])
+    for field in filter_data.get('sort_by') or ():
+        if field.lstrip('-') not in sort_fields:
+            return None
+
+    rollup_filter_data = dict(filter_data, no_distinct=True)
+    for key in _ROLLUP_JOIN_PARAMS:
+        rollup_filter_data.pop(key, None)
+    return models.TestRollup.query_objects(rollup_filter_data,
+                                           apply_presentation=False)
+
+
+def iterate_test_views(filter_data, chunk_size=1000):
+    """
+    Like the get_test_views RPC, but returns an iterator over the test dicts,
+    read from the database as they are needed instead of building a list of
+    all of them.  Closing the iterator closes its database cursor.
+    """
+    query = models.TestView.query_objects(filter_data)
+    return models.TestView.objects.iterate_dicts(query, chunk_size,
+                                                 _prepare_test_view)
+
+
+def _prepare_test_view(test_dict):
+    models.TestView.clean_object_dicts([test_dict])
+    return rpc_utils.prepare_for_serialization(test_dict)
+
+
 def _construct_machine_label_header_sql(machine_labels):
     """
     Example result for machine_labels=['Index', 'Diskful']:
@@ -123,7 +219,7 @@ class GroupDataProcessor(object):
 
     def _fetch_data(self):
         self._restrict_header_values()
-        self._group_dicts = models.TestView.objects.execute_group_query(
+        self._group_dicts = self._query.model.objects.execute_group_query(
             self._query, self._group_by)
 
 
@@ -1,6 +1,6 @@
 import django.http
 from autotest_lib.frontend.tko import rpc_interface, graphing_utils
-from autotest_lib.frontend.tko import csv_encoder
+from autotest_lib.frontend.tko import csv_encoder, tko_rpc_utils
 from autotest_lib.frontend.afe import rpc_handler, rpc_utils
 
 rpc_handler_obj = rpc_handler.RpcHandler((rpc_interface,),
@@ -14,10 +14,21 @@ def handle_jsonp_rpc(request):
     return rpc_handler_obj.handle_jsonp_rpc_request(request)
 
 
+# RPCs whose CSV export is streamed from the database, mapped to functions
+# taking the RPC's filter_data and returning an iterator over its results
+_STREAMED_CSV_METHODS = {
+    'get_test_views': tko_rpc_utils.iterate_test_views,
+}
+
 def handle_csv(request):
     request_data = rpc_handler_obj.raw_request_data(request)
     decoded_request = rpc_handler_obj.decode_request(request_data)
-    result = rpc_handler_obj.dispatch_request(decoded_request)['result']
+    method = decoded_request['method']
+    if method in _STREAMED_CSV_METHODS:
+        filter_data = dict(decoded_request['params'][-1])
+        result = _STREAMED_CSV_METHODS[method](filter_data)
+    else:
+        result = rpc_handler_obj.dispatch_request(decoded_request)['result']
     encoder = csv_encoder.encoder(decoded_request, result)
     return encoder.encode()
 
@@ -0,0 +1,160 @@
+"""
+Admission order for agents waiting to be started by the dispatcher.
+
+On every tick the dispatcher starts as many waiting agents as the process
+limits allow.  Walking the list of all agents to find them costs time
+proportional to the number of agents, even though only a handful can start,
+and starts them in creation order regardless of job priority or of how many
+processes their owner already has running.
+
+AgentQueue keeps the waiting agents in a priority queue per user, ordered by
+job priority and then age, and picks the next agent across users by fair
+share, so admission only ever looks at the agents it actually starts (plus
+the one that hits a limit).
+"""
+
+import collections, heapq, itertools
+from autotest_lib.frontend.afe import models
+
+
+# priority of agents whose tasks don't work for a job
+DEFAULT_PRIORITY = models.Job.Priority.MEDIUM
+
+
+def get_priority(agent):
+    return getattr(agent.task, 'priority', DEFAULT_PRIORITY)
+
+
+class AgentQueue(object):
+    """
+    Agents waiting to be started, in the order they should be started.
+
+    Zero-process agents are never throttled, so they come first, oldest
+    first.  The other agents are ordered by priority (highest first) and then
+    age within each user.  Across users the next agent is the highest priority
+    one at the head of any user's queue; ties go to the user with the fewest
+    processes running for agents started through this queue, then to the
+    oldest agent.
+    """
+    def __init__(self):
+        self._sequence = itertools.count()
+        self._zero_process_agents = collections.deque()
+        # maps username to a heap of (-priority, sequence, agent)
+        self._user_queues = {}
+        # agents still waiting; removed agents are dropped from the deque and
+        # heaps lazily, when they reach the head
+        self._waiting = set()
+        # maps username to the processes of its started, unfinished agents,
+        # and started agents to the (username, processes) counted for them
+        self._user_processes = {}
+        self._started = {}
+
+
+    def __len__(self):
+        return len(self._waiting)
+
+
+    def __contains__(self, agent):
+        return agent in self._waiting
+
+
+    def get_agents(self):
+        """
+        @returns A list of the waiting agents, in no particular order.
+        """
+        return list(self._waiting)
+
+
+    def add(self, agent):
+        assert agent not in self._waiting
+        self._waiting.add(agent)
+        if agent.task.num_processes == 0:
+            self._zero_process_agents.append(agent)
+            return
+        user_queue = self._user_queues.setdefault(agent.task.owner_username,
+                                                  [])
+        heapq.heappush(user_queue, (-get_priority(agent),
+                                    self._sequence.next(), agent))
+
+
+    def remove(self, agent):
+        """
+        Forget a waiting or started agent.
+        """
+        if agent in self._waiting:
+            self._waiting.remove(agent)
+            return
+        if agent in self._started:
+            username, num_processes = self._started.pop(agent)
+            self._user_processes[username] -= num_processes
+            if not self._user_processes[username]:
+                del self._user_processes[username]
+
+
+    def _get_zero_process_head(self):
+        while (self._zero_process_agents and
+               self._zero_process_agents[0] not in self._waiting):
+            self._zero_process_agents.popleft()
+        if self._zero_process_agents:
+            return self._zero_process_agents[0]
+        return None
+
+
+    def _get_user_head(self, username):
+        user_queue = self._user_queues[username]
+        while user_queue and user_queue[0][2] not in self._waiting:
+            heapq.heappop(user_queue)
+        if not user_queue:
+            del self._user_queues[username]
+            return None
+        return user_queue[0]
+
+
+    def _next_username(self):
+        best_key, best_username = None, None
+        for username in self._user_queues.keys():
+            head = self._get_user_head(username)
+            if head is None:
+                continue
+            negative_priority, sequence, _ = head
+            key = (negative_priority, self._user_processes.get(username, 0),
+                   sequence)
+            if best_key is None or key < best_key:
+                best_key, best_username = key, username
+        return best_username
+
+
+    def peek(self):
+        """
+        @returns The next agent to start, or None if no agents are waiting.
+        """
+        agent = self._get_zero_process_head()
+        if agent is not None:
+            return agent
+        username = self._next_username()
+        if username is None:
+            return None
+        return self._user_queues[username][0][2]
+
+
+    def pop(self):
+        """
+        Take the next agent off the queue because it's being started.  Its
+        processes count towards its user's share until it's removed.
+
+        @returns The agent, as returned by peek().
+        """
+        if self._get_zero_process_head() is not None:
+            agent = self._zero_process_agents.popleft()
+            self._waiting.remove(agent)
+            return agent
+
+        username = self._next_username()
+        assert username is not None, 'No agents waiting'
+        _, _, agent = heapq.heappop(self._user_queues[username])
+        self._waiting.remove(agent)
+        num_processes = agent.task.num_processes
+        self._started[agent] = (username, num_processes)
+        self._user_processes[username] = (
+                self._user_processes.get(username, 0) + num_processes)
+        return agent
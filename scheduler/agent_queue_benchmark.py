@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+"""
+Simulation benchmark for starting agents in Dispatcher._handle_agents().
+
+Queues a number of agents, owned by several users and with random job
+priorities and process counts, against a set of simulated drones.  Every tick
+the running agents make progress and finish after a few ticks, and waiting
+agents are admitted as capacity allows.  The time per tick is reported for the
+dispatcher's agent queue and for the previous algorithm, which scanned the
+whole agent list and filtered all drones for every agent it considered
+(reimplemented here for comparison).
+"""
+
+import optparse, random, time
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from autotest_lib.frontend.afe import models
+from autotest_lib.scheduler import drone_manager, monitor_db
+from autotest_lib.scheduler import scheduler_config
+
+
+class SimulatedDrone(object):
+    def __init__(self, hostname, max_processes):
+        self.hostname = hostname
+        self.max_processes = max_processes
+        self.active_processes = 0
+
+
+    def usable_by(self, user):
+        return True
+
+
+class SimulatedDroneManager(object):
+    def __init__(self, num_drones, max_processes_per_drone):
+        self.drones = [SimulatedDrone('drone%d' % i, max_processes_per_drone)
+                       for i in xrange(num_drones)]
+
+
+    def get_capacity_view(self):
+        return drone_manager.DroneCapacityView(self.drones)
+
+
+    def max_runnable_processes(self, username, drone_hostnames_allowed):
+        # what DroneManager.max_runnable_processes() did for every agent
+        usable_drones = [drone for drone in self.drones
+                         if drone.usable_by(username) and
+                         (drone_hostnames_allowed is None or
+                          drone.hostname in drone_hostnames_allowed)]
+        return max([0] + [drone.max_processes - drone.active_processes
+                          for drone in usable_drones])
+
+
+    def total_running_processes(self):
+        return sum(drone.active_processes for drone in self.drones)
+
+
+    def start_processes(self, num_processes):
+        drone = min(self.drones, key=lambda drone: drone.active_processes)
+        drone.active_processes += num_processes
+        return drone
+
+
+class SimulatedTask(object):
+    """
+    A task whose process runs on a simulated drone for a number of ticks.
+    """
+    aborted = False
+    success = True
+    queue_entry_ids = ()
+    host_ids = ()
+
+    def __init__(self, manager, owner_username, priority, num_processes,
+                 num_ticks):
+        self._manager = manager
+        self.owner_username = owner_username
+        self.priority = priority
+        self.num_processes = num_processes
+        self._ticks_left = num_ticks
+        self._drone = None
+        self._done = False
+
+
+    def get_drone_hostnames_allowed(self):
+        return None
+
+
+    def poll(self):
+        if self._drone is None:
+            self._drone = self._manager.start_processes(self.num_processes)
+        self._ticks_left -= 1
+        if self._ticks_left <= 0:
+            self._drone.active_processes -= self.num_processes
+            self._done = True
+
+
+    def is_done(self):
+        return self._done
+
+
+    def abort(self):
+        pass
+
+
+def _linear_handle_agents(dispatcher, agents, manager):
+    """
+    The previous Dispatcher._handle_agents(), for a plain list of agents.
+    """
+    num_started_this_cycle = 0
+    have_reached_limit = False
+    for agent in list(agents):
+        if not agent.started:
+            task = agent.task
+            if task.num_processes > 0:
+                can_start = not have_reached_limit and (
+                        task.num_processes <= manager.max_runnable_processes(
+                                task.owner_username,
+                                task.get_drone_hostnames_allowed()))
+                if can_start and num_started_this_cycle:
+                    can_start = (
+                            num_started_this_cycle + task.num_processes <=
+                            scheduler_config.config.
+                            max_processes_started_per_cycle)
+                if not can_start:
+                    have_reached_limit = True
+                    continue
+            num_started_this_cycle += task.num_processes
+        agent.tick()
+        if agent.is_done():
+            agents.remove(agent)
+
+
+def _make_tasks(manager, options):
+    random.seed(options.seed)
+    return [SimulatedTask(manager, 'user%d' % random.randint(1, options.users),
+                          random.randint(models.Job.Priority.LOW,
+                                         models.Job.Priority.URGENT),
+                          random.randint(1, 3), random.randint(1, 20))
+            for _ in xrange(options.agents)]
+
+
+def _time_ticks(handle_agents, options):
+    durations = []
+    for _ in xrange(options.ticks):
+        start_time = time.time()
+        handle_agents()
+        durations.append(time.time() - start_time)
+    return durations
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-a', '--agents', type='int', default=10000,
+                      help='number of waiting agents')
+    parser.add_option('-u', '--users', type='int', default=20,
+                      help='number of users owning the agents')
+    parser.add_option('-d', '--drones', type='int', default=10,
+                      help='number of drones')
+    parser.add_option('-p', '--max-processes', type='int', default=100,
+                      help='maximum processes per drone')
+    parser.add_option('-s', '--max-started', type='int', default=50,
+                      help='maximum processes started per tick')
+    parser.add_option('-t', '--ticks', type='int', default=50,
+                      help='number of ticks to time')
+    parser.add_option('--seed', type='int', default=0,
+                      help='random seed')
+    options, args = parser.parse_args()
+
+    scheduler_config.config.max_processes_started_per_cycle = (
+            options.max_started)
+
+    for mode in ('linear', 'queue'):
+        manager = SimulatedDroneManager(options.drones, options.max_processes)
+        monitor_db._drone_manager = manager
+        dispatcher = monitor_db.Dispatcher()
+        agents = [monitor_db.Agent(task)
+                  for task in _make_tasks(manager, options)]
+        if mode == 'queue':
+            for agent in agents:
+                dispatcher._agent_queue.add(agent)
+            handle_agents = dispatcher._handle_agents
+        else:
+            handle_agents = lambda: _linear_handle_agents(dispatcher, agents,
+                                                          manager)
+
+        durations = _time_ticks(handle_agents, options)
+        print ('%-6s %d agents: avg tick %.4fs, max tick %.4fs, '
+               '%d processes running'
+               % (mode, options.agents, sum(durations) / len(durations),
+                  max(durations), manager.total_running_processes()))
+
+
+if __name__ == '__main__':
+    main()
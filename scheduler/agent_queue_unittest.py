@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from autotest_lib.client.common_lib.test_utils import unittest
+from autotest_lib.scheduler import agent_queue
+
+
+class MockTask(object):
+    def __init__(self, owner_username, priority, num_processes):
+        self.owner_username = owner_username
+        self.priority = priority
+        self.num_processes = num_processes
+
+
+class MockAgent(object):
+    def __init__(self, name, owner_username='user', priority=1,
+                 num_processes=1):
+        self.name = name
+        self.task = MockTask(owner_username, priority, num_processes)
+
+
+    def __repr__(self):
+        return self.name
+
+
+class AgentQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = agent_queue.AgentQueue()
+
+
+    def _add(self, *args, **kwargs):
+        agent = MockAgent(*args, **kwargs)
+        self.queue.add(agent)
+        return agent
+
+
+    def _pop_all(self):
+        agents = []
+        while self.queue.peek() is not None:
+            agent = self.queue.peek()
+            self.assertEquals(agent, self.queue.pop())
+            agents.append(agent.name)
+        return agents
+
+
+    def test_priority_then_age(self):
+        self._add('low', priority=0)
+        self._add('first', priority=2)
+        self._add('second', priority=2)
+        self._add('zero', priority=0, num_processes=0)
+        self.assertEquals(4, len(self.queue))
+        self.assertEquals(['zero', 'first', 'second', 'low'], self._pop_all())
+        self.assertEquals(0, len(self.queue))
+
+
+    def test_fair_share(self):
+        for i in xrange(3):
+            self._add('busy%d' % i, owner_username='busy')
+        self._add('idle0', owner_username='idle', num_processes=2)
+        self._add('idle1', owner_username='idle')
+        self._add('urgent', owner_username='busy', priority=3)
+        # ties in priority go to the user with fewer running processes
+        self.assertEquals(['urgent', 'idle0', 'busy0', 'busy1', 'idle1',
+                           'busy2'], self._pop_all())
+
+
+    def test_finished_agents_release_share(self):
+        busy = self._add('busy', owner_username='busy', num_processes=3)
+        self.assertEquals(busy, self.queue.pop())
+        self._add('busy_next', owner_username='busy')
+        self._add('other', owner_username='other')
+        self.assertEquals('other', self.queue.peek().name)
+
+        self.queue.remove(busy)
+        self.assertEquals('busy_next', self.queue.peek().name)
+
+
+    def test_remove_waiting(self):
+        first = self._add('first')
+        self._add('second')
+        zero = self._add('zero', num_processes=0)
+        self.queue.remove(first)
+        self.queue.remove(zero)
+        self.assertFalse(first in self.queue)
+        self.assertEquals(1, len(self.queue))
+        self.assertEquals(['second'], self._pop_all())
+
+
+    def test_default_priority(self):
+        agent = MockAgent('agent')
+        del agent.task.priority
+        self.assertEquals(agent_queue.DEFAULT_PRIORITY,
+                          agent_queue.get_priority(agent))
+
+
+if __name__ == '__main__':
+    unittest.main()
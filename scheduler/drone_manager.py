@@ -1,4 +1,5 @@
 import os, re, shutil, signal, subprocess, errno, time, heapq, traceback
+import sys, threading
 try:
     import autotest.common as common
 except ImportError:
@@ -82,6 +83,12 @@ class PidfileId(CustomEquals):
 class _PidfileInfo(object):
     age = 0
     num_processes = None
+    # hostname of the drone the pidfile is on, None until that is known
+    hostname = None
+    # (first read, second read) raw contents from the last refresh
+    raw_contents = None
+    # (hostname, num_processes) counted towards that drone's active processes
+    counted_processes = None
 
 
 class PidfileContents(object):
@@ -128,6 +135,68 @@ class _DroneHeapWrapper(object):
         return cmp(self.drone.used_capacity(), other.drone.used_capacity())
 
 
+class DroneCapacityView(object):
+    """
+    The drones usable by each user and drone set, for admission checks.
+
+    DroneManager.max_runnable_processes() filters the whole drone queue on
+    every call.  A view is taken once per scheduler tick and remembers the
+    usable drones for each (user, allowed drones) combination it is asked
+    about.  Process counts are read from the drones themselves, so processes
+    started while the view is in use are taken into account.
+    """
+    def __init__(self, drones):
+        self._drones = list(drones)
+        self._usable_drones = {}
+
+
+    def _get_usable_drones(self, username, drone_hostnames_allowed):
+        if drone_hostnames_allowed is not None:
+            drone_hostnames_allowed = frozenset(drone_hostnames_allowed)
+        key = (username, drone_hostnames_allowed)
+        if key not in self._usable_drones:
+            self._usable_drones[key] = [
+                    drone for drone in self._drones
+                    if drone.usable_by(username) and
+                    (drone_hostnames_allowed is None or
+                     drone.hostname in drone_hostnames_allowed)]
+        return self._usable_drones[key]
+
+
+    def max_runnable_processes(self, username, drone_hostnames_allowed):
+        """
+        @see DroneManager.max_runnable_processes()
+        """
+        usable_drones = self._get_usable_drones(username,
+                                                drone_hostnames_allowed)
+        # all drones disabled or inaccessible if there are none
+        return max([0] + [drone.max_processes - drone.active_processes
+                          for drone in usable_drones])
+
+
+class _DroneCallThread(threading.Thread):
+    """Runs a single drone operation in the background.
+
+    Used by the DroneManager concurrent mode to talk to all drones at once.
+    The thread is a daemon so a hung drone can never prevent the scheduler
+    from exiting.
+    """
+    def __init__(self, drone, function):
+        threading.Thread.__init__(self, name='drone-call-%s' % drone.hostname)
+        self.setDaemon(True)
+        self.drone = drone
+        self._function = function
+        self.result = None
+        self.exc_info = None
+
+
+    def run(self):
+        try:
+            self.result = self._function(self.drone)
+        except Exception:
+            self.exc_info = sys.exc_info()
+
+
 class DroneManager(object):
     """
     This class acts as an interface from the scheduler to drones, whether it be
@@ -147,6 +216,14 @@ class DroneManager(object):
         self._pidfiles_second_read = {}
         # maps PidfileId to _PidfileInfo
         self._registered_pidfile_info = {}
+        # maps drone hostname to the set of registered PidfileIds on that
+        # drone; pidfiles not yet known to be on any drone are under None
+        self._pidfiles_by_drone = {None: set()}
+        # maps drone hostname to the number of processes of running pidfiles
+        self._active_processes = {}
+        # PidfileIds unregistered since the last refresh, whose contents are
+        # forgotten at the next refresh
+        self._unregistered_pidfiles = set()
         # used to generate unique temporary paths
         self._temporary_path_counter = 0
         # maps hostname to Drone object
@@ -156,6 +233,20 @@ class DroneManager(object):
         self._attached_files = {}
         # heapq of _DroneHeapWrappers
         self._drone_queue = []
+        # maps hostname to the _DroneCallThread of a drone that missed its
+        # deadline; the drone is considered unhealthy until the thread exits
+        self._unhealthy_drone_threads = {}
+        # maps hostname to the last results list received from refresh()
+        self._last_refresh_results = {}
+        # maps hostname to the number of file transfers waiting or running
+        # on that drone, as of the last refresh()
+        self._pending_transfers = {}
+        # maps the full destination path of each file transfer to the results
+        # repository not yet known to be over to the drone running it
+        self._results_transfers = {}
+        # maps drone to the destinations in _results_transfers whose queued
+        # call has not been sent to that drone yet
+        self._unsent_results_transfers = {}
 
 
     def initialize(self, base_results_dir, drone_hostnames,
@@ -205,6 +296,28 @@ class DroneManager(object):
         return pidfile_timeout
 
 
+    def _use_concurrent_drone_calls(self):
+        """
+        @returns: True if drones should be refreshed and flushed in parallel.
+        """
+        return global_config.global_config.get_config_value(
+                scheduler_config.CONFIG_SECTION, 'concurrent_drone_calls',
+                type=bool, default=False)
+
+
+    def _get_drone_call_timeout(self):
+        """
+        Only used in concurrent mode.
+
+        @returns: The number of seconds to wait for all drones to answer a
+                single refresh() or execute_actions() before marking the
+                stragglers unhealthy.
+        """
+        return global_config.global_config.get_config_value(
+                scheduler_config.CONFIG_SECTION, 'drone_call_timeout_secs',
+                type=int, default=60)
+
+
     def _add_drone(self, hostname):
         logging.info('Adding drone %s' % hostname)
         drone = drones.get_drone(hostname)
@@ -214,7 +327,13 @@ class DroneManager(object):
 
 
     def _remove_drone(self, hostname):
-        self._drones.pop(hostname, None)
+        drone = self._drones.pop(hostname, None)
+        if drone is not None:
+            # its transfers won't be reported anymore
+            self._forget_results_transfers(drone)
+        # look for its pidfiles on all drones again
+        for pidfile_id in list(self._pidfiles_by_drone.get(hostname, ())):
+            self._assign_pidfile_to_drone(pidfile_id, None)
 
 
     def refresh_drone_configs(self):
@@ -268,15 +387,105 @@ class DroneManager(object):
 
     def _reset(self):
         self._process_set = set()
-        self._pidfiles = {}
-        self._pidfiles_second_read = {}
         self._drone_queue = []
 
 
-    def _call_all_drones(self, method, *args, **kwargs):
+    def _forget_unregistered_pidfiles(self):
+        for pidfile_id in self._unregistered_pidfiles:
+            if pidfile_id not in self._registered_pidfile_info:
+                self._pidfiles.pop(pidfile_id, None)
+                self._pidfiles_second_read.pop(pidfile_id, None)
+        self._unregistered_pidfiles = set()
+
+
+    def _call_drones(self, function):
+        """
+        Run function(drone) for every drone.
+
+        @returns: A dict mapping drones to function results.  In concurrent
+                mode, drones that did not answer in time are left out.
+        """
+        if self._use_concurrent_drone_calls():
+            return self._run_on_drones_concurrently(self.get_drones(),
+                                                    function)
+
         all_results = {}
         for drone in self.get_drones():
-            all_results[drone] = drone.call(method, *args, **kwargs)
+            all_results[drone] = function(drone)
+        return all_results
+
+
+    def _call_all_drones(self, method, *args, **kwargs):
+        """
+        Call the given method on every drone.
+
+        @returns: A dict mapping drones to their results.  In concurrent mode,
+                drones that did not answer in time are left out.
+        """
+        return self._call_drones(
+                lambda drone: drone.call(method, *args, **kwargs))
+
+
+    def is_drone_healthy(self, drone):
+        """
+        Check whether the drone answered its last concurrent call in time.
+        A drone stays unhealthy until the overdue call finally returns.
+        """
+        thread = self._unhealthy_drone_threads.get(drone.hostname)
+        if thread is None:
+            return True
+        if thread.isAlive():
+            return False
+        logging.info('Drone %s finished its overdue call, marking healthy',
+                     drone.hostname)
+        self._unhealthy_drone_threads.pop(drone.hostname, None)
+        return True
+
+
+    def _mark_drone_unhealthy(self, thread, timeout):
+        hostname = thread.drone.hostname
+        self._unhealthy_drone_threads[hostname] = thread
+        subject = 'Drone %s timed out' % hostname
+        message = ('Drone %s did not answer within %d seconds; it will not be '
+                   'used until its pending call returns.' % (hostname, timeout))
+        logging.error(message)
+        email_manager.manager.enqueue_notify_email(subject, message)
+
+
+    def _run_on_drones_concurrently(self, drones, function):
+        """
+        Run function(drone) for each healthy drone in its own thread, waiting
+        at most the configured drone call timeout for all of them.  Drones
+        that miss the deadline are marked unhealthy and left out of the
+        results.  If any call raised, the first exception is re-raised once
+        all threads have been waited for.
+
+        @returns: A dict mapping drones to function results.
+        """
+        threads = []
+        for drone in drones:
+            if not self.is_drone_healthy(drone):
+                logging.warning('Skipping unhealthy drone %s', drone.hostname)
+                continue
+            thread = _DroneCallThread(drone, function)
+            thread.start()
+            threads.append(thread)
+
+        timeout = self._get_drone_call_timeout()
+        deadline = time.time() + timeout
+        all_results = {}
+        exc_info = None
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+            if thread.isAlive():
+                self._mark_drone_unhealthy(thread, timeout)
+            elif thread.exc_info:
+                exc_info = exc_info or thread.exc_info
+            else:
+                all_results[thread.drone] = thread.result
+
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
         return all_results
 
 
@@ -303,11 +512,93 @@ class DroneManager(object):
         return contents
 
 
-    def _process_pidfiles(self, drone, pidfiles, store_in_dict):
-        for pidfile_path, contents in pidfiles.iteritems():
+    def _assign_pidfile_to_drone(self, pidfile_id, hostname):
+        info = self._registered_pidfile_info[pidfile_id]
+        if info.hostname == hostname:
+            return
+        self._pidfiles_by_drone[info.hostname].discard(pidfile_id)
+        info.hostname = hostname
+        self._pidfiles_by_drone.setdefault(hostname, set()).add(pidfile_id)
+
+
+    def _set_counted_processes(self, info, counted_processes):
+        if info.counted_processes == counted_processes:
+            return
+        if info.counted_processes:
+            hostname, num_processes = info.counted_processes
+            self._active_processes[hostname] -= num_processes
+        if counted_processes:
+            hostname, num_processes = counted_processes
+            self._active_processes[hostname] = (
+                    self._active_processes.get(hostname, 0) + num_processes)
+        info.counted_processes = counted_processes
+
+
+    def _update_active_processes(self, pidfile_id):
+        """
+        Recount what a pidfile adds to its drone's active processes, after its
+        contents or its process count changed.
+        """
+        info = self._registered_pidfile_info[pidfile_id]
+        contents = self._pidfiles.get(pidfile_id)
+        counted_processes = None
+        if (contents and not contents.is_invalid() and contents.process
+                and contents.exit_status is None
+                and info.num_processes is not None):
+            counted_processes = (contents.process.hostname,
+                                 info.num_processes)
+        self._set_counted_processes(info, counted_processes)
+
+
+    def _store_pidfile_contents(self, drone, pidfile_id, raw_contents,
+                                raw_contents_second_read):
+        """
+        Store the contents read for a pidfile, parsing only what changed
+        since the last refresh.  None stands for a missing pidfile.
+        """
+        info = self._registered_pidfile_info[pidfile_id]
+        last_raw_contents = info.raw_contents or (None, None)
+        changed = (info.raw_contents is None
+                   or raw_contents != last_raw_contents[0])
+        if changed:
+            self._pidfiles[pidfile_id] = self._parse_pidfile(drone,
+                                                             raw_contents)
+
+        if raw_contents_second_read == raw_contents:
+            self._pidfiles_second_read[pidfile_id] = self._pidfiles[pidfile_id]
+        elif (info.raw_contents is None
+              or raw_contents_second_read != last_raw_contents[1]):
+            self._pidfiles_second_read[pidfile_id] = self._parse_pidfile(
+                    drone, raw_contents_second_read)
+
+        info.raw_contents = (raw_contents, raw_contents_second_read)
+        if changed:
+            self._update_active_processes(pidfile_id)
+
+
+    def _process_pidfiles(self, drone, results, unassigned_pidfiles):
+        """
+        Update the pidfiles on the given drone from its refresh results.
+        Pidfiles that weren't known to be on any drone are assigned to it when
+        it has them.
+
+        @returns: The set of previously unassigned PidfileIds found.
+        """
+        pidfiles = results['pidfiles']
+        pidfiles_second_read = results['pidfiles_second_read']
+        found_pidfiles = set()
+        for pidfile_path in pidfiles:
             pidfile_id = PidfileId(pidfile_path)
-            contents = self._parse_pidfile(drone, contents)
-            store_in_dict[pidfile_id] = contents
+            if (pidfile_id in unassigned_pidfiles
+                    and pidfile_id in self._pidfiles_by_drone[None]):
+                self._assign_pidfile_to_drone(pidfile_id, drone.hostname)
+                found_pidfiles.add(pidfile_id)
+
+        for pidfile_id in self._pidfiles_by_drone.get(drone.hostname, ()):
+            self._store_pidfile_contents(
+                    drone, pidfile_id, pidfiles.get(pidfile_id.path),
+                    pidfiles_second_read.get(pidfile_id.path))
+        return found_pidfiles
 
 
     def _add_process(self, drone, process_info):
@@ -332,16 +623,19 @@ class DroneManager(object):
         heapq.heapify(self._drone_queue)
 
 
-    def _compute_active_processes(self, drone):
-        drone.active_processes = 0
-        for pidfile_id, contents in self._pidfiles.iteritems():
-            is_running = contents.exit_status is None
-            on_this_drone = (contents.process
-                             and contents.process.hostname == drone.hostname)
-            if is_running and on_this_drone:
-                info = self._registered_pidfile_info[pidfile_id]
-                if info.num_processes is not None:
-                    drone.active_processes += info.num_processes
+    def _refresh_drones(self, unassigned_pidfiles):
+        """
+        Call refresh() on every drone with the paths of its own pidfiles and
+        of the pidfiles not yet known to be on any drone.
+        """
+        pidfile_paths = {}
+        for drone in self.get_drones():
+            pidfile_ids = self._pidfiles_by_drone.get(drone.hostname, set())
+            pidfile_paths[drone] = sorted(
+                    pidfile_id.path
+                    for pidfile_id in pidfile_ids | unassigned_pidfiles)
+        return self._call_drones(
+                lambda drone: drone.call('refresh', pidfile_paths[drone]))
 
 
     def refresh(self):
@@ -351,25 +645,140 @@ class DroneManager(object):
         """
         self._reset()
         self._drop_old_pidfiles()
-        pidfile_paths = [pidfile_id.path
-                         for pidfile_id in self._registered_pidfile_info]
-        all_results = self._call_all_drones('refresh', pidfile_paths)
+        self._forget_unregistered_pidfiles()
+        unassigned_pidfiles = set(self._pidfiles_by_drone[None])
+        all_results = self._refresh_drones(unassigned_pidfiles)
+        refreshed_drones = set(all_results)
+        self._fill_in_missing_refresh_results(all_results)
 
         for drone, results_list in all_results.iteritems():
             results = results_list[0]
+            if 'process_scan_duration' in results:
+                logging.debug('Process scan on drone %s took %.3f sec',
+                              drone.hostname, results['process_scan_duration'])
 
             for process_info in results['autoserv_processes']:
                 self._add_autoserv_process(drone, process_info)
             for process_info in results['parse_processes']:
                 self._add_process(drone, process_info)
+            if 'transfers' in results:
+                transfer_status = results['transfers']
+                self._pending_transfers[drone.hostname] = (
+                        transfer_status['waiting'] + transfer_status['running'])
+                # stale results may predate transfers queued since
+                if drone in refreshed_drones:
+                    self._process_transfer_status(drone, transfer_status)
+
+            unassigned_pidfiles -= self._process_pidfiles(
+                    drone, results, unassigned_pidfiles)
+
+        # unassigned pidfiles that no drone has
+        for pidfile_id in unassigned_pidfiles:
+            if pidfile_id in self._pidfiles_by_drone[None]:
+                self._store_pidfile_contents(None, pidfile_id, None, None)
+
+        for drone in all_results:
+            drone.active_processes = self._active_processes.get(
+                    drone.hostname, 0)
+            if drone.enabled and self.is_drone_healthy(drone):
+                self._enqueue_drone(drone)
 
-            self._process_pidfiles(drone, results['pidfiles'], self._pidfiles)
-            self._process_pidfiles(drone, results['pidfiles_second_read'],
-                                   self._pidfiles_second_read)
+        self._poll_results_drone_transfers()
+
+
+    def _process_transfer_status(self, drone, transfer_status):
+        """
+        Forget the results transfers on the given drone that are no longer
+        waiting or running, whether they succeeded or not.  Transfers whose
+        call is still queued here, e.g. because execute_actions() skipped the
+        drone while it was unhealthy, are kept.
+        """
+        for key, success in transfer_status['finished']:
+            logging.debug('Transfer %s on drone %s finished with success=%s',
+                          key, drone.hostname, success)
+        # the last element of a transfer key is its destination path
+        pending_destinations = set(key[-1]
+                                   for key in transfer_status['pending'])
+        pending_destinations.update(
+                self._unsent_results_transfers.get(drone, ()))
+        for destination, transfer_drone in self._results_transfers.items():
+            if (transfer_drone is drone
+                    and destination not in pending_destinations):
+                del self._results_transfers[destination]
+
+
+    def _poll_results_drone_transfers(self):
+        """
+        The results drone isn't refreshed with the others, so ask it directly
+        about the transfers it runs (fetches from remote drones), if any.
+        """
+        if self._results_drone not in self._results_transfers.values():
+            return
+        try:
+            transfer_status = self._results_drone.call('poll_transfers')[0]
+        except error.AutoservError:
+            logging.exception('Failed to poll results repository transfers')
+            return
+        self._process_transfer_status(self._results_drone, transfer_status)
 
-            self._compute_active_processes(drone)
-            if drone.enabled:
-                self._enqueue_drone(drone)
+
+    def _forget_results_transfers(self, drone):
+        self._unsent_results_transfers.pop(drone, None)
+        for destination, transfer_drone in self._results_transfers.items():
+            if transfer_drone is drone:
+                del self._results_transfers[destination]
+
+
+    def has_pending_results_transfers(self, path):
+        """
+        @param path: a path in the results repository, relative to its base.
+        @returns True if a file transfer to path, or to anything under it, was
+                queued and has not been reported finished or failed yet.
+        """
+        full_path = self.absolute_path(path, on_results_repository=True)
+        full_path = full_path.rstrip('/')
+        for destination in self._results_transfers:
+            destination = destination.rstrip('/')
+            if (destination == full_path
+                    or destination.startswith(full_path + '/')):
+                return True
+        return False
+
+
+    def pending_transfers(self, drone=None):
+        """
+        @param drone: the drone to count for.  All drones if None.
+        @returns The number of file transfers that were waiting or running
+                at the last refresh.
+        """
+        if drone is not None:
+            return self._pending_transfers.get(drone.hostname, 0)
+        return sum(self._pending_transfers.itervalues())
+
+
+    def _fill_in_missing_refresh_results(self, all_results):
+        """
+        Drones that timed out in concurrent mode are reported with the process
+        and pidfile state from their last successful refresh, so their running
+        tasks don't look lost.  Such drones are not given any new work.
+        """
+        for drone, results_list in all_results.iteritems():
+            self._last_refresh_results[drone.hostname] = results_list
+        for drone in self.get_drones():
+            if drone in all_results:
+                continue
+            last_results = self._last_refresh_results.get(drone.hostname)
+            if last_results is not None:
+                logging.warning('Using stale process information for drone %s',
+                                drone.hostname)
+                all_results[drone] = last_results
+
+
+    def _execute_queued_calls(self, drone):
+        # once sent, a transfer is either reported pending by the drone or
+        # over, even if the calls fail
+        self._unsent_results_transfers.pop(drone, None)
+        drone.execute_queued_calls()
 
 
     def execute_actions(self):
@@ -377,11 +786,15 @@ class DroneManager(object):
         Called at the end of a scheduler cycle to execute all queued actions
         on drones.
         """
-        for drone in self._drones.values():
-            drone.execute_queued_calls()
+        if self._use_concurrent_drone_calls():
+            self._run_on_drones_concurrently(self._drones.values(),
+                                             self._execute_queued_calls)
+        else:
+            for drone in self._drones.values():
+                self._execute_queued_calls(drone)
 
         try:
-            self._results_drone.execute_queued_calls()
+            self._execute_queued_calls(self._results_drone)
         except error.AutoservError:
             warning = ('Results repository failed to execute calls:\n' +
                        traceback.format_exc())
@@ -424,18 +837,15 @@ class DroneManager(object):
         @param drone_hostnames_allowed: list of drones that can be used. May be
                                         None
         """
-        usable_drone_wrappers = [wrapper for wrapper in self._drone_queue
-                                 if wrapper.drone.usable_by(username) and
-                                 (drone_hostnames_allowed is None or
-                                          wrapper.drone.hostname in
-                                                  drone_hostnames_allowed)]
-        if not usable_drone_wrappers:
-            # all drones disabled or inaccessible
-            return 0
-        runnable_processes = [
-                wrapper.drone.max_processes - wrapper.drone.active_processes
-                for wrapper in usable_drone_wrappers]
-        return max([0] + runnable_processes)
+        return self.get_capacity_view().max_runnable_processes(
+                username, drone_hostnames_allowed)
+
+
+    def get_capacity_view(self):
+        """
+        @returns A DroneCapacityView of the currently enabled drones.
+        """
+        return DroneCapacityView(wrapper.drone for wrapper in self._drone_queue)
 
 
     def _least_loaded_drone(self, drones):
@@ -551,7 +961,8 @@ class DroneManager(object):
         pidfile_path = os.path.join(abs_working_directory, pidfile_name)
         pidfile_id = PidfileId(pidfile_path)
         self.register_pidfile(pidfile_id)
-        self._registered_pidfile_info[pidfile_id].num_processes = num_processes
+        self._assign_pidfile_to_drone(pidfile_id, drone.hostname)
+        self.declare_process_count(pidfile_id, num_processes)
         return pidfile_id
 
 
@@ -568,6 +979,7 @@ class DroneManager(object):
         if pidfile_id not in self._registered_pidfile_info:
             logging.info('monitoring pidfile %s', pidfile_id)
             self._registered_pidfile_info[pidfile_id] = _PidfileInfo()
+            self._pidfiles_by_drone[None].add(pidfile_id)
         self._reset_pidfile_age(pidfile_id)
 
 
@@ -579,11 +991,15 @@ class DroneManager(object):
     def unregister_pidfile(self, pidfile_id):
         if pidfile_id in self._registered_pidfile_info:
             logging.info('forgetting pidfile %s', pidfile_id)
-            del self._registered_pidfile_info[pidfile_id]
+            info = self._registered_pidfile_info.pop(pidfile_id)
+            self._pidfiles_by_drone[info.hostname].discard(pidfile_id)
+            self._set_counted_processes(info, None)
+            self._unregistered_pidfiles.add(pidfile_id)
 
 
     def declare_process_count(self, pidfile_id, num_processes):
         self._registered_pidfile_info[pidfile_id].num_processes = num_processes
+        self._update_active_processes(pidfile_id)
 
 
     def get_pidfile_contents(self, pidfile_id, use_second_read=False):
@@ -633,8 +1049,13 @@ class DroneManager(object):
                 destination_path, on_results_repository=to_results_repository)
         source_drone = self._get_drone_for_process(process)
         if to_results_repository:
-            source_drone.send_file_to(self._results_drone, full_source,
-                                      full_destination, can_fail=True)
+            transfer_drone = source_drone.send_file_to(
+                    self._results_drone, full_source, full_destination,
+                    can_fail=True)
+            if transfer_drone is not None:
+                self._results_transfers[full_destination] = transfer_drone
+                self._unsent_results_transfers.setdefault(
+                        transfer_drone, set()).add(full_destination)
         else:
             source_drone.queue_call('copy_file_or_directory', full_source,
                                     full_destination)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+"""
+Benchmark for DroneManager tick latency with many slow drones.
+
+Simulates a number of drones whose calls take a fixed (optionally jittered)
+time, like an ssh round-trip to drone_utility.py, and reports the wall time
+of DroneManager.refresh() + execute_actions() in serial and concurrent mode.
+"""
+
+import optparse, random, time
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.client.common_lib import global_config
+from autotest_lib.scheduler import drone_manager, drones, scheduler_config
+
+
+class _SimulatedDrone(drones._AbstractDrone):
+    def __init__(self, hostname, latency, jitter):
+        super(_SimulatedDrone, self).__init__()
+        self.hostname = hostname
+        self.max_processes = 100
+        self._latency = latency
+        self._jitter = jitter
+
+
+    def _execute_calls_impl(self, calls):
+        time.sleep(self._latency + random.uniform(0, self._jitter))
+        results = []
+        for method_call in calls:
+            if method_call._method == 'refresh':
+                results.append({'pidfiles': {},
+                                'autoserv_processes': [],
+                                'parse_processes': [],
+                                'pidfiles_second_read': {}})
+            else:
+                results.append(None)
+        return dict(results=results, warnings=[])
+
+
+def _time_ticks(manager, num_ticks):
+    durations = []
+    for _ in xrange(num_ticks):
+        start_time = time.time()
+        manager.refresh()
+        for drone in manager.get_drones():
+            drone.queue_call('write_to_file', '/dev/null', '')
+        manager.execute_actions()
+        durations.append(time.time() - start_time)
+    return durations
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--drones', type='int', default=20,
+                      help='number of simulated drones')
+    parser.add_option('-l', '--latency', type='float', default=0.2,
+                      help='latency of each drone call (seconds)')
+    parser.add_option('-j', '--jitter', type='float', default=0.05,
+                      help='random extra latency per call (seconds)')
+    parser.add_option('-t', '--ticks', type='int', default=3,
+                      help='number of ticks to time per mode')
+    options, args = parser.parse_args()
+
+    config = global_config.global_config
+    for concurrent in (False, True):
+        config.override_config_value(scheduler_config.CONFIG_SECTION,
+                                     'concurrent_drone_calls', str(concurrent))
+        manager = drone_manager.DroneManager()
+        manager._results_drone = _SimulatedDrone('results', 0, 0)
+        for index in xrange(options.drones):
+            drone = _SimulatedDrone('drone%d' % index, options.latency,
+                                    options.jitter)
+            manager._drones[drone.hostname] = drone
+
+        durations = _time_ticks(manager, options.ticks)
+        print '%-10s %d drones: avg tick %.3fs, max tick %.3fs' % (
+                concurrent and 'concurrent' or 'serial', options.drones,
+                sum(durations) / len(durations), max(durations))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/python
 
-import os, unittest
+import os, threading, unittest
 try:
     import autotest.common as common
 except ImportError:
@@ -60,6 +60,22 @@ class MockDrone(drones._AbstractDrone):
                                               destination_path))
 
 
+class BlockingMockDrone(MockDrone):
+    """A MockDrone whose calls block until release() is called."""
+    def __init__(self, name):
+        super(BlockingMockDrone, self).__init__(name)
+        self._release_event = threading.Event()
+
+
+    def call(self, method, *args, **kwargs):
+        self._release_event.wait()
+        return super(BlockingMockDrone, self).call(method, *args, **kwargs)
+
+
+    def release(self):
+        self._release_event.set()
+
+
 class DroneManager(unittest.TestCase):
     _DRONE_INSTALL_DIR = '/drone/install/dir'
     _DRONE_RESULTS_DIR = os.path.join(_DRONE_INSTALL_DIR, 'results')
@@ -208,6 +224,25 @@ class DroneManager(unittest.TestCase):
         self.assertEqual(drone.name, 2)
 
 
+    def test_capacity_view(self):
+        self._setup_test_drone_restrictions()
+        view = self.manager.get_capacity_view()
+        self.assertEquals(5, view.max_runnable_processes(self._USERNAME,
+                                                         [2, 3]))
+
+        # process counts are read from the drones on each call, the set of
+        # drones is fixed when the view is taken
+        drones_by_name = dict((wrapper.drone.name, wrapper.drone)
+                              for wrapper in self.manager._drone_queue)
+        drones_by_name[2].active_processes = 4
+        self.manager._enqueue_drone(MockDrone(4, max_processes=20))
+        self.assertEquals(2, view.max_runnable_processes(self._USERNAME,
+                                                         [2, 3]))
+        self.assertEquals(10, view.max_runnable_processes(self._USERNAME,
+                                                          None))
+        self.assertEquals(0, view.max_runnable_processes(self._USERNAME, [4]))
+
+
     def test_drone_restrictions_allow_none(self):
         self._setup_test_drone_restrictions()
         drone_hostnames_allowed = ()
@@ -333,5 +368,286 @@ class DroneManager(unittest.TestCase):
         self.assertFalse(self.manager._registered_pidfile_info)
 
 
+    def _refresh_results(self, pidfiles, pidfiles_second_read=None):
+        if pidfiles_second_read is None:
+            pidfiles_second_read = pidfiles
+        return [{'autoserv_processes': [],
+                 'parse_processes': [],
+                 'pidfiles': pidfiles,
+                 'pidfiles_second_read': pidfiles_second_read}]
+
+
+    def _refresh_with(self, results_by_drone):
+        """
+        Refresh, answering each drone's refresh() call with the given results
+        and recording the pidfile paths each drone was asked for.
+        """
+        requested_paths = {}
+        for drone in self.manager.get_drones():
+            def call(method, pidfile_paths, drone=drone):
+                requested_paths[drone.hostname] = pidfile_paths
+                return results_by_drone.get(drone.hostname,
+                                            self._refresh_results({}))
+            drone.call = call
+            drone.enabled = True
+        self.manager.refresh()
+        return requested_paths
+
+
+    def test_refresh_sends_pidfiles_to_their_drone(self):
+        other_drone = MockDrone('other_drone')
+        self.manager._drones[other_drone.name] = other_drone
+        self.manager._enqueue_drone(self.mock_drone)
+        executed_id = self.manager.execute_command(
+                ['command'], self._WORKING_DIRECTORY, 'pidfile', 2)
+        # a recovered pidfile is looked for on every drone until one has it
+        recovered_id = self.manager.get_pidfile_id_from('tag', 'pidfile')
+        self.manager.register_pidfile(recovered_id)
+
+        requested_paths = self._refresh_with(
+                {'other_drone': self._refresh_results(
+                        {recovered_id.path: '10\n'})})
+        self.assertEquals(sorted([executed_id.path, recovered_id.path]),
+                          requested_paths['mock_drone'])
+        self.assertEquals([recovered_id.path], requested_paths['other_drone'])
+
+        requested_paths = self._refresh_with({})
+        self.assertEquals([executed_id.path], requested_paths['mock_drone'])
+        self.assertEquals([recovered_id.path], requested_paths['other_drone'])
+
+
+    def test_active_processes_updated_incrementally(self):
+        self.manager._enqueue_drone(self.mock_drone)
+        pidfile_id = self.manager.execute_command(
+                ['command'], self._WORKING_DIRECTORY, 'pidfile', 3)
+        self.assertEquals(3, self.mock_drone.active_processes)
+
+        # the process hasn't written its pidfile yet
+        self._refresh_with({})
+        self.assertEquals(0, self.mock_drone.active_processes)
+
+        running = self._refresh_results({pidfile_id.path: '10\n'})
+        self._refresh_with({'mock_drone': running})
+        self.assertEquals(3, self.mock_drone.active_processes)
+        self.manager.declare_process_count(pidfile_id, 1)
+        self._refresh_with({'mock_drone': running})
+        self.assertEquals(1, self.mock_drone.active_processes)
+
+        self._refresh_with({'mock_drone': self._refresh_results(
+                {pidfile_id.path: '10\n0\n0\n'})})
+        self.assertEquals(0, self.mock_drone.active_processes)
+        contents = self.manager.get_pidfile_contents(pidfile_id)
+        self.assertEquals((0, 0), (contents.exit_status,
+                                   contents.num_tests_failed))
+
+        self._refresh_with({'mock_drone': running})
+        self.assertEquals(1, self.mock_drone.active_processes)
+        self.manager.unregister_pidfile(pidfile_id)
+        self._refresh_with({'mock_drone': running})
+        self.assertEquals(0, self.mock_drone.active_processes)
+        self.assertEquals(drone_manager.PidfileContents,
+                          type(self.manager.get_pidfile_contents(pidfile_id)))
+        self.assertEquals(None,
+                          self.manager.get_pidfile_contents(pidfile_id).process)
+
+
+    def test_unchanged_pidfiles_not_parsed(self):
+        pidfile_id = self.manager.get_pidfile_id_from('tag', 'pidfile')
+        self.manager.register_pidfile(pidfile_id)
+        parsed = []
+        original_parse = self.manager._parse_pidfile
+        def parse(drone, raw_contents):
+            parsed.append(raw_contents)
+            return original_parse(drone, raw_contents)
+        self.god.stub_with(self.manager, '_parse_pidfile', parse)
+
+        results = self._refresh_results({pidfile_id.path: '10\n'})
+        self._refresh_with({'mock_drone': results})
+        self._refresh_with({'mock_drone': results})
+        self.assertEquals(['10\n'], parsed)
+        self.assertEquals(
+                self.manager.get_pidfile_contents(pidfile_id),
+                self.manager.get_pidfile_contents(pidfile_id,
+                                                  use_second_read=True))
+
+        self._refresh_with({'mock_drone': self._refresh_results(
+                {pidfile_id.path: '10\n'},
+                {pidfile_id.path: '10\n1\n0\n'})})
+        self.assertEquals(['10\n', '10\n1\n0\n'], parsed)
+        self.assertEquals(1, self.manager.get_pidfile_contents(
+                pidfile_id, use_second_read=True).exit_status)
+
+
+    def test_pending_transfers(self):
+        results = self._refresh_results({})
+        results[0]['transfers'] = dict(waiting=2, running=1, pending=[],
+                                       finished=[])
+        self._refresh_with({'mock_drone': results})
+        self.assertEquals(3, self.manager.pending_transfers(self.mock_drone))
+        self.assertEquals(3, self.manager.pending_transfers())
+
+        results[0]['transfers'] = dict(
+                waiting=0, running=0, pending=[],
+                finished=[(('sync_send_file_to', 'results_drone', 'source',
+                            'dest'), True)])
+        self._refresh_with({'mock_drone': results})
+        self.assertEquals(0, self.manager.pending_transfers())
+
+
+    def _copy_with_transfer_on(self, transfer_drone):
+        self.god.stub_with(self.mock_drone, 'send_file_to',
+                           lambda *args, **dargs: transfer_drone)
+        self.manager.copy_to_results_repository(
+                self.mock_drone_process, self._WORKING_DIRECTORY + '/')
+        return os.path.join(self._RESULTS_DIR, self._WORKING_DIRECTORY) + '/'
+
+
+    def test_pending_results_transfers(self):
+        destination = self._copy_with_transfer_on(self.mock_drone)
+        self.manager.execute_actions()
+        self.assert_(self.manager.has_pending_results_transfers(
+                self._WORKING_DIRECTORY))
+        self.assert_(self.manager.has_pending_results_transfers('working'))
+        self.assertFalse(self.manager.has_pending_results_transfers('work'))
+
+        key = ('sync_send_file_to', 'results_drone', 'source', destination)
+        results = self._refresh_results({})
+        results[0]['transfers'] = dict(waiting=0, running=1, pending=[key],
+                                       finished=[])
+        self._refresh_with({'mock_drone': results})
+        self.assert_(self.manager.has_pending_results_transfers(
+                self._WORKING_DIRECTORY))
+
+        # failed transfers are over too
+        results[0]['transfers'] = dict(waiting=0, running=0, pending=[],
+                                       finished=[(key, False)])
+        self._refresh_with({'mock_drone': results})
+        self.assertFalse(self.manager.has_pending_results_transfers(
+                self._WORKING_DIRECTORY))
+
+
+    def test_pending_results_transfers_on_results_drone(self):
+        self._copy_with_transfer_on(self.results_drone)
+        self.manager.execute_actions()
+        polls = []
+        def call(method):
+            polls.append(method)
+            return [dict(waiting=0, running=0, pending=[], finished=[])]
+        self.results_drone.call = call
+
+        self._refresh_with({})
+        self.assertEquals(['poll_transfers'], polls)
+        self.assertFalse(self.manager.has_pending_results_transfers(
+                self._WORKING_DIRECTORY))
+        # nothing left to poll for
+        self._refresh_with({})
+        self.assertEquals(['poll_transfers'], polls)
+
+
+    def _enable_concurrent_drone_calls(self, timeout):
+        self.god.stub_with(self.manager, '_use_concurrent_drone_calls',
+                           lambda: True)
+        self.god.stub_with(self.manager, '_get_drone_call_timeout',
+                           lambda: timeout)
+
+
+    def test_call_all_drones_concurrently(self):
+        self._enable_concurrent_drone_calls(timeout=1)
+        slow_drone = BlockingMockDrone('slow_drone')
+        self.manager._drones[slow_drone.name] = slow_drone
+        self.god.stub_function(drone_manager.email_manager.manager,
+                               'enqueue_notify_email')
+        drone_manager.email_manager.manager.enqueue_notify_email.expect_call(
+                'Drone slow_drone timed out', mock.is_string_comparator())
+
+        all_results = self.manager._call_all_drones('refresh', [])
+        self.assertEquals([self.mock_drone], all_results.keys())
+        self.assert_(self.mock_drone.was_call_queued('refresh', []))
+        self.assertFalse(self.manager.is_drone_healthy(slow_drone))
+
+        # unhealthy drones are not called again until they catch up
+        self.manager._call_all_drones('refresh', [])
+        slow_drone.release()
+        self.manager._unhealthy_drone_threads[slow_drone.name].join()
+        self.assertEquals([('refresh', ([],), {})],
+                          slow_drone._recorded_calls['queue_call'])
+        self.assert_(self.manager.is_drone_healthy(slow_drone))
+        self.god.check_playback()
+
+
+    def test_call_all_drones_concurrently_reraises(self):
+        self._enable_concurrent_drone_calls(timeout=10)
+        def fail(*args, **kwargs):
+            raise drone_manager.DroneManagerError('drone failed')
+        self.mock_drone.call = fail
+        self.assertRaises(drone_manager.DroneManagerError,
+                          self.manager._call_all_drones, 'refresh', [])
+
+
+    def test_refresh_uses_stale_results_for_unhealthy_drone(self):
+        self._enable_concurrent_drone_calls(timeout=10)
+        self.mock_drone.enabled = True
+        results = {'autoserv_processes': [dict(pid='5', pgid='5', ppid='1',
+                                               comm='autoserv')],
+                   'parse_processes': [],
+                   'pidfiles': {},
+                   'pidfiles_second_read': {}}
+        self.mock_drone.call = lambda method, *args: [results]
+        self.manager.refresh()
+        process = drone_manager.Process(self.mock_drone.name, 5)
+        self.assert_(self.manager.is_process_running(process))
+        self.assertEquals(1, len(self.manager._drone_queue))
+
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        self.manager._unhealthy_drone_threads[self.mock_drone.name] = thread
+        self.god.stub_with(thread, 'isAlive', lambda: True)
+        self.manager.refresh()
+        self.assert_(self.manager.is_process_running(process))
+        self.assertEquals([], self.manager._drone_queue)
+
+
+    def test_pending_results_transfers_on_unhealthy_drone(self):
+        self._enable_concurrent_drone_calls(timeout=10)
+        self._copy_with_transfer_on(self.mock_drone)
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        self.manager._unhealthy_drone_threads[self.mock_drone.name] = thread
+        self.god.stub_with(thread, 'isAlive', lambda: True)
+        self.manager.execute_actions()
+
+        # the drone recovers, but the copy is still only queued here
+        self.god.stub_with(thread, 'isAlive', lambda: False)
+        results = self._refresh_results({})
+        results[0]['transfers'] = dict(waiting=0, running=0, pending=[],
+                                       finished=[])
+        self._refresh_with({'mock_drone': results})
+        self.assert_(self.manager.has_pending_results_transfers(
+                self._WORKING_DIRECTORY))
+
+        self.manager.execute_actions()
+        self._refresh_with({'mock_drone': results})
+        self.assertFalse(self.manager.has_pending_results_transfers(
+                self._WORKING_DIRECTORY))
+
+
+    def test_execute_actions_concurrently(self):
+        self._enable_concurrent_drone_calls(timeout=10)
+        executed_calls = []
+        def execute_calls(calls):
+            executed_calls.extend(str(call) for call in calls)
+            return []
+        drone = drones._AbstractDrone()
+        drone.hostname = 'real_drone'
+        drone._execute_calls = execute_calls
+        self.manager._drones = {drone.hostname: drone}
+
+        drone.queue_call('write_to_file', 'path', 'contents')
+        self.manager.execute_actions()
+        self.assertEquals(["write_to_file('path', 'contents')"],
+                          executed_calls)
+        self.assertEquals([], drone._calls)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 
 import pickle, subprocess, os, shutil, socket, sys, time, signal, getpass
-import datetime, traceback, tempfile, itertools, logging
+import datetime, traceback, tempfile, itertools, logging, struct, collections
 try:
     import autotest.common as common
 except ImportError:
@@ -18,6 +18,11 @@ DARK_MARK_ENVIRONMENT_VAR = 'AUTOTEST_SCHEDULER_DARK_MARK'
 _TEMPORARY_DIRECTORY = 'drone_tmp'
 _TRANSFER_FAILED_FILE = '.transfer_failed'
 
+# command line flag to run as a resident agent (see agent_main())
+AGENT_FLAG = '--agent'
+# header of each frame exchanged with a resident agent: payload length
+_FRAME_HEADER = struct.Struct('>I')
+
 
 class _MethodCall(object):
     def __init__(self, method, args, kwargs):
@@ -43,6 +48,194 @@ def call(method, *args, **kwargs):
     return _MethodCall(method, args, kwargs)
 
 
+def _get_path_size(path):
+    """
+    @returns The total size in bytes of the files at path, 0 if it's missing.
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return 0
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class _Transfer(object):
+    """
+    A copy between this drone and another host, run in a subcommand.
+
+    Attributes:
+    * key: (method name, hostname, source path, destination path); transfers
+            with the same key copy the same thing.
+    * local_path: path on this drone whose size is charged against the rate
+            limit of hostname.
+    * size: bytes charged once the transfer has started or finished.
+    """
+    def __init__(self, function, args, hostname, source_path,
+                 destination_path, local_path, size_known_at_start):
+        self.function = function
+        self.args = args
+        self.hostname = hostname
+        self.key = (function.__name__, hostname, source_path,
+                    destination_path)
+        self.local_path = local_path
+        self.size_known_at_start = size_known_at_start
+        self.size = 0
+        self.subcommand = None
+
+
+    def start(self):
+        self.subcommand = subcommand.subcommand(self.function, self.args)
+        self.subcommand.fork_start()
+
+
+    def poll(self):
+        """
+        @returns None while running, then whether the transfer succeeded.
+        """
+        try:
+            returncode = self.subcommand.poll()
+        except error.AutoservSubcommandError:
+            return False
+        if returncode is None:
+            return None
+        return returncode == 0
+
+
+    def wait(self):
+        try:
+            return self.subcommand.wait() == 0
+        except error.AutoservSubcommandError:
+            return False
+
+
+class TransferQueue(object):
+    """
+    Results transfers that may run in the background across batches of calls.
+
+    At most max_transfer_processes transfers run at once and the others wait
+    in order.  A transfer requested again while an identical one is still
+    waiting is dropped.  If rate_limit_kbps is set, the average rate at which
+    bytes are sent to or fetched from each host is kept under it by holding
+    back that host's next transfer.
+    """
+    def __init__(self, rate_limit_kbps=0, time_function=time.time):
+        self._rate_limit_kbps = rate_limit_kbps
+        self._time = time_function
+        self._waiting = collections.deque()
+        self._waiting_keys = set()
+        self._running = []
+        # maps hostname to the earliest time its next transfer may start
+        self._next_start_time = {}
+        # (key, success) of the transfers finished since get_status()
+        self._finished = []
+
+
+    def __len__(self):
+        return len(self._waiting) + len(self._running)
+
+
+    def add(self, transfer):
+        """
+        @returns False if an identical transfer was already waiting.
+        """
+        if transfer.key in self._waiting_keys:
+            return False
+        self._waiting.append(transfer)
+        self._waiting_keys.add(transfer.key)
+        return True
+
+
+    def _charge(self, hostname, size):
+        if not self._rate_limit_kbps or not size:
+            return
+        delay = size / (self._rate_limit_kbps * 1024.0)
+        start_time = max(self._time(), self._next_start_time.get(hostname, 0))
+        self._next_start_time[hostname] = start_time + delay
+
+
+    def _is_rate_limited(self, hostname):
+        return self._next_start_time.get(hostname, 0) > self._time()
+
+
+    def _finish(self, transfer, success):
+        if not transfer.size_known_at_start:
+            transfer.size = _get_path_size(transfer.local_path)
+            self._charge(transfer.hostname, transfer.size)
+        self._finished.append((transfer.key, success))
+
+
+    def _reap(self):
+        still_running = []
+        for transfer in self._running:
+            success = transfer.poll()
+            if success is None:
+                still_running.append(transfer)
+            else:
+                self._finish(transfer, success)
+        self._running = still_running
+
+
+    def _start_waiting(self):
+        max_processes = scheduler_config.config.max_transfer_processes
+        held_back = []
+        while self._waiting and len(self._running) < max_processes:
+            transfer = self._waiting.popleft()
+            if self._is_rate_limited(transfer.hostname):
+                held_back.append(transfer)
+                continue
+            self._waiting_keys.discard(transfer.key)
+            if transfer.size_known_at_start:
+                transfer.size = _get_path_size(transfer.local_path)
+                self._charge(transfer.hostname, transfer.size)
+            transfer.start()
+            self._running.append(transfer)
+        self._waiting.extendleft(reversed(held_back))
+
+
+    def poll(self):
+        """
+        Reap finished transfers and start waiting ones, without blocking.
+        """
+        self._reap()
+        self._start_waiting()
+
+
+    def wait(self):
+        """
+        Block until every transfer, including waiting ones, has finished.
+        """
+        while self._waiting or self._running:
+            self.poll()
+            if not self._running:
+                # everything left is held back by the rate limit
+                time.sleep(1)
+                continue
+            transfer = self._running.pop(0)
+            self._finish(transfer, transfer.wait())
+
+
+    def get_status(self):
+        """
+        @returns A dict with the number of waiting and running transfers, the
+                keys of the transfers still waiting or running, and the
+                (key, success) of each transfer finished since the last call.
+        """
+        finished, self._finished = self._finished, []
+        pending = [transfer.key
+                   for transfer in itertools.chain(self._waiting,
+                                                   self._running)]
+        return dict(waiting=len(self._waiting), running=len(self._running),
+                    pending=pending, finished=finished)
+
+
 class DroneUtility(object):
     """
     This class executes actual OS calls on the drone machine.
@@ -51,12 +244,27 @@ class DroneUtility(object):
     """
     _WARNING_DURATION = 60
 
-    def __init__(self):
+    def __init__(self, async_transfers=False):
+        """
+        @param async_transfers: if True, execute_calls() returns without
+                waiting for file transfers; they keep running in the
+                background and their progress is reported by refresh().
+                Only useful if this object lives across batches of calls.
+        """
         # Tattoo ourselves so that all of our spawn bears our mark.
         os.putenv(DARK_MARK_ENVIRONMENT_VAR, str(os.getpid()))
 
         self.warnings = []
-        self._subcommands = []
+        self._async_transfers = async_transfers
+        self._transfers = TransferQueue(
+                rate_limit_kbps=global_config.global_config.get_config_value(
+                        scheduler_config.CONFIG_SECTION,
+                        'transfer_rate_limit_kbps', type=int, default=0))
+        # maps pid to (start time, comm, cmdline or None if not ours) for
+        # processes seen by the last /proc scan
+        self._process_cache = {}
+        # maps pidfile path to ((mtime, size, inode), contents)
+        self._pidfile_cache = {}
 
 
     def initialize(self, results_dir):
@@ -87,10 +295,11 @@ class DroneUtility(object):
 
 
     _PS_ARGS = ('pid', 'pgid', 'ppid', 'comm', 'args')
+    _PROC_DIR = '/proc'
 
 
     @classmethod
-    def _get_process_info(cls):
+    def _get_process_info_from_ps(cls):
         """
         @returns A generator of dicts with cls._PS_ARGS as keys and
                 string values each representing a running process.
@@ -106,13 +315,100 @@ class DroneUtility(object):
                 for line_components in split_lines)
 
 
+    @staticmethod
+    def _read_proc_file(path, open=open):
+        file_object = open(path, 'rb')
+        try:
+            return file_object.read()
+        finally:
+            file_object.close()
+
+
+    def _parse_proc_stat(self, pid, open=open):
+        """
+        @returns A tuple (comm, ppid, pgid, start time) of strings read from
+                /proc/<pid>/stat.
+        """
+        stat = self._read_proc_file(
+                os.path.join(self._PROC_DIR, pid, 'stat'), open=open)
+        # comm is in parentheses and may itself contain spaces and parentheses
+        comm_start, comm_end = stat.index('('), stat.rindex(')')
+        comm = stat[comm_start + 1:comm_end]
+        fields = stat[comm_end + 2:].split()
+        # fields now starts at field 3 (state); see "man 5 proc"
+        return comm, fields[1], fields[2], fields[19]
+
+
+    def _scan_process(self, pid, uid, open=open):
+        """
+        @returns A process info dict for the given pid, or None if it does not
+                belong to uid.  Only the ownership check and the command line
+                are cached, under the process start time and comm, so just
+                /proc/<pid>/stat is read for processes already seen.
+        """
+        comm, ppid, pgid, start_time = self._parse_proc_stat(pid, open=open)
+        # A process keeps its start time across exec() and setpgrp(), so
+        # comm, ppid and pgid always come from the fresh stat, and a changed
+        # comm means the cached command line is stale.
+        cached = self._process_cache.get(pid)
+        if cached and cached[:2] == (start_time, comm):
+            cmdline = cached[2]
+        else:
+            if os.stat(os.path.join(self._PROC_DIR, pid)).st_uid != uid:
+                cmdline = None
+            else:
+                cmdline = self._read_proc_file(
+                        os.path.join(self._PROC_DIR, pid, 'cmdline'),
+                        open=open)
+            self._process_cache[pid] = (start_time, comm, cmdline)
+        if cmdline is None:
+            return None
+        args = cmdline.rstrip('\0').replace('\0', ' ') or comm
+        return dict(pid=pid, pgid=pgid, ppid=ppid, comm=comm, args=args)
+
+
+    def _get_process_info(self, open=open):
+        """
+        Scan /proc for the processes of the current user, like "ps x" does.
+        Falls back to running ps where /proc is not available.
+
+        @returns A list of dicts with self._PS_ARGS as keys and string values
+                each representing a running process.
+        """
+        if not os.path.isdir(self._PROC_DIR):
+            return list(self._get_process_info_from_ps())
+        uid = os.geteuid()
+        processes = []
+        seen_pids = set()
+        for pid in os.listdir(self._PROC_DIR):
+            if not pid.isdigit():
+                continue
+            try:
+                info = self._scan_process(pid, uid, open=open)
+            except (EnvironmentError, ValueError, IndexError):
+                # the process exited while we were looking at it
+                continue
+            seen_pids.add(pid)
+            if info is not None:
+                processes.append(info)
+        for pid in set(self._process_cache) - seen_pids:
+            del self._process_cache[pid]
+        return processes
+
+
     def _refresh_processes(self, command_name, open=open,
-                           site_check_parse=None):
+                           site_check_parse=None, process_info=None):
+        """
+        @param process_info: Result of _get_process_info() to filter.  The
+                process table is scanned if it's not given.
+        """
         # The open argument is used for test injection.
         check_mark = global_config.global_config.get_config_value(
             'SCHEDULER', 'check_processes_for_dark_mark', bool, False)
+        if process_info is None:
+            process_info = self._get_process_info()
         processes = []
-        for info in self._get_process_info():
+        for info in process_info:
             is_parse = (site_check_parse and site_check_parse(info))
             if info['comm'] == command_name or is_parse:
                 if (check_mark and not
@@ -126,9 +422,21 @@ class DroneUtility(object):
 
 
     def _read_pidfiles(self, pidfile_paths):
+        """
+        Pidfiles whose mtime, size and inode haven't changed since they were
+        last read are served from a cache instead of being read again.
+        """
         pidfiles = {}
         for pidfile_path in pidfile_paths:
-            if not os.path.exists(pidfile_path):
+            try:
+                stat = os.stat(pidfile_path)
+            except OSError:
+                self._pidfile_cache.pop(pidfile_path, None)
+                continue
+            file_key = (stat.st_mtime, stat.st_size, stat.st_ino)
+            cached = self._pidfile_cache.get(pidfile_path)
+            if cached and cached[0] == file_key:
+                pidfiles[pidfile_path] = cached[1]
                 continue
             try:
                 file_object = open(pidfile_path, 'r')
@@ -136,9 +444,16 @@ class DroneUtility(object):
                 file_object.close()
             except IOError:
                 continue
+            self._pidfile_cache[pidfile_path] = (file_key,
+                                                 pidfiles[pidfile_path])
         return pidfiles
 
 
+    def _prune_pidfile_cache(self, pidfile_paths):
+        for pidfile_path in set(self._pidfile_cache) - set(pidfile_paths):
+            del self._pidfile_cache[pidfile_path]
+
+
     def refresh(self, pidfile_paths):
         """
         pidfile_paths should be a list of paths to check for pidfiles.
@@ -152,17 +467,30 @@ class DroneUtility(object):
         * parse_processes: likewise, for parse processes.
         * pidfiles_second_read: same info as pidfiles, but gathered after the
         processes are scanned.
+        * process_scan_duration: seconds spent scanning the process table.
+        * transfers: file transfer progress, see TransferQueue.get_status().
         """
         site_check_parse = utils.import_site_function(
                 __file__, 'autotest_lib.scheduler.site_drone_utility',
                 'check_parse', lambda x: False)
+        self._prune_pidfile_cache(pidfile_paths)
+        pidfiles = self._read_pidfiles(pidfile_paths)
+
+        scan_start = time.time()
+        process_info = self._get_process_info()
+        scan_duration = time.time() - scan_start
+
         results = {
-            'pidfiles' : self._read_pidfiles(pidfile_paths),
-            'autoserv_processes' : self._refresh_processes('autoserv'),
+            'pidfiles' : pidfiles,
+            'autoserv_processes' : self._refresh_processes(
+                    'autoserv', process_info=process_info),
             'parse_processes' : self._refresh_processes(
-                    'parse', site_check_parse=site_check_parse),
+                    'parse', site_check_parse=site_check_parse,
+                    process_info=process_info),
             'pidfiles_second_read' : self._read_pidfiles(pidfile_paths),
+            'process_scan_duration' : scan_duration,
         }
+        results['transfers'] = self.poll_transfers()
         return results
 
 
@@ -295,32 +623,31 @@ class DroneUtility(object):
         return os.path.samefile(source_path, destination_path)
 
 
-    def wait_for_all_async_commands(self):
-        for subproc in self._subcommands:
-            subproc.fork_waitfor()
-        self._subcommands = []
+    def _get_transfer_status(self):
+        status = self._transfers.get_status()
+        for key, success in status['finished']:
+            if not success:
+                self._warn('Transfer %s with %s failed: %s -> %s' % key)
+        return status
 
 
-    def _poll_async_commands(self):
-        still_running = []
-        for subproc in self._subcommands:
-            if subproc.poll() is None:
-                still_running.append(subproc)
-        self._subcommands = still_running
+    def poll_transfers(self):
+        """
+        Reap finished file transfers and start waiting ones.
+
+        @returns The transfer progress, see TransferQueue.get_status().
+        """
+        self._transfers.poll()
+        return self._get_transfer_status()
 
 
-    def _wait_for_some_async_commands(self):
-        self._poll_async_commands()
-        max_processes = scheduler_config.config.max_transfer_processes
-        while len(self._subcommands) >= max_processes:
-            time.sleep(1)
-            self._poll_async_commands()
+    def wait_for_all_transfers(self):
+        self._transfers.wait()
 
 
-    def run_async_command(self, function, args):
-        subproc = subcommand.subcommand(function, args)
-        self._subcommands.append(subproc)
-        subproc.fork_start()
+    def _add_transfer(self, transfer):
+        if self._transfers.add(transfer):
+            self._transfers.poll()
 
 
     def _sync_get_file_from(self, hostname, source_path, destination_path):
@@ -330,8 +657,12 @@ class DroneUtility(object):
 
 
     def get_file_from(self, hostname, source_path, destination_path):
-        self.run_async_command(self._sync_get_file_from,
-                               (hostname, source_path, destination_path))
+        # the size of what is fetched is only known once it's here
+        self._add_transfer(_Transfer(
+                self._sync_get_file_from,
+                (hostname, source_path, destination_path), hostname,
+                source_path, destination_path, local_path=destination_path,
+                size_known_at_start=False))
 
 
     def sync_send_file_to(self, hostname, source_path, destination_path,
@@ -362,9 +693,11 @@ class DroneUtility(object):
 
     def send_file_to(self, hostname, source_path, destination_path,
                      can_fail=False):
-        self.run_async_command(self.sync_send_file_to,
-                               (hostname, source_path, destination_path,
-                                can_fail))
+        self._add_transfer(_Transfer(
+                self.sync_send_file_to,
+                (hostname, source_path, destination_path, can_fail), hostname,
+                source_path, destination_path, local_path=source_path,
+                size_known_at_start=True))
 
 
     def _report_long_execution(self, calls, duration):
@@ -380,12 +713,11 @@ class DroneUtility(object):
     def execute_calls(self, calls):
         results = []
         start_time = time.time()
-        max_processes = scheduler_config.config.max_transfer_processes
         for method_call in calls:
             results.append(method_call.execute_on(self))
-            if len(self._subcommands) >= max_processes:
-                self._wait_for_some_async_commands()
-        self.wait_for_all_async_commands()
+        if not self._async_transfers:
+            self.wait_for_all_transfers()
+            self._get_transfer_status()
 
         duration = time.time() - start_time
         if duration > self._WARNING_DURATION:
@@ -396,6 +728,16 @@ class DroneUtility(object):
         return dict(results=results, warnings=warnings)
 
 
+def use_async_transfers():
+    """
+    @returns True if long-lived DroneUtility objects should let file transfers
+            run in the background instead of waiting for them.
+    """
+    return global_config.global_config.get_config_value(
+            scheduler_config.CONFIG_SECTION, 'async_results_transfers',
+            type=bool, default=False)
+
+
 def create_host(hostname):
     username = global_config.global_config.get_config_value(
         'SCHEDULER', hostname + '_username', default=getpass.getuser())
@@ -426,7 +768,64 @@ def return_data(data):
     print pickle.dumps(data)
 
 
+def _read_exactly(file_object, size):
+    data = file_object.read(size)
+    if len(data) != size:
+        raise EOFError('Expected %d bytes, got %d' % (size, len(data)))
+    return data
+
+
+def write_frame(file_object, data):
+    """
+    Write data to file_object as one length-prefixed pickle frame.
+    """
+    payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    file_object.write(_FRAME_HEADER.pack(len(payload)) + payload)
+    file_object.flush()
+
+
+def read_frame(file_object):
+    """
+    Read one frame written by write_frame().
+
+    @raises EOFError: if the stream ends before a full frame is read.
+    """
+    header = _read_exactly(file_object, _FRAME_HEADER.size)
+    payload_size = _FRAME_HEADER.unpack(header)[0]
+    return pickle.loads(_read_exactly(file_object, payload_size))
+
+
+def agent_main():
+    """
+    Serve framed batches of _MethodCalls from stdin until it is closed.
+
+    A single DroneUtility (along with the already parsed global_config) is
+    kept alive across batches.  Each batch is answered with a
+    ('ok', execute_calls() result) or ('error', traceback) frame.
+    """
+    # Reserve the real stdout for frames; anything printed by the calls
+    # themselves goes to stderr instead of corrupting the stream.
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    drone_utility = DroneUtility(async_transfers=use_async_transfers())
+    while True:
+        try:
+            calls = read_frame(sys.stdin)
+        except EOFError:
+            break
+        try:
+            response = ('ok', drone_utility.execute_calls(calls))
+        except Exception:
+            drone_utility.warnings = []
+            response = ('error', traceback.format_exc())
+        write_frame(output, response)
+
+
 def main():
+    if AGENT_FLAG in sys.argv[1:]:
+        agent_main()
+        return
     calls = parse_input()
     drone_utility = DroneUtility()
     return_value = drone_utility.execute_calls(calls)
@@ -2,7 +2,7 @@
 
 """Tests for drone_utility."""
 
-import os, sys, unittest
+import os, shutil, sys, tempfile, time, unittest
 from cStringIO import StringIO
 
 try:
@@ -11,7 +11,7 @@ except ImportError:
     import common
 from autotest_lib.client.common_lib import global_config
 from autotest_lib.client.common_lib.test_utils import mock
-from autotest_lib.scheduler import drone_utility
+from autotest_lib.scheduler import drone_utility, scheduler_config
 
 
 class TestDroneUtility(unittest.TestCase):
@@ -78,5 +78,248 @@ class TestDroneUtility(unittest.TestCase):
         self.god.check_playback()
 
 
+class ProcessScanTest(unittest.TestCase):
+    def setUp(self):
+        self.drone_utility = drone_utility.DroneUtility()
+        self._proc_dir = tempfile.mkdtemp()
+        self.drone_utility._PROC_DIR = self._proc_dir
+        self._opened_paths = []
+
+
+    def tearDown(self):
+        shutil.rmtree(self._proc_dir)
+
+
+    def _open(self, path, mode='r'):
+        self._opened_paths.append(os.path.basename(path))
+        return open(path, mode)
+
+
+    def _write_file(self, path, contents):
+        file_object = open(path, 'w')
+        file_object.write(contents)
+        file_object.close()
+
+
+    def _add_process(self, pid, comm, ppid, pgid, start_time, cmdline):
+        pid_dir = os.path.join(self._proc_dir, str(pid))
+        if not os.path.exists(pid_dir):
+            os.mkdir(pid_dir)
+        self._write_file(os.path.join(pid_dir, 'stat'),
+                         '%s (%s) S %s %s %s 0 -1 4194560 %s\n' %
+                         (pid, comm, ppid, pgid, pgid,
+                          ' '.join(['0'] * 12 + [str(start_time), '0'])))
+        self._write_file(os.path.join(pid_dir, 'cmdline'),
+                         cmdline.replace(' ', '\0') + '\0')
+
+
+    def test_scan_caches_metadata(self):
+        self._add_process(10, 'autoserv', 1, 10, 500, 'autoserv -p -r dir')
+        self._add_process(11, 'my (odd) name', 10, 10, 501, 'odd')
+        os.mkdir(os.path.join(self._proc_dir, 'self'))
+
+        processes = self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual(
+                [dict(pid='10', pgid='10', ppid='1', comm='autoserv',
+                      args='autoserv -p -r dir'),
+                 dict(pid='11', pgid='10', ppid='10', comm='my (odd) name',
+                      args='odd')],
+                sorted(processes, key=lambda info: info['pid']))
+        self.assertEqual(['stat', 'cmdline'] * 2, self._opened_paths)
+
+        # a known process is rescanned from its stat only
+        self._opened_paths = []
+        self._add_process(11, 'my (odd) name', 1, 10, 501, 'odd')
+        processes = self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual(['stat', 'stat'], self._opened_paths)
+        self.assertEqual(['1', '1'], [info['ppid'] for info in processes])
+
+        # a new process reusing a pid is detected through its start time
+        self._opened_paths = []
+        self._add_process(11, 'parse', 1, 11, 900, 'parse -l 2')
+        processes = self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual(['stat', 'stat', 'cmdline'],
+                         sorted(self._opened_paths, reverse=True))
+        self.assert_(dict(pid='11', pgid='11', ppid='1', comm='parse',
+                          args='parse -l 2') in processes)
+
+        shutil.rmtree(os.path.join(self._proc_dir, '10'))
+        self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual(['11'], self.drone_utility._process_cache.keys())
+
+
+    def test_scan_follows_exec_and_setpgrp(self):
+        # an autoserv seen between fork and exec still looks like its parent
+        self._add_process(10, 'monitor_db', 1, 1, 500, 'monitor_db.py')
+        processes = self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual([dict(pid='10', pgid='1', ppid='1', comm='monitor_db',
+                               args='monitor_db.py')], processes)
+
+        # exec() and setpgrp() keep the start time
+        self._opened_paths = []
+        self._add_process(10, 'autoserv', 1, 10, 500, 'autoserv -p -r dir')
+        processes = self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual(['stat', 'cmdline'], self._opened_paths)
+        self.assertEqual([dict(pid='10', pgid='10', ppid='1', comm='autoserv',
+                               args='autoserv -p -r dir')], processes)
+
+        # a later pgid change alone needs no new command line
+        self._opened_paths = []
+        self._add_process(10, 'autoserv', 1, 12, 500, 'autoserv -p -r dir')
+        processes = self.drone_utility._get_process_info(open=self._open)
+        self.assertEqual(['stat'], self._opened_paths)
+        self.assertEqual(['12'], [info['pgid'] for info in processes])
+
+
+    def test_read_pidfiles_cache(self):
+        pidfile_path = os.path.join(self._proc_dir, '.autoserv_execute')
+        missing_path = os.path.join(self._proc_dir, 'missing')
+        self._write_file(pidfile_path, '123\n')
+        self.assertEqual(
+                {pidfile_path: '123\n'},
+                self.drone_utility._read_pidfiles([pidfile_path, missing_path]))
+
+        self.god = mock.mock_god()
+        self.god.stub_function(drone_utility, 'open')
+        self.assertEqual({pidfile_path: '123\n'},
+                         self.drone_utility._read_pidfiles([pidfile_path]))
+        self.god.unstub_all()
+
+        self._write_file(pidfile_path, '123\n0\n1\n')
+        self.assertEqual({pidfile_path: '123\n0\n1\n'},
+                         self.drone_utility._read_pidfiles([pidfile_path]))
+
+        self.drone_utility._prune_pidfile_cache([])
+        self.assertEqual({}, self.drone_utility._pidfile_cache)
+
+
+def _copy(*args):
+    pass
+
+
+def _fail(*args):
+    raise IOError('copy failed')
+
+
+def _slow_copy(*args):
+    time.sleep(0.2)
+
+
+class TransferQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.god = mock.mock_god()
+        self.god.stub_with(scheduler_config.config, 'max_transfer_processes',
+                           1)
+        self._now = 1000.0
+        self._temp_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        self.god.unstub_all()
+        shutil.rmtree(self._temp_dir)
+
+
+    def _transfer(self, function=_copy, hostname='host', path='path',
+                  size_known_at_start=True):
+        return drone_utility._Transfer(
+                function, (path,), hostname, path, path,
+                local_path=os.path.join(self._temp_dir, path),
+                size_known_at_start=size_known_at_start)
+
+
+    def test_duplicates_of_waiting_transfers_dropped(self):
+        queue = drone_utility.TransferQueue()
+        self.assertTrue(queue.add(self._transfer(function=_slow_copy)))
+        queue.poll()
+        # the first copy is already running, so this one is still needed
+        self.assertTrue(queue.add(self._transfer(function=_slow_copy)))
+        self.assertFalse(queue.add(self._transfer(function=_slow_copy)))
+        self.assertTrue(queue.add(self._transfer(function=_fail)))
+        self.assertEqual(3, len(queue))
+        key = ('_slow_copy', 'host', 'path', 'path')
+        self.assertEqual(dict(waiting=2, running=1,
+                              pending=[key, ('_fail',) + key[1:], key],
+                              finished=[]),
+                         queue.get_status())
+
+        queue.wait()
+        self.assertEqual(dict(waiting=0, running=0, pending=[],
+                              finished=[(key, True), (key, True),
+                                        (('_fail',) + key[1:], False)]),
+                         queue.get_status())
+        self.assertEqual(0, len(queue))
+
+
+    def test_rate_limit_per_host(self):
+        self.god.stub_with(scheduler_config.config, 'max_transfer_processes',
+                           10)
+        file_object = open(os.path.join(self._temp_dir, 'big'), 'w')
+        file_object.write('x' * 2048)
+        file_object.close()
+        queue = drone_utility.TransferQueue(rate_limit_kbps=1,
+                                            time_function=lambda: self._now)
+        queue.add(self._transfer(path='big'))
+        queue.add(self._transfer(path='other'))
+        queue.add(self._transfer(hostname='other_host', path='other'))
+        queue.poll()
+        self.assertEqual(1, queue.get_status()['waiting'])
+
+        self._now += 2
+        queue.poll()
+        self.assertEqual(0, queue.get_status()['waiting'])
+        queue.wait()
+
+
+    def test_fetched_size_charged_when_finished(self):
+        file_object = open(os.path.join(self._temp_dir, 'fetched'), 'w')
+        file_object.write('x' * 1024)
+        file_object.close()
+        queue = drone_utility.TransferQueue(rate_limit_kbps=1,
+                                            time_function=lambda: self._now)
+        queue.add(self._transfer(path='fetched', size_known_at_start=False))
+        queue.wait()
+        queue.add(self._transfer(path='next'))
+        queue.poll()
+        self.assertEqual(1, queue.get_status()['waiting'])
+        self._now += 1
+        queue.poll()
+        queue.wait()
+
+
+    def test_async_transfers_not_waited_for(self):
+        utility = drone_utility.DroneUtility(async_transfers=True)
+        self.god.stub_with(utility, 'sync_send_file_to', _slow_copy)
+        self.god.stub_with(utility, '_sync_get_file_from', _fail)
+        utility.execute_calls([
+                drone_utility.call('send_file_to', 'host', 'source', 'dest'),
+                drone_utility.call('get_file_from', 'host', 'source', 'dest')])
+        self.assertEqual(2, len(utility._transfers))
+
+        utility.wait_for_all_transfers()
+        status = utility._get_transfer_status()
+        self.assertEqual([True, False],
+                         [success for key, success in status['finished']])
+        self.assertEqual(['Transfer _fail with host failed: source -> dest'],
+                         utility.warnings)
+
+
+class FrameTest(unittest.TestCase):
+    def test_round_trip(self):
+        stream = StringIO()
+        drone_utility.write_frame(stream, [1, 'two'])
+        drone_utility.write_frame(stream, {'three': 3})
+        stream.seek(0)
+        self.assertEqual([1, 'two'], drone_utility.read_frame(stream))
+        self.assertEqual({'three': 3}, drone_utility.read_frame(stream))
+        self.assertRaises(EOFError, drone_utility.read_frame, stream)
+
+
+    def test_truncated_frame(self):
+        stream = StringIO()
+        drone_utility.write_frame(stream, 'some data')
+        stream = StringIO(stream.getvalue()[:-1])
+        self.assertRaises(EOFError, drone_utility.read_frame, stream)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,4 @@
-import cPickle, os, tempfile, logging
+import cPickle, os, signal, subprocess, tempfile, logging
 try:
     import autotest.common as common
 except ImportError:
@@ -15,6 +15,79 @@ class DroneUnreachable(Exception):
     pass
 
 
+class DroneAgentError(error.AutoservError):
+    """A resident drone agent failed or died while executing calls."""
+    pass
+
+
+class _DroneAgent(object):
+    """
+    A resident drone_utility process, fed framed batches of calls over its
+    stdin and answering on its stdout.
+
+    The command may run drone_utility locally or through ssh; the agent is
+    (re)started on demand, so a dead agent only fails the batch that was in
+    flight.
+    """
+    def __init__(self, command):
+        self._command = command
+        self._process = None
+
+
+    def _start(self):
+        logging.info('Starting drone agent: %s', self._command)
+        self._process = subprocess.Popen(self._command, shell=True,
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         close_fds=True)
+
+
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+
+    def execute_calls(self, calls):
+        if not self.is_running():
+            self.close()
+            self._start()
+        try:
+            drone_utility.write_frame(self._process.stdin, calls)
+            reply = drone_utility.read_frame(self._process.stdout)
+        except Exception, exc:
+            # whatever went wrong, the stream can't be trusted to be at a
+            # frame boundary any more, so the agent is not reused
+            self.close()
+            raise DroneAgentError('Drone agent "%s" died: %s' %
+                                  (self._command, exc))
+        if not isinstance(reply, tuple) or len(reply) != 2:
+            self.close()
+            raise DroneAgentError('Drone agent "%s" sent a malformed reply: '
+                                  '%r' % (self._command, reply))
+        status, payload = reply
+        if status != 'ok':
+            raise DroneAgentError('Drone agent "%s" failed:\n%s' %
+                                  (self._command, payload))
+        return payload
+
+
+    def close(self):
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except IOError:
+            pass
+        if process.poll() is None:
+            # closing stdin asks the agent to exit once it's done
+            try:
+                os.kill(process.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        process.wait()
+        process.stdout.close()
+
+
 class _AbstractDrone(object):
     """
     Attributes:
@@ -85,8 +158,26 @@ class _AbstractDrone(object):
     def execute_queued_calls(self):
         if not self._calls:
             return
-        self._execute_calls(self._calls)
+        # detach the queue before executing, so calls queued while this batch
+        # is still in flight (see DroneManager concurrent mode) are kept for
+        # the next batch instead of being cleared unexecuted
+        calls = self._calls
         self.clear_call_queue()
+        self._execute_calls(calls)
+
+
+    def send_file_to(self, drone, source_path, destination_path,
+                     can_fail=False):
+        """
+        Queue a copy of source_path on this drone to destination_path on the
+        given drone.
+
+        @returns The drone the copy is queued on if it runs as a file
+                transfer, which may go on in the background after the queued
+                calls are executed (see DroneUtility.poll_transfers()), or
+                None if it is a plain copy.
+        """
+        raise NotImplementedError
 
 
     def set_autotest_install_dir(self, path):
@@ -97,7 +188,8 @@ class _LocalDrone(_AbstractDrone):
     def __init__(self):
         super(_LocalDrone, self).__init__()
         self.hostname = 'localhost'
-        self._drone_utility = drone_utility.DroneUtility()
+        self._drone_utility = drone_utility.DroneUtility(
+                async_transfers=drone_utility.use_async_transfers())
 
 
     def _execute_calls_impl(self, calls):
@@ -109,9 +201,10 @@ class _LocalDrone(_AbstractDrone):
         if drone.hostname == self.hostname:
             self.queue_call('copy_file_or_directory', source_path,
                             destination_path)
-        else:
-            self.queue_call('send_file_to', drone.hostname, source_path,
-                            destination_path, can_fail)
+            return None
+        self.queue_call('send_file_to', drone.hostname, source_path,
+                        destination_path, can_fail)
+        return self
 
 
 class _RemoteDrone(_AbstractDrone):
@@ -123,6 +216,10 @@ class _RemoteDrone(_AbstractDrone):
             logging.error('Drone %s is unpingable, kicking out', hostname)
             raise DroneUnreachable
         self._autotest_install_dir = AUTOTEST_INSTALL_DIR
+        self._use_agent = global_config.global_config.get_config_value(
+                'SCHEDULER', 'persistent_drone_agents', type=bool,
+                default=False)
+        self._agent = None
 
 
     @property
@@ -133,14 +230,36 @@ class _RemoteDrone(_AbstractDrone):
 
     def set_autotest_install_dir(self, path):
         self._autotest_install_dir = path
+        self._close_agent()
+
+
+    def _close_agent(self):
+        if self._agent:
+            self._agent.close()
+            self._agent = None
 
 
     def shutdown(self):
         super(_RemoteDrone, self).shutdown()
+        self._close_agent()
         self._host.close()
 
 
+    def _get_agent(self):
+        if not self._agent:
+            self._host.start_master_ssh()
+            command = '%s "python %s %s"' % (
+                    self._host.ssh_command(connect_timeout=300),
+                    self._drone_utility_path, drone_utility.AGENT_FLAG)
+            self._agent = _DroneAgent(command)
+        return self._agent
+
+
     def _execute_calls_impl(self, calls):
+        if self._use_agent:
+            logging.info("Sending calls to drone agent on %s", self.hostname)
+            return self._get_agent().execute_calls(calls)
+
         logging.info("Running drone_utility on %s", self.hostname)
         result = self._host.run('python %s' % self._drone_utility_path,
                                 stdin=cPickle.dumps(calls), stdout_tee=None,
@@ -157,12 +276,14 @@ class _RemoteDrone(_AbstractDrone):
         if drone.hostname == self.hostname:
             self.queue_call('copy_file_or_directory', source_path,
                             destination_path)
-        elif isinstance(drone, _LocalDrone):
+            return None
+        if isinstance(drone, _LocalDrone):
             drone.queue_call('get_file_from', self.hostname, source_path,
                              destination_path)
-        else:
-            self.queue_call('send_file_to', drone.hostname, source_path,
-                            destination_path, can_fail)
+            return drone
+        self.queue_call('send_file_to', drone.hostname, source_path,
+                        destination_path, can_fail)
+        return self
 
 
 def get_drone(hostname):
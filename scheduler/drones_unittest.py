@@ -2,12 +2,12 @@
 
 """Tests for autotest_lib.scheduler.drones."""
 
-import cPickle
+import cPickle, os, shutil, sys, tempfile
 
 import common
 from autotest_lib.client.common_lib import utils
 from autotest_lib.client.common_lib.test_utils import mock, unittest
-from autotest_lib.scheduler import drones
+from autotest_lib.scheduler import drone_utility, drones
 from autotest_lib.server.hosts import ssh_host
 
 
@@ -50,5 +50,86 @@ class RemoteDroneTest(unittest.TestCase):
         self.god.check_playback()
 
 
+class DroneAgentTest(unittest.TestCase):
+    """Drives a real local drone_utility agent over a pipe."""
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        drone_utility_path = os.path.splitext(drone_utility.__file__)[0]
+        self._agent = drones._DroneAgent('%s %s.py %s' % (
+                sys.executable, drone_utility_path, drone_utility.AGENT_FLAG))
+
+
+    def tearDown(self):
+        self._agent.close()
+        shutil.rmtree(self._tempdir)
+
+
+    def _write_to_file(self, path, contents):
+        return self._agent.execute_calls(
+                [drone_utility.call('write_to_file', path, contents)])
+
+
+    def test_agent_stays_resident(self):
+        path = os.path.join(self._tempdir, 'file')
+        self.assertEqual(dict(results=[None], warnings=[]),
+                         self._write_to_file(path, 'foo'))
+        pid = self._agent._process.pid
+        self._write_to_file(path, 'bar')
+        self.assertEqual(pid, self._agent._process.pid)
+        self.assertEqual('foobar', open(path).read())
+
+
+    def test_agent_error(self):
+        self.assertRaises(drones.DroneAgentError, self._agent.execute_calls,
+                          [drone_utility.call('no_such_method')])
+        # the agent survives a failed batch
+        self.assertTrue(self._agent.is_running())
+        self._write_to_file(os.path.join(self._tempdir, 'file'), 'foo')
+
+
+    def test_agent_restarts_after_death(self):
+        path = os.path.join(self._tempdir, 'file')
+        self._write_to_file(path, 'foo')
+        pid = self._agent._process.pid
+        self._agent._process.kill()
+        self._agent._process.wait()
+        self._write_to_file(path, 'bar')
+        self.assertNotEqual(pid, self._agent._process.pid)
+        self.assertEqual('foobar', open(path).read())
+
+
+
+class CorruptDroneAgentTest(unittest.TestCase):
+    """Drives agents whose replies are not what drone_utility would send."""
+    def _make_agent(self, reply):
+        # answer the first batch with the given raw bytes, then wait for
+        # stdin to be closed like a real agent
+        script = ('import sys; sys.stdin.read(4); '
+                  'sys.stdout.write(%r); sys.stdout.flush(); '
+                  'sys.stdin.read()' % reply)
+        return drones._DroneAgent('%s -c "%s"' % (sys.executable, script))
+
+
+    def _assert_agent_closed_on_error(self, reply):
+        agent = self._make_agent(reply)
+        try:
+            self.assertRaises(drones.DroneAgentError, agent.execute_calls,
+                              [drone_utility.call('refresh', [])])
+            self.assertFalse(agent.is_running())
+        finally:
+            agent.close()
+
+
+    def test_unpicklable_reply(self):
+        self._assert_agent_closed_on_error(
+                drone_utility._FRAME_HEADER.pack(5) + 'junk\n')
+
+
+    def test_malformed_reply(self):
+        payload = cPickle.dumps('not a tuple', cPickle.HIGHEST_PROTOCOL)
+        self._assert_agent_closed_on_error(
+                drone_utility._FRAME_HEADER.pack(len(payload)) + payload)
+
+
 if __name__ == '__main__':
     unittest.main()
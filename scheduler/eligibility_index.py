@@ -0,0 +1,357 @@
+"""
+In-memory index of the state the host scheduler needs on every tick.
+
+BaseHostScheduler.refresh() normally rebuilds all of its auxiliary data
+structures from the database on each tick.  With thousands of hosts and tens
+of thousands of queued entries that means several large queries (plus one
+Job query per pending entry) every few seconds.
+
+The EligibilityIndex loads that state once and afterwards applies only the
+changes recorded in the afe_scheduler_changes table, which is filled in by
+database triggers (see frontend/migrations/069_add_scheduler_change_log.py).
+Each change row names the kind of object that changed and its id; the index
+re-reads just those objects.
+
+Every update reads all the rows in the change log and then deletes exactly
+the rows it read.  InnoDB allocates auto-increment ids before commit, so a
+row may become visible after rows with higher ids; it is simply picked up by
+the next update.  check_consistency() still compares the index against a full
+rebuild so the host scheduler can detect and repair anything else the
+triggers do not cover.
+"""
+
+import logging
+
+from autotest_lib.scheduler import scheduler_models
+
+
+# above this many change rows in one update, reloading everything is cheaper
+MAX_INCREMENTAL_CHANGES = 10000
+
+# the most change row ids deleted by a single statement
+_DELETE_BATCH_SIZE = 1000
+
+# the order in which change types are applied: labels before the hosts that
+# might carry them, hosts before queue entries, queue entries before jobs
+_CHANGE_TYPES = ('label', 'host', 'host_labels', 'host_acls', 'queue_entry',
+                 'job', 'user_acls')
+
+_PENDING_QUEUE_ENTRY_WHERE = 'NOT complete AND NOT active AND status="Queued"'
+
+
+def _queue_entry_sort_key(queue_entry):
+    # by job priority, then non-metahost over metahost, then FIFO
+    return (-queue_entry.job.priority, queue_entry.meta_host,
+            queue_entry.job_id, queue_entry.id)
+
+
+def sort_pending_queue_entries(queue_entries):
+    return sorted(queue_entries, key=_queue_entry_sort_key)
+
+
+class EligibilityIndex(object):
+    """
+    Ready hosts with their labels and ACLs, plus pending queue entries with
+    the ACLs, dependencies and ineligible hosts of their jobs.
+
+    The attributes below may be read directly but must not be modified; the
+    host scheduler copies whatever it mutates during a tick.
+
+    ready_hosts: maps host id to Host for hosts that can be scheduled on
+    host_labels, label_hosts: label ids of each ready host and vice versa
+    host_acls: ACL group ids of each ready host
+    labels: maps label id to Label for all labels
+    pending_queue_entries: maps entry id to HostQueueEntry for queued entries
+    job_acls, job_dependencies, job_ineligible_hosts: per job id, for jobs
+            with pending entries
+
+    As in BaseHostScheduler, none of the mappings of sets holds empty sets.
+    """
+    def __init__(self, db, loader):
+        """
+        @param db: DatabaseConnection to read the change log from.
+        @param loader: BaseHostScheduler instance whose query methods are used
+                to load hosts, labels and job data.
+        """
+        self._db = db
+        self._loader = loader
+        self._loaded = False
+        self._clear()
+
+
+    def _clear(self):
+        self.ready_hosts = {}
+        self.host_labels = {}
+        self.label_hosts = {}
+        self.host_acls = {}
+        self.labels = {}
+        self.pending_queue_entries = {}
+        self.job_acls = {}
+        self.job_dependencies = {}
+        self.job_ineligible_hosts = {}
+        # maps job id to the ids of its pending entries
+        self._pending_job_entries = {}
+
+
+    def is_loaded(self):
+        return self._loaded
+
+
+    def load(self):
+        """
+        (Re)build the whole index from the database.
+
+        Change rows are left in the log; applying them again on the next
+        update is harmless.
+        """
+        self._clear()
+        self._loaded = True
+
+        self.labels = self._loader._get_labels()
+        self.ready_hosts = self._loader._get_ready_hosts()
+        host_ids = self.ready_hosts.keys()
+        self.host_acls = self._loader._get_host_acls(host_ids)
+        self.label_hosts, self.host_labels = (
+                self._loader._get_label_hosts(host_ids))
+
+        queue_entries = scheduler_models.HostQueueEntry.fetch(
+                where=_PENDING_QUEUE_ENTRY_WHERE)
+        for queue_entry in queue_entries:
+            self._add_pending_entry(queue_entry)
+        self._load_job_data(self._pending_job_entries.keys())
+
+
+    def update(self):
+        """
+        Apply the changes logged since the last update (or load the index if
+        this is the first call) and delete them from the change log.
+
+        @returns The number of change rows processed.
+        """
+        # the rows are read before loading, so that changes committed while
+        # we load stay in the log for the next update
+        rows = self._db.execute(
+                'SELECT id, change_type, object_id FROM afe_scheduler_changes')
+        if not self.is_loaded():
+            self.load()
+            self._delete_changes(rows)
+            return 0
+        if not rows:
+            return 0
+
+        if len(rows) > MAX_INCREMENTAL_CHANGES:
+            logging.info('%d scheduler changes pending, reloading host '
+                         'eligibility index', len(rows))
+            self.load()
+        else:
+            changes = dict((change_type, set())
+                           for change_type in _CHANGE_TYPES)
+            for _, change_type, object_id in rows:
+                if change_type not in changes:
+                    logging.warning('Ignoring unknown scheduler change type '
+                                    '%r', change_type)
+                    continue
+                changes[change_type].add(int(object_id))
+            self._apply_changes(changes)
+
+        self._delete_changes(rows)
+        return len(rows)
+
+
+    def _delete_changes(self, rows):
+        change_ids = [row[0] for row in rows]
+        for start in xrange(0, len(change_ids), _DELETE_BATCH_SIZE):
+            id_list = self._loader._get_sql_id_list(
+                    change_ids[start:start + _DELETE_BATCH_SIZE])
+            self._db.execute('DELETE FROM afe_scheduler_changes '
+                             'WHERE id IN (%s)' % id_list)
+
+
+    def _apply_changes(self, changes):
+        if changes['label']:
+            self._update_labels(changes['label'])
+
+        # a host whose readiness changed needs its labels and ACLs (re)loaded
+        # as well; other hosts only need what was changed for them
+        host_ids = changes['host']
+        if host_ids:
+            self._update_hosts(host_ids)
+        self._update_host_labels(self._ready_host_ids_in(
+                changes['host_labels'] | host_ids))
+        self._update_host_acls(self._ready_host_ids_in(
+                changes['host_acls'] | host_ids))
+
+        job_ids = set(changes['job'])
+        self._update_jobs(self._pending_job_ids_in(job_ids))
+        if changes['queue_entry']:
+            job_ids |= self._update_queue_entries(changes['queue_entry'])
+        if changes['user_acls']:
+            # ACLs of jobs are derived from the memberships of their owner
+            job_ids |= set(self._pending_job_entries)
+        self._load_job_data(self._pending_job_ids_in(job_ids))
+
+
+    def _ready_host_ids_in(self, host_ids):
+        return set(host_id for host_id in host_ids
+                   if host_id in self.ready_hosts)
+
+
+    def _pending_job_ids_in(self, job_ids):
+        return set(job_id for job_id in job_ids
+                   if job_id in self._pending_job_entries)
+
+
+    def _update_labels(self, label_ids):
+        labels = self._loader._get_labels(label_ids=label_ids)
+        for label_id in label_ids:
+            if label_id in labels:
+                self.labels[label_id] = labels[label_id]
+            else:
+                self.labels.pop(label_id, None)
+
+
+    def _update_hosts(self, host_ids):
+        ready_hosts = self._loader._get_ready_hosts(host_ids=host_ids)
+        for host_id in host_ids:
+            if host_id in ready_hosts:
+                self.ready_hosts[host_id] = ready_hosts[host_id]
+            else:
+                self.ready_hosts.pop(host_id, None)
+                self._set_host_labels(host_id, ())
+                self.host_acls.pop(host_id, None)
+
+
+    def _set_host_labels(self, host_id, label_ids):
+        for label_id in self.host_labels.pop(host_id, ()):
+            hosts = self.label_hosts[label_id]
+            hosts.discard(host_id)
+            if not hosts:
+                del self.label_hosts[label_id]
+        if label_ids:
+            self.host_labels[host_id] = set(label_ids)
+            for label_id in label_ids:
+                self.label_hosts.setdefault(label_id, set()).add(host_id)
+
+
+    def _update_host_labels(self, host_ids):
+        if not host_ids:
+            return
+        _, host_labels = self._loader._get_label_hosts(host_ids)
+        for host_id in host_ids:
+            self._set_host_labels(host_id, host_labels.get(host_id, ()))
+
+
+    def _update_host_acls(self, host_ids):
+        if not host_ids:
+            return
+        host_acls = self._loader._get_host_acls(host_ids)
+        for host_id in host_ids:
+            if host_id in host_acls:
+                self.host_acls[host_id] = host_acls[host_id]
+            else:
+                self.host_acls.pop(host_id, None)
+
+
+    def _add_pending_entry(self, queue_entry):
+        self.pending_queue_entries[queue_entry.id] = queue_entry
+        self._pending_job_entries.setdefault(queue_entry.job_id,
+                                             set()).add(queue_entry.id)
+
+
+    def _remove_pending_entry(self, queue_entry_id):
+        queue_entry = self.pending_queue_entries.pop(queue_entry_id, None)
+        if queue_entry is None:
+            return
+        entry_ids = self._pending_job_entries[queue_entry.job_id]
+        entry_ids.discard(queue_entry_id)
+        if not entry_ids:
+            job_id = queue_entry.job_id
+            del self._pending_job_entries[job_id]
+            self.job_acls.pop(job_id, None)
+            self.job_dependencies.pop(job_id, None)
+            self.job_ineligible_hosts.pop(job_id, None)
+
+
+    def _update_queue_entries(self, queue_entry_ids):
+        """
+        @returns The set of ids of jobs that gained their first pending entry.
+        """
+        new_job_ids = set()
+        id_list = self._loader._get_sql_id_list(queue_entry_ids)
+        pending_entries = scheduler_models.HostQueueEntry.fetch(
+                where='id IN (%s) AND %s' % (id_list,
+                                             _PENDING_QUEUE_ENTRY_WHERE))
+        for queue_entry_id in queue_entry_ids:
+            self._remove_pending_entry(queue_entry_id)
+        for queue_entry in pending_entries:
+            if queue_entry.job_id not in self._pending_job_entries:
+                new_job_ids.add(queue_entry.job_id)
+            self._add_pending_entry(queue_entry)
+        return new_job_ids
+
+
+    def _update_jobs(self, job_ids):
+        if not job_ids:
+            return
+        # updates the Job instances shared by the pending entries in place,
+        # e.g. for a changed priority
+        scheduler_models.Job.fetch(
+                where='id IN (%s)' % self._loader._get_sql_id_list(job_ids))
+
+
+    def _load_job_data(self, job_ids):
+        if not job_ids:
+            return
+        job_ids = list(job_ids)
+        for attribute, query_method in (
+                ('job_acls', self._loader._get_job_acl_groups),
+                ('job_dependencies', self._loader._get_job_dependencies),
+                ('job_ineligible_hosts',
+                 self._loader._get_job_ineligible_hosts)):
+            job_data = getattr(self, attribute)
+            loaded_data = query_method(job_ids)
+            for job_id in job_ids:
+                if job_id in loaded_data:
+                    job_data[job_id] = loaded_data[job_id]
+                else:
+                    job_data.pop(job_id, None)
+
+
+    def get_pending_queue_entries(self):
+        """
+        @returns A list of pending HostQueueEntries in priority order.
+        """
+        return sort_pending_queue_entries(
+                self.pending_queue_entries.itervalues())
+
+
+    def check_consistency(self):
+        """
+        Compare this index against one freshly built from the database.
+
+        @returns A tuple (differences, rebuilt index), where differences is a
+                list of strings describing each mismatch (empty if the index
+                is consistent).
+        """
+        rebuilt = EligibilityIndex(self._db, self._loader)
+        rebuilt.load()
+
+        differences = []
+        for attribute in ('ready_hosts', 'labels', 'pending_queue_entries'):
+            ours = set(getattr(self, attribute))
+            theirs = set(getattr(rebuilt, attribute))
+            if ours != theirs:
+                differences.append(
+                        '%s: missing %s, extra %s'
+                        % (attribute, sorted(theirs - ours),
+                           sorted(ours - theirs)))
+        for attribute in ('host_labels', 'label_hosts', 'host_acls',
+                          'job_acls', 'job_dependencies',
+                          'job_ineligible_hosts'):
+            ours, theirs = getattr(self, attribute), getattr(rebuilt, attribute)
+            mismatched = sorted(key for key in set(ours) | set(theirs)
+                                if ours.get(key) != theirs.get(key))
+            if mismatched:
+                differences.append('%s differ for ids %s'
+                                   % (attribute, mismatched))
+        return differences, rebuilt
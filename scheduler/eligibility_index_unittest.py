@@ -0,0 +1,233 @@
+#!/usr/bin/python
+
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend.afe import frontend_test_utils
+from autotest_lib.client.common_lib.test_utils import unittest
+from autotest_lib.database import database_connection
+from autotest_lib.frontend.afe import models
+from autotest_lib.scheduler import eligibility_index, host_scheduler
+from autotest_lib.scheduler import monitor_db_functional_test
+from autotest_lib.scheduler import scheduler_models
+
+
+# (table, event, change type, id column); sqlite equivalents of the triggers
+# in frontend/migrations/069_add_scheduler_change_log.py
+_TEST_TRIGGERS = (
+    ('afe_hosts', 'INSERT', 'host', 'NEW.id'),
+    ('afe_hosts', 'UPDATE', 'host', 'NEW.id'),
+    ('afe_hosts', 'DELETE', 'host', 'OLD.id'),
+    ('afe_host_queue_entries', 'INSERT', 'queue_entry', 'NEW.id'),
+    ('afe_host_queue_entries', 'UPDATE', 'queue_entry', 'NEW.id'),
+    ('afe_host_queue_entries', 'DELETE', 'queue_entry', 'OLD.id'),
+    ('afe_host_queue_entries', 'INSERT', 'host', 'NEW.host_id'),
+    ('afe_host_queue_entries', 'UPDATE', 'host', 'NEW.host_id'),
+    ('afe_host_queue_entries', 'UPDATE', 'host', 'OLD.host_id'),
+    ('afe_host_queue_entries', 'DELETE', 'host', 'OLD.host_id'),
+    ('afe_hosts_labels', 'INSERT', 'host_labels', 'NEW.host_id'),
+    ('afe_hosts_labels', 'DELETE', 'host_labels', 'OLD.host_id'),
+    ('afe_acl_groups_hosts', 'INSERT', 'host_acls', 'NEW.host_id'),
+    ('afe_acl_groups_hosts', 'DELETE', 'host_acls', 'OLD.host_id'),
+    ('afe_acl_groups_users', 'INSERT', 'user_acls', 'NEW.user_id'),
+    ('afe_acl_groups_users', 'DELETE', 'user_acls', 'OLD.user_id'),
+    ('afe_labels', 'INSERT', 'label', 'NEW.id'),
+    ('afe_labels', 'UPDATE', 'label', 'NEW.id'),
+    ('afe_labels', 'DELETE', 'label', 'OLD.id'),
+    ('afe_jobs', 'UPDATE', 'job', 'NEW.id'),
+    ('afe_jobs_dependency_labels', 'INSERT', 'job', 'NEW.job_id'),
+    ('afe_jobs_dependency_labels', 'DELETE', 'job', 'OLD.job_id'),
+    ('afe_ineligible_host_queues', 'INSERT', 'job', 'NEW.job_id'),
+    ('afe_ineligible_host_queues', 'DELETE', 'job', 'OLD.job_id'),
+)
+
+
+def create_test_change_log(database):
+    """
+    Create the scheduler change log table and its triggers in a sqlite test
+    database.
+    """
+    database.execute('CREATE TABLE afe_scheduler_changes ('
+                     'id integer NOT NULL PRIMARY KEY AUTOINCREMENT, '
+                     'change_type varchar(32) NOT NULL, '
+                     'object_id integer NOT NULL)')
+    for index, (table, event, change_type, column) in enumerate(
+            _TEST_TRIGGERS):
+        database.execute(
+                'CREATE TRIGGER change_log_%d AFTER %s ON %s FOR EACH ROW '
+                'BEGIN INSERT INTO afe_scheduler_changes '
+                '(change_type, object_id) SELECT \'%s\', %s '
+                'WHERE %s IS NOT NULL; END'
+                % (index, event, table, change_type, column, column))
+
+
+class EligibilityIndexTest(unittest.TestCase,
+                           frontend_test_utils.FrontendTestMixin):
+    def setUp(self):
+        self._frontend_common_setup()
+        scheduler_models.DBObject._clear_instance_cache()
+        self._database = (
+            database_connection.TranslatingDatabase.get_test_database(
+                translators=monitor_db_functional_test._DB_TRANSLATORS))
+        self._database.connect(db_type='django')
+        self.god.stub_with(scheduler_models, '_db', self._database)
+        create_test_change_log(self._database)
+
+        loader = host_scheduler.BaseHostScheduler(self._database)
+        self.index = eligibility_index.EligibilityIndex(self._database,
+                                                        loader)
+        self.index.update()
+        self.platform = models.Label.objects.get(name='myplatform')
+
+
+    def tearDown(self):
+        self._database.disconnect()
+        self._frontend_common_teardown()
+
+
+    def _assert_consistent(self):
+        differences, _ = self.index.check_consistency()
+        self.assertEquals([], differences)
+
+
+    def _count_changes(self):
+        return self._database.execute(
+                'SELECT COUNT(*) FROM afe_scheduler_changes')[0][0]
+
+
+    def test_initial_load(self):
+        self.assertEquals(set(host.id for host in self.hosts),
+                          set(self.index.ready_hosts))
+        self.assertEquals(set([self.labels[0].id, self.platform.id]),
+                          self.index.host_labels[self.hosts[0].id])
+        self.assertEquals({}, self.index.pending_queue_entries)
+        self.assertEquals(0, self._count_changes())
+        self._assert_consistent()
+
+
+    def test_host_changes(self):
+        host1, host2 = self.hosts[0], self.hosts[1]
+        host1.locked = True
+        host1.save()
+        host2.labels.add(self.label3)
+        self.assertEquals(2, self.index.update())
+
+        self.assertFalse(host1.id in self.index.ready_hosts)
+        self.assertFalse(host1.id in self.index.host_labels)
+        self.assertFalse(self.labels[0].id in self.index.label_hosts)
+        self.assertTrue(host2.id in self.index.label_hosts[self.label3.id])
+        self.assertEquals(0, self._count_changes())
+        self._assert_consistent()
+
+        host1.locked = False
+        host1.save()
+        self.index.update()
+        self.assertTrue(host1.id in self.index.label_hosts[self.labels[0].id])
+        self._assert_consistent()
+
+
+    def test_queue_entry_changes(self):
+        job = self._create_job(hosts=[1], metahosts=[self.labels[0].id])
+        self.index.update()
+        self.assertEquals(2, len(self.index.pending_queue_entries))
+        self.assertTrue(job.id in self.index.job_acls)
+        self._assert_consistent()
+
+        models.IneligibleHostQueue.objects.create(job=job, host=self.hosts[1])
+        self.index.update()
+        self.assertTrue(self.hosts[1].id
+                        in self.index.job_ineligible_hosts[job.id])
+
+        # an active entry takes its host out of the ready hosts
+        job.hostqueueentry_set.filter(host__id=1).update(active=True,
+                                                         status='Running')
+        self.index.update()
+        self.assertEquals(1, len(self.index.pending_queue_entries))
+        self.assertFalse(1 in self.index.ready_hosts)
+        self._assert_consistent()
+
+        job.hostqueueentry_set.update(active=False, complete=True,
+                                      status='Completed')
+        self.index.update()
+        self.assertEquals({}, self.index.pending_queue_entries)
+        self.assertFalse(job.id in self.index.job_ineligible_hosts)
+        self.assertTrue(1 in self.index.ready_hosts)
+        self._assert_consistent()
+
+
+    def test_priority_change_reorders_entries(self):
+        first_job = self._create_job(hosts=[1])
+        second_job = self._create_job(hosts=[2])
+        self.index.update()
+        self.assertEquals([first_job.id, second_job.id],
+                          [entry.job_id for entry
+                           in self.index.get_pending_queue_entries()])
+
+        second_job.priority = 1
+        second_job.save()
+        self.index.update()
+        self.assertEquals([second_job.id, first_job.id],
+                          [entry.job_id for entry
+                           in self.index.get_pending_queue_entries()])
+
+
+    def test_late_committed_change(self):
+        self._database.execute('INSERT INTO afe_scheduler_changes '
+                               '(id, change_type, object_id) '
+                               'VALUES (100, "label", %s)',
+                               (self.platform.id,))
+        self.assertEquals(1, self.index.update())
+
+        # a change whose lower id only becomes visible after id 100 was read
+        host = self.hosts[0]
+        host.locked = True
+        host.save()
+        self._database.execute('UPDATE afe_scheduler_changes SET id = 50')
+        self.assertEquals(1, self.index.update())
+        self.assertFalse(host.id in self.index.ready_hosts)
+        self.assertEquals(0, self._count_changes())
+        self._assert_consistent()
+
+
+    def test_changes_during_load_are_kept(self):
+        loader = host_scheduler.BaseHostScheduler(self._database)
+        index = eligibility_index.EligibilityIndex(self._database, loader)
+        real_load = index.load
+        def load_with_concurrent_change():
+            real_load()
+            host = self.hosts[0]
+            host.locked = True
+            host.save()
+        self.god.stub_with(index, 'load', load_with_concurrent_change)
+        index.update()
+        self.assertEquals(1, self._count_changes())
+        self.assertEquals(1, index.update())
+        self.assertFalse(self.hosts[0].id in index.ready_hosts)
+
+
+    def test_check_consistency_detects_missed_changes(self):
+        self._create_job(hosts=[1])
+        # lose the logged changes, as if a commit raced with an update
+        self._database.execute('DELETE FROM afe_scheduler_changes')
+        self.index.update()
+
+        differences, rebuilt = self.index.check_consistency()
+        self.assertEquals('pending_queue_entries: missing [1], extra []',
+                          differences[0])
+        self.assertEquals(1, len(rebuilt.pending_queue_entries))
+        self.assertEquals([], rebuilt.check_consistency()[0])
+
+
+    def test_reload_on_many_changes(self):
+        self.god.stub_with(eligibility_index, 'MAX_INCREMENTAL_CHANGES', 1)
+        self.god.stub_function(self.index, 'load')
+        self._create_job(hosts=[1, 2])
+        self.index.load.expect_call()
+        self.index.update()
+        self.god.check_playback()
+
+
+if __name__ == '__main__':
+    unittest.main()
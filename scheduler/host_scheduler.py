@@ -3,10 +3,11 @@ Autotest scheduling utility.
 """
 
 
-import logging
+import logging, time
 
 from autotest_lib.client.common_lib import global_config, utils
 from autotest_lib.frontend.afe import models
+from autotest_lib.scheduler import eligibility_index, email_manager
 from autotest_lib.scheduler import metahost_scheduler, scheduler_config
 from autotest_lib.scheduler import scheduler_models
 
@@ -31,10 +32,28 @@ class BaseHostScheduler(metahost_scheduler.HostSchedulingUtility):
     In the past this was done with one or two very large, complex database
     queries.  It has proven much simpler and faster to build these auxiliary
     data structures and perform the logic in Python.
+
+    With incremental_host_scheduling enabled, the data structures are kept in
+    an EligibilityIndex that is updated from a change log instead of being
+    rebuilt on every tick.
     """
     def __init__(self, db):
         self._db = db
         self._metahost_schedulers = metahost_scheduler.get_metahost_schedulers()
+        # label ids whose host set in _label_hosts is shared with the
+        # eligibility index and must be copied before being modified
+        self._shared_label_ids = set()
+
+        config = global_config.global_config
+        self._index = None
+        if config.get_config_value(scheduler_config.CONFIG_SECTION,
+                                   'incremental_host_scheduling', type=bool,
+                                   default=False):
+            self._index = eligibility_index.EligibilityIndex(db, self)
+        self._index_check_interval = 60 * config.get_config_value(
+                scheduler_config.CONFIG_SECTION,
+                'host_index_check_interval_mins', type=int, default=60)
+        self._last_index_check_time = time.time()
 
         # load site-specific scheduler selected in global_config
         site_schedulers_str = global_config.global_config.get_config_value(
@@ -51,16 +70,22 @@ class BaseHostScheduler(metahost_scheduler.HostSchedulingUtility):
                                in self._metahost_schedulers))
 
 
-    def _get_ready_hosts(self):
+    def _get_ready_hosts(self, host_ids=None):
         # avoid any host with a currently active queue entry against it
+        where = ("active_hqe.host_id IS NULL "
+                 "AND NOT afe_hosts.locked "
+                 "AND (afe_hosts.status IS NULL "
+                         "OR afe_hosts.status = 'Ready')")
+        if host_ids is not None:
+            if not host_ids:
+                return {}
+            where += ' AND afe_hosts.id IN (%s)' % self._get_sql_id_list(
+                    host_ids)
         hosts = scheduler_models.Host.fetch(
             joins='LEFT JOIN afe_host_queue_entries AS active_hqe '
                   'ON (afe_hosts.id = active_hqe.host_id AND '
                       'active_hqe.active)',
-            where="active_hqe.host_id IS NULL "
-                  "AND NOT afe_hosts.locked "
-                  "AND (afe_hosts.status IS NULL "
-                          "OR afe_hosts.status = 'Ready')")
+            where=where)
         return dict((host.id, host) for host in hosts)
 
 
@@ -139,9 +164,14 @@ class BaseHostScheduler(metahost_scheduler.HostSchedulingUtility):
         return labels_to_hosts, hosts_to_labels
 
 
-    def _get_labels(self):
+    def _get_labels(self, label_ids=None):
+        where = ''
+        if label_ids is not None:
+            if not label_ids:
+                return {}
+            where = 'id IN (%s)' % self._get_sql_id_list(label_ids)
         return dict((label.id, label) for label
-                    in scheduler_models.Label.fetch())
+                    in scheduler_models.Label.fetch(where=where))
 
 
     def recovery_on_startup(self):
@@ -149,7 +179,58 @@ class BaseHostScheduler(metahost_scheduler.HostSchedulingUtility):
             metahost_scheduler.recovery_on_startup()
 
 
+    def _update_index(self):
+        self._index.update()
+        now = time.time()
+        if now - self._last_index_check_time < self._index_check_interval:
+            return
+        self._last_index_check_time = now
+        differences, rebuilt_index = self._index.check_consistency()
+        if differences:
+            message = '\n'.join(differences)
+            logging.error('Host eligibility index was inconsistent, '
+                          'rebuilding it:\n%s', message)
+            email_manager.manager.enqueue_notify_email(
+                    'Host eligibility index inconsistent', message)
+            self._index = rebuilt_index
+
+
+    def get_pending_queue_entries(self):
+        """
+        @returns A list of pending HostQueueEntries sorted in priority order.
+        """
+        # the queries below don't go through scheduler_models
+        scheduler_models.flush_writes()
+        if self._index is not None:
+            self._update_index()
+            return self._index.get_pending_queue_entries()
+
+        # prioritize by job priority, then non-metahost over metahost, then FIFO
+        return list(scheduler_models.HostQueueEntry.fetch(
+            joins='INNER JOIN afe_jobs ON (job_id=afe_jobs.id)',
+            where='NOT complete AND NOT active AND status="Queued"',
+            order_by='afe_jobs.priority DESC, meta_host, job_id'))
+
+
+    def _refresh_from_index(self):
+        # only the structures modified during a tick are copied
+        self._hosts_available = dict(self._index.ready_hosts)
+        self._label_hosts = dict(self._index.label_hosts)
+        self._shared_label_ids = set(self._label_hosts)
+        self._host_labels = self._index.host_labels
+        self._host_acls = self._index.host_acls
+        self._labels = self._index.labels
+        self._job_acls = self._index.job_acls
+        self._ineligible_hosts = self._index.job_ineligible_hosts
+        self._job_dependencies = self._index.job_dependencies
+
+
     def refresh(self, pending_queue_entries):
+        scheduler_models.flush_writes()
+        if self._index is not None:
+            self._refresh_from_index()
+            return
+
         self._hosts_available = self._get_ready_hosts()
 
         relevant_jobs = [queue_entry.job_id
@@ -161,6 +242,7 @@ class BaseHostScheduler(metahost_scheduler.HostSchedulingUtility):
         host_ids = self._hosts_available.keys()
         self._host_acls = self._get_host_acls(host_ids)
         self._label_hosts, self._host_labels = self._get_label_hosts(host_ids)
+        self._shared_label_ids = set()
 
         self._labels = self._get_labels()
 
@@ -175,6 +257,9 @@ class BaseHostScheduler(metahost_scheduler.HostSchedulingUtility):
 
 
     def remove_host_from_label(self, host_id, label_id):
+        if label_id in self._shared_label_ids:
+            self._label_hosts[label_id] = set(self._label_hosts[label_id])
+            self._shared_label_ids.remove(label_id)
         self._label_hosts[label_id].remove(host_id)
 
 
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+"""
+Benchmark for the per-tick cost of the host scheduler's refresh.
+
+Fills an in-memory sqlite database with a number of hosts, labels and queued
+host queue entries, then times getting the pending entries and refreshing the
+host scheduler, once rebuilding everything from the database on every tick
+and once with the incremental eligibility index, with a number of host
+changes logged between ticks.
+"""
+
+import optparse, random, time
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.frontend import setup_django_environment
+from autotest_lib.frontend import setup_test_environment
+from django.db import connection
+from autotest_lib.client.common_lib import global_config
+from autotest_lib.database import database_connection
+from autotest_lib.scheduler import eligibility_index_unittest, host_scheduler
+from autotest_lib.scheduler import monitor_db_functional_test
+from autotest_lib.scheduler import scheduler_config, scheduler_models
+
+
+def _populate(db, num_hosts, num_labels, num_entries, entries_per_job):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO afe_users (login, access_level, "
+                   "reboot_before, reboot_after, show_experimental) "
+                   "VALUES ('user', 0, 0, 0, 0)")
+    cursor.execute("INSERT INTO afe_acl_groups (name, description) "
+                   "VALUES ('acl', '')")
+    cursor.execute('INSERT INTO afe_acl_groups_users (aclgroup_id, user_id) '
+                   'VALUES (1, 1)')
+    cursor.executemany(
+            'INSERT INTO afe_labels (id, name, kernel_config, platform, '
+            'invalid, only_if_needed) VALUES (%s, %s, "", 0, 0, 0)',
+            [(label_id, 'label%d' % label_id)
+             for label_id in xrange(1, num_labels + 1)])
+    cursor.executemany(
+            'INSERT INTO afe_hosts (id, hostname, locked, status, invalid, '
+            'protection, dirty) VALUES (%s, %s, 0, "Ready", 0, 0, 0)',
+            [(host_id, 'host%d' % host_id)
+             for host_id in xrange(1, num_hosts + 1)])
+    cursor.executemany(
+            'INSERT INTO afe_hosts_labels (host_id, label_id) VALUES (%s, %s)',
+            [(host_id, host_id % num_labels + 1)
+             for host_id in xrange(1, num_hosts + 1)])
+    cursor.executemany(
+            'INSERT INTO afe_acl_groups_hosts (aclgroup_id, host_id) '
+            'VALUES (1, %s)',
+            [(host_id,) for host_id in xrange(1, num_hosts + 1)])
+
+    num_jobs = (num_entries + entries_per_job - 1) / entries_per_job
+    cursor.executemany(
+            'INSERT INTO afe_jobs (id, owner, name, priority, control_file, '
+            'control_type, created_on, synch_count, timeout, run_verify, '
+            'email_list, reboot_before, reboot_after, parse_failed_repair, '
+            'max_runtime_hrs) VALUES (%s, "user", "job", %s, "", 2, '
+            '"2011-01-01 00:00:00", 1, 72, 1, "", 0, 0, 1, 72)',
+            [(job_id, random.randint(0, 3))
+             for job_id in xrange(1, num_jobs + 1)])
+    # all entries are metahosts, so the hosts stay ready
+    cursor.executemany(
+            'INSERT INTO afe_host_queue_entries (job_id, meta_host, status, '
+            'active, complete, deleted, execution_subdir, aborted) '
+            'VALUES (%s, %s, "Queued", 0, 0, 0, "", 0)',
+            [(entry / entries_per_job + 1, random.randint(1, num_labels))
+             for entry in xrange(num_entries)])
+
+
+def _make_changes(db, num_hosts, num_changes):
+    for _ in xrange(num_changes):
+        db.execute('UPDATE afe_hosts SET locked = NOT locked WHERE id = %s',
+                   (random.randint(1, num_hosts),))
+
+
+def _time_ticks(db, scheduler, options):
+    durations = []
+    for _ in xrange(options.ticks):
+        _make_changes(db, options.hosts, options.changes)
+        start_time = time.time()
+        scheduler.refresh(scheduler.get_pending_queue_entries())
+        durations.append(time.time() - start_time)
+    return durations
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-H', '--hosts', type='int', default=10000,
+                      help='number of hosts')
+    parser.add_option('-l', '--labels', type='int', default=100,
+                      help='number of labels')
+    parser.add_option('-q', '--queue-entries', type='int', default=50000,
+                      help='number of queued host queue entries')
+    parser.add_option('-e', '--entries-per-job', type='int', default=5,
+                      help='number of queue entries per job')
+    parser.add_option('-c', '--changes', type='int', default=50,
+                      help='number of host changes between ticks')
+    parser.add_option('-t', '--ticks', type='int', default=3,
+                      help='number of ticks to time per mode')
+    options, args = parser.parse_args()
+
+    setup_test_environment.set_up()
+    db = database_connection.TranslatingDatabase.get_test_database(
+            translators=monitor_db_functional_test._DB_TRANSLATORS)
+    db.connect(db_type='django')
+    scheduler_models._db = db
+    eligibility_index_unittest.create_test_change_log(db)
+    _populate(db, options.hosts, options.labels, options.queue_entries,
+              options.entries_per_job)
+
+    config = global_config.global_config
+    for incremental in (False, True):
+        config.override_config_value(scheduler_config.CONFIG_SECTION,
+                                     'incremental_host_scheduling',
+                                     str(incremental))
+        scheduler_models.DBObject._clear_instance_cache()
+        scheduler = host_scheduler.HostScheduler(db)
+        if incremental:
+            start_time = time.time()
+            scheduler.get_pending_queue_entries()
+            print 'initial index load %.3fs' % (time.time() - start_time)
+
+        durations = _time_ticks(db, scheduler, options)
+        print ('%-11s %d hosts, %d entries: avg tick %.3fs, max tick %.3fs'
+               % (incremental and 'incremental' or 'full', options.hosts,
+                  options.queue_entries, sum(durations) / len(durations),
+                  max(durations)))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,10 +18,11 @@ from autotest_lib.client.common_lib import host_protections, utils
 from autotest_lib.database import database_connection
 from autotest_lib.frontend.afe import models, rpc_utils, readonly_connection
 from autotest_lib.frontend.afe import model_attributes
-from autotest_lib.scheduler import drone_manager, drones, email_manager
+from autotest_lib.scheduler import agent_queue, drone_manager, drones
+from autotest_lib.scheduler import email_manager
 from autotest_lib.scheduler import gc_stats, host_scheduler, monitor_db_cleanup
 from autotest_lib.scheduler import status_server, scheduler_config
-from autotest_lib.scheduler import scheduler_models
+from autotest_lib.scheduler import scheduler_models, tick_stats
 
 WATCHER_PID_FILE_PREFIX = 'autotest-scheduler-watcher'
 PID_FILE_PREFIX = 'autotest-scheduler'
@@ -94,6 +95,15 @@ def _autoserv_command_line(machines, extra_args, job=None,
     return autoserv_argv + extra_args
 
 
+def _count_django_queries():
+    """
+    @returns The number of queries Django recorded since the last
+            django.db.reset_queries().  Django only records queries when
+            sql_debug_mode is enabled, otherwise this is always 0.
+    """
+    return len(django.db.connection.queries)
+
+
 def _site_init_monitor_db_dummy():
     return {}
 
@@ -233,6 +243,7 @@ def main_without_exception_handling():
     email_manager.manager.send_queued_emails()
     server.shutdown()
     _drone_manager.shutdown()
+    scheduler_models.disable_unit_of_work()
     _db.disconnect()
 
 
@@ -251,7 +262,9 @@ def main():
 
 class Dispatcher(object):
     def __init__(self):
-        self._agents = []
+        # agents waiting to be started, and started agents
+        self._agent_queue = agent_queue.AgentQueue()
+        self._running_agents = []
         self._last_clean_time = time.time()
         self._host_scheduler = host_scheduler.HostScheduler(_db)
         user_cleanup_time = scheduler_config.config.clean_interval
@@ -261,11 +274,18 @@ class Dispatcher(object):
         self._host_agents = {}
         self._queue_entry_agents = {}
         self._tick_count = 0
+        self._tick_stats = tick_stats.instance()
+        self._tick_stats.query_counter = _count_django_queries
         self._last_garbage_stats_time = time.time()
         self._seconds_between_garbage_stats = 60 * (
                 global_config.global_config.get_config_value(
                         scheduler_config.CONFIG_SECTION,
                         'gc_stats_interval_mins', type=int, default=6*60))
+        self._unit_of_work = None
+        if global_config.global_config.get_config_value(
+                scheduler_config.CONFIG_SECTION, 'batch_scheduler_writes',
+                type=bool, default=False):
+            self._unit_of_work = scheduler_models.enable_unit_of_work()
 
 
     def initialize(self, recover_hosts=True):
@@ -279,26 +299,45 @@ class Dispatcher(object):
             self._recover_hosts()
 
         self._host_scheduler.recovery_on_startup()
+        self._flush_writes()
 
 
     def tick(self):
-        self._garbage_collection()
-        _drone_manager.refresh()
-        self._run_cleanup()
-        self._find_aborting()
-        self._process_recurring_runs()
-        self._schedule_delay_tasks()
-        self._schedule_running_host_queue_entries()
-        self._schedule_special_tasks()
-        self._schedule_new_jobs()
-        self._handle_agents()
-        self._host_scheduler.tick()
-        _drone_manager.execute_actions()
-        email_manager.manager.send_queued_emails()
+        stats = self._tick_stats
+        stats.start_tick()
+        stats.run_phase('garbage_collection', self._garbage_collection)
+        stats.run_phase('drone_refresh', _drone_manager.refresh)
+        stats.run_phase('run_cleanup', self._run_cleanup)
+        stats.run_phase('find_aborting', self._find_aborting)
+        stats.run_phase('process_recurring_runs', self._process_recurring_runs)
+        stats.run_phase('schedule_delay_tasks', self._schedule_delay_tasks)
+        stats.run_phase('schedule_running_host_queue_entries',
+                        self._schedule_running_host_queue_entries)
+        stats.run_phase('schedule_special_tasks', self._schedule_special_tasks)
+        stats.run_phase('schedule_new_jobs', self._schedule_new_jobs)
+        stats.run_phase('handle_agents', self._handle_agents)
+        stats.run_phase('host_scheduler_tick', self._host_scheduler.tick)
+        # write the tick's database changes before acting on them
+        stats.run_phase('flush_writes', self._flush_writes)
+        stats.run_phase('execute_actions', _drone_manager.execute_actions)
+        stats.run_phase('send_queued_emails',
+                        email_manager.manager.send_queued_emails)
+        stats.end_tick()
+        # query counts must be taken before this
         django.db.reset_queries()
         self._tick_count += 1
 
 
+    def _flush_writes(self):
+        if self._unit_of_work is None:
+            return
+        self._unit_of_work.flush()
+        num_updates, num_statements = self._unit_of_work.pop_stats()
+        self._tick_stats.add_count('batched_field_updates', num_updates)
+        self._tick_stats.add_count('update_statements_saved',
+                                   num_updates - num_statements)
+
+
     def _run_cleanup(self):
         self._periodic_cleanup.run_cleanup_maybe()
         self._24hr_upkeep.run_cleanup_maybe()
@@ -332,13 +371,20 @@ class Dispatcher(object):
 
     def add_agent_task(self, agent_task):
         agent = Agent(agent_task)
-        self._agents.append(agent)
+        self._agent_queue.add(agent)
         agent.dispatcher = self
         self._register_agent_for_ids(self._host_agents, agent.host_ids, agent)
         self._register_agent_for_ids(self._queue_entry_agents,
                                      agent.queue_entry_ids, agent)
 
 
+    def get_agents(self):
+        """
+        @returns A list of all agents, started ones first.
+        """
+        return self._running_agents + self._agent_queue.get_agents()
+
+
     def get_agents_for_entry(self, queue_entry):
         """
         Find agents corresponding to the specified queue_entry.
@@ -354,7 +400,13 @@ class Dispatcher(object):
 
 
     def remove_agent(self, agent):
-        self._agents.remove(agent)
+        if agent not in self._agent_queue:
+            self._running_agents.remove(agent)
+        self._unregister_agent(agent)
+
+
+    def _unregister_agent(self, agent):
+        self._agent_queue.remove(agent)
         self._unregister_agent_for_ids(self._host_agents, agent.host_ids,
                                        agent)
         self._unregister_agent_for_ids(self._queue_entry_agents,
@@ -627,11 +679,7 @@ class Dispatcher(object):
 
 
     def _get_pending_queue_entries(self):
-        # prioritize by job priority, then non-metahost over metahost, then FIFO
-        return list(scheduler_models.HostQueueEntry.fetch(
-            joins='INNER JOIN afe_jobs ON (job_id=afe_jobs.id)',
-            where='NOT complete AND NOT active AND status="Queued"',
-            order_by='afe_jobs.priority DESC, meta_host, job_id'))
+        return self._host_scheduler.get_pending_queue_entries()
 
 
     def _refresh_pending_queue_entries(self):
@@ -726,29 +774,30 @@ class Dispatcher(object):
 
 
     def _find_aborting(self):
-        jobs_to_stop = set()
-        for entry in scheduler_models.HostQueueEntry.fetch(
-                where='aborted and not complete'):
+        queue_entries = scheduler_models.HostQueueEntry.fetch_with_related(
+                where='aborted and not complete')
+        if not queue_entries:
+            return
+
+        # an agent may be shared by several of the entries
+        agents_to_abort, seen_agents = [], set()
+        for entry in queue_entries:
             logging.info('Aborting %s', entry)
             for agent in self.get_agents_for_entry(entry):
-                agent.abort()
-            entry.abort(self)
-            jobs_to_stop.add(entry.job)
-        for job in jobs_to_stop:
-            job.stop_if_necessary()
+                if agent not in seen_agents:
+                    seen_agents.add(agent)
+                    agents_to_abort.append(agent)
+        for agent in agents_to_abort:
+            agent.abort()
+        scheduler_models.HostQueueEntry.abort_entries(queue_entries, self)
 
 
-    def _can_start_agent(self, agent, num_started_this_cycle,
-                         have_reached_limit):
+    def _can_start_agent(self, agent, num_started_this_cycle, capacity):
         # always allow zero-process agents to run
         if agent.task.num_processes == 0:
             return True
-        # don't allow any nonzero-process agents to run after we've reached a
-        # limit (this avoids starvation of many-process agents)
-        if have_reached_limit:
-            return False
         # total process throttling
-        max_runnable_processes = _drone_manager.max_runnable_processes(
+        max_runnable_processes = capacity.max_runnable_processes(
                 agent.task.owner_username,
                 agent.task.get_drone_hostnames_allowed())
         if agent.task.num_processes > max_runnable_processes:
@@ -764,21 +813,47 @@ class Dispatcher(object):
         return True
 
 
-    def _handle_agents(self):
+    def _tick_agent(self, agent):
+        """
+        @returns True if the agent is still running after the tick.
+        """
+        agent.tick()
+        if agent.is_done():
+            logging.info("agent finished")
+            self._unregister_agent(agent)
+            return False
+        return True
+
+
+    def _start_waiting_agents(self):
+        capacity = _drone_manager.get_capacity_view()
         num_started_this_cycle = 0
-        have_reached_limit = False
-        # iterate over copy, so we can remove agents during iteration
-        for agent in list(self._agents):
-            if not agent.started:
-                if not self._can_start_agent(agent, num_started_this_cycle,
-                                             have_reached_limit):
-                    have_reached_limit = True
-                    continue
-                num_started_this_cycle += agent.task.num_processes
-            agent.tick()
+        while True:
+            agent = self._agent_queue.peek()
+            if agent is None:
+                break
             if agent.is_done():
+                # aborted before it was started
                 logging.info("agent finished")
                 self.remove_agent(agent)
+                continue
+            if not self._can_start_agent(agent, num_started_this_cycle,
+                                         capacity):
+                # don't start any nonzero-process agents after we've reached a
+                # limit (this avoids starvation of many-process agents)
+                break
+            self._agent_queue.pop()
+            num_started_this_cycle += agent.task.num_processes
+            self._tick_stats.add_count('agents_started')
+            if self._tick_agent(agent):
+                self._running_agents.append(agent)
+
+
+    def _handle_agents(self):
+        self._running_agents = [agent for agent in self._running_agents
+                                if self._tick_agent(agent)]
+        self._start_waiting_agents()
+        self._tick_stats.add_count('agents_waiting', len(self._agent_queue))
         logging.info('%d running processes',
                      _drone_manager.total_running_processes())
 
@@ -969,6 +1044,8 @@ class PidfileRunMonitor(object):
         process is unimportant here, as it shouldn't be used by anyone.
         """
         self.lost_process = True
+        # the drone manager's PidfileContents are kept across refreshes
+        self._state = drone_manager.PidfileContents()
         self._state.process = process
         self._state.exit_status = 1
         self._state.num_tests_failed = 0
@@ -1015,6 +1092,10 @@ class Agent(object):
         success - bool, True if this task succeeded.
         queue_entry_ids - A sequence of HostQueueEntry ids this task handles.
         host_ids - A sequence of Host ids this task represents.
+
+    The following attribute is optional:
+        priority - The job priority used to order agents waiting to be
+                started (see agent_queue.py).
     """
 
 
@@ -1234,6 +1315,15 @@ class AgentTask(object):
         raise NotImplementedError
 
 
+    @property
+    def priority(self):
+        """
+        Return priority of the job this task works for, used to order agents
+        waiting to be started.  To be overridden by tasks working for a job.
+        """
+        return agent_queue.DEFAULT_PRIORITY
+
+
     def _working_directory(self):
         """
         Return the directory where this AgentTask's process executes.  Must be
@@ -1466,6 +1556,13 @@ class SpecialAgentTask(AgentTask, TaskWithJobKeyvals):
         return None
 
 
+    @property
+    def priority(self):
+        if self.queue_entry:
+            return self.queue_entry.job.priority
+        return super(SpecialAgentTask, self).priority
+
+
     def prolog(self):
         super(SpecialAgentTask, self).prolog()
         self.task.activate()
@@ -1741,6 +1838,11 @@ class AbstractQueueTask(AgentTask, TaskWithJobKeyvals):
         return self.job.owner
 
 
+    @property
+    def priority(self):
+        return self.job.priority
+
+
     def _working_directory(self):
         return self._get_consistent_execution_path(self.queue_entries)
 
@@ -1902,6 +2004,11 @@ class PostJobTask(AgentTask):
         return self.queue_entries[0].job.owner
 
 
+    @property
+    def priority(self):
+        return self.queue_entries[0].job.priority
+
+
     def _working_directory(self):
         return self._get_consistent_execution_path(self.queue_entries)
 
@@ -2089,6 +2196,10 @@ class SelfThrottledPostJobTask(PostJobTask):
     def _try_starting_process(self):
         if not self._can_run_new_process():
             return
+        if _drone_manager.has_pending_results_transfers(
+                self._working_directory()):
+            # results copied by the previous tasks are still on their way
+            return
 
         # actually run the command
         super(SelfThrottledPostJobTask, self).run()
@@ -76,6 +76,8 @@ class MockDroneManager(NullMethodObject):
     Public attributes:
     max_runnable_processes_value: value returned by max_runnable_processes().
             tests can change this to activate throttling.
+    pending_results_transfers: working directories for which
+            has_pending_results_transfers() returns True.
     """
     _NULL_METHODS = ('reinitialize_drones', 'copy_to_results_repository',
                      'copy_results_on_drone')
@@ -126,6 +128,9 @@ class MockDroneManager(NullMethodObject):
         # pidfile IDs that have just been unregistered (so will disappear on the
         # next cycle)
         self._unregistered_pidfiles = set()
+        # (working_directory, pidfile_name) of every executed process
+        self._executed_processes = set()
+        self.pending_results_transfers = set()
 
 
     # utility APIs for use by the test
@@ -163,6 +168,10 @@ class MockDroneManager(NullMethodObject):
                 if self._pidfiles[pidfile_id].process is not None]
 
 
+    def was_process_executed(self, working_directory, pidfile_name):
+        return (working_directory, pidfile_name) in self._executed_processes
+
+
     def pidfile_from_path(self, working_directory, pidfile_name):
         return self._pidfile_index[(working_directory, pidfile_name)]
 
@@ -192,6 +201,10 @@ class MockDroneManager(NullMethodObject):
         return self.process_capacity - self.total_running_processes()
 
 
+    def get_capacity_view(self):
+        return self
+
+
     def refresh(self):
         for pidfile_id in self._unregistered_pidfiles:
             # intentionally handle non-registered pidfiles silently
@@ -247,9 +260,14 @@ class MockDroneManager(NullMethodObject):
         self._initialize_pidfile(pidfile_id)
         self._pidfile_index[(working_directory, pidfile_name)] = pidfile_id
         self._set_last_pidfile(pidfile_id, working_directory, pidfile_name)
+        self._executed_processes.add((working_directory, pidfile_name))
         return pidfile_id
 
 
+    def has_pending_results_transfers(self, path):
+        return path in self.pending_results_transfers
+
+
     def get_pidfile_contents(self, pidfile_id, use_second_read=False):
         if pidfile_id not in self._pidfiles:
             logging.debug('Request for nonexistent pidfile %s' % pidfile_id)
@@ -416,6 +434,28 @@ class SchedulerFunctionalTest(unittest.TestCase,
         self._assert_nothing_is_running()
 
 
+    def test_parsing_waits_for_results_transfers(self):
+        self._initialize_test()
+        job, queue_entry = self._make_job_and_queue_entry()
+        self._run_pre_job_verify(queue_entry)
+        self._run_dispatcher() # launches job
+        execution_path = self._update_instance(queue_entry).execution_path()
+        self.mock_drone_manager.pending_results_transfers.add(execution_path)
+
+        self.mock_drone_manager.finish_process(_PidfileType.JOB)
+        self._run_dispatcher()
+        self._check_entry_status(queue_entry, HqeStatus.PARSING)
+        self.assertFalse(self.mock_drone_manager.was_process_executed(
+                execution_path, drone_manager.PARSER_PID_FILE))
+
+        self.mock_drone_manager.pending_results_transfers.clear()
+        self._run_dispatcher()
+        self.assert_(self.mock_drone_manager.was_process_executed(
+                execution_path, drone_manager.PARSER_PID_FILE))
+        self._finish_parsing_and_cleanup(queue_entry)
+        self._check_statuses(queue_entry, HqeStatus.COMPLETED, HostStatus.READY)
+
+
     def _setup_for_pre_job_cleanup(self):
         self._initialize_test()
         job, queue_entry = self._make_job_and_queue_entry()
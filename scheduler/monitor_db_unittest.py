@@ -7,14 +7,16 @@ except ImportError:
     import common
 from autotest_lib.frontend import setup_django_environment
 from autotest_lib.frontend.afe import frontend_test_utils
+from autotest_lib.client.common_lib import global_config
 from autotest_lib.client.common_lib.test_utils import mock
 from autotest_lib.client.common_lib.test_utils import unittest
 from autotest_lib.database import database_connection
 from autotest_lib.frontend.afe import models
 from autotest_lib.scheduler import monitor_db, drone_manager, email_manager
 from autotest_lib.scheduler import scheduler_config, gc_stats, host_scheduler
+from autotest_lib.scheduler import eligibility_index_unittest
 from autotest_lib.scheduler import monitor_db_functional_test
-from autotest_lib.scheduler import scheduler_models
+from autotest_lib.scheduler import scheduler_models, tick_stats
 
 _DEBUG = False
 
@@ -720,6 +722,84 @@ class DispatcherSchedulingTest(BaseSchedulerTest):
         self._dispatcher._garbage_collection()
 
 
+class IncrementalDispatcherSchedulingTest(DispatcherSchedulingTest):
+    """
+    Runs all the scheduling tests with the host scheduler's eligibility index
+    updated from the change log instead of rebuilt on every tick.
+    """
+    def _set_monitor_stubs(self):
+        super(IncrementalDispatcherSchedulingTest, self)._set_monitor_stubs()
+        eligibility_index_unittest.create_test_change_log(self._database)
+        global_config.global_config.override_config_value(
+                scheduler_config.CONFIG_SECTION, 'incremental_host_scheduling',
+                'True')
+
+
+    def tearDown(self):
+        global_config.global_config.reset_config_values()
+        super(IncrementalDispatcherSchedulingTest, self).tearDown()
+
+
+    def _run_scheduler(self):
+        super(IncrementalDispatcherSchedulingTest, self)._run_scheduler()
+        # changes made while scheduling are applied on the next tick
+        index = self._dispatcher._host_scheduler._index
+        index.update()
+        self.assertEquals([], index.check_consistency()[0])
+
+
+    def test_inconsistent_index_is_rebuilt(self):
+        self._dispatcher._host_scheduler._index_check_interval = 0
+        self._run_scheduler()
+        self._create_job(hosts=[1])
+        # lose the logged changes so the index never sees the new job
+        self._do_query('DELETE FROM afe_scheduler_changes')
+        self.god.stub_function(email_manager.manager, 'enqueue_notify_email')
+        email_manager.manager.enqueue_notify_email.expect_call(
+                'Host eligibility index inconsistent',
+                mock.is_string_comparator())
+
+        self._run_scheduler()
+        self.god.check_playback()
+        self._assert_job_scheduled_on(1, 1)
+        self._check_for_extra_schedulings()
+
+
+class BatchedWritesDispatcherSchedulingTest(DispatcherSchedulingTest):
+    """
+    Runs all the scheduling tests with DBObject field updates batched by a
+    unit of work.
+    """
+    def _set_monitor_stubs(self):
+        super(BatchedWritesDispatcherSchedulingTest, self)._set_monitor_stubs()
+        global_config.global_config.override_config_value(
+                scheduler_config.CONFIG_SECTION, 'batch_scheduler_writes',
+                'True')
+
+
+    def tearDown(self):
+        scheduler_models.disable_unit_of_work()
+        global_config.global_config.reset_config_values()
+        super(BatchedWritesDispatcherSchedulingTest, self).tearDown()
+
+
+    def _run_scheduler(self):
+        for _ in xrange(2):
+            self._dispatcher._schedule_new_jobs()
+            self._dispatcher._flush_writes()
+
+
+    def test_flush_writes_counts(self):
+        self._dispatcher._tick_stats = tick_stats.TickStats()
+        self._create_job_simple([1, 2])
+        self._run_scheduler()
+        self._assert_job_scheduled_on(1, 1)
+        self._assert_job_scheduled_on(1, 2)
+        counts = self._dispatcher._tick_stats.snapshot()['total_counts']
+        self.assertTrue(counts['update_statements_saved'] > 0)
+        self.assertTrue(counts['batched_field_updates']
+                        > counts['update_statements_saved'])
+
 
 class DispatcherThrottlingTest(BaseSchedulerTest):
     """
@@ -742,13 +822,17 @@ class DispatcherThrottlingTest(BaseSchedulerTest):
                           for agent in self._agents
                           if agent.started and not agent.is_done())
             return self._MAX_RUNNING - running
-        self.god.stub_with(drone_manager.DroneManager, 'max_runnable_processes',
+        self.god.stub_with(drone_manager.DroneCapacityView,
+                           'max_runnable_processes',
                            fake_max_runnable_processes)
 
 
-    def _setup_some_agents(self, num_agents):
+    def _setup_some_agents(self, num_agents, zero_process_indexes=()):
         self._agents = [DummyAgent() for i in xrange(num_agents)]
-        self._dispatcher._agents = list(self._agents)
+        for i in zero_process_indexes:
+            self._agents[i].task.num_processes = 0
+        for agent in self._agents:
+            self._dispatcher._agent_queue.add(agent)
 
 
     def _run_a_few_cycles(self):
@@ -805,14 +889,95 @@ class DispatcherThrottlingTest(BaseSchedulerTest):
         self._assert_agents_not_started([2])
 
 
+    def test_admission_order(self):
+        self.god.stub_with(scheduler_config.config,
+                           'max_processes_started_per_cycle', 1)
+        self._agents = [DummyAgent() for i in xrange(4)]
+        self._agents[2].task.owner_username = 'other_user'
+        self._agents[3].task.priority = models.Job.Priority.URGENT
+        for agent in self._agents:
+            self._dispatcher._agent_queue.add(agent)
+
+        # by priority, then the user with fewer running processes, then age
+        started_order = []
+        for i in xrange(4):
+            self._dispatcher._handle_agents()
+            started_order.extend(
+                    index for index, agent in enumerate(self._agents)
+                    if agent.started and index not in started_order)
+        self.assertEquals([3, 2, 0], started_order)
+        self.assertEquals([self._agents[1]],
+                          self._dispatcher._agent_queue.get_agents())
+
+
     def test_zero_process_agent(self):
-        self._setup_some_agents(5)
-        self._agents[4].task.num_processes = 0
+        self._setup_some_agents(5, zero_process_indexes=[4])
         self._run_a_few_cycles()
         self._assert_agents_started([0, 1, 2, 4])
         self._assert_agents_not_started([3])
 
 
+class DispatcherAbortTest(BaseSchedulerTest):
+    def _count_queries(self, function):
+        queries = []
+        execute = self._database.execute
+        def counting_execute(query, parameters=None, **kwargs):
+            queries.append(query)
+            return execute(query, parameters, **kwargs)
+        self.god.stub_with(self._database, 'execute', counting_execute)
+        try:
+            function()
+        finally:
+            self.god.unstub(self._database, 'execute')
+        return len(queries)
+
+
+    def _abort_pending_job(self, num_hosts):
+        """
+        @returns A tuple (job, number of queries made to abort it).
+        """
+        job = self._create_job(hosts=range(1, num_hosts + 1))
+        self._update_hqe('status="Pending", active=1, aborted=1',
+                         'job_id=%d' % job.id)
+        self._do_query('UPDATE afe_hosts SET status="Pending" WHERE id <= %d'
+                       % num_hosts)
+        return job, self._count_queries(self._dispatcher._find_aborting)
+
+
+    def test_abort_query_count_independent_of_entries(self):
+        _, small_job_queries = self._abort_pending_job(2)
+        job, large_job_queries = self._abort_pending_job(8)
+        self.assertEquals(small_job_queries, large_job_queries)
+        self.assertEquals(8, job.hostqueueentry_set.filter(
+                status=models.HostQueueEntry.Status.ABORTED,
+                complete=True).count())
+        self.assertEquals(8, models.Host.objects.filter(
+                status=models.Host.Status.READY, id__lte=8).count())
+
+
+    def test_abort_entries_by_status(self):
+        job = self._create_job(hosts=[1, 2, 3, 4])
+        for host_id, status in ((2, 'Pending'), (3, 'Verifying'),
+                                (4, 'Gathering')):
+            self._update_hqe('status="%s", active=1' % status,
+                             'host_id=%d' % host_id)
+        self._do_query('UPDATE afe_hosts SET status="Pending" WHERE id=2')
+        self._update_hqe('aborted=1')
+
+        self._dispatcher._find_aborting()
+
+        statuses = dict((entry.host.id, entry.status)
+                        for entry in job.hostqueueentry_set.all())
+        self.assertEquals({1: 'Aborted', 2: 'Aborted', 3: 'Aborted',
+                           4: 'Gathering'}, statuses)
+        self.assertEquals(models.Host.Status.READY,
+                          models.Host.objects.get(id=2).status)
+        cleanup = models.SpecialTask.objects.get(host__id=3)
+        self.assertEquals(models.SpecialTask.Task.CLEANUP, cleanup.task)
+        self.assertEquals(job.owner, cleanup.requested_by.login)
+        self.assertFalse(cleanup.is_active or cleanup.is_complete)
+
+
 class PidfileRunMonitorTest(unittest.TestCase):
     execution_tag = 'test_tag'
     pid = 12345
@@ -1074,7 +1239,7 @@ class JobSchedulingTest(BaseSchedulerTest):
 
         self._dispatcher._schedule_delay_tasks()
         self._dispatcher._schedule_running_host_queue_entries()
-        agent = self._dispatcher._agents[0]
+        agent = self._dispatcher.get_agents()[0]
 
         actual_status = models.HostQueueEntry.smart_get(1).status
         self.assertEquals(expected_status, actual_status)
@@ -1123,7 +1288,7 @@ class JobSchedulingTest(BaseSchedulerTest):
         self.assertEquals('Waiting', hqe.status)
         self._dispatcher._schedule_delay_tasks()
         self.assertEquals('Pending', hqe.status)
-        agent = self._dispatcher._agents[0]
+        agent = self._dispatcher.get_agents()[0]
         self.assert_(job._delay_ready_task)
         self.assert_(isinstance(agent, monitor_db.Agent))
         self.assert_(agent.task)
@@ -1223,7 +1388,7 @@ class JobSchedulingTest(BaseSchedulerTest):
 
         # Check that job run() and _finish_run() were called by the above:
         self._dispatcher._schedule_running_host_queue_entries()
-        agent = self._dispatcher._agents[0]
+        agent = self._dispatcher.get_agents()[0]
         self.assert_(agent.task)
         task = agent.task
         self.assert_(isinstance(task, monitor_db.QueueTask))
@@ -1314,18 +1479,18 @@ class JobSchedulingTest(BaseSchedulerTest):
         hqe = hqe_query[0]
 
         self.assertEqual(models.HostQueueEntry.Status.QUEUED, hqe.status)
-        self.assertEqual(0, len(self._dispatcher._agents))
+        self.assertEqual(0, len(self._dispatcher.get_agents()))
 
         self._dispatcher._schedule_new_jobs()
 
         self.assertEqual(models.HostQueueEntry.Status.STARTING, hqe.status)
-        self.assertEqual(1, len(self._dispatcher._agents))
+        self.assertEqual(1, len(self._dispatcher.get_agents()))
 
         self._dispatcher._schedule_new_jobs()
 
         # No change to previously schedule hostless job, and no additional agent
         self.assertEqual(models.HostQueueEntry.Status.STARTING, hqe.status)
-        self.assertEqual(1, len(self._dispatcher._agents))
+        self.assertEqual(1, len(self._dispatcher.get_agents()))
 
 
 class TopLevelFunctionsTest(unittest.TestCase):
@@ -14,10 +14,11 @@ _notify_email_statuses: list of HQE statuses.  each time a single HQE reaches
 _base_url: URL to the local AFE server, used to construct URLs for emails.
 _db: DatabaseConnection for this module.
 _drone_manager: reference to global DroneManager instance.
+_unit_of_work: UnitOfWork batching DBObject field updates, or None.
 """
 
 import datetime, itertools, logging, os, re, sys, time, weakref
-from django.db import connection
+from django.db import connection, transaction
 from autotest_lib.client.common_lib import global_config, host_protections
 from autotest_lib.client.common_lib import global_config, utils
 from autotest_lib.frontend.afe import models, model_attributes
@@ -30,6 +31,7 @@ _base_url = None
 
 _db = None
 _drone_manager = None
+_unit_of_work = None
 
 def initialize():
     global _db
@@ -122,6 +124,180 @@ class DelayedCallTask(object):
         self.aborted = True
 
 
+class UnitOfWork(object):
+    """
+    Accumulates DBObject field updates and writes them out in batches.
+
+    Instead of one UPDATE per update_field() call, the new values are kept on
+    the (identity mapped) DBObject instances and flushed as one UPDATE per
+    table and set of assigned values, covering all the rows they apply to,
+    within a single transaction.
+
+    Updates must be written before anything reads the database, so a flush
+    happens before every query made by DBObject and before every Django ORM
+    query (see install_query_barrier()).  Code reading through a
+    DatabaseConnection of its own must call flush_writes() first.
+    """
+    # maximum number of row ids in the IN clause of one statement
+    _MAX_IDS_PER_STATEMENT = 1000
+
+    def __init__(self):
+        # maps (type, id) to the DBObject instance with pending updates.  this
+        # holds strong references so that pending updates can't be dropped by
+        # the identity map letting go of the instance.
+        self._dirty_objects = {}
+        self._flushing = False
+        self._original_cursor = None
+        # update_field() calls deferred, and statements run to flush them,
+        # since the last pop_stats()
+        self._num_updates = 0
+        self._num_statements = 0
+
+
+    def add_update(self, db_object, field, value):
+        key = (type(db_object), db_object.id)
+        self._dirty_objects[key] = db_object
+        db_object._pending_updates[field] = value
+        self._num_updates += 1
+
+
+    def discard_updates(self, db_object):
+        self._dirty_objects.pop((type(db_object), db_object.id), None)
+        db_object._pending_updates.clear()
+
+
+    def has_pending_updates(self):
+        return bool(self._dirty_objects)
+
+
+    def _group_updates(self):
+        """
+        @returns A dict mapping (table name, ((field, value), ...)) to the
+                list of ids of the rows getting exactly those assignments.
+        """
+        groups = {}
+        for db_object in self._dirty_objects.itervalues():
+            assignments = tuple(sorted(db_object._pending_updates.items()))
+            key = (db_object._table_name, assignments)
+            groups.setdefault(key, []).append(db_object.id)
+            db_object._pending_updates.clear()
+        self._dirty_objects.clear()
+        return groups
+
+
+    def _get_statements(self):
+        statements = []
+        for (table, assignments), ids in self._group_updates().iteritems():
+            ids.sort()
+            set_clause = ', '.join('%s = %%s' % field
+                                   for field, _ in assignments)
+            values = [value for _, value in assignments]
+            for start in xrange(0, len(ids), self._MAX_IDS_PER_STATEMENT):
+                id_chunk = ids[start:start + self._MAX_IDS_PER_STATEMENT]
+                query = 'UPDATE %s SET %s WHERE id IN (%s)' % (
+                        table, set_clause, ','.join(['%s'] * len(id_chunk)))
+                statements.append((query, values + id_chunk))
+        return statements
+
+
+    def flush(self):
+        """
+        Write all pending updates to the database in one transaction.
+        """
+        if self._flushing or not self._dirty_objects:
+            return
+        self._flushing = True
+        try:
+            statements = self._get_statements()
+            self._execute_in_transaction(statements)
+            self._num_statements += len(statements)
+        finally:
+            self._flushing = False
+
+
+    def _execute_in_transaction(self, statements):
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            try:
+                if connection.vendor == 'mysql':
+                    # the scheduler's connection is in autocommit mode
+                    _db.execute('START TRANSACTION')
+                for query, parameters in statements:
+                    _db.execute(query, parameters)
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            transaction.leave_transaction_management()
+
+
+    def pop_stats(self):
+        """
+        @returns A tuple (deferred updates, statements run to write them)
+                since the last call.
+        """
+        stats = (self._num_updates, self._num_statements)
+        self._num_updates = self._num_statements = 0
+        return stats
+
+
+    def install_query_barrier(self):
+        """
+        Flush before every query made through the Django ORM.
+
+        The ORM asks the connection for a new cursor for each query, so this
+        wraps the connection's cursor() method.
+        """
+        assert self._original_cursor is None
+        self._original_cursor = connection.cursor
+        def cursor():
+            self.flush()
+            return self._original_cursor()
+        connection.cursor = cursor
+
+
+    def uninstall_query_barrier(self):
+        if self._original_cursor is not None:
+            del connection.cursor
+            self._original_cursor = None
+
+
+def enable_unit_of_work():
+    """
+    Start batching DBObject field updates.
+
+    @returns The UnitOfWork in use.
+    """
+    global _unit_of_work
+    if _unit_of_work is None:
+        _unit_of_work = UnitOfWork()
+        _unit_of_work.install_query_barrier()
+    return _unit_of_work
+
+
+def disable_unit_of_work():
+    global _unit_of_work
+    if _unit_of_work is not None:
+        _unit_of_work.flush()
+        _unit_of_work.uninstall_query_barrier()
+        _unit_of_work = None
+
+
+def flush_writes():
+    """
+    Write any batched DBObject field updates to the database.
+    """
+    if _unit_of_work is not None:
+        _unit_of_work.flush()
+
+
+def _execute(query, parameters=None):
+    flush_writes()
+    return _db.execute(query, parameters)
+
+
 class DBError(Exception):
     """Raised by the DBObject constructor when its select fails."""
 
@@ -155,6 +331,10 @@ class DBObject(object):
 
     def __init__(self, id=None, row=None, new_record=False, always_query=True):
         assert bool(id) or bool(row)
+        if not self._initialized:
+            # field values set by update_field() but not yet written out by
+            # the unit of work
+            self._pending_updates = {}
         if id is not None and row is not None:
             assert id == row[0]
         assert self._table_name, '_table_name must be defined in your class'
@@ -193,7 +373,7 @@ class DBObject(object):
 
     def _fetch_row_from_db(self, row_id):
         sql = 'SELECT * FROM %s WHERE ID=%%s' % self.__table
-        rows = _db.execute(sql, (row_id,))
+        rows = _execute(sql, (row_id,))
         if not rows:
             raise DBError("row not found (table=%s, row id=%s)"
                           % (self.__table, row_id))
@@ -259,7 +439,7 @@ class DBObject(object):
         if not table:
             table = self.__table
 
-        rows = _db.execute("""
+        rows = _execute("""
                 SELECT count(*) FROM %s
                 WHERE %s
         """ % (table, where))
@@ -275,32 +455,64 @@ class DBObject(object):
         if getattr(self, field) == value:
             return
 
-        query = "UPDATE %s SET %s = %%s WHERE id = %%s" % (self.__table, field)
-        _db.execute(query, (value, self.id))
+        if _unit_of_work is not None and not self.__new_record:
+            _unit_of_work.add_update(self, field, value)
+        else:
+            query = ("UPDATE %s SET %s = %%s WHERE id = %%s"
+                     % (self.__table, field))
+            _db.execute(query, (value, self.id))
 
         setattr(self, field, value)
 
 
+    @classmethod
+    def update_fields_for_all(cls, db_objects, values):
+        """
+        Set the same field values on many objects.  The bulk equivalent of
+        calling update_field() for each object and field, using one UPDATE per
+        UnitOfWork._MAX_IDS_PER_STATEMENT objects.
+
+        @param db_objects: instances of this class.
+        @param values: dict mapping field names to their new values.
+        """
+        assignments = sorted(values.items())
+        changed = dict((db_object.id, db_object) for db_object in db_objects
+                       if any(getattr(db_object, field) != value
+                              for field, value in assignments))
+        if not changed:
+            return
+
+        set_clause = ', '.join('%s = %%s' % field for field, _ in assignments)
+        ids = sorted(changed)
+        step = UnitOfWork._MAX_IDS_PER_STATEMENT
+        for start in xrange(0, len(ids), step):
+            id_chunk = ids[start:start + step]
+            _execute('UPDATE %s SET %s WHERE id IN (%s)'
+                     % (cls._table_name, set_clause,
+                        ','.join(['%s'] * len(id_chunk))),
+                     [value for _, value in assignments] + id_chunk)
+
+        for db_object in changed.itervalues():
+            for field, value in assignments:
+                assert field in db_object._valid_fields
+                setattr(db_object, field, value)
+
+
     def save(self):
         if self.__new_record:
             keys = self._fields[1:] # avoid id
             columns = ','.join([str(key) for key in keys])
-            values = []
-            for key in keys:
-                value = getattr(self, key)
-                if value is None:
-                    values.append('NULL')
-                else:
-                    values.append('"%s"' % value)
-            values_str = ','.join(values)
+            placeholders = ','.join(['%s'] * len(keys))
             query = ('INSERT INTO %s (%s) VALUES (%s)' %
-                     (self.__table, columns, values_str))
-            _db.execute(query)
+                     (self.__table, columns, placeholders))
+            _db.execute(query, [getattr(self, key) for key in keys])
             # Update our id to the one the database just assigned to us.
             self.id = _db.execute('SELECT LAST_INSERT_ID()')[0][0]
 
 
     def delete(self):
+        if _unit_of_work is not None:
+            _unit_of_work.discard_updates(self)
         self._instances_by_type_and_id.pop((type(self), id), None)
         self._initialized = False
         self._valid_fields.clear()
@@ -329,10 +541,47 @@ class DBObject(object):
                                              'joins' : joins,
                                              'where' : where,
                                              'order_by' : order_by})
-        rows = _db.execute(query, params)
+        rows = _execute(query, params)
         return [cls(id=row[0], row=row) for row in rows]
 
 
+def _sql_id_list(ids):
+    return ','.join(str(id) for id in ids)
+
+
+def _unique_jobs(queue_entries):
+    """
+    @returns The distinct jobs of the given entries, ordered by id.
+    """
+    jobs = dict((queue_entry.job.id, queue_entry.job)
+                for queue_entry in queue_entries)
+    return [jobs[job_id] for job_id in sorted(jobs)]
+
+
+def _get_execution_details(job, job_stats):
+    """
+    job.get_execution_details(), cached in the job_stats dict by job id.
+    """
+    if job.id not in job_stats:
+        job_stats[job.id] = job.get_execution_details()
+    return job_stats[job.id]
+
+
+def _get_full_status_counts(counts):
+    """
+    @param counts: (status, aborted, complete, count) tuples for one job, as
+            returned by Job.get_entry_counts().
+    @returns A dict mapping full status to count, like the values returned by
+            models.Job.objects.get_status_counts().
+    """
+    status_counts = {}
+    for status, aborted, complete, count in counts:
+        full_status = models.HostQueueEntry.compute_full_status(
+                status, aborted, complete)
+        status_counts[full_status] = status_counts.get(full_status, 0) + count
+    return status_counts
+
+
 class IneligibleHostQueue(DBObject):
     _table_name = 'afe_ineligible_host_queues'
     _fields = ('id', 'job_id', 'host_id')
@@ -366,11 +615,22 @@ class Host(DBObject):
         self.update_field('status',status)
 
 
+    @classmethod
+    def set_status_for_all(cls, hosts, status):
+        """
+        Bulk equivalent of calling set_status() on each of the hosts.
+        """
+        for host in hosts:
+            if host.status != status:
+                logging.info('%s -> %s', host.hostname, status)
+        cls.update_fields_for_all(hosts, {'status': status})
+
+
     def platform_and_labels(self):
         """
         Returns a tuple (platform_name, list_of_all_label_names).
         """
-        rows = _db.execute("""
+        rows = _execute("""
                 SELECT afe_labels.name, afe_labels.platform
                 FROM afe_labels
                 INNER JOIN afe_hosts_labels ON
@@ -434,13 +694,20 @@ class HostQueueEntry(DBObject):
                'atomic_group_id', 'aborted', 'started_on')
 
 
-    def __init__(self, id=None, row=None, **kwargs):
+    def __init__(self, id=None, row=None, query_related=True, **kwargs):
+        """
+        @param query_related: If False, reuse already loaded Job and Host
+                instances instead of querying them again.
+        """
         assert id or row
         super(HostQueueEntry, self).__init__(id=id, row=row, **kwargs)
-        self.job = Job(self.job_id)
+        related_kwargs = {}
+        if not query_related:
+            related_kwargs['always_query'] = False
+        self.job = Job(self.job_id, **related_kwargs)
 
         if self.host_id:
-            self.host = Host(self.host_id)
+            self.host = Host(self.host_id, **related_kwargs)
         else:
             self.host = None
 
@@ -469,6 +736,28 @@ class HostQueueEntry(DBObject):
         return clone
 
 
+    @classmethod
+    def fetch_with_related(cls, where='', params=()):
+        """
+        Like fetch(), but loads the jobs and hosts of all the entries with one
+        query each rather than two queries per entry.
+        """
+        where = cls._prefix_with(where, 'WHERE ')
+        rows = _execute('SELECT * FROM %s %s' % (cls._table_name, where),
+                        params)
+        if not rows:
+            return []
+        # these keep the instances alive in the identity map until the
+        # entries reference them
+        jobs = Job.fetch(where='id IN (%s)'
+                         % _sql_id_list(set(row[1] for row in rows)))
+        host_ids = set(row[2] for row in rows if row[2])
+        hosts = []
+        if host_ids:
+            hosts = Host.fetch(where='id IN (%s)' % _sql_id_list(host_ids))
+        return [cls(id=row[0], row=row, query_related=False) for row in rows]
+
+
     def _view_job_url(self):
         return "%s#tab_id=view_job&object_id=%s" % (_base_url, self.job.id)
 
@@ -573,16 +862,58 @@ class HostQueueEntry(DBObject):
             self._on_complete(status)
             self._email_on_job_complete()
 
-        should_email_status = (status.lower() in _notify_email_statuses or
-                               'all' in _notify_email_statuses)
-        if should_email_status:
+        if self._should_email_status(status):
             self._email_on_status(status)
 
 
+    @classmethod
+    def set_status_for_all(cls, queue_entries, status):
+        """
+        Bulk equivalent of calling set_status() on each of the entries.  The
+        entries are updated together and the per-job work is done once per
+        job, so the number of queries does not grow with the number of entries.
+        """
+        if not queue_entries:
+            return
+        for queue_entry in queue_entries:
+            logging.info("%s -> %s", queue_entry, status)
+
+        active = (status in models.HostQueueEntry.ACTIVE_STATUSES)
+        complete = (status in models.HostQueueEntry.COMPLETE_STATUSES)
+        assert not (active and complete)
+
+        cls.update_fields_for_all(queue_entries, {'status': status,
+                                                  'active': active,
+                                                  'complete': complete})
+
+        job_stats = {}
+        if complete:
+            if status != models.HostQueueEntry.Status.ABORTED:
+                Job.stop_all_if_necessary(_unique_jobs(queue_entries))
+            for queue_entry in queue_entries:
+                queue_entry._unregister_pidfiles()
+            cls._email_on_jobs_complete(queue_entries, job_stats)
+
+        if cls._should_email_status(status):
+            for queue_entry in queue_entries:
+                queue_entry._email_on_status(
+                        status, _get_execution_details(queue_entry.job,
+                                                       job_stats))
+
+
+    @staticmethod
+    def _should_email_status(status):
+        return (status.lower() in _notify_email_statuses or
+                'all' in _notify_email_statuses)
+
+
     def _on_complete(self, status):
         if status is not models.HostQueueEntry.Status.ABORTED:
             self.job.stop_if_necessary()
+        self._unregister_pidfiles()
 
+
+    def _unregister_pidfiles(self):
         if not self.execution_subdir:
             return
         # unregister any possible pidfiles associated with this queue entry
@@ -592,7 +923,8 @@ class HostQueueEntry(DBObject):
             _drone_manager.unregister_pidfile(pidfile_id)
 
 
-    def _get_status_email_contents(self, status, summary=None, hostname=None):
+    def _get_status_email_contents(self, status, summary=None, hostname=None,
+                                   job_stats=None):
         """
         Gather info for the status notification e-mails.
 
@@ -603,10 +935,13 @@ class HostQueueEntry(DBObject):
         @param status: Job status text. Mandatory.
         @param summary: Job summary text. Optional.
         @param hostname: A hostname for the job. Optional.
+        @param job_stats: The job's Job.get_execution_details(), if already
+                known. Optional.
 
         @return: Tuple (subject, body) for the notification e-mail.
         """
-        job_stats = Job(id=self.job.id).get_execution_details()
+        if job_stats is None:
+            job_stats = Job(id=self.job.id).get_execution_details()
 
         subject = ('Autotest | Job ID: %s "%s" | Status: %s ' %
                    (self.job.id, self.job.name, status))
@@ -640,9 +975,10 @@ class HostQueueEntry(DBObject):
         return subject, body
 
 
-    def _email_on_status(self, status):
+    def _email_on_status(self, status, job_stats=None):
         hostname = self._get_hostname()
-        subject, body = self._get_status_email_contents(status, None, hostname)
+        subject, body = self._get_status_email_contents(status, None, hostname,
+                                                        job_stats)
         email_manager.manager.send_email(self.job.email_list, subject, body)
 
 
@@ -650,20 +986,49 @@ class HostQueueEntry(DBObject):
         if not self.job.is_finished():
             return
 
+        status_counts = models.Job.objects.get_status_counts(
+                [self.job.id])[self.job.id]
+        self._send_job_complete_email(status_counts)
+
+
+    @classmethod
+    def _email_on_jobs_complete(cls, queue_entries, job_stats):
+        """
+        Bulk equivalent of calling _email_on_job_complete() on each of the
+        entries: one email for each of their jobs that is finished.
+
+        @param job_stats: dict caching Job.get_execution_details() by job id.
+        """
+        entries_by_job_id = {}
+        for queue_entry in queue_entries:
+            entries_by_job_id.setdefault(queue_entry.job.id, queue_entry)
+        entry_counts = Job.get_entry_counts(entries_by_job_id.keys())
+
+        for job_id in sorted(entries_by_job_id):
+            counts = entry_counts[job_id]
+            if not all(complete for _, _, complete, _ in counts):
+                continue
+            queue_entry = entries_by_job_id[job_id]
+            queue_entry._send_job_complete_email(
+                    _get_full_status_counts(counts),
+                    _get_execution_details(queue_entry.job, job_stats))
+
+
+    def _send_job_complete_email(self, status_counts, job_stats=None):
         summary = []
-        hosts_queue = HostQueueEntry.fetch('job_id = %s' % self.job.id)
+        hosts_queue = HostQueueEntry.fetch_with_related(
+                'job_id = %s' % self.job.id)
         for queue_entry in hosts_queue:
             summary.append("Host: %s Status: %s" %
                                 (queue_entry._get_hostname(),
                                  queue_entry.status))
 
         summary = "\n".join(summary)
-        status_counts = models.Job.objects.get_status_counts(
-                [self.job.id])[self.job.id]
         status = ', '.join('%d %s' % (count, status) for status, count
                     in status_counts.iteritems())
 
-        subject, body = self._get_status_email_contents(status, summary, None)
+        subject, body = self._get_status_email_contents(status, summary, None,
+                                                        job_stats)
         email_manager.manager.send_email(self.job.email_list, subject, body)
 
 
@@ -708,7 +1073,7 @@ class HostQueueEntry(DBObject):
         """ Fetch info about who aborted the job. """
         if hasattr(self, "_aborted_by"):
             return
-        rows = _db.execute("""
+        rows = _execute("""
                 SELECT afe_users.login,
                         afe_aborted_host_queue_entries.aborted_on
                 FROM afe_aborted_host_queue_entries
@@ -766,6 +1131,61 @@ class HostQueueEntry(DBObject):
         self.job.abort_delay_ready_task()
 
 
+    @classmethod
+    def abort_entries(cls, queue_entries, dispatcher):
+        """
+        Bulk equivalent of calling abort() on each of the entries and then
+        stop_if_necessary() on each of their jobs, using a number of queries
+        that depends on the number of jobs involved but not on the number of
+        entries.  The agents of the entries must already have been aborted.
+        """
+        Status = models.HostQueueEntry.Status
+        entries_to_abort, hosts_to_release, entries_to_clean_up = [], [], []
+        for queue_entry in queue_entries:
+            assert queue_entry.aborted and not queue_entry.complete
+            if queue_entry.status in (Status.GATHERING, Status.PARSING,
+                                      Status.ARCHIVING):
+                # as in abort(), post-job tasks will take care of these
+                continue
+
+            if queue_entry.status in (Status.STARTING, Status.PENDING,
+                                      Status.RUNNING, Status.WAITING):
+                assert not dispatcher.get_agents_for_entry(queue_entry)
+                hosts_to_release.append(queue_entry.host)
+            elif queue_entry.status == Status.VERIFYING:
+                entries_to_clean_up.append(queue_entry)
+            entries_to_abort.append(queue_entry)
+
+        Host.set_status_for_all(hosts_to_release, models.Host.Status.READY)
+        cls._create_cleanup_tasks(entries_to_clean_up)
+        cls.set_status_for_all(entries_to_abort, Status.ABORTED)
+        for job in _unique_jobs(entries_to_abort):
+            job.abort_delay_ready_task()
+        Job.stop_all_if_necessary(_unique_jobs(queue_entries))
+
+
+    @staticmethod
+    def _create_cleanup_tasks(queue_entries):
+        """
+        Schedule a cleanup of the host of each of the entries, as abort()
+        does for a verifying entry, with one multi-row INSERT per
+        UnitOfWork._MAX_IDS_PER_STATEMENT entries.
+        """
+        time_requested = datetime.datetime.now()
+        rows = [(queue_entry.host.id, models.SpecialTask.Task.CLEANUP,
+                 queue_entry.job.owner_model().id, time_requested)
+                for queue_entry in queue_entries]
+        step = UnitOfWork._MAX_IDS_PER_STATEMENT
+        for start in xrange(0, len(rows), step):
+            row_chunk = rows[start:start + step]
+            _execute('INSERT INTO afe_special_tasks (host_id, task, '
+                     'requested_by_id, time_requested, is_active, '
+                     'is_complete, success) VALUES %s'
+                     % ', '.join(['(%s, %s, %s, %s, 0, 0, 0)']
+                                 * len(row_chunk)),
+                     list(itertools.chain(*row_chunk)))
+
+
     def get_group_name(self):
         atomic_group = self.atomic_group
         if not atomic_group:
@@ -850,7 +1270,7 @@ class Job(DBObject):
 
 
     def get_host_queue_entries(self):
-        rows = _db.execute("""
+        rows = _execute("""
                 SELECT * FROM afe_host_queue_entries
                 WHERE job_id= %s
         """, (self.id,))
@@ -886,7 +1306,7 @@ class Job(DBObject):
 
         stats = {}
 
-        rows = _db.execute("""
+        rows = _execute("""
                 SELECT t.test, s.word, t.reason
                 FROM tko_tests AS t, tko_jobs AS j, tko_status AS s
                 WHERE t.job_idx = j.job_idx
@@ -920,7 +1340,7 @@ class Job(DBObject):
         else:
             stats['failed_rows'] = ''
 
-        time_row = _db.execute("""
+        time_row = _execute("""
                    SELECT started_time, finished_time
                    FROM tko_jobs
                    WHERE afe_job_id = %s
@@ -1077,6 +1497,67 @@ class Job(DBObject):
             self._stop_all_entries()
 
 
+    @staticmethod
+    def get_entry_counts(job_ids):
+        """
+        Count the entries of many jobs with one grouped query.
+
+        @returns A dict mapping each job id to a list of (status, aborted,
+                complete, count) tuples covering the entries of that job.
+        """
+        entry_counts = dict((job_id, []) for job_id in job_ids)
+        if not entry_counts:
+            return entry_counts
+        rows = _execute("""
+                SELECT job_id, status, aborted, complete, COUNT(*)
+                FROM afe_host_queue_entries
+                WHERE job_id IN (%s)
+                GROUP BY job_id, status, aborted, complete
+        """ % _sql_id_list(entry_counts))
+        for job_id, status, aborted, complete, count in rows:
+            entry_counts[job_id].append((status, aborted, complete, int(count)))
+        return entry_counts
+
+
+    @classmethod
+    def stop_all_if_necessary(cls, jobs):
+        """
+        Bulk equivalent of calling stop_if_necessary() on each of the jobs,
+        using a constant number of queries.
+        """
+        Status = models.HostQueueEntry.Status
+        not_yet_run_statuses = (Status.QUEUED, Status.PENDING, Status.VERIFYING)
+        stoppable_statuses = (Status.QUEUED, Status.PENDING)
+        entry_counts = cls.get_entry_counts(job.id for job in jobs)
+
+        jobs_to_stop = []
+        for job in jobs:
+            counts = entry_counts[job.id]
+            not_yet_run = sum(count for status, _, _, count in counts
+                              if status in not_yet_run_statuses)
+            stoppable = sum(count for status, _, _, count in counts
+                            if status in stoppable_statuses)
+            if not_yet_run < job.synch_count and stoppable:
+                logging.info('Stopping %d queued or pending entries of job %s',
+                             stoppable, job)
+                jobs_to_stop.append(job)
+        if not jobs_to_stop:
+            return
+
+        # the set-based version of _stop_all_entries()
+        job_id_list = _sql_id_list(job.id for job in jobs_to_stop)
+        _execute("""
+                UPDATE afe_hosts SET status = %%s
+                WHERE id IN (SELECT host_id FROM afe_host_queue_entries
+                             WHERE job_id IN (%s) AND status = %%s)
+        """ % job_id_list, (models.Host.Status.READY, Status.PENDING))
+        _execute("""
+                UPDATE afe_host_queue_entries
+                SET status = %%s, active = %%s, complete = %%s
+                WHERE job_id IN (%s) AND status IN (%%s, %%s)
+        """ % job_id_list, (Status.STOPPED, False, True) + stoppable_statuses)
+
+
     def write_to_machines_file(self, queue_entry):
         hostname = queue_entry.host.hostname
         file_path = os.path.join(self.tag(), '.machines')
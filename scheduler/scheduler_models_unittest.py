@@ -177,6 +177,65 @@ class DBObjectTest(BaseSchedulerModelsTest):
         self.assertEqual(hqe.started_on, None)
 
 
+class UnitOfWorkTest(BaseSchedulerModelsTest):
+    def setUp(self):
+        super(UnitOfWorkTest, self).setUp()
+        self.unit = scheduler_models.enable_unit_of_work()
+
+
+    def tearDown(self):
+        scheduler_models.disable_unit_of_work()
+        super(UnitOfWorkTest, self).tearDown()
+
+
+    def _get_statuses(self):
+        # bypasses the unit of work
+        return dict(self._database.execute(
+                'SELECT id, status FROM afe_hosts WHERE id IN (1, 2, 3)'))
+
+
+    def test_updates_batched(self):
+        hosts = [scheduler_models.Host(id=host_id) for host_id in (1, 2, 3)]
+        for host in hosts:
+            host.update_field('status', 'Running')
+        hosts[0].update_field('dirty', False)
+        hosts[0].update_field('status', 'Cleaning')
+        self.assertEqual('Cleaning', hosts[0].status)
+        self.assertEqual({1: 'Ready', 2: 'Ready', 3: 'Ready'},
+                         self._get_statuses())
+
+        self.unit.flush()
+        self.assertEqual({1: 'Cleaning', 2: 'Running', 3: 'Running'},
+                         self._get_statuses())
+        self.assertFalse(models.Host.objects.get(id=1).dirty)
+        # one statement for host 1, one for hosts 2 and 3
+        self.assertEqual((5, 2), self.unit.pop_stats())
+        self.assertEqual((0, 0), self.unit.pop_stats())
+
+
+    def test_reads_flush(self):
+        host = scheduler_models.Host(id=1)
+        host.update_field('status', 'Running')
+        self.assertEqual(1, host.count("status = 'Running'", 'afe_hosts'))
+
+        host.update_field('status', 'Repairing')
+        self.assertEqual('Repairing', models.Host.objects.get(id=1).status)
+
+        host.update_field('status', 'Cleaning')
+        hosts = scheduler_models.Host.fetch(where='id = 1')
+        self.assertEqual('Cleaning', hosts[0].status)
+        self.assertFalse(self.unit.has_pending_updates())
+
+
+    def test_delete_discards_updates(self):
+        host = scheduler_models.Host(id=1)
+        host.update_field('status', 'Running')
+        host.delete()
+        self.assertFalse(self.unit.has_pending_updates())
+        self.unit.flush()
+        self.assertEqual({2: 'Ready', 3: 'Ready'}, self._get_statuses())
+
+
 class HostTest(BaseSchedulerModelsTest):
     def test_cmp_for_sort(self):
         expected_order = [
@@ -1,11 +1,13 @@
 import os, BaseHTTPServer, cgi, threading, urllib, fcntl, logging
+import simplejson
 try:
     import autotest.common as common
 except ImportError:
     import common
-from autotest_lib.scheduler import drone_manager, scheduler_config
+from autotest_lib.scheduler import drone_manager, scheduler_config, tick_stats
 
 _PORT = 13467
+_METRICS_PATH = '/metrics'
 
 _HEADER = """
 <html>
@@ -14,6 +16,7 @@ _HEADER = """
 Actions:<br>
 <a href="?reparse_config=1">Reparse global config values</a><br>
 <a href="?restart_scheduler=1">Restart the scheduler</a><br>
+<a href="metrics">Tick metrics (JSON)</a><br>
 <br>
 """
 
@@ -84,7 +87,34 @@ class StatusServerRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         self._write_line()
 
 
+    def _get_drone_metrics(self, drone):
+        manager = self.server._drone_manager
+        return {'hostname': drone.hostname,
+                'active_processes': drone.active_processes,
+                'max_processes': drone.max_processes,
+                'enabled': drone.enabled,
+                'healthy': manager.is_drone_healthy(drone),
+                'pending_transfers': manager.pending_transfers(drone)}
+
+
+    def _write_metrics(self):
+        metrics = tick_stats.instance().snapshot()
+        metrics['drones'] = [self._get_drone_metrics(drone) for drone
+                             in self.server._drone_manager.get_drones()]
+        metrics['total_running_processes'] = (
+                self.server._drone_manager.total_running_processes())
+
+        self.send_response(200, 'OK')
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(simplejson.dumps(metrics))
+
+
     def do_GET(self):
+        if self.path.split('?', 1)[0] == _METRICS_PATH:
+            self._write_metrics()
+            return
+
         self._send_headers()
         self.wfile.write(_HEADER)
 
@@ -0,0 +1,183 @@
+"""
+Per-phase timing and counters for scheduler ticks.
+
+The Dispatcher runs every phase of its tick through TickStats.run_phase(), so
+the status server can report which phase is eating a slow tick.
+"""
+
+import threading, time
+
+
+# upper bounds (in seconds) of the duration histogram buckets; a final
+# unbounded bucket catches everything slower
+_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+
+class Histogram(object):
+    """
+    Bucketed distribution of values, with count, total and max.
+    """
+    def __init__(self, bounds=_DURATION_BUCKETS):
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = None
+
+
+    def add(self, value):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            index = len(self.bounds)
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+
+
+    def to_dict(self):
+        bounds = list(self.bounds) + ['inf']
+        return {'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'last': self.last,
+                'buckets': [{'le': bound, 'count': count} for bound, count
+                            in zip(bounds, self.bucket_counts)]}
+
+
+class _PhaseStats(object):
+    def __init__(self):
+        self.durations = Histogram()
+        self.last_queries = 0
+        self.total_queries = 0
+
+
+    def to_dict(self):
+        return {'duration': self.durations.to_dict(),
+                'last_queries': self.last_queries,
+                'total_queries': self.total_queries}
+
+
+class TickStats(object):
+    """
+    Collects timing histograms and SQL query counts for each tick phase,
+    plus arbitrary per-tick counters.
+
+    All methods may be called from different threads; the scheduler records
+    while the status server reads snapshots.
+    """
+    def __init__(self, query_counter=None):
+        """
+        @param query_counter: Function returning the number of SQL queries run
+                so far in this tick.  Queries are not counted if it's None.
+        """
+        self.query_counter = query_counter
+        self._lock = threading.Lock()
+        self._tick_count = 0
+        self._tick_durations = Histogram()
+        self._tick_start_time = None
+        # maps phase name to _PhaseStats, plus the phase names in tick order
+        self._phases = {}
+        self._phase_order = []
+        # maps counter name to its value in the last (or current) tick, and
+        # to its total over all ticks
+        self._last_counts = {}
+        self._total_counts = {}
+
+
+    def _count_queries(self):
+        if self.query_counter is None:
+            return 0
+        return self.query_counter()
+
+
+    def start_tick(self):
+        self._lock.acquire()
+        try:
+            self._tick_start_time = time.time()
+            self._last_counts = {}
+        finally:
+            self._lock.release()
+
+
+    def end_tick(self):
+        self._lock.acquire()
+        try:
+            self._tick_durations.add(time.time() - self._tick_start_time)
+            self._tick_count += 1
+        finally:
+            self._lock.release()
+
+
+    def run_phase(self, name, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs), recording its duration and the number
+        of SQL queries it issued under the given phase name.
+        """
+        start_queries = self._count_queries()
+        start_time = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.time() - start_time
+            queries = self._count_queries() - start_queries
+            self._record_phase(name, duration, queries)
+
+
+    def _record_phase(self, name, duration, queries):
+        self._lock.acquire()
+        try:
+            phase = self._phases.get(name)
+            if phase is None:
+                phase = self._phases[name] = _PhaseStats()
+                self._phase_order.append(name)
+            phase.durations.add(duration)
+            phase.last_queries = queries
+            phase.total_queries += queries
+        finally:
+            self._lock.release()
+
+
+    def add_count(self, name, count=1):
+        """
+        Add to a counter for the current tick (e.g. agents started).
+        """
+        self._lock.acquire()
+        try:
+            self._last_counts[name] = self._last_counts.get(name, 0) + count
+            self._total_counts[name] = self._total_counts.get(name, 0) + count
+        finally:
+            self._lock.release()
+
+
+    def snapshot(self):
+        """
+        @returns A dict of all stats, suitable for JSON encoding.
+        """
+        self._lock.acquire()
+        try:
+            return {'ticks': self._tick_count,
+                    'tick_duration': self._tick_durations.to_dict(),
+                    'phases': [dict(name=name, **self._phases[name].to_dict())
+                               for name in self._phase_order],
+                    'last_counts': dict(self._last_counts),
+                    'total_counts': dict(self._total_counts)}
+        finally:
+            self._lock.release()
+
+
+_the_instance = None
+
+def instance():
+    if _the_instance is None:
+        _set_instance(TickStats())
+    return _the_instance
+
+
+def _set_instance(instance): # usable for testing
+    global _the_instance
+    _the_instance = instance
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.client.common_lib.test_utils import mock
+from autotest_lib.client.common_lib.test_utils import unittest
+from autotest_lib.scheduler import tick_stats
+
+
+class HistogramTest(unittest.TestCase):
+    def test_add(self):
+        histogram = tick_stats.Histogram(bounds=(1, 10))
+        for value in (0.5, 1, 5, 20):
+            histogram.add(value)
+        self.assertEqual(
+                {'count': 4, 'total': 26.5, 'max': 20, 'last': 20,
+                 'buckets': [{'le': 1, 'count': 2}, {'le': 10, 'count': 1},
+                             {'le': 'inf', 'count': 1}]},
+                histogram.to_dict())
+
+
+class TickStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.god = mock.mock_god()
+        self._queries = []
+        self._time = 100
+        self.god.stub_with(tick_stats.time, 'time', lambda: self._time)
+        self.stats = tick_stats.TickStats(
+                query_counter=lambda: len(self._queries))
+
+
+    def tearDown(self):
+        self.god.unstub_all()
+
+
+    def _phase(self, duration, num_queries):
+        self._time += duration
+        self._queries.extend([None] * num_queries)
+        return 'result'
+
+
+    def test_tick(self):
+        self.stats.start_tick()
+        self.assertEqual('result',
+                         self.stats.run_phase('first', self._phase, 2, 3))
+        self.stats.run_phase('second', self._phase, duration=20, num_queries=0)
+        self.stats.add_count('agents_started')
+        self.stats.add_count('agents_started', 2)
+        self.stats.end_tick()
+
+        snapshot = self.stats.snapshot()
+        self.assertEqual(1, snapshot['ticks'])
+        self.assertEqual(22, snapshot['tick_duration']['last'])
+        self.assertEqual(['first', 'second'],
+                         [phase['name'] for phase in snapshot['phases']])
+        first, second = snapshot['phases']
+        self.assertEqual(2, first['duration']['last'])
+        self.assertEqual(3, first['last_queries'])
+        self.assertEqual(0, second['last_queries'])
+        self.assertEqual({'agents_started': 3}, snapshot['last_counts'])
+
+        # counters restart with each tick, totals accumulate
+        self.stats.start_tick()
+        self.stats.run_phase('first', self._phase, 1, 4)
+        self.stats.add_count('agents_started')
+        self.stats.end_tick()
+        snapshot = self.stats.snapshot()
+        self.assertEqual({'agents_started': 1}, snapshot['last_counts'])
+        self.assertEqual({'agents_started': 4}, snapshot['total_counts'])
+        self.assertEqual(7, snapshot['phases'][0]['total_queries'])
+        self.assertEqual(2, snapshot['phases'][0]['duration']['count'])
+
+
+    def test_phase_recorded_on_exception(self):
+        def fail():
+            self._time += 5
+            raise ValueError
+        self.assertRaises(ValueError, self.stats.run_phase, 'failing', fail)
+        phase = self.stats.snapshot()['phases'][0]
+        self.assertEqual(5, phase['duration']['last'])
+
+
+    def test_no_query_counter(self):
+        self.stats = tick_stats.TickStats()
+        self.stats.run_phase('phase', self._phase, 1, 3)
+        self.assertEqual(0, self.stats.snapshot()['phases'][0]['last_queries'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -200,6 +200,15 @@ class AFE(RpcClient):
         return self.get_hosts(id=id)[0]
 
 
+    def create_hosts(self, hostnames, **dargs):
+        """
+        Adds many hosts in one call.  See rpc_interface.add_hosts() for
+        the labels, acls, platform and other options accepted.
+        """
+        ids = self.run('add_hosts', hostnames=hostnames, **dargs)
+        return self.get_hosts(id__in=ids)
+
+
     def get_labels(self, **dargs):
         labels = self.run('get_labels', **dargs)
         return [Label(self, l) for l in labels]
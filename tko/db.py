@@ -5,6 +5,7 @@ try:
 except ImportError:
     import common
 from autotest_lib.client.common_lib import global_config
+from autotest_lib.client.common_lib import utils as common_utils
 from autotest_lib.tko import utils
 
 
@@ -12,7 +13,63 @@ class MySQLTooManyRows(Exception):
     pass
 
 
+class _InsertBatch(object):
+    """\
+            Rows waiting to be inserted, grouped by table and fields
+            so that each group can be written with multi-row INSERTs.
+    """
+    def __init__(self):
+        # maps (table, fields) to a list of value tuples
+        self._rows = {}
+        self._groups = []
+
+
+    def add(self, table, data):
+        fields = tuple(sorted(data))
+        group = (table, fields)
+        if group not in self._rows:
+            self._rows[group] = []
+            self._groups.append(group)
+        self._rows[group].append(tuple(data[field] for field in fields))
+
+
+    def flush(self, db, commit=None):
+        for table, fields in self._groups:
+            db.insert_many(table, fields, self._rows[(table, fields)],
+                           commit=commit)
+        self._rows = {}
+        self._groups = []
+
+
+# rebuilds the tko_test_rollup rows of one job (see
+# frontend/migrations/070_add_tko_test_rollup.py)
+_TEST_ROLLUP_SQL = """\
+insert into tko_test_rollup (job_idx, machine_idx, kernel_idx, status_idx,
+                             test_name, job_tag, job_name, job_owner,
+                             hostname, platform, kernel, status, test_count,
+                             max_test_idx)
+select tko_tests.job_idx, tko_jobs.machine_idx, tko_tests.kernel_idx,
+       tko_tests.status, tko_tests.test, tko_jobs.tag, tko_jobs.label,
+       tko_jobs.username, tko_machines.hostname, tko_machines.machine_group,
+       tko_kernels.printable, tko_status.word, count(1),
+       max(tko_tests.test_idx)
+from tko_tests
+inner join tko_jobs on tko_jobs.job_idx = tko_tests.job_idx
+inner join tko_machines on tko_machines.machine_idx = tko_jobs.machine_idx
+inner join tko_kernels on tko_kernels.kernel_idx = tko_tests.kernel_idx
+inner join tko_status on tko_status.status_idx = tko_tests.status
+where tko_tests.job_idx = %s
+group by tko_tests.job_idx, tko_tests.test, tko_tests.kernel_idx,
+         tko_tests.status
+"""
+
+
 class db_sql(object):
+    # rows per statement in insert_many()
+    _MAX_ROWS_PER_INSERT = 1000
+    # entries in each of the lookup caches
+    _LOOKUP_CACHE_SIZE = 1000
+
     def __init__(self, debug=False, autocommit=True, host=None,
                  database=None, user=None, password=None):
         self.debug = debug
@@ -22,6 +79,21 @@ class db_sql(object):
         self.con = None
         self._init_db()
 
+        # maps table name to [rows written, seconds spent] while a job is
+        # being written by insert_job()
+        self._write_stats = None
+        # set when tko_generation is to be bumped by the next commit()
+        self._generation_bump_pending = False
+
+        # the ids found by lookup_kernel() and lookup_machine(), with
+        # _lookup_caches mapping each table to the column its ids are
+        # looked up by and its cache
+        self._kernel_cache = common_utils.LruCache(self._LOOKUP_CACHE_SIZE)
+        self._machine_cache = common_utils.LruCache(self._LOOKUP_CACHE_SIZE)
+        self._lookup_caches = {
+                'tko_kernels': ('kernel_hash', self._kernel_cache),
+                'tko_machines': ('hostname', self._machine_cache)}
+
         # if not present, insert statuses
         self.status_idx = {}
         self.status_word = {}
@@ -77,6 +149,8 @@ class db_sql(object):
         if self.con:
             self.con.close()
             self.con = None
+            # anything cached from an unfinished transaction is gone
+            self._clear_lookup_caches()
 
         # create the db connection and cursor
         self.con = self.connect(self.host, self.database,
@@ -135,7 +209,21 @@ class db_sql(object):
 
 
     def commit(self):
+        if self._generation_bump_pending:
+            self.bump_generation(commit=False)
         self.con.commit()
+        self._generation_bump_pending = False
+
+
+    def _rollback(self):
+        OperationalError = _get_error_class("OperationalError")
+        self._clear_lookup_caches()
+        self._generation_bump_pending = False
+        try:
+            self.con.rollback()
+        except OperationalError:
+            # the connection is gone; run_with_retry() makes a new one
+            pass
 
 
     def get_last_autonumber_value(self):
@@ -248,13 +336,13 @@ class db_sql(object):
             # re-run the query until it succeeds
             def exec_sql():
                 self.cur.execute(sql, values)
-                self.con.commit()
+                self.commit()
             self.run_with_retry(exec_sql)
         else:
             # take one shot at running the query
             self.cur.execute(sql, values)
             if commit:
-                self.con.commit()
+                self.commit()
 
 
     def insert(self, table, data, commit=None):
@@ -272,7 +360,65 @@ class db_sql(object):
                 ','.join(refs)))
         self.dprint('%s %s' % (cmd, values))
 
+        start_time = time.time()
         self._exec_sql_with_commit(cmd, values, commit)
+        self._record_write(table, 1, time.time() - start_time)
+        self._invalidate_lookups(table)
+
+
+    def insert_many(self, table, fields, rows, commit=None):
+        """\
+                'insert into table (fields) values (%s ... %s), (...) ...',
+                values
+
+                fields:
+                        sequence of field names
+                rows:
+                        sequence of value sequences, in the order of fields
+
+                The rows are sent in statements of at most
+                _MAX_ROWS_PER_INSERT rows each.
+        """
+        if not rows:
+            return
+        quoted_fields = ','.join(self._quote(field) for field in fields)
+        row_refs = '(%s)' % ','.join('%s' for field in fields)
+        start_time = time.time()
+        for start in xrange(0, len(rows), self._MAX_ROWS_PER_INSERT):
+            chunk = rows[start:start + self._MAX_ROWS_PER_INSERT]
+            cmd = ('insert into %s (%s) values %s' %
+                   (table, quoted_fields, ','.join([row_refs] * len(chunk))))
+            values = [value for row in chunk for value in row]
+            self.dprint('%s %s' % (cmd, values))
+
+            self._exec_sql_with_commit(cmd, values, commit)
+        self._record_write(table, len(rows), time.time() - start_time)
+        self._invalidate_lookups(table)
+
+
+    def _record_write(self, table, num_rows, seconds):
+        if self._write_stats is None:
+            return
+        stats = self._write_stats.setdefault(table, [0, 0.0])
+        stats[0] += num_rows
+        stats[1] += seconds
+
+
+    def _invalidate_lookups(self, table, fields=None):
+        """\
+                Clear the lookup cache of table after a write to it, which
+                for an update means one changing the looked up column.
+        """
+        if table not in self._lookup_caches:
+            return
+        key_field, cache = self._lookup_caches[table]
+        if fields is None or key_field in fields:
+            cache.clear()
+
+
+    def _clear_lookup_caches(self):
+        for key_field, cache in self._lookup_caches.itervalues():
+            cache.clear()
 
 
     def delete(self, table, where, commit = None):
@@ -285,6 +431,7 @@ class db_sql(object):
         self.dprint('%s %s' % (sql, values))
 
         self._exec_sql_with_commit(sql, values, commit)
+        self._invalidate_lookups(table)
 
 
     def update(self, table, data, where, commit = None):
@@ -309,6 +456,7 @@ class db_sql(object):
         self.dprint('%s %s' % (cmd, values))
 
         self._exec_sql_with_commit(cmd, values, commit)
+        self._invalidate_lookups(table, fields)
 
 
     def delete_job(self, tag, commit = None):
@@ -320,11 +468,74 @@ class db_sql(object):
             self.delete('tko_test_attributes', where)
             self.delete('tko_test_labels_tests', {'test_id': test_idx})
         where = {'job_idx' : job_idx}
+        self.delete('tko_test_rollup', where)
         self.delete('tko_tests', where)
         self.delete('tko_jobs', where)
+        self._generation_changed(commit)
+
 
+    def insert_job(self, tag, job, commit = None, tests=None):
+        """\
+                Write a job with its machine, keyvals and tests.
+
+                Only the given tests are written if tests is not None,
+                for callers that know the rest of job.tests are already
+                stored unchanged.  The test rows are collected per table
+                and written with multi-row INSERTs once all the tests are
+                in, and the job's tko_test_rollup rows are rebuilt after
+                them.  The generation is bumped as the last statement of
+                the transaction.  With autocommit, the whole job is
+                written in one transaction, which is retried as a whole
+                after operational errors.
+        """
+        if tests is None:
+            tests = job.tests
+        if self.autocommit:
+            self.run_with_retry(self._insert_job_in_transaction, tag, job,
+                                tests)
+        else:
+            self._insert_job(tag, job, tests, commit)
 
-    def insert_job(self, tag, job, commit = None):
+
+    def _insert_job_in_transaction(self, tag, job, tests):
+        had_index = hasattr(job, 'index')
+        new_tests = [test for test in tests if not hasattr(test, 'test_idx')]
+        self.autocommit = False
+        try:
+            try:
+                self._insert_job(tag, job, tests, commit=False)
+                self.commit()
+            except:
+                self._rollback()
+                # forget the ids handed out by the rolled back inserts
+                if not had_index and hasattr(job, 'index'):
+                    del job.index
+                for test in new_tests:
+                    if hasattr(test, 'test_idx'):
+                        del test.test_idx
+                raise
+        finally:
+            self.autocommit = True
+
+
+    def _insert_job(self, tag, job, tests, commit):
+        self._write_stats = {}
+        try:
+            self._write_job(tag, job, tests, commit)
+            self._log_write_stats(tag)
+        finally:
+            self._write_stats = None
+
+
+    def _log_write_stats(self, tag):
+        tables = sorted(self._write_stats)
+        summary = ', '.join('%s %d rows in %.3fs'
+                            % ((table,) + tuple(self._write_stats[table]))
+                            for table in tables)
+        utils.dprint('+ Wrote job %s: %s' % (tag, summary))
+
+
+    def _write_job(self, tag, job, tests, commit):
         job.machine_idx = self.lookup_machine(job.machine)
         if not job.machine_idx:
             job.machine_idx = self.insert_machine(job, commit=commit)
@@ -348,23 +559,92 @@ class db_sql(object):
             self.insert('tko_jobs', data, commit=commit)
             job.index = self.get_last_autonumber_value()
         self.update_job_keyvals(job, commit=commit)
-        for test in job.tests:
-            self.insert_test(job, test, commit=commit)
+        batch = _InsertBatch()
+        for test in tests:
+            self.insert_test(job, test, commit=commit, batch=batch)
+        batch.flush(self, commit=commit)
+        self._tests_changed(job.index, commit=commit)
+
+
+    def _tests_changed(self, job_idx, commit):
+        self.refresh_test_rollup(job_idx, commit=commit)
+        self._generation_changed(commit)
+
+
+    def _generation_changed(self, commit):
+        if commit is None:
+            commit = self.autocommit
+        if commit:
+            self.bump_generation(commit=True)
+        else:
+            # every parser updates the same tko_generation row, so it is
+            # only locked from the last statement of the transaction on
+            self._generation_bump_pending = True
+
+
+    def bump_generation(self, commit=None):
+        """\
+                Bump the counter in tko_generation, which tells the
+                TKO frontend that its cached query results are out of
+                date (see frontend/tko/query_cache.py).
+        """
+        if commit is None:
+            commit = self.autocommit
+        sql = 'update tko_generation set generation=generation+1'
+        self.dprint(sql)
+        self._exec_sql_with_commit(sql, [], commit)
+
+
+    def refresh_test_rollup(self, job_idx, commit=None):
+        """\
+                Rebuild the tko_test_rollup rows of a job from its
+                tests, which is simpler than keeping the counts right
+                through test updates and deletions and only touches
+                the rows of one job.
+        """
+        if commit is None:
+            commit = self.autocommit
+        self.delete('tko_test_rollup', {'job_idx': job_idx}, commit=commit)
+        self.dprint('%s %s' % (_TEST_ROLLUP_SQL, [job_idx]))
+        self._exec_sql_with_commit(_TEST_ROLLUP_SQL, [job_idx], commit)
 
 
     def update_job_keyvals(self, job, commit=None):
+        """\
+                Read the job's stored keyvals with one query, then
+                update the changed ones and insert all the new ones
+                with a single multi-row INSERT.
+        """
+        rows = self.select('%s, value' % self._quote('key'),
+                           'tko_job_keyvals', {'job_id': job.index})
+        stored_values = dict(rows)
+        new_rows = []
         for key, value in job.keyval_dict.iteritems():
-            where = {'job_id': job.index, 'key': key}
-            data = dict(where, value=value)
-            exists = self.select('id', 'tko_job_keyvals', where=where)
+            if key not in stored_values:
+                new_rows.append((job.index, key, value))
+            elif stored_values[key] != value:
+                where = {'job_id': job.index, 'key': key}
+                self.update('tko_job_keyvals', {'value': value}, where=where,
+                            commit=commit)
+        self.insert_many('tko_job_keyvals', ('job_id', 'key', 'value'),
+                         new_rows, commit=commit)
 
-            if exists:
-                self.update('tko_job_keyvals', data, where=where, commit=commit)
-            else:
-                self.insert('tko_job_keyvals', data, commit=commit)
 
+    def insert_test(self, job, test, commit = None, batch=None):
+        """\
+                Write a test row and its iterations, attributes and
+                labels.  The rows other than the test's own are added
+                to batch if one is given, for the caller to flush and
+                rebuild the job's rollup; otherwise they are written and
+                the rollup rebuilt before returning.
+        """
+        if batch is None:
+            batch = _InsertBatch()
+            self.insert_test(job, test, commit=commit, batch=batch)
+            batch.flush(self, commit=commit)
+            self._tests_changed(job.index, commit=commit)
+            return
 
-    def insert_test(self, job, test, commit = None):
         kver = self.insert_kernel(test.kernel, commit=commit)
         data = {'job_idx':job.index, 'test':test.testname,
                 'subdir':test.subdir, 'kernel_idx':kver,
@@ -385,30 +665,26 @@ class db_sql(object):
         else:
             self.insert('tko_tests', data, commit=commit)
             test_idx = test.test_idx = self.get_last_autonumber_value()
-        data = {'test_idx': test_idx}
 
         for i in test.iterations:
-            data['iteration'] = i.index
             for key, value in i.attr_keyval.iteritems():
-                data['attribute'] = key
-                data['value'] = value
-                self.insert('tko_iteration_attributes', data,
-                            commit=commit)
+                batch.add('tko_iteration_attributes',
+                          {'test_idx': test_idx, 'iteration': i.index,
+                           'attribute': key, 'value': value})
             for key, value in i.perf_keyval.iteritems():
-                data['attribute'] = key
-                data['value'] = value
-                self.insert('tko_iteration_result', data,
-                            commit=commit)
+                batch.add('tko_iteration_result',
+                          {'test_idx': test_idx, 'iteration': i.index,
+                           'attribute': key, 'value': value})
 
         for key, value in test.attributes.iteritems():
-            data = {'test_idx': test_idx, 'attribute': key,
-                    'value': value}
-            self.insert('tko_test_attributes', data, commit=commit)
+            batch.add('tko_test_attributes',
+                      {'test_idx': test_idx, 'attribute': key,
+                       'value': value})
 
         if not is_update:
             for label_index in test.labels:
-                data = {'test_id': test_idx, 'testlabel_id': label_index}
-                self.insert('tko_test_labels_tests', data, commit=commit)
+                batch.add('tko_test_labels_tests',
+                          {'test_id': test_idx, 'testlabel_id': label_index})
 
 
     def read_machine_map(self):
@@ -436,7 +712,9 @@ class db_sql(object):
     def insert_machine(self, job, commit = None):
         machine_info = self.machine_info_dict(job)
         self.insert('tko_machines', machine_info, commit=commit)
-        return self.get_last_autonumber_value()
+        machine_idx = self.get_last_autonumber_value()
+        self._machine_cache.set(machine_info['hostname'], machine_idx)
+        return machine_idx
 
 
     def update_machine_information(self, job, commit = None):
@@ -444,21 +722,37 @@ class db_sql(object):
         self.update('tko_machines', machine_info,
                     where={'hostname': machine_info['hostname']},
                     commit=commit)
+        # the platform is copied into the rollup rows of all the machine's
+        # jobs, and may have changed (to or from NULL too)
+        self.update('tko_test_rollup',
+                    {'platform': machine_info['machine_group']},
+                    where=('hostname=%s and not (platform <=> %s)',
+                           [machine_info['hostname'],
+                            machine_info['machine_group']]),
+                    commit=commit)
 
 
     def lookup_machine(self, hostname):
+        machine_idx = self._machine_cache.get(hostname)
+        if machine_idx is not None:
+            return machine_idx
         where = { 'hostname' : hostname }
         rows = self.select('machine_idx', 'tko_machines', where)
         if rows:
+            self._machine_cache.set(hostname, rows[0][0])
             return rows[0][0]
         else:
             return None
 
 
     def lookup_kernel(self, kernel):
+        kernel_idx = self._kernel_cache.get(kernel.kernel_hash)
+        if kernel_idx is not None:
+            return kernel_idx
         rows = self.select('kernel_idx', 'tko_kernels',
                                 {'kernel_hash':kernel.kernel_hash})
         if rows:
+            self._kernel_cache.set(kernel.kernel_hash, rows[0][0])
             return rows[0][0]
         else:
             return None
@@ -494,6 +788,7 @@ class db_sql(object):
 
         for patch in kernel.patches:
             self.insert_patch(kver, patch, commit=commit)
+        self._kernel_cache.set(kernel.kernel_hash, kver)
         return kver
 
 
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+"""
+Benchmark for writing parsed jobs with db.insert_job().
+
+Writes a job with many iterations and perf keyvals into an in-memory sqlite
+database, once with insert_job() and once with the previous row-at-a-time
+implementation (reimplemented here for comparison), and reports the number
+of statements and the time taken by each.  A per-statement delay can be added
+to stand in for the round trip to a remote database server.
+"""
+
+import optparse, sys, time
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.tko import db_unittest
+from autotest_lib.tko import utils as tko_utils
+
+
+class RowAtATimeDb(db_unittest.SqliteDb):
+    def update_job_keyvals(self, job, commit=None):
+        for key, value in job.keyval_dict.iteritems():
+            where = {'job_id': job.index, 'key': key}
+            data = dict(where, value=value)
+            exists = self.select('id', 'tko_job_keyvals', where=where)
+
+            if exists:
+                self.update('tko_job_keyvals', data, where=where, commit=commit)
+            else:
+                self.insert('tko_job_keyvals', data, commit=commit)
+
+
+    def insert_test(self, job, test, commit=None, batch=None):
+        kver = self.insert_kernel(test.kernel, commit=commit)
+        data = {'job_idx':job.index, 'test':test.testname,
+                'subdir':test.subdir, 'kernel_idx':kver,
+                'status':self.status_idx[test.status],
+                'reason':test.reason, 'machine_idx':job.machine_idx,
+                'started_time': test.started_time,
+                'finished_time':test.finished_time}
+        self.insert('tko_tests', data, commit=commit)
+        test_idx = test.test_idx = self.get_last_autonumber_value()
+        data = {'test_idx': test_idx}
+
+        for i in test.iterations:
+            data['iteration'] = i.index
+            for key, value in i.attr_keyval.iteritems():
+                data['attribute'] = key
+                data['value'] = value
+                self.insert('tko_iteration_attributes', data,
+                            commit=commit)
+            for key, value in i.perf_keyval.iteritems():
+                data['attribute'] = key
+                data['value'] = value
+                self.insert('tko_iteration_result', data,
+                            commit=commit)
+
+        for key, value in test.attributes.iteritems():
+            data = {'test_idx': test_idx, 'attribute': key,
+                    'value': value}
+            self.insert('tko_test_attributes', data, commit=commit)
+
+        for label_index in test.labels:
+            data = {'test_id': test_idx, 'testlabel_id': label_index}
+            self.insert('tko_test_labels_tests', data, commit=commit)
+
+
+def _add_latency(db, latency):
+    cursor_execute = db.cur.execute
+    def execute(sql, values=()):
+        time.sleep(latency)
+        return cursor_execute(sql, values)
+    db.cur.execute = execute
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-t', '--tests', type='int', default=1,
+                      help='number of tests in the job')
+    parser.add_option('-i', '--iterations', type='int', default=50,
+                      help='number of iterations per test')
+    parser.add_option('-k', '--keyvals', type='int', default=200,
+                      help='number of perf keyvals per iteration')
+    parser.add_option('-l', '--latency-ms', type='float', default=0.2,
+                      help='delay added to every statement (ms)')
+    options, args = parser.parse_args()
+
+    tko_utils.redirect_parser_debugging(sys.stdout)
+    for name, db_class in (('row-at-a-time', RowAtATimeDb),
+                           ('batched', db_unittest.SqliteDb)):
+        db = db_class()
+        _add_latency(db, options.latency_ms / 1000.0)
+        job = db_unittest.make_job(num_tests=options.tests,
+                                   num_iterations=options.iterations,
+                                   num_keyvals=options.keyvals)
+        num_statements = len(db.con.statements)
+        start_time = time.time()
+        db.insert_job('1-user/host', job)
+        db.commit()
+        print '%-14s %6d statements, %.3fs' % (
+                name, len(db.con.statements) - num_statements,
+                time.time() - start_time)
+
+
+if __name__ == '__main__':
+    main()
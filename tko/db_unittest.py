@@ -0,0 +1,333 @@
+#!/usr/bin/python
+
+import sqlite3, sys, unittest
+
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.tko import db, models
+from autotest_lib.tko import utils as tko_utils
+
+
+_SCHEMA = """
+CREATE TABLE tko_status (status_idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                         word VARCHAR(10));
+INSERT INTO tko_status (word) VALUES ('ABORT'),('ALERT'),('ERROR'),('FAIL'),
+                                     ('GOOD'),('NOSTATUS'),('RUNNING'),
+                                     ('TEST_NA'),('WARN');
+CREATE TABLE tko_machines (machine_idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                           hostname VARCHAR(700), machine_group VARCHAR(80),
+                           owner VARCHAR(80));
+CREATE TABLE tko_kernels (kernel_idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                          kernel_hash VARCHAR(35), base VARCHAR(30),
+                          printable VARCHAR(100));
+CREATE TABLE tko_patches (kernel_idx INTEGER NOT NULL, name VARCHAR(80),
+                          url VARCHAR(300), hash VARCHAR(35));
+CREATE TABLE tko_jobs (job_idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                       tag VARCHAR(100), label VARCHAR(100),
+                       username VARCHAR(80), machine_idx INTEGER NOT NULL,
+                       queued_time DATETIME, started_time DATETIME,
+                       finished_time DATETIME, afe_job_id INTEGER);
+CREATE TABLE tko_job_keyvals (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                              job_id INTEGER NOT NULL,
+                              `key` VARCHAR(90) NOT NULL,
+                              value VARCHAR(300) NOT NULL);
+CREATE TABLE tko_tests (test_idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job_idx INTEGER NOT NULL, test VARCHAR(60),
+                        subdir VARCHAR(60), kernel_idx INTEGER NOT NULL,
+                        status INTEGER NOT NULL, reason VARCHAR(1024),
+                        machine_idx INTEGER NOT NULL,
+                        invalid TINYINT DEFAULT 0, finished_time DATETIME,
+                        started_time DATETIME);
+CREATE TABLE tko_iteration_attributes (test_idx INTEGER NOT NULL,
+                                       iteration INTEGER,
+                                       attribute VARCHAR(30),
+                                       value VARCHAR(1024));
+CREATE TABLE tko_iteration_result (test_idx INTEGER NOT NULL,
+                                   iteration INTEGER, attribute VARCHAR(30),
+                                   value FLOAT);
+CREATE TABLE tko_test_attributes (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  test_idx INTEGER NOT NULL,
+                                  attribute VARCHAR(30),
+                                  value VARCHAR(1024),
+                                  user_created TINYINT NOT NULL DEFAULT 0);
+CREATE TABLE tko_test_labels_tests (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    testlabel_id INTEGER NOT NULL,
+                                    test_id INTEGER NOT NULL);
+CREATE TABLE tko_test_rollup (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                              job_idx INTEGER NOT NULL,
+                              machine_idx INTEGER NOT NULL,
+                              kernel_idx INTEGER NOT NULL,
+                              status_idx INTEGER NOT NULL,
+                              test_name VARCHAR(300), job_tag VARCHAR(100),
+                              job_name VARCHAR(100), job_owner VARCHAR(80),
+                              hostname VARCHAR(700), platform VARCHAR(80),
+                              kernel VARCHAR(100), status VARCHAR(10),
+                              test_count INTEGER NOT NULL,
+                              max_test_idx INTEGER NOT NULL);
+CREATE TABLE tko_generation (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                             generation INTEGER NOT NULL DEFAULT 0);
+INSERT INTO tko_generation (generation) VALUES (0);
+"""
+
+
+class SqliteCursor(object):
+    """
+    Runs the MySQL flavoured SQL of db_sql on sqlite, counting statements.
+    """
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.sqlite_connection.cursor()
+
+
+    def execute(self, sql, values=()):
+        sql = sql.replace('%s', '?').replace('LAST_INSERT_ID()',
+                                             'last_insert_rowid()')
+        sql = sql.replace('<=>', 'IS')
+        self._connection.statements.append(sql)
+        self._cursor.execute(sql, tuple(values))
+        return self._cursor.rowcount
+
+
+    def fetchall(self):
+        return [tuple(row) for row in self._cursor.fetchall()]
+
+
+class SqliteConnection(object):
+    def __init__(self):
+        self.sqlite_connection = sqlite3.connect(':memory:')
+        self.sqlite_connection.text_factory = str
+        self.sqlite_connection.executescript(_SCHEMA)
+        self.statements = []
+
+
+    def cursor(self):
+        return SqliteCursor(self)
+
+
+    def commit(self):
+        self.sqlite_connection.commit()
+
+
+    def rollback(self):
+        self.sqlite_connection.rollback()
+
+
+    def close(self):
+        self.sqlite_connection.close()
+
+
+class SqliteDb(db.db_sql):
+    """
+    A db_sql on an in-memory sqlite database with the TKO tables.
+    """
+    def __init__(self, **dargs):
+        super(SqliteDb, self).__init__(autocommit=False, host='', database='',
+                                       user='', password='', **dargs)
+
+
+    def connect(self, host, database, user, password):
+        return SqliteConnection()
+
+
+    def count_statements(self, prefix):
+        return len([sql for sql in self.con.statements
+                    if sql.lower().startswith(prefix)])
+
+
+def make_job(num_tests=2, num_iterations=3, num_keyvals=4, tag='job'):
+    job = models.job('/results/' + tag, 'user', 'label', 'host', None, None,
+                     None, None, None, None, None,
+                     dict(('job_key%d' % i, str(i)) for i in xrange(2)))
+    kernel = models.kernel('2.6.30', [], 'kernel_hash')
+    for test_index in xrange(num_tests):
+        iterations = [
+                models.iteration(
+                        iteration_index,
+                        dict(('attr%d' % i, str(i))
+                             for i in xrange(num_keyvals)),
+                        dict(('perf%d' % i, float(i))
+                             for i in xrange(num_keyvals)))
+                for iteration_index in xrange(1, num_iterations + 1)]
+        job.tests.append(models.test(
+                'subdir%d' % test_index, 'test%d' % test_index, 'GOOD', '',
+                kernel, 'host', None, None, iterations,
+                {'test_attr': 'value'}, [1, 2]))
+    return job
+
+
+class InsertJobTest(unittest.TestCase):
+    def setUp(self):
+        tko_utils.redirect_parser_debugging(open('/dev/null', 'w'))
+        self.db = SqliteDb()
+
+
+    def tearDown(self):
+        tko_utils.redirect_parser_debugging(sys.stderr)
+
+
+    def _count_rows(self, table):
+        return self.db.select('count(*)', table, None)[0][0]
+
+
+    def test_insert_job(self):
+        job = make_job()
+        self.db.insert_job('1-user/host', job)
+        self.db.commit()
+
+        self.assertEquals(1, self._count_rows('tko_jobs'))
+        self.assertEquals(2, self._count_rows('tko_tests'))
+        self.assertEquals(2 * 3 * 4, self._count_rows('tko_iteration_result'))
+        self.assertEquals(2 * 3 * 4,
+                          self._count_rows('tko_iteration_attributes'))
+        self.assertEquals(2, self._count_rows('tko_test_attributes'))
+        self.assertEquals(4, self._count_rows('tko_test_labels_tests'))
+        self.assertEquals(2, self._count_rows('tko_job_keyvals'))
+        self.assertEquals([(1, 1, 'perf1', 1.0)],
+                          self.db.select('*', 'tko_iteration_result',
+                                         {'test_idx': job.tests[0].test_idx,
+                                          'iteration': 1,
+                                          'attribute': 'perf1'}))
+
+        # one INSERT per table for everything but the jobs, machines,
+        # kernels and tests, which need their ids, and one for the rollup
+        self.assertEquals(1 + 1 + 1 + 2 + 5 + 1,
+                          self.db.count_statements('insert'))
+
+
+    def test_insert_many_chunks_rows(self):
+        self.db._MAX_ROWS_PER_INSERT = 2
+        rows = [(1, i, 'attr', 'value') for i in xrange(5)]
+        self.db.insert_many('tko_iteration_attributes',
+                            ('test_idx', 'iteration', 'attribute', 'value'),
+                            rows)
+        self.assertEquals(3, self.db.count_statements('insert'))
+        self.assertEquals(5, self._count_rows('tko_iteration_attributes'))
+
+
+    def test_update_job_keyvals(self):
+        job = make_job(num_tests=0)
+        self.db.insert_job('1-user/host', job)
+        num_updates = self.db.count_statements('update')
+        job.keyval_dict = {'job_key0': '0', 'job_key1': 'changed',
+                           'job_key2': 'new'}
+        self.db.update_job_keyvals(job)
+
+        self.assertEquals(
+                [('job_key0', '0'), ('job_key1', 'changed'),
+                 ('job_key2', 'new')],
+                self.db.select('`key`, value', 'tko_job_keyvals',
+                               '1 ORDER BY `key`'))
+        self.assertEquals(1, self.db.count_statements('update') - num_updates)
+
+
+    def test_reparse_replaces_test_rows(self):
+        job = make_job()
+        self.db.insert_job('1-user/host', job)
+        test_idxs = [test.test_idx for test in job.tests]
+
+        reparsed_job = make_job(num_iterations=1)
+        reparsed_job.index = job.index
+        for test, test_idx in zip(reparsed_job.tests, test_idxs):
+            test.test_idx = test_idx
+        self.db.insert_job('1-user/host', reparsed_job)
+
+        self.assertEquals(2, self._count_rows('tko_tests'))
+        self.assertEquals(2 * 4, self._count_rows('tko_iteration_result'))
+        self.assertEquals(2, self._count_rows('tko_test_attributes'))
+        # labels are only written for new tests
+        self.assertEquals(4, self._count_rows('tko_test_labels_tests'))
+
+
+    def _select_rollup(self):
+        return self.db.select('job_tag, test_name, status, platform, '
+                              'test_count, max_test_idx',
+                              'tko_test_rollup', '1 ORDER BY id')
+
+
+    def test_rollup_rebuilt_with_job(self):
+        job = make_job(num_tests=3)
+        job.tests[1].testname = job.tests[0].testname
+        self.db.insert_job('1-user/host', job)
+        test_idxs = [test.test_idx for test in job.tests]
+        self.assertEquals(
+                [('1-user/host', 'test0', 'GOOD', 'host', 2, test_idxs[1]),
+                 ('1-user/host', 'test2', 'GOOD', 'host', 1, test_idxs[2])],
+                self._select_rollup())
+
+        job.tests[1].status = 'FAIL'
+        job.machine_group = 'platform'
+        self.db.insert_job('1-user/host', job, tests=[job.tests[1]])
+        self.assertEquals(
+                [('1-user/host', 'test0', 'GOOD', 'platform', 1,
+                  test_idxs[0]),
+                 ('1-user/host', 'test0', 'FAIL', 'platform', 1,
+                  test_idxs[1]),
+                 ('1-user/host', 'test2', 'GOOD', 'platform', 1,
+                  test_idxs[2])],
+                sorted(self._select_rollup(),
+                       key=lambda row: (row[1], row[5])))
+
+        self.db.delete_job('1-user/host')
+        self.assertEquals(0, self._count_rows('tko_test_rollup'))
+
+
+    def test_rollup_platform_follows_machine(self):
+        self.db.insert_job('1-user/host', make_job(num_tests=1))
+        # rows written before the machine had a platform
+        self.db.update('tko_test_rollup', {'platform': None},
+                       where={'job_tag': '1-user/host'})
+        job = make_job(num_tests=1)
+        job.machine_group = 'platform'
+        self.db.insert_job('2-user/host', job)
+        self.assertEquals([('platform',), ('platform',)],
+                          self.db.select('platform', 'tko_test_rollup', None))
+
+
+    def _select_generation(self):
+        return self.db.select('generation', 'tko_generation', None)
+
+
+    def test_generation_bumped_by_writes(self):
+        job = make_job(num_tests=1)
+        self.db.insert_job('1-user/host', job)
+        self.db.commit()
+        self.db.insert_test(job, job.tests[0])
+        self.db.commit()
+        self.db.delete_job('1-user/host')
+        self.db.commit()
+        self.assertEquals([(3,)], self._select_generation())
+
+
+    def test_generation_bumped_last_in_transaction(self):
+        self.db.insert_job('1-user/host', make_job(num_tests=2))
+        self.db.insert_job('2-user/host', make_job(num_tests=2))
+        self.assertEquals([(0,)], self._select_generation())
+        self.db.commit()
+        self.assertEquals([(1,)], self._select_generation())
+        self.assert_(self.db.con.statements[-2].lower().startswith(
+                'update tko_generation'))
+
+
+    def test_kernel_and_machine_looked_up_once(self):
+        self.db.insert_job('1-user/host', make_job(num_tests=5))
+        self.db.insert_job('2-user/host', make_job(num_tests=5))
+        self.assertEquals(1, self.db.count_statements(
+                'select kernel_idx from tko_kernels'))
+        self.assertEquals(1, self.db.count_statements(
+                'select machine_idx from tko_machines'))
+        self.assertEquals(1, self._count_rows('tko_kernels'))
+
+
+    def test_lookup_caches_cleared_on_reconnect(self):
+        self.db.insert_job('1-user/host', make_job(num_tests=1))
+        # a new in-memory database, as if the transaction was lost
+        self.db._init_db()
+        self.db.insert_job('1-user/host', make_job(num_tests=1))
+        self.assertEquals(1, self._count_rows('tko_kernels'))
+        self.assertEquals(1, self._count_rows('tko_machines'))
+
+
+if __name__ == '__main__':
+    unittest.main()
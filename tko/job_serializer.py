@@ -3,14 +3,19 @@
 """A script that provides convertion between models.job and a protocol
 buffer object.
 
-This script contains only one class that takes an job instance and
-convert it into a protocol buffer object. The class will also be
-responsible for serializing the job instance via protocol buffers.
+JobSerializer takes a job instance and converts it into a protocol
+buffer object. It is also responsible for serializing the job instance
+via protocol buffers.
+
+JobStreamWriter and JobStreamReader write and read the serialized job one
+test at a time, so that the whole job never has to be held in memory as a
+protocol buffer.
 
 """
 
 # import python libraries
 import os
+import mmap
 import datetime
 import time
 import random
@@ -108,14 +113,13 @@ class JobSerializer(object):
         binary of the serialized object.
         """
 
-        pb_job = tko_pb2.Job()
-        self.set_pb_job(the_job, pb_job, tag)
-
-        out = open(binaryfilename, 'wb')
+        writer = JobStreamWriter(binaryfilename, self)
         try:
-            out.write(pb_job.SerializeToString())
+            for test in the_job.tests:
+                writer.write_test(test)
+            writer.write_job(the_job, tag)
         finally:
-            out.close()
+            writer.close()
 
 
     def set_afe_job_id_and_tag(self, pb_job, tag):
@@ -182,13 +186,27 @@ class JobSerializer(object):
         tag: used to set pb_job.tag and pb_job.afe_job_id.
         """
 
-        self.set_trivial_attr(tko_job, pb_job, self.job_type_dict)
-        self.set_afe_job_id_and_tag(pb_job, tag)
+        self.set_pb_job_fields(tko_job, pb_job, tag)
 
         for test in tko_job.tests:
             newtest = pb_job.tests.add()
             self.set_pb_test(test, newtest)
 
+
+    def set_pb_job_fields(self, tko_job, pb_job, tag):
+        """Set all the fields of the new job object except for the tests.
+
+        @param
+        tko_job: a tko job instance that will have it's values
+        transfered to the new job
+        pb_job: a new instance of the job class provided in the
+        protocol buffer.
+        tag: used to set pb_job.tag and pb_job.afe_job_id.
+        """
+
+        self.set_trivial_attr(tko_job, pb_job, self.job_type_dict)
+        self.set_afe_job_id_and_tag(pb_job, tag)
+
         for key, val in tko_job.keyval_dict.iteritems():
             newkeyval = pb_job.keyval_dict.add()
             newkeyval.name = key
@@ -427,3 +445,197 @@ class JobSerializer(object):
                 (type(value), attr, vartype))
 
             setattr(var, attr, value)
+
+
+# wire types of the protocol buffer encoding
+_WIRETYPE_VARINT = 0
+_WIRETYPE_FIXED64 = 1
+_WIRETYPE_LENGTH_DELIMITED = 2
+_WIRETYPE_FIXED32 = 5
+
+_TESTS_FIELD_NUMBER = tko_pb2.Job.DESCRIPTOR.fields_by_name['tests'].number
+_TESTS_FIELD_TAG = (_TESTS_FIELD_NUMBER << 3) | _WIRETYPE_LENGTH_DELIMITED
+
+
+def _encode_varint(value):
+    """Returns the protocol buffer varint encoding of value."""
+    chunks = []
+    while value > 0x7f:
+        chunks.append(chr(0x80 | (value & 0x7f)))
+        value >>= 7
+    chunks.append(chr(value))
+    return ''.join(chunks)
+
+
+def _decode_varint(data, position):
+    """Decodes the varint at position in data.
+
+    @return a (value, position after the varint) tuple.
+    """
+    value = shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError('Truncated varint in serialized job')
+        byte = ord(data[position])
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+class JobStreamWriter(object):
+    """Writes a serialized job to a binary file one test at a time.
+
+    The protocol buffer encoding of a message is just the sequence of its
+    encoded fields, in any order, and each test of a job is a length
+    delimited field. Every test is therefore written as soon as it is
+    given, and the other fields of the job are written once the job is
+    complete. The file is a serialized tko_pb2.Job, so it can also be
+    read back with JobSerializer.deserialize_from_binary().
+    """
+
+    def __init__(self, binaryfilename, serializer=None):
+        """
+        @param
+        binaryfilename: the name of the file that will be written to.
+        serializer: the JobSerializer used to convert the tko objects.
+        """
+        if serializer is None:
+            serializer = JobSerializer()
+        self.serializer = serializer
+        self.out = open(binaryfilename, 'wb')
+
+
+    def write_test(self, tko_test):
+        """Appends a tko test to the job.
+
+        @param
+        tko_test: the tko test that will be written.
+        """
+        pb_test = tko_pb2.Job.Test()
+        self.serializer.set_pb_test(tko_test, pb_test)
+        record = pb_test.SerializeToString()
+        self.out.write(_encode_varint(_TESTS_FIELD_TAG))
+        self.out.write(_encode_varint(len(record)))
+        self.out.write(record)
+
+
+    def write_job(self, tko_job, tag):
+        """Writes all the fields of the job except for the tests, which
+        are written with write_test().
+
+        @param
+        tko_job: the tko job that will be written.
+        tag: contains the job name and the afe_job_id
+        """
+        pb_job = tko_pb2.Job()
+        self.serializer.set_pb_job_fields(tko_job, pb_job, tag)
+        self.out.write(pb_job.SerializeToString())
+
+
+    def close(self):
+        self.out.close()
+
+
+class JobStreamReader(object):
+    """Reads the tests of a serialized job one at a time.
+
+    The file is mapped into memory and only the field headers are scanned
+    when it is opened, so single tests can be read without deserializing
+    the rest of the job.
+    """
+
+    def __init__(self, binaryfilename, serializer=None):
+        """
+        @param
+        binaryfilename: the name of a file written by JobStreamWriter or
+        JobSerializer.
+        serializer: the JobSerializer used to convert the pb objects.
+        """
+        if serializer is None:
+            serializer = JobSerializer()
+        self.serializer = serializer
+
+        binary = open(binaryfilename, 'rb')
+        try:
+            size = os.fstat(binary.fileno()).st_size
+            if size:
+                self._data = mmap.mmap(binary.fileno(), size,
+                                       access=mmap.ACCESS_READ)
+            else:
+                self._data = ''
+        finally:
+            binary.close()
+
+        # the (start, end) offsets of the encoded tests, and the encoded
+        # other fields of the job
+        self._test_records = []
+        job_fields = []
+        position = 0
+        while position < size:
+            field_start = position
+            field_tag, position = _decode_varint(self._data, position)
+            wire_type = field_tag & 0x7
+            if wire_type == _WIRETYPE_VARINT:
+                value, position = _decode_varint(self._data, position)
+            elif wire_type == _WIRETYPE_FIXED64:
+                position += 8
+            elif wire_type == _WIRETYPE_FIXED32:
+                position += 4
+            elif wire_type == _WIRETYPE_LENGTH_DELIMITED:
+                length, position = _decode_varint(self._data, position)
+                if field_tag == _TESTS_FIELD_TAG:
+                    self._test_records.append((position, position + length))
+                position += length
+            else:
+                raise ValueError('Unexpected wire type %d in serialized job'
+                                 % wire_type)
+            if position > size:
+                raise ValueError('Truncated field in serialized job')
+            if field_tag != _TESTS_FIELD_TAG:
+                job_fields.append(self._data[field_start:position])
+
+        self._pb_job = tko_pb2.Job()
+        self._pb_job.ParseFromString(''.join(job_fields))
+
+
+    def __len__(self):
+        return len(self._test_records)
+
+
+    def get_pb_test(self, index):
+        """Returns the pb test at index, deserializing only that test."""
+        start, end = self._test_records[index]
+        pb_test = tko_pb2.Job.Test()
+        pb_test.ParseFromString(self._data[start:end])
+        return pb_test
+
+
+    def get_test(self, index):
+        """Returns the tko test at index, deserializing only that test."""
+        return self.serializer.get_tko_test(self.get_pb_test(index))
+
+
+    def iter_tests(self):
+        """Yields the tko tests of the job in order."""
+        for index in xrange(len(self._test_records)):
+            yield self.get_test(index)
+
+
+    def get_job(self, include_tests=True):
+        """Returns the tko job, with or without its tests.
+
+        @param
+        include_tests: if False, the returned job has no tests, and they
+        can be read one at a time with get_test() or iter_tests().
+        """
+        tko_job = self.serializer.get_tko_job(self._pb_job)
+        if include_tests:
+            tko_job.tests.extend(self.iter_tests())
+        return tko_job
+
+
+    def close(self):
+        if self._data:
+            self._data.close()
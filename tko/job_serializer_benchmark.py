@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+"""
+Round-trip benchmark for the job.serialize files written by the parser.
+
+Builds a synthetic job with many tests and writes it once by building the
+whole protocol buffer in memory (the previous serialize_to_binary(),
+reimplemented here for comparison) and once one test at a time with
+JobStreamWriter.  The file is then read back whole with
+deserialize_from_binary() and one test at a time with JobStreamReader, and
+a sample of single tests is read with JobStreamReader.get_test().  Every
+step runs in a forked process and reports its time and how much it grew
+the peak memory use of that process.
+"""
+
+import datetime, optparse, os, random, resource, tempfile, time, cPickle
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.tko import job_serializer, models, tko_pb2
+
+
+def make_job(num_tests, num_iterations, num_keyvals):
+    now = datetime.datetime.now()
+    job = models.job('/results/1-user/host', 'user', 'label', 'host', now,
+                     now, now, 'owner', 'group', '', now,
+                     {'job_key': 'value'})
+    kernel = models.kernel('2.6.30', [], 'kernel_hash')
+    iterations = [models.iteration(index,
+                                   dict(('attr%d' % i, str(i))
+                                        for i in xrange(num_keyvals)),
+                                   dict(('perf%d' % i, float(i))
+                                        for i in xrange(num_keyvals)))
+                  for index in xrange(1, num_iterations + 1)]
+    for test_index in xrange(num_tests):
+        job.tests.append(models.test(
+                'subdir%d' % test_index, 'test%d' % test_index, 'GOOD', '',
+                kernel, 'host', now, now, iterations,
+                {'test_attr': 'value'}, ['label']))
+    return job
+
+
+def write_in_memory(job, path):
+    pb_job = tko_pb2.Job()
+    job_serializer.JobSerializer().set_pb_job(job, pb_job, '1-user/host')
+    out = open(path, 'wb')
+    try:
+        out.write(pb_job.SerializeToString())
+    finally:
+        out.close()
+
+
+def write_streaming(job, path):
+    job_serializer.JobSerializer().serialize_to_binary(job, '1-user/host',
+                                                       path)
+
+
+def read_in_memory(path):
+    return len(job_serializer.JobSerializer().deserialize_from_binary(
+            path).tests)
+
+
+def read_streaming(path):
+    reader = job_serializer.JobStreamReader(path)
+    try:
+        # only one test is held at a time
+        return sum(1 for test in reader.iter_tests())
+    finally:
+        reader.close()
+
+
+def read_sample(path, num_tests):
+    reader = job_serializer.JobStreamReader(path)
+    try:
+        indexes = random.sample(xrange(len(reader)), num_tests)
+        return len([reader.get_test(index) for index in indexes])
+    finally:
+        reader.close()
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_in_child(function, *args):
+    """
+    Runs function(*args) in a forked process.
+
+    @returns A (seconds, peak memory growth in KB) tuple.
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(read_end)
+        start_rss = _max_rss_kb()
+        start_time = time.time()
+        function(*args)
+        result = (time.time() - start_time, _max_rss_kb() - start_rss)
+        os.write(write_end, cPickle.dumps(result))
+        os._exit(0)
+    os.close(write_end)
+    result_file = os.fdopen(read_end)
+    result = cPickle.loads(result_file.read())
+    result_file.close()
+    os.waitpid(pid, 0)
+    return result
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-t', '--tests', type='int', default=10000,
+                      help='number of tests in the job')
+    parser.add_option('-i', '--iterations', type='int', default=3,
+                      help='number of iterations per test')
+    parser.add_option('-k', '--keyvals', type='int', default=20,
+                      help='number of attribute and perf keyvals per '
+                           'iteration')
+    parser.add_option('-s', '--sample', type='int', default=100,
+                      help='number of single tests to read')
+    options, args = parser.parse_args()
+
+    job = make_job(options.tests, options.iterations, options.keyvals)
+    path = tempfile.mktemp(prefix='job.serialize.')
+    try:
+        steps = [('write in memory', write_in_memory, (job, path)),
+                 ('write streaming', write_streaming, (job, path)),
+                 ('read in memory', read_in_memory, (path,)),
+                 ('read streaming', read_streaming, (path,)),
+                 ('read %d tests' % options.sample, read_sample,
+                  (path, options.sample))]
+        for name, function, args in steps:
+            seconds, rss_kb = run_in_child(function, *args)
+            print '%-16s %8.3fs %8d KB peak memory growth' % (name, seconds,
+                                                              rss_kb)
+        print '%d tests, %d bytes' % (options.tests, os.path.getsize(path))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
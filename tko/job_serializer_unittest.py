@@ -333,5 +333,67 @@ class ReadBackGetterTest(JobSerializerUnittest):
                             newiteration.perf_keyval)
 
 
+class StreamReadBackGetterTest(ReadBackGetterTest):
+    """Check that a job written by serialize_to_binary() one test at a
+    time reads back the same with deserialize_from_binary() and with
+    JobStreamReader.
+    """
+
+    def setUp(self):
+        JobSerializerUnittest.setUp(self)
+        self.tko_job.tests[1] = models.test(
+            '/tmp/other', 'othertest', 'FAIL', 'broken',
+            self.tko_job.tests[0].kernel, 'My Computer', datetime.now(),
+            datetime.now(), [], {}, [])
+
+        temp_binary = NamedTemporaryFile(mode='wb')
+        try:
+            js = job_serializer.JobSerializer()
+            js.serialize_to_binary(self.tko_job, self.tag, temp_binary.name)
+            self.from_pb_job = js.deserialize_from_binary(temp_binary.name)
+            self.reader = job_serializer.JobStreamReader(temp_binary.name)
+        finally:
+            temp_binary.close()
+
+
+    def tearDown(self):
+        self.reader.close()
+
+
+    def test_reader_job(self):
+        job = self.reader.get_job(include_tests=False)
+        self.assertEqual(self.tko_job.dir, job.dir)
+        self.assertEqual([], job.tests)
+        self.check_dict(self.tko_job.keyval_dict, job.keyval_dict)
+
+
+    def test_reader_single_test(self):
+        self.assertEqual(3, len(self.reader))
+        test = self.reader.get_test(1)
+        self.assertEqual('othertest', test.testname)
+        self.assertEqual('broken', test.reason)
+
+
+    def test_reader_tests(self):
+        self.from_pb_job = self.reader.get_job()
+        self.test_tests()
+
+
+    def test_reader_reads_in_memory_serialization(self):
+        temp_binary = NamedTemporaryFile(mode='wb')
+        try:
+            temp_binary.write(self.pb_job.SerializeToString())
+            temp_binary.flush()
+            reader = job_serializer.JobStreamReader(temp_binary.name)
+        finally:
+            temp_binary.close()
+        try:
+            self.assertEqual(3, len(reader))
+            self.assertEqual('mocktest', reader.get_test(2).testname)
+            self.assertEqual(self.tko_job.user, reader.get_job().user)
+        finally:
+            reader.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -4,6 +4,18 @@ from autotest_lib.client.common_lib import utils
 from autotest_lib.tko import utils as tko_utils
 
 
+def _read_keyval_file(path):
+    if os.path.isfile(path):
+        return utils.read_keyval(path)
+    return {}
+
+
+def read_keyval_file(path):
+    """Read a keyval file through the parser's keyval cache. Returns an
+    empty dictionary if the file does not exist."""
+    return dict(tko_utils.read_cached(path, _read_keyval_file))
+
+
 class job(object):
     def __init__(self, dir, user, label, machine, queued_time, started_time,
                  finished_time, machine_owner, machine_group, aborted_by,
@@ -36,7 +48,7 @@ class job(object):
         keyval = {}
         while True:
             try:
-                upper_keyval = utils.read_keyval(dir)
+                upper_keyval = read_keyval_file(os.path.join(dir, "keyval"))
                 # HACK: exclude hostname from the override - this is a special
                 # case where we want lower to override higher
                 if "hostname" in upper_keyval and "hostname" in keyval:
@@ -145,9 +157,7 @@ class test(object):
     def load_attributes(keyval_path):
         """Load the test attributes into a dictionary from a test
         keyval path. Does not assume that the path actually exists."""
-        if not os.path.exists(keyval_path):
-            return {}
-        return utils.read_keyval(keyval_path)
+        return read_keyval_file(keyval_path)
 
 
     @staticmethod
@@ -159,10 +169,7 @@ class test(object):
 
         # the keyval is <job_dir>/host_keyvals/<hostname> if it exists
         keyval_path = os.path.join(job_dir, "host_keyvals", hostname)
-        if os.path.isfile(keyval_path):
-            return utils.read_keyval(keyval_path)
-        else:
-            return {}
+        return read_keyval_file(keyval_path)
 
 
 class patch(object):
@@ -196,6 +203,12 @@ class iteration(object):
         Keyval data from separate iterations is separated by blank
         lines. Makes use of the parse_line_into_dicts method to
         actually parse the individual lines."""
+        return list(tko_utils.read_cached(keyval_path,
+                                          cls._load_from_keyval_file))
+
+
+    @classmethod
+    def _load_from_keyval_file(cls, keyval_path):
         if not os.path.exists(keyval_path):
             return []
 
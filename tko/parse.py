@@ -1,6 +1,7 @@
 #!/usr/bin/python -u
 
-import os, sys, optparse, fcntl, errno, traceback, socket
+import os, sys, optparse, fcntl, errno, traceback, socket, time, cPickle
+import cStringIO
 
 try:
     import autotest.common as common
@@ -8,7 +9,8 @@ except ImportError:
     import common
 from autotest_lib.client.common_lib import mail, pidfile
 from autotest_lib.tko import db as tko_db, utils as tko_utils, status_lib, models
-from autotest_lib.client.common_lib import utils
+from autotest_lib.client.common_lib import utils, error
+from autotest_lib.server import subcommand
 
 
 def parse_args():
@@ -33,6 +35,9 @@ def parse_args():
                       action="store")
     parser.add_option("-d", help="Database name", dest="db_name",
                       action="store")
+    parser.add_option("-j", help=("Number of processes parsing job "
+                                  "directories in parallel"),
+                      type="int", dest="processes", default=1)
     parser.add_option("--write-pidfile",
                       help="write pidfile (.parser_execute)",
                       dest="write_pidfile", action="store_true",
@@ -72,13 +77,128 @@ def mailfailure(jobname, job, message):
     mail.send("", job.user, "", subject, message_header + message)
 
 
+# the parser state after the complete lines of status.log, which a reparse
+# continues from instead of parsing the whole log again
+_CHECKPOINT_FILE = ".parse.checkpoint"
+_CHECKPOINT_VERSION = 1
+# how much of the log before the checkpoint must still match to resume
+_CHECKPOINT_TAIL_BYTES = 1024
+
+
+def _load_checkpoint(path, **expected_values):
+    """
+    Returns the checkpoint saved by the last parse of the job at path, or
+    None if there isn't one matching expected_values.
+    """
+    checkpoint_path = os.path.join(path, _CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        checkpoint = cPickle.load(open(checkpoint_path))
+    except Exception:
+        tko_utils.dprint("! Ignoring unreadable parser checkpoint")
+        return None
+    if not isinstance(checkpoint, dict):
+        return None
+    expected_values["version"] = _CHECKPOINT_VERSION
+    for key, value in expected_values.iteritems():
+        if checkpoint.get(key) != value:
+            return None
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    checkpoint_path = os.path.join(path, _CHECKPOINT_FILE)
+    temp_path = checkpoint_path + ".tmp"
+    try:
+        checkpoint_file = open(temp_path, "w")
+        try:
+            cPickle.dump(checkpoint, checkpoint_file,
+                         cPickle.HIGHEST_PROTOCOL)
+        finally:
+            checkpoint_file.close()
+        os.rename(temp_path, checkpoint_path)
+    except (IOError, OSError), e:
+        tko_utils.dprint("! Unable to save parser checkpoint: %s" % e)
+
+
+def _log_matches_checkpoint(log, checkpoint):
+    """
+    Checks that the log still starts with what was parsed up to the
+    checkpoint, i.e. that it has not been truncated or rewritten since.
+    """
+    offset, tail = checkpoint["offset"], checkpoint["tail"]
+    stat = os.fstat(log.fileno())
+    if stat.st_ino != checkpoint["inode"] or stat.st_size < offset:
+        return False
+    log.seek(offset - len(tail))
+    return log.read(len(tail)) == tail
+
+
+def _read_status_log(status_log, checkpoint):
+    """
+    Reads the lines of status_log following the checkpoint, or all of them
+    if checkpoint is None or no longer matches the log.
+
+    @returns A (lines, partial_line, position, resumed) tuple.  lines are
+            the complete lines read, partial_line any unterminated text at
+            the end of the log and position a dict of the checkpoint values
+            describing the end of the complete lines.  resumed is True if
+            the lines follow the checkpoint.
+    """
+    log = open(status_log)
+    try:
+        resumed = bool(checkpoint) and _log_matches_checkpoint(log,
+                                                               checkpoint)
+        if resumed:
+            offset, tail = checkpoint["offset"], checkpoint["tail"]
+        else:
+            offset, tail = 0, ""
+        log.seek(offset)
+        data = log.read()
+        inode = os.fstat(log.fileno()).st_ino
+    finally:
+        log.close()
+
+    # a line still being written is parsed, but not checkpointed
+    complete_length = data.rfind("\n") + 1
+    complete_data = data[:complete_length]
+    lines = cStringIO.StringIO(complete_data).readlines()
+    position = {"inode": inode, "offset": offset + complete_length,
+                "tail": (tail + complete_data)[-_CHECKPOINT_TAIL_BYTES:]}
+    return lines, data[complete_length:], position, resumed
+
+
+def _unique_tests(tests):
+    # the parser can return the same object multiple times, so filter out dups
+    unique_tests = []
+    already_added = set()
+    for test in tests:
+        if test not in already_added:
+            already_added.add(test)
+            unique_tests.append(test)
+    return unique_tests
+
+
 def parse_one(db, jobname, path, reparse, mail_on_failure):
     """
     Parse a single job. Optionally send email on failure.
     """
+    cache = tko_utils.start_keyval_cache(path)
+    try:
+        _parse_one(db, jobname, path, reparse, mail_on_failure)
+    finally:
+        tko_utils.stop_keyval_cache()
+        if cache.hits or cache.misses:
+            tko_utils.dprint("+ Keyval cache: %d hits, %d misses"
+                             % (cache.hits, cache.misses))
+
+
+def _parse_one(db, jobname, path, reparse, mail_on_failure):
     tko_utils.dprint("\nScanning %s (%s)" % (jobname, path))
     old_job_idx = db.find_job(jobname)
-    # old tests is a dict from tuple (test_name, subdir) to test_idx
+    # old tests is a dict from tuple (test_name, subdir) to a list of the
+    # test_idx values stored for it
     old_tests = {}
     if old_job_idx is not None:
         if not reparse:
@@ -87,9 +207,8 @@ def parse_one(db, jobname, path, reparse, mail_on_failure):
 
         raw_old_tests = db.select("test_idx,subdir,test", "tko_tests",
                                   {"job_idx": old_job_idx})
-        if raw_old_tests:
-            old_tests = dict(((test, subdir), test_idx)
-                             for test_idx, subdir, test in raw_old_tests)
+        for test_idx, subdir, test in raw_old_tests:
+            old_tests.setdefault((test, subdir), []).append(test_idx)
 
     # look up the status version
     job_keyval = models.job.read_keyval(path)
@@ -105,33 +224,55 @@ def parse_one(db, jobname, path, reparse, mail_on_failure):
         tko_utils.dprint("! Unable to parse job, no status file")
         return
 
+    checkpoint = None
+    if old_job_idx is not None and parser.supports_checkpoints:
+        checkpoint = _load_checkpoint(
+                path, job_idx=old_job_idx, status_version=status_version,
+                status_log=os.path.basename(status_log))
+
     # parse the status logs
     tko_utils.dprint("+ Parsing dir=%s, jobname=%s" % (path, jobname))
-    status_lines = open(status_log).readlines()
-    parser.start(job)
-    tests = parser.end(status_lines)
+    lines, partial_line, position, resumed = _read_status_log(status_log,
+                                                              checkpoint)
+    if resumed:
+        tko_utils.dprint("+ Resuming from parser checkpoint at byte %d"
+                         % checkpoint["offset"])
+        parser_state, parsed_tests = cPickle.loads(checkpoint["state"])
+        parser.start(job, parser_state)
+    else:
+        parsed_tests = []
+        parser.start(job)
+    new_tests = parser.process_lines(lines)
+    parsed_tests = _unique_tests(parsed_tests + new_tests)
+    if parser.supports_checkpoints:
+        # pickle the state now, before end() aborts anything still running
+        state = cPickle.dumps((parser.checkpoint(), parsed_tests),
+                              cPickle.HIGHEST_PROTOCOL)
+    if partial_line:
+        new_tests += parser.end([partial_line])
+    else:
+        new_tests += parser.end()
 
-    # parser.end can return the same object multiple times, so filter out dups
-    job.tests = []
-    already_added = set()
-    for test in tests:
-        if test not in already_added:
-            already_added.add(test)
-            job.tests.append(test)
+    job.tests = _unique_tests(parsed_tests + new_tests)
+    if resumed:
+        # the other tests are stored already and have not changed since
+        changed_tests = _unique_tests(new_tests)
+    else:
+        changed_tests = job.tests
 
     # try and port test_idx over from the old tests, but if old tests stop
     # matching up with new ones just give up
     if reparse and old_job_idx is not None:
         job.index = old_job_idx
         for test in job.tests:
-            test_idx = old_tests.pop((test.testname, test.subdir), None)
-            if test_idx is not None:
-                test.test_idx = test_idx
+            test_idxs = old_tests.get((test.testname, test.subdir))
+            if test_idxs:
+                test.test_idx = test_idxs.pop(0)
             else:
                 tko_utils.dprint("! Reparse returned new test "
                                  "testname=%r subdir=%r" %
                                  (test.testname, test.subdir))
-        for test_idx in old_tests.itervalues():
+        for test_idx in sum(old_tests.itervalues(), []):
             where = {'test_idx' : test_idx}
             db.delete('tko_iteration_result', where)
             db.delete('tko_iteration_attributes', where)
@@ -159,7 +300,7 @@ def parse_one(db, jobname, path, reparse, mail_on_failure):
         mailfailure(jobname, job, message)
 
     # write the job into the database
-    db.insert_job(jobname, job)
+    db.insert_job(jobname, job, tests=changed_tests)
 
     # Serializing job into a binary file
     try:
@@ -184,6 +325,13 @@ def parse_one(db, jobname, path, reparse, mail_on_failure):
 
     db.commit()
 
+    if parser.supports_checkpoints:
+        position.update(version=_CHECKPOINT_VERSION, job_idx=job.index,
+                        status_version=status_version,
+                        status_log=os.path.basename(status_log),
+                        state=state)
+        _save_checkpoint(path, position)
+
 def _site_export_dummy(binary_file_name):
     pass
 
@@ -213,7 +361,17 @@ def _get_job_subdirs(path):
     return None
 
 
+def _format_error():
+    """Returns the last line of the exception being handled."""
+    exc_type, exc_value = sys.exc_info()[:2]
+    return traceback.format_exception_only(exc_type, exc_value)[-1].strip()
+
+
 def parse_leaf_path(db, path, level, reparse, mail_on_failure):
+    """
+    Returns a (jobname, error) tuple, where error is None if the job was
+    parsed and a one line description of the failure otherwise.
+    """
     job_elements = path.split("/")[-level:]
     jobname = "/".join(job_elements)
     try:
@@ -221,23 +379,151 @@ def parse_leaf_path(db, path, level, reparse, mail_on_failure):
                           mail_on_failure)
     except Exception:
         traceback.print_exc()
+        return jobname, _format_error()
+    return jobname, None
 
 
 def parse_path(db, path, level, reparse, mail_on_failure):
+    """
+    Returns a list of parse_leaf_path() results, one per job found in path.
+    """
     job_subdirs = _get_job_subdirs(path)
-    if job_subdirs is not None:
-        # parse status.log in current directory, if it exists. multi-machine
-        # synchronous server side tests record output in this directory. without
-        # this check, we do not parse these results.
-        if os.path.exists(os.path.join(path, 'status.log')):
-            parse_leaf_path(db, path, level, reparse, mail_on_failure)
-        # multi-machine job
-        for subdir in job_subdirs:
-            jobpath = os.path.join(path, subdir)
-            parse_path(db, jobpath, level + 1, reparse, mail_on_failure)
-    else:
+    if job_subdirs is None:
         # single machine job
-        parse_leaf_path(db, path, level, reparse, mail_on_failure)
+        return [parse_leaf_path(db, path, level, reparse, mail_on_failure)]
+
+    results = []
+    # parse status.log in current directory, if it exists. multi-machine
+    # synchronous server side tests record output in this directory. without
+    # this check, we do not parse these results.
+    if os.path.exists(os.path.join(path, 'status.log')):
+        results.append(parse_leaf_path(db, path, level, reparse,
+                                       mail_on_failure))
+    # multi-machine job
+    for subdir in job_subdirs:
+        jobpath = os.path.join(path, subdir)
+        results += parse_path(db, jobpath, level + 1, reparse,
+                              mail_on_failure)
+    return results
+
+
+def _connect_db(options):
+    return tko_db.db(autocommit=False, host=options.db_host,
+                     user=options.db_user, password=options.db_pass,
+                     database=options.db_name)
+
+
+def parse_locked_path(db, path, options):
+    """
+    Parse the jobs in path while holding its .parse.lock.  Returns the
+    parse_path() results, or an empty list if the lock is already held and
+    nonblocking mode was requested.
+    """
+    lockfile = open(os.path.join(path, ".parse.lock"), "w")
+    flags = fcntl.LOCK_EX
+    if options.noblock:
+        flags |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(lockfile, flags)
+    except IOError, e:
+        # lock is not available and nonblock has been requested
+        if e.errno == errno.EWOULDBLOCK:
+            lockfile.close()
+            return []
+        else:
+            raise # something unexpected happened
+    try:
+        return parse_path(db, path, options.level, options.reparse,
+                          options.mailit)
+    finally:
+        fcntl.flock(lockfile, fcntl.LOCK_UN)
+        lockfile.close()
+
+
+def summarize_results(results):
+    """
+    Returns a (number of jobs, [(jobname, error), ...]) summary of parse
+    results, listing only the jobs that failed.
+    """
+    return len(results), [(jobname, reason) for jobname, reason in results
+                          if reason]
+
+
+def _parse_in_subprocess(path, options):
+    # every process needs a database connection of its own, and only the
+    # summary is sent back so that the result pipe never fills up
+    return summarize_results(
+            parse_locked_path(_connect_db(options), path, options))
+
+
+def _collect_subprocess_summary(task, path):
+    """
+    Returns the results summary of a finished _parse_in_subprocess() task.
+    """
+    try:
+        exit_code = task.poll()
+    except error.AutoservSubcommandError:
+        exit_code = task.returncode
+    try:
+        results = cPickle.load(task.result_pickle)
+    except (EOFError, cPickle.UnpicklingError):
+        results = None
+    task.result_pickle.close()
+
+    if isinstance(results, Exception):
+        return 0, [(path, str(results) or type(results).__name__)]
+    if results is None:
+        return 0, [(path,
+                    'parser process died with exit code %s' % exit_code)]
+    return results
+
+
+def parse_paths_in_parallel(paths, options):
+    """
+    Parse each path in its own process, running at most options.processes
+    of them at once.
+
+    Returns a summarize_results() summary of all the paths.
+    """
+    waiting_paths = list(paths)
+    running = []
+    num_jobs, failures = 0, []
+    while waiting_paths or running:
+        while waiting_paths and len(running) < options.processes:
+            path = waiting_paths.pop(0)
+            task = subcommand.subcommand(_parse_in_subprocess, (path, options))
+            task.fork_start()
+            running.append((task, path))
+
+        still_running = []
+        for task, path in running:
+            try:
+                exit_code = task.poll()
+            except error.AutoservSubcommandError:
+                exit_code = task.returncode
+            if exit_code is None:
+                still_running.append((task, path))
+            else:
+                task_jobs, task_failures = _collect_subprocess_summary(task,
+                                                                       path)
+                num_jobs += task_jobs
+                failures += task_failures
+        if len(still_running) == len(running):
+            time.sleep(0.1)
+        running = still_running
+    return num_jobs, failures
+
+
+def report_results(num_jobs, failures, elapsed_time):
+    if elapsed_time > 0:
+        rate = num_jobs / elapsed_time
+    else:
+        rate = 0
+    tko_utils.dprint("\nParsed %d jobs in %.1f sec (%.2f jobs/sec), "
+                     "%d failed" % (num_jobs, elapsed_time, rate,
+                                    len(failures)))
+    for jobname, reason in failures:
+        tko_utils.dprint("! %s: %s" % (jobname, reason))
 
 
 def main():
@@ -251,6 +537,7 @@ def main():
         pid_file_manager.open_file()
 
     try:
+        start_time = time.time()
         # build up the list of job dirs to parse
         if options.singledir:
             jobs_list = [results_dir]
@@ -258,33 +545,17 @@ def main():
             jobs_list = [os.path.join(results_dir, subdir)
                          for subdir in os.listdir(results_dir)]
 
-        # build up the database
-        db = tko_db.db(autocommit=False, host=options.db_host,
-                       user=options.db_user, password=options.db_pass,
-                       database=options.db_name)
-
         # parse all the jobs
-        for path in jobs_list:
-            lockfile = open(os.path.join(path, ".parse.lock"), "w")
-            flags = fcntl.LOCK_EX
-            if options.noblock:
-                flags |= fcntl.LOCK_NB
-            try:
-                fcntl.flock(lockfile, flags)
-            except IOError, e:
-                # lock is not available and nonblock has been requested
-                if e.errno == errno.EWOULDBLOCK:
-                    lockfile.close()
-                    continue
-                else:
-                    raise # something unexpected happened
-            try:
-                parse_path(db, path, options.level, options.reparse,
-                           options.mailit)
+        if options.processes > 1:
+            num_jobs, failures = parse_paths_in_parallel(jobs_list, options)
+        else:
+            db = _connect_db(options)
+            results = []
+            for path in jobs_list:
+                results += parse_locked_path(db, path, options)
+            num_jobs, failures = summarize_results(results)
 
-            finally:
-                fcntl.flock(lockfile, fcntl.LOCK_UN)
-                lockfile.close()
+        report_results(num_jobs, failures, time.time() - start_time)
 
     except:
         pid_file_manager.close_file(1)
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+
+import fcntl, os, shutil, sys, tempfile, unittest
+
+try:
+    import autotest.common as common
+except ImportError:
+    import common
+from autotest_lib.client.common_lib.test_utils import mock
+from autotest_lib.tko import db_unittest, parse
+from autotest_lib.tko import utils as tko_utils
+
+
+_JOB_KEYVAL = """\
+status_version=1
+user=user
+label=label
+hostname=host
+job_started=1000
+"""
+
+_STATUS_LINES = [
+        "START\t----\t----\ttimestamp=1000\t\n",
+        "\tSTART\tfirst\tfirst\ttimestamp=1001\t\n",
+        "\tEND GOOD\tfirst\tfirst\ttimestamp=1002\tcompleted\n",
+        "\tSTART\tsecond\tsecond\ttimestamp=1003\t\n",
+        "\t\tFAIL\tsecond\tsecond\ttimestamp=1004\tbroken\n",
+        "\tEND FAIL\tsecond\tsecond\ttimestamp=1005\tbroken\n",
+        "END GOOD\t----\t----\ttimestamp=1006\t\n",
+]
+
+
+class ParseInParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.god = mock.mock_god()
+        self.results_dir = tempfile.mkdtemp()
+        tko_utils.redirect_parser_debugging(open('/dev/null', 'w'))
+        self.god.stub_with(parse, '_connect_db', lambda options: None)
+        self.god.stub_with(parse, 'parse_path', self._fake_parse_path)
+        self.options = self._make_options()
+
+
+    def tearDown(self):
+        self.god.unstub_all()
+        tko_utils.redirect_parser_debugging(sys.stderr)
+        shutil.rmtree(self.results_dir)
+
+
+    def _make_options(self):
+        sys_argv = sys.argv
+        sys.argv = ['parse', '-j', '3', '-l', '1', self.results_dir]
+        try:
+            options, args = parse.parse_args()
+        finally:
+            sys.argv = sys_argv
+        return options
+
+
+    def _fake_parse_path(self, db, path, level, reparse, mail_on_failure):
+        name = os.path.basename(path)
+        if name == 'crash':
+            raise ValueError('bad job')
+        if name == 'exit':
+            os._exit(3)
+        results = [(name + '/host1', None), (name + '/host2', None)]
+        if name == 'fail':
+            results.append((name + '/host3', 'ParseError: bad status.log'))
+        return results
+
+
+    def _make_job_dirs(self, *names):
+        paths = []
+        for name in names:
+            path = os.path.join(self.results_dir, name)
+            os.mkdir(path)
+            paths.append(path)
+        return paths
+
+
+    def test_results_are_aggregated(self):
+        paths = self._make_job_dirs('1-user', '2-user', 'fail', '3-user',
+                                    'crash', 'exit')
+        num_jobs, failures = parse.parse_paths_in_parallel(paths,
+                                                           self.options)
+
+        # two jobs in each directory, plus one more in 'fail'
+        self.assertEquals(9, num_jobs)
+        failures.sort()
+        self.assertEquals(3, len(failures))
+        self.assertEquals(paths[4], failures[0][0])
+        self.assertEquals('bad job', failures[0][1])
+        self.assertEquals(paths[5], failures[1][0])
+        self.assertTrue('exit code 3' in failures[1][1])
+        self.assertEquals(('fail/host3', 'ParseError: bad status.log'),
+                          failures[2])
+
+
+    def test_locked_directories_are_skipped(self):
+        self.options.noblock = True
+        lockfile = open(os.path.join(self._make_job_dirs('1-user')[0],
+                                     '.parse.lock'), 'w')
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            self.assertEquals((0, []), parse.parse_paths_in_parallel(
+                    [os.path.dirname(lockfile.name)], self.options))
+        finally:
+            lockfile.close()
+
+
+class ParseOneCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        tko_utils.redirect_parser_debugging(open('/dev/null', 'w'))
+        open(os.path.join(self.job_dir, 'keyval'), 'w').write(_JOB_KEYVAL)
+        self.db = db_unittest.SqliteDb()
+
+
+    def tearDown(self):
+        tko_utils.redirect_parser_debugging(sys.stderr)
+        shutil.rmtree(self.job_dir)
+
+
+    def _write_status_log(self, lines, mode='w'):
+        status_log = open(os.path.join(self.job_dir, 'status.log'), mode)
+        status_log.write(''.join(lines))
+        status_log.close()
+
+
+    def _parse(self, db, reparse=True):
+        parse.parse_one(db, '1-user/host', self.job_dir, reparse, False)
+
+
+    def _stored_tests(self, db):
+        return db.select('test, subdir, status, reason', 'tko_tests',
+                         '1 ORDER BY test')
+
+
+    def _full_parse_tests(self):
+        os.remove(os.path.join(self.job_dir, parse._CHECKPOINT_FILE))
+        db = db_unittest.SqliteDb()
+        self._parse(db, reparse=False)
+        return self._stored_tests(db)
+
+
+    def test_reparse_resumes_from_checkpoint(self):
+        self._write_status_log(_STATUS_LINES[:4])
+        self._parse(self.db, reparse=False)
+        # the running test is aborted until the rest of the log is in
+        self.assertEquals(5, len(self._stored_tests(self.db)))
+        self.assertTrue(os.path.exists(
+                os.path.join(self.job_dir, parse._CHECKPOINT_FILE)))
+
+        self._write_status_log(_STATUS_LINES[4:], mode='a')
+        num_statements = len(self.db.con.statements)
+        self._parse(self.db)
+        statements = self.db.con.statements[num_statements:]
+
+        # the first test was complete and isn't written again
+        self.assertEquals(3, len([sql for sql in statements
+                                  if sql.startswith('update tko_tests')]))
+        self.assertEquals(self._full_parse_tests(),
+                          self._stored_tests(self.db))
+
+
+    def test_partial_line_is_parsed_but_not_checkpointed(self):
+        self._write_status_log(_STATUS_LINES[:3] + [_STATUS_LINES[3][:-1]])
+        self._parse(self.db, reparse=False)
+        self.assertEquals(5, len(self._stored_tests(self.db)))
+
+        self._write_status_log(['\n'] + _STATUS_LINES[4:], mode='a')
+        self._parse(self.db)
+        self.assertEquals(self._full_parse_tests(),
+                          self._stored_tests(self.db))
+
+
+    def test_rewritten_log_is_parsed_from_the_start(self):
+        self._write_status_log(_STATUS_LINES)
+        self._parse(self.db, reparse=False)
+
+        lines = list(_STATUS_LINES)
+        lines[2] = lines[2].replace('first', 'renamed')
+        self._write_status_log(lines)
+        self._parse(self.db)
+        stored_tests = self._stored_tests(self.db)
+        self.assertEquals(self._full_parse_tests(), stored_tests)
+        self.assertEquals(['CLIENT_JOB.0', 'SERVER_JOB', 'renamed', 'second'],
+                          [test for test, _, _, _ in stored_tests])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,13 +8,20 @@ class parser(object):
     Abstract parser base class. Provides a generic implementation of the
     standard parser interfaction functions. The derived classes must
     implement a state_iterator method for this class to be useful.
+    Derived classes that also implement checkpoint() set
+    supports_checkpoints.
     """
-    def start(self, job):
+    supports_checkpoints = False
+
+    def start(self, job, checkpoint=None):
         """ Initialize the parser for processing the results of
-        'job'."""
+        'job'. If 'checkpoint' is given the parser continues from a
+        state returned by checkpoint(), expecting only the lines that
+        followed it."""
         # initialize all the basic parser parameters
         self.job = job
         self.finished = False
+        self.resume_state = checkpoint
         self.line_buffer = status_lib.line_buffer()
         # create and prime the parser state machine
         self.state = self.state_iterator(self.line_buffer)
@@ -57,6 +64,14 @@ class parser(object):
             return []
 
 
+    def checkpoint(self):
+        """ Return the state of the parser after the last
+        process_lines() call, for a later start() to continue from.
+        The state refers to live parser objects, so it has to be
+        pickled before any more lines are processed."""
+        raise NotImplementedError
+
+
     @staticmethod
     def make_job(dir):
         """ Create a new instance of the job model used by the
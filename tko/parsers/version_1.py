@@ -137,11 +137,17 @@ patch = version_0.patch
 
 
 class parser(base.parser):
+    supports_checkpoints = True
+
     @staticmethod
     def make_job(dir):
         return job(dir)
 
 
+    def checkpoint(self):
+        return self.checkpoint_state
+
+
     @staticmethod
     def make_dummy_abort(indent, subdir, testname, timestamp, reason):
         indent = "\t" * indent
@@ -170,25 +176,44 @@ class parser(base.parser):
 
 
     def state_iterator(self, buffer):
-        line = None
         new_tests = []
-        job_count, boot_count = 0, 0
-        min_stack_size = 0
-        stack = status_lib.status_stack()
-        current_kernel = kernel("", [])  # UNKNOWN
-        current_status = status_lib.statuses[-1]
-        current_reason = None
-        started_time_stack = [None]
-        subdir_stack = [None]
-        running_test = None
-        running_reasons = set()
-        yield []   # we're ready to start running
-
-        # create a RUNNING SERVER_JOB entry to represent the entire test
-        running_job = test.parse_partial_test(self.job, "----", "SERVER_JOB",
-                                              "", current_kernel,
-                                              self.job.started_time)
-        new_tests.append(running_job)
+        self.checkpoint_state = state = self.resume_state
+        if state:
+            line = state["line"]
+            job_count, boot_count = state["job_count"], state["boot_count"]
+            min_stack_size = state["min_stack_size"]
+            stack = state["stack"]
+            current_kernel = state["current_kernel"]
+            current_status = state["current_status"]
+            current_reason = state["current_reason"]
+            started_time_stack = state["started_time_stack"]
+            subdir_stack = state["subdir_stack"]
+            running_job = state["running_job"]
+            running_client = state["running_client"]
+            running_test = state["running_test"]
+            running_reasons = state["running_reasons"]
+            yield []   # we're ready to continue
+        else:
+            line = None
+            job_count, boot_count = 0, 0
+            min_stack_size = 0
+            stack = status_lib.status_stack()
+            current_kernel = kernel("", [])  # UNKNOWN
+            current_status = status_lib.statuses[-1]
+            current_reason = None
+            started_time_stack = [None]
+            subdir_stack = [None]
+            running_client = None
+            running_test = None
+            running_reasons = set()
+            yield []   # we're ready to start running
+
+            # create a RUNNING SERVER_JOB entry to represent the entire test
+            running_job = test.parse_partial_test(self.job, "----",
+                                                  "SERVER_JOB", "",
+                                                  current_kernel,
+                                                  self.job.started_time)
+            new_tests.append(running_job)
 
         while True:
             # are we finished with parsing?
@@ -218,6 +243,21 @@ class parser(base.parser):
 
             # stop processing once the buffer is empty
             if buffer.size() == 0:
+                if not self.finished:
+                    # everything needed to continue with the next line
+                    self.checkpoint_state = {
+                        "line": line, "job_count": job_count,
+                        "boot_count": boot_count,
+                        "min_stack_size": min_stack_size, "stack": stack,
+                        "current_kernel": current_kernel,
+                        "current_status": current_status,
+                        "current_reason": current_reason,
+                        "started_time_stack": started_time_stack,
+                        "subdir_stack": subdir_stack,
+                        "running_job": running_job,
+                        "running_client": running_client,
+                        "running_test": running_test,
+                        "running_reasons": running_reasons}
                 yield new_tests
                 new_tests = []
                 continue
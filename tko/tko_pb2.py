@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: tko.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor.FileDescriptor(
+  name='tko.proto',
+  package='',
+  syntax='proto2',
+  serialized_options=None,
+  create_key=_descriptor._internal_create_key,
+  serialized_pb=b'\n\ttko.proto\"\xe4\x05\n\x03Job\x12\x0b\n\x03\x64ir\x18\x01 \x02(\t\x12\x18\n\x05tests\x18\x02 \x03(\x0b\x32\t.Job.Test\x12\x0c\n\x04user\x18\x03 \x02(\t\x12\r\n\x05label\x18\x04 \x02(\t\x12\x0b\n\x03tag\x18\x05 \x02(\t\x12\x13\n\x0bqueued_time\x18\x06 \x02(\x03\x12\x14\n\x0cstarted_time\x18\x07 \x02(\x03\x12\x15\n\rfinished_time\x18\x08 \x02(\x03\x12\x0f\n\x07machine\x18\t \x02(\t\x12\x15\n\rmachine_owner\x18\n \x02(\t\x12\x15\n\rmachine_group\x18\x0b \x02(\t\x12\x12\n\naborted_by\x18\x0c \x02(\t\x12\x12\n\naborted_on\x18\r \x02(\x03\x12\x12\n\nafe_job_id\x18\x0e \x02(\t\x12 \n\x0bkeyval_dict\x18\x0f \x03(\x0b\x32\x0b.Job.KeyVal\x1a%\n\x06KeyVal\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\r\n\x05value\x18\x02 \x02(\t\x1a+\n\x06Kernel\x12\x0c\n\x04\x62\x61se\x18\x01 \x02(\t\x12\x13\n\x0bkernel_hash\x18\x02 \x02(\t\x1a^\n\tIteration\x12\r\n\x05index\x18\x01 \x02(\x03\x12 \n\x0b\x61ttr_keyval\x18\x02 \x03(\x0b\x32\x0b.Job.KeyVal\x12 \n\x0bperf_keyval\x18\x03 \x03(\x0b\x32\x0b.Job.KeyVal\x1a\xf8\x01\n\x04Test\x12\x0e\n\x06subdir\x18\x01 \x02(\t\x12\x10\n\x08testname\x18\x02 \x02(\t\x12\x0e\n\x06status\x18\x03 \x02(\t\x12\x0e\n\x06reason\x18\x04 \x02(\t\x12\x1b\n\x06kernel\x18\x05 \x02(\x0b\x32\x0b.Job.Kernel\x12\x0f\n\x07machine\x18\x06 \x02(\t\x12\x14\n\x0cstarted_time\x18\x07 \x02(\x03\x12\x15\n\rfinished_time\x18\x08 \x02(\x03\x12\"\n\niterations\x18\t \x03(\x0b\x32\x0e.Job.Iteration\x12\x1f\n\nattributes\x18\n \x03(\x0b\x32\x0b.Job.KeyVal\x12\x0e\n\x06labels\x18\x0b \x03(\t'
+)
+
+
+
+
+_JOB_KEYVAL = _descriptor.Descriptor(
+  name='KeyVal',
+  full_name='Job.KeyVal',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='name', full_name='Job.KeyVal.name', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='value', full_name='Job.KeyVal.value', index=1,
+      number=2, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=325,
+  serialized_end=362,
+)
+
+_JOB_KERNEL = _descriptor.Descriptor(
+  name='Kernel',
+  full_name='Job.Kernel',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='base', full_name='Job.Kernel.base', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='kernel_hash', full_name='Job.Kernel.kernel_hash', index=1,
+      number=2, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=364,
+  serialized_end=407,
+)
+
+_JOB_ITERATION = _descriptor.Descriptor(
+  name='Iteration',
+  full_name='Job.Iteration',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='index', full_name='Job.Iteration.index', index=0,
+      number=1, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='attr_keyval', full_name='Job.Iteration.attr_keyval', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='perf_keyval', full_name='Job.Iteration.perf_keyval', index=2,
+      number=3, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=409,
+  serialized_end=503,
+)
+
+_JOB_TEST = _descriptor.Descriptor(
+  name='Test',
+  full_name='Job.Test',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='subdir', full_name='Job.Test.subdir', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='testname', full_name='Job.Test.testname', index=1,
+      number=2, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='status', full_name='Job.Test.status', index=2,
+      number=3, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='reason', full_name='Job.Test.reason', index=3,
+      number=4, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='kernel', full_name='Job.Test.kernel', index=4,
+      number=5, type=11, cpp_type=10, label=2,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='machine', full_name='Job.Test.machine', index=5,
+      number=6, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='started_time', full_name='Job.Test.started_time', index=6,
+      number=7, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='finished_time', full_name='Job.Test.finished_time', index=7,
+      number=8, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='iterations', full_name='Job.Test.iterations', index=8,
+      number=9, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='attributes', full_name='Job.Test.attributes', index=9,
+      number=10, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='labels', full_name='Job.Test.labels', index=10,
+      number=11, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=506,
+  serialized_end=754,
+)
+
+_JOB = _descriptor.Descriptor(
+  name='Job',
+  full_name='Job',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='dir', full_name='Job.dir', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='tests', full_name='Job.tests', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='user', full_name='Job.user', index=2,
+      number=3, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='label', full_name='Job.label', index=3,
+      number=4, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='tag', full_name='Job.tag', index=4,
+      number=5, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='queued_time', full_name='Job.queued_time', index=5,
+      number=6, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='started_time', full_name='Job.started_time', index=6,
+      number=7, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='finished_time', full_name='Job.finished_time', index=7,
+      number=8, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='machine', full_name='Job.machine', index=8,
+      number=9, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='machine_owner', full_name='Job.machine_owner', index=9,
+      number=10, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='machine_group', full_name='Job.machine_group', index=10,
+      number=11, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='aborted_by', full_name='Job.aborted_by', index=11,
+      number=12, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='aborted_on', full_name='Job.aborted_on', index=12,
+      number=13, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='afe_job_id', full_name='Job.afe_job_id', index=13,
+      number=14, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='keyval_dict', full_name='Job.keyval_dict', index=14,
+      number=15, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[_JOB_KEYVAL, _JOB_KERNEL, _JOB_ITERATION, _JOB_TEST, ],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=14,
+  serialized_end=754,
+)
+
+_JOB_KEYVAL.containing_type = _JOB
+_JOB_KERNEL.containing_type = _JOB
+_JOB_ITERATION.fields_by_name['attr_keyval'].message_type = _JOB_KEYVAL
+_JOB_ITERATION.fields_by_name['perf_keyval'].message_type = _JOB_KEYVAL
+_JOB_ITERATION.containing_type = _JOB
+_JOB_TEST.fields_by_name['kernel'].message_type = _JOB_KERNEL
+_JOB_TEST.fields_by_name['iterations'].message_type = _JOB_ITERATION
+_JOB_TEST.fields_by_name['attributes'].message_type = _JOB_KEYVAL
+_JOB_TEST.containing_type = _JOB
+_JOB.fields_by_name['tests'].message_type = _JOB_TEST
+_JOB.fields_by_name['keyval_dict'].message_type = _JOB_KEYVAL
+DESCRIPTOR.message_types_by_name['Job'] = _JOB
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
+
+Job = _reflection.GeneratedProtocolMessageType('Job', (_message.Message,), {
+
+  'KeyVal' : _reflection.GeneratedProtocolMessageType('KeyVal', (_message.Message,), {
+    'DESCRIPTOR' : _JOB_KEYVAL,
+    '__module__' : 'tko_pb2'
+    # @@protoc_insertion_point(class_scope:Job.KeyVal)
+    })
+  ,
+
+  'Kernel' : _reflection.GeneratedProtocolMessageType('Kernel', (_message.Message,), {
+    'DESCRIPTOR' : _JOB_KERNEL,
+    '__module__' : 'tko_pb2'
+    # @@protoc_insertion_point(class_scope:Job.Kernel)
+    })
+  ,
+
+  'Iteration' : _reflection.GeneratedProtocolMessageType('Iteration', (_message.Message,), {
+    'DESCRIPTOR' : _JOB_ITERATION,
+    '__module__' : 'tko_pb2'
+    # @@protoc_insertion_point(class_scope:Job.Iteration)
+    })
+  ,
+
+  'Test' : _reflection.GeneratedProtocolMessageType('Test', (_message.Message,), {
+    'DESCRIPTOR' : _JOB_TEST,
+    '__module__' : 'tko_pb2'
+    # @@protoc_insertion_point(class_scope:Job.Test)
+    })
+  ,
+  'DESCRIPTOR' : _JOB,
+  '__module__' : 'tko_pb2'
+  # @@protoc_insertion_point(class_scope:Job)
+  })
+_sym_db.RegisterMessage(Job)
+_sym_db.RegisterMessage(Job.KeyVal)
+_sym_db.RegisterMessage(Job.Kernel)
+_sym_db.RegisterMessage(Job.Iteration)
+_sym_db.RegisterMessage(Job.Test)
+
+
+# @@protoc_insertion_point(module_scope)
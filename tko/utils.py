@@ -18,12 +18,87 @@ def get_timestamp(mapping, field):
     return val
 
 
+class keyval_cache(object):
+    """ Cache of the files read while parsing the results under one job
+    directory, so that files shared by many tests (like the host keyvals)
+    are read and parsed only once. Entries are keyed by path and the
+    function that parsed them, and are reloaded when the mtime or size
+    of the file changes. """
+    def __init__(self, job_dir):
+        self.job_dir = os.path.normpath(job_dir)
+        self.hits = self.misses = 0
+        self._entries = {}
+        self._toplevel_job_dirs = {}
+
+
+    def covers(self, path):
+        path = os.path.normpath(path)
+        return (path == self.job_dir or
+                path.startswith(os.path.join(self.job_dir, "")))
+
+
+    def read(self, path, loader):
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime, stat.st_size)
+        except OSError:
+            version = None
+        key = (path, loader)
+        entry = self._entries.get(key)
+        if entry and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = loader(path)
+        self._entries[key] = (version, value)
+        return value
+
+
+    def find_toplevel_job_dir(self, start_dir):
+        if start_dir not in self._toplevel_job_dirs:
+            self._toplevel_job_dirs[start_dir] = _find_toplevel_job_dir(
+                start_dir)
+        return self._toplevel_job_dirs[start_dir]
+
+
+_keyval_cache = None
+def start_keyval_cache(job_dir):
+    """ Start caching the files read through read_cached() while parsing
+    the job at job_dir, replacing any previous cache. Files outside the
+    top-level job dir of job_dir are never cached. Returns the cache. """
+    global _keyval_cache
+    # look up the top-level dir without the previous job's cache
+    _keyval_cache = None
+    _keyval_cache = keyval_cache(find_toplevel_job_dir(job_dir) or job_dir)
+    return _keyval_cache
+
+
+def stop_keyval_cache():
+    global _keyval_cache
+    _keyval_cache = None
+
+
+def read_cached(path, loader):
+    """ Return loader(path), using the keyval cache if there is one for
+    path. The value may be shared with other callers, so it must not be
+    modified. """
+    if _keyval_cache and _keyval_cache.covers(path):
+        return _keyval_cache.read(path, loader)
+    return loader(path)
+
+
 def find_toplevel_job_dir(start_dir):
     """ Starting from start_dir and moving upwards, find the top-level
     of the job results dir. We can't just assume that it corresponds to
     the actual job.dir, because job.dir may just be a subdir of the "real"
     job dir that autoserv was launched with. Returns None if it can't find
     a top-level dir. """
+    if _keyval_cache and _keyval_cache.covers(start_dir):
+        return _keyval_cache.find_toplevel_job_dir(start_dir)
+    return _find_toplevel_job_dir(start_dir)
+
+
+def _find_toplevel_job_dir(start_dir):
     job_dir = start_dir
     while not os.path.exists(os.path.join(job_dir, ".autoserv_execute")):
         if job_dir == "/":
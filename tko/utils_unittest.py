@@ -1,6 +1,6 @@
 #!/usr/bin/python
 
-import os, unittest, time, datetime, itertools
+import os, unittest, time, datetime, itertools, tempfile, shutil
 
 try:
     import autotest.common as common
@@ -129,5 +129,71 @@ class drop_redundant_messages(unittest.TestCase):
                 set(["abcdef", "defghi"]))
 
 
+class keyval_cache_test(unittest.TestCase):
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        open(os.path.join(self.job_dir, ".autoserv_execute"), "w").close()
+        os.mkdir(os.path.join(self.job_dir, "host1"))
+        self.keyval = os.path.join(self.job_dir, "keyval")
+        self._write_keyval("a=1\n")
+        self.reads = []
+        self.cache = utils.start_keyval_cache(
+                os.path.join(self.job_dir, "host1"))
+
+
+    def tearDown(self):
+        utils.stop_keyval_cache()
+        shutil.rmtree(self.job_dir)
+
+
+    def _write_keyval(self, contents):
+        keyval_file = open(self.keyval, "w")
+        keyval_file.write(contents)
+        keyval_file.close()
+
+
+    def _loader(self, path):
+        self.reads.append(path)
+        if os.path.exists(path):
+            return open(path).read()
+        return None
+
+
+    def test_scoped_to_toplevel_job_dir(self):
+        self.assertEquals(self.job_dir, self.cache.job_dir)
+        self.assertEquals(self.job_dir, utils.find_toplevel_job_dir(
+                os.path.join(self.job_dir, "host1")))
+
+
+    def test_file_read_once(self):
+        for i in xrange(3):
+            self.assertEquals("a=1\n",
+                              utils.read_cached(self.keyval, self._loader))
+        self.assertEquals([self.keyval], self.reads)
+        self.assertEquals((2, 1), (self.cache.hits, self.cache.misses))
+
+
+    def test_changed_file_read_again(self):
+        utils.read_cached(self.keyval, self._loader)
+        self._write_keyval("a=1\nb=2\n")
+        self.assertEquals("a=1\nb=2\n",
+                          utils.read_cached(self.keyval, self._loader))
+        self.assertEquals(2, len(self.reads))
+
+
+    def test_missing_file_cached(self):
+        missing = os.path.join(self.job_dir, "host1", "keyval")
+        utils.read_cached(missing, self._loader)
+        utils.read_cached(missing, self._loader)
+        self.assertEquals([missing], self.reads)
+
+
+    def test_files_outside_job_dir_not_cached(self):
+        utils.read_cached("/outside/keyval", self._loader)
+        utils.read_cached("/outside/keyval", self._loader)
+        self.assertEquals(2, len(self.reads))
+        self.assertEquals((0, 0), (self.cache.hits, self.cache.misses))
+
+
 if __name__ == "__main__":
     unittest.main()